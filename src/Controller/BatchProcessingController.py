@@ -36,6 +36,7 @@ class BatchProcessingController:
         self.batch_path = ""
         self.dvh_output_path = ""
         self.pyrad_output_path = ""
+        self.suv_output_path = ""
         self.clinical_data_input_path = ""
         self.clinical_data_output_path = ""
         self.processes = []
@@ -59,6 +60,7 @@ class BatchProcessingController:
         self.batch_path = file_paths.get('batch_path')
         self.dvh_output_path = file_paths.get('dvh_output_path')
         self.pyrad_output_path = file_paths.get('pyrad_output_path')
+        self.suv_output_path = file_paths.get('suv_output_path')
         self.clinical_data_input_path = \
             file_paths.get('clinical_data_input_path')
         self.clinical_data_output_path = \
@@ -317,7 +319,9 @@ class BatchProcessingController:
         process = BatchProcessSUV2ROI(progress_callback,
                                       interrupt_flag,
                                       cur_patient_files,
-                                      patient_weight)
+                                      patient_weight,
+                                      self.suv_output_path)
+        process.set_filename('SUVs_' + self.timestamp + '.csv')
         success = process.start()
 
         # Add rtss to patient in case it is needed in future
@@ -1,4 +1,3 @@
-from shutil import which
 
 from PySide6 import QtCore, QtWidgets, QtGui
 from PySide6.QtWidgets import QMessageBox
@@ -208,29 +207,20 @@ class MainWindow(QtWidgets.QMainWindow, UIMainWindow):
         """
         Sends signal to initiate pyradiomics analysis
         """
-        if which('plastimatch') is not None:
-            if hashed_path == '':
-                confirm_pyradi = QMessageBox.information(
-                    self, "Confirmation",
-                    "Are you sure you want to perform pyradiomics? Once "
-                    "started the process cannot be terminated until it "
-                    "finishes.",
-                    QMessageBox.Yes,
-                    QMessageBox.No)
-                if confirm_pyradi == QMessageBox.Yes:
-                    self.run_pyradiomics.emit(path, filepaths, hashed_path)
-                if confirm_pyradi == QMessageBox.No:
-                    pass
-            else:
+        if hashed_path == '':
+            confirm_pyradi = QMessageBox.information(
+                self, "Confirmation",
+                "Are you sure you want to perform pyradiomics? Once "
+                "started the process cannot be terminated until it "
+                "finishes.",
+                QMessageBox.Yes,
+                QMessageBox.No)
+            if confirm_pyradi == QMessageBox.Yes:
                 self.run_pyradiomics.emit(path, filepaths, hashed_path)
+            if confirm_pyradi == QMessageBox.No:
+                pass
         else:
-            exe_not_found = QMessageBox.information(
-                self, "Error",
-                "Plastimatch not installed. Please install Plastimatch "
-                "(https://sourceforge.net/projects/plastimatch/) to carry out "
-                "pyradiomics analysis. If using Windows, please ensure that "
-                "your system's PATH variable inlcudes the directory where "
-                "Plastimatch's executable is installed.")
+            self.run_pyradiomics.emit(path, filepaths, hashed_path)
 
     def cleanup(self):
         patient_dict_container = PatientDictContainer()
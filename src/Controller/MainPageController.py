@@ -3,11 +3,8 @@
 import csv
 import math
 
-import matplotlib.cbook
-import matplotlib.pyplot as plt1
 from PySide6 import QtWidgets, QtCore, QtGui
 from dateutil.relativedelta import relativedelta
-from matplotlib.backend_bases import MouseEvent
 
 import src.constants as constant
 from src.Model.Anon import anonymize
@@ -16,12 +13,23 @@ from src.Model.Transform import linear_transform
 from src.Controller.PathHandler import resource_path
 from src.View.mainpage import ClinicalDataView
 
-matplotlib.cbook.handle_exceptions = "print"  # default
-matplotlib.cbook.handle_exceptions = "raise"
-matplotlib.cbook.handle_exceptions = "ignore"
 
-# matplotlib.cobook.handle_exceptions = my_logger
-# will be called with exception as argument
+def import_pyplot():
+    """
+    Import matplotlib.pyplot on first use. matplotlib is slow to import
+    and is only needed once a transect is drawn.
+    :return: The matplotlib.pyplot module
+    """
+    import matplotlib.cbook
+    import matplotlib.pyplot as plt1
+
+    matplotlib.cbook.handle_exceptions = "print"  # default
+    matplotlib.cbook.handle_exceptions = "raise"
+    matplotlib.cbook.handle_exceptions = "ignore"
+
+    # matplotlib.cobook.handle_exceptions = my_logger
+    # will be called with exception as argument
+    return plt1
 
 # The following code are global functions and data/variables used by both
 # Clinical Data form and Display classes
@@ -121,6 +129,7 @@ class Transect(QtWidgets.QGraphicsScene):
     # 2D view of the scan
     def mousePressEvent(self, event):
         # Clear the current transect first
+        plt1 = import_pyplot()
         plt1.close()
         # If is the first time we can draw as we want a line per button press
         if self.drawing:
@@ -209,6 +218,7 @@ class Transect(QtWidgets.QGraphicsScene):
 
     # This function handles the closing event of the transect graph
     def on_close(self, event):
+        plt1 = import_pyplot()
         plt1.close()
 
         # returns the main page back to a non-drawing environment
@@ -236,6 +246,7 @@ class Transect(QtWidgets.QGraphicsScene):
 
     # This function plots the Transect graph into a pop up window
     def plot_result(self):
+        plt1 = import_pyplot()
         plt1.close('all')
         new_list = [(x * self.pix_spacing) for x in self.distances]
         self.thresholds[0] = new_list[1]
@@ -310,6 +321,8 @@ class Transect(QtWidgets.QGraphicsScene):
             self._figure.canvas.draw()
 
     def _add_point(self, x, y=None):
+        from matplotlib.backend_bases import MouseEvent
+
         if self.is_ROI_draw:
             if isinstance(x, MouseEvent):
                 x = int(x.xdata)
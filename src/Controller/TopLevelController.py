@@ -90,9 +90,7 @@ class Controller:
             self.main_window.update_ui()
 
         if isinstance(self.image_fusion_window, ImageFusionWindow):
-            progress_window.update_progress(
-                ("Registering Images...\nThis may take a few minutes.", 
-                90))
+            progress_window.update_progress(("Loading Image Fusion", 95))
             self.main_window.update_image_fusion_ui()
 
         if isinstance(self.pt_ct_window, OpenPTCTPatientWindow):
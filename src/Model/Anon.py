@@ -7,31 +7,51 @@ import pathlib
 import shutil
 import uuid
 
-import pandas as pd
 import pydicom
+from pydicom.datadict import dictionary_VR, tag_for_keyword
 
-try:
-    import pymedphys.experimental.pseudonymisation as pseudonymise
+from src.Model.ForkPool import map_forked
+
+# pymedphys is slow to import and only needed when anonymising, so it is
+# imported by _import_pymedphys() on the first call to anonymize().
+FEATURE_TOGGLE_PSEUDONYMISE = True
+pseudonymise = None
+create_filename_from_dataset = None
+pmp_anonymise = None
+
+
+def _import_pymedphys():
+    """Import the pymedphys functions used for pseudonymisation into the
+    module namespace, if they have not been imported yet.
+    """
+    global FEATURE_TOGGLE_PSEUDONYMISE, pseudonymise, \
+        create_filename_from_dataset, pmp_anonymise
+    if pmp_anonymise is not None:
+        return
 
     try:
-        # pymedphys 0.33.x
-        from pymedphys._dicom.anonymise import create_filename_from_dataset
+        import pymedphys.experimental.pseudonymisation as pseudonymise
 
-        logging.warning(
-            "Using deprecated version of pymedphys, please upgrade to "
-            "0.34.0 or newer"
-        )
-    except:
-        # pymedphys 0.34.x
-        from pymedphys._dicom.anonymise.core import \
-            create_filename_from_dataset
-    from pymedphys.dicom import anonymise as pmp_anonymise
+        try:
+            # pymedphys 0.33.x
+            from pymedphys._dicom.anonymise import \
+                create_filename_from_dataset
+
+            logging.warning(
+                "Using deprecated version of pymedphys, please upgrade to "
+                "0.34.0 or newer"
+            )
+        except:
+            # pymedphys 0.34.x
+            from pymedphys._dicom.anonymise.core import \
+                create_filename_from_dataset
+        from pymedphys.dicom import anonymise as pmp_anonymise
 
-    FEATURE_TOGGLE_PSEUDONYMISE = True
-except ImportError as ePymedphysImportFailed:
-    FEATURE_TOGGLE_PSEUDONYMISE = False
-    logging.error(ePymedphysImportFailed)
-    raise
+        FEATURE_TOGGLE_PSEUDONYMISE = True
+    except ImportError as ePymedphysImportFailed:
+        FEATURE_TOGGLE_PSEUDONYMISE = False
+        logging.error(ePymedphysImportFailed)
+        raise
 
 
 # ============================Anonymization code ==============================
@@ -221,6 +241,8 @@ def _create_reidentification_spreadsheet(p_name, sha1_p_name, csv_filename):
     -------
 
     """
+    import pandas as pd
+
     # print("Csv file name is : ",csv_filename)
     # chcek if the patientHash.csv exist
     csv_exist, csv_file_path = _check_identity_mapping_file_exists(
@@ -679,6 +701,278 @@ def _workaround_hacks_for_pmp_pseudo(ds_input: pydicom.dataset.Dataset):
     pass
 
 
+def _get_uid_keywords(identifying_keywords):
+    """Select the identifying keywords of UID attributes
+
+    Parameters
+    ----------
+    identifying_keywords : ``list`` of ``str``
+        keywords of the attributes to be pseudonymised
+
+    Returns
+    -------
+    ``set`` of ``str``
+        the keywords whose value representation is UI
+    """
+    uid_keywords = set()
+    for keyword in identifying_keywords:
+        tag = tag_for_keyword(keyword)
+        if tag is not None and dictionary_VR(tag) == "UI":
+            uid_keywords.add(keyword)
+    return uid_keywords
+
+
+def _pseudonymise_uid(uid, uid_map):
+    """Look up the pseudonym of a UID, falling back on pseudonymising it
+    for UIDs that are not in the map
+
+    Parameters
+    ----------
+    uid : ``str``
+        the UID to be replaced
+
+    uid_map : ``dict`` with key and value of type ``str``
+        the pseudonym of every UID of the patient's DICOM data
+
+    Returns
+    -------
+    ``str``
+        the pseudonym of the UID
+    """
+    pseudonym = uid_map.get(uid)
+    if pseudonym is None:
+        pseudonym = pseudonymise.pseudonymisation_dispatch["UI"](uid)
+    return pseudonym
+
+
+def _create_uid_map(datasets, uid_keywords):
+    """Map every identifying UID of the patient's DICOM data to its
+    pseudonym, so that a UID is replaced by the same pseudonym in the file
+    that defines it and in the files that refer to it, e.g. the structure
+    set, dose and plan referring to each other and to the images, whichever
+    process anonymises them
+
+    Parameters
+    ----------
+    datasets : ``dict`` with values of ``pydicom.dataset.Dataset``
+        The set of DICOM data for the patient to be anonymised
+
+    uid_keywords : ``set`` of ``str``
+        keywords of the UID attributes to be pseudonymised
+
+    Returns
+    -------
+    ``dict`` with key and value of type ``str``
+        the pseudonym of every UID
+    """
+    uid_map = {}
+
+    def add_uids(dataset, data_element):
+        if data_element.keyword not in uid_keywords \
+                or not data_element.value:
+            return
+        uids = data_element.value if data_element.VM > 1 \
+            else [data_element.value]
+        for uid in uids:
+            if uid not in uid_map:
+                uid_map[uid] = _pseudonymise_uid(uid, uid_map)
+
+    for dicom_object_as_dataset in datasets.values():
+        dicom_object_as_dataset.walk(add_uids)
+    return uid_map
+
+
+def _replace_uids_in_place(ds_input, uid_map, uid_keywords):
+    """Replace the identifying UIDs of a dataset, including those in
+    sequences, with their pseudonyms
+
+    Parameters
+    ----------
+    ds_input : ``pydicom.dataset.Dataset``
+        the DICOM object to be modified
+
+    uid_map : ``dict`` with key and value of type ``str``
+        the pseudonym of every UID of the patient's DICOM data
+
+    uid_keywords : ``set`` of ``str``
+        keywords of the UID attributes to be pseudonymised
+    """
+
+    def replace_uids(dataset, data_element):
+        if data_element.keyword not in uid_keywords \
+                or not data_element.value:
+            return
+        if data_element.VM > 1:
+            data_element.value = [_pseudonymise_uid(uid, uid_map)
+                                  for uid in data_element.value]
+        else:
+            data_element.value = _pseudonymise_uid(data_element.value,
+                                                   uid_map)
+
+    ds_input.walk(replace_uids)
+
+
+def _read_dataset_to_anonymise(key, datasets, file_paths):
+    """Get a DICOM object to be anonymised. Images are read from their
+    file, so that only one image at a time is held by the process and the
+    bytes of the pixel data are written back unchanged, as pydicom only
+    decodes them when the pixel array is requested. The other objects,
+    which may have been modified since they were loaded, are taken from
+    the set of DICOM data.
+
+    Parameters
+    ----------
+    key : ``str`` | ``int``
+        key of the DICOM object in the set of DICOM data
+
+    datasets : ``dict`` with values of ``pydicom.dataset.Dataset``
+        The set of DICOM data for the patient to be anonymised
+
+    file_paths : ``dict`` with values of ``str``
+        the path of the file of every DICOM object
+
+    Returns
+    -------
+    ``pydicom.dataset.Dataset``, ``bool``
+        the DICOM object, and whether it is shared with the set of DICOM
+        data and has to be copied before it is modified
+    """
+    file_path = file_paths.get(key)
+    if str(key).isnumeric() and file_path is not None \
+            and os.path.isfile(file_path):
+        return pydicom.dcmread(file_path), False
+    return datasets[key], True
+
+
+def _anonymise_file(key, datasets, file_paths, uid_map, uid_keywords,
+                    identifying_keywords, anonymised_patient_full_path):
+    """Pseudonymise one DICOM object of the patient and save it in the
+    anonymisation folder
+
+    Parameters
+    ----------
+    key : ``str`` | ``int``
+        key of the DICOM object in the set of DICOM data
+
+    datasets : ``dict`` with values of ``pydicom.dataset.Dataset``
+        The set of DICOM data for the patient to be anonymised
+
+    file_paths : ``dict`` with values of ``str``
+        the path of the file of every DICOM object
+
+    uid_map : ``dict`` with key and value of type ``str``
+        the pseudonym of every UID of the patient's DICOM data
+
+    uid_keywords : ``set`` of ``str``
+        keywords of the UID attributes to be pseudonymised
+
+    identifying_keywords : ``list`` of ``str``
+        keywords of the other attributes to be pseudonymised
+
+    anonymised_patient_full_path : ``pathlib.Path``
+        the folder the anonymised data is placed in
+
+    Returns
+    -------
+    ``str``
+        the path of the anonymised DICOM file
+    """
+    dicom_object_as_dataset, is_shared = _read_dataset_to_anonymise(
+        key, datasets, file_paths)
+    # _workaround_hacks_for_pmp_pseudo(dicom_object_as_dataset)
+    # Leave series description alone for SRs, as OnkoDICOM checks
+    # this tag when determining what is stored in the SR
+    if dicom_object_as_dataset.SOPClassUID.name == "Comprehensive SR Storage":
+        leave_unchanged = ["PatientSex", "PatientWeight",
+                           "PatientSize", "SeriesDescription"]
+    else:
+        # Leave PatientWeight and PatientSize unmodified per @AAM
+        leave_unchanged = ["PatientSex", "PatientWeight",
+                           "PatientSize"]
+
+    # Objects read from file are anonymised in place instead of copied
+    ds_pseudo = pmp_anonymise(
+        dicom_object_as_dataset,
+        keywords_to_leave_unchanged=leave_unchanged,
+        copy_dataset=is_shared,
+        replacement_strategy=pseudonymise.pseudonymisation_dispatch,
+        identifying_keywords=identifying_keywords,
+    )
+    if not is_shared:
+        ds_pseudo = dicom_object_as_dataset
+    # The UIDs are replaced using the map, so that references between
+    # files are kept
+    _replace_uids_in_place(ds_pseudo, uid_map, uid_keywords)
+    if hasattr(ds_pseudo, "file_meta"):
+        _replace_uids_in_place(ds_pseudo.file_meta, uid_map, uid_keywords)
+    # PatientSex has specific values that are valid.
+    # pseudonymisation doesn't handle that any better than other
+    # anonymisation techniques. above, it's left alone.  But it
+    # could be set to empty or it could be set to O. But
+    # clinically... the gender of the patient can be quite relevant
+    # and if the organ involved or imaged is sex linked or sex
+    # influenced (breast, prostate, ovary), "hiding" the gender in
+    # the metadata may not really prevent re-identification of the
+    # gender/PatientSex
+
+    # Manually specify new name for comprehensive SR files, as
+    # pymedphys cannot handle them.
+    if ds_pseudo.SOPClassUID.name == "Comprehensive SR Storage":
+        ds_pseudo_full_path = \
+            anonymised_patient_full_path.joinpath(
+                ("SR." + ds_pseudo.SOPInstanceUID + ".dcm"))
+    else:
+        ds_pseudo_full_path = create_filename_from_dataset(
+            ds_pseudo, anonymised_patient_full_path)
+    ds_pseudo.save_as(ds_pseudo_full_path)
+    return str(ds_pseudo_full_path)
+
+
+def _anonymise_files(datasets, file_paths, anonymised_patient_full_path,
+                     max_workers=None):
+    """Pseudonymise every DICOM object of the patient and save them in the
+    anonymisation folder. On fork-safe platforms the files are anonymised
+    by a pool of worker processes.
+
+    Parameters
+    ----------
+    datasets : ``dict`` with values of ``pydicom.dataset.Dataset``
+        The set of DICOM data for the patient to be anonymised
+
+    file_paths : ``dict`` with values of ``str``
+        the path of the file of every DICOM object
+
+    anonymised_patient_full_path : ``pathlib.Path``
+        the folder the anonymised data is placed in
+
+    max_workers : ``int``
+        Number of worker processes. Defaults to the CPU count.
+
+    Returns
+    -------
+    ``list`` of ``str``
+        the paths of the anonymised DICOM files
+    """
+    # workaround for pseudonymisation failing when faced with SQ that
+    # are identifiers. it was designed to pseudonymise what is *in* a
+    # SQ. identifying_keywords_less_sequences = [ x for x in
+    # pseudonymise.get_default_pseudonymisation_keywords() if not
+    # x.endswith("Sequence") ]
+    identifying_keywords = \
+        pseudonymise.get_default_pseudonymisation_keywords()
+    # The UIDs are mapped once by this process, instead of being
+    # pseudonymised by every worker
+    uid_keywords = _get_uid_keywords(identifying_keywords)
+    identifying_keywords = [keyword for keyword in identifying_keywords
+                            if keyword not in uid_keywords]
+    uid_map = _create_uid_map(datasets, uid_keywords)
+    return map_forked(_anonymise_file, datasets,
+                      shared=(datasets, file_paths, uid_map, uid_keywords,
+                              identifying_keywords,
+                              anonymised_patient_full_path),
+                      max_workers=max_workers)
+
+
 def anonymize(path, datasets, file_paths, rawdvh):
     """
     Create an anonymised copy of an entire patient data set, including
@@ -700,7 +994,8 @@ def anonymize(path, datasets, file_paths, rawdvh):
 
     file_paths: ``list`` of ``string``
         The list of fully or partially qualified (relative to current working
-        directory) filenames pointing to the patient's DICOM data
+        directory) filenames pointing to the patient's DICOM data. The
+        images are anonymised from these files rather than from datasets
 
     rawdvh: ``dict`` with key = ROINumber, value = DVH
         a representation of the Dose Volume Histogram
@@ -711,6 +1006,7 @@ def anonymize(path, datasets, file_paths, rawdvh):
         The fully qualified directory name where the anonymised data has been
         placed
     """
+    _import_pymedphys()
 
     all_filepaths = file_paths
     new_dict_dataset = datasets
@@ -783,50 +1079,8 @@ def anonymize(path, datasets, file_paths, rawdvh):
         )
 
         os.makedirs(anonymised_patient_full_path, exist_ok=True)
-        # workaround for pseudonymisation failing when faced with SQ that
-        # are identifiers. it was designed to pseudonymise what is *in* a
-        # SQ. identifying_keywords_less_sequences = [ x for x in
-        # pseudonymise.get_default_pseudonymisation_keywords() if not
-        # x.endswith("Sequence") ]
-        for key, dicom_object_as_dataset in new_dict_dataset.items():
-            # _workaround_hacks_for_pmp_pseudo(dicom_object_as_dataset)
-            # Leave series description alone for SRs, as OnkoDICOM checks
-            # this tag when determining what is stored in the SR
-            if dicom_object_as_dataset.SOPClassUID.name == "Comprehensive SR Storage":
-                leave_unchanged = ["PatientSex", "PatientWeight",
-                                   "PatientSize", "SeriesDescription"]
-            else:
-                # Leave PatientWeight and PatientSize unmodified per @AAM
-                leave_unchanged = ["PatientSex", "PatientWeight",
-                                   "PatientSize"]
-
-            ds_pseudo = pmp_anonymise(
-                dicom_object_as_dataset,
-                keywords_to_leave_unchanged=leave_unchanged,
-                replacement_strategy=pseudonymise.pseudonymisation_dispatch,
-                identifying_keywords=
-                pseudonymise.get_default_pseudonymisation_keywords(),
-            )
-            # PatientSex has specific values that are valid.
-            # pseudonymisation doesn't handle that any better than other
-            # anonymisation techniques. above, it's left alone.  But it
-            # could be set to empty or it could be set to O. But
-            # clinically... the gender of the patient can be quite relevant
-            # and if the organ involved or imaged is sex linked or sex
-            # influenced (breast, prostate, ovary), "hiding" the gender in
-            # the metadata may not really prevent re-identification of the
-            # gender/PatientSex
-
-            # Manually specify new name for comprehensive SR files, as
-            # pymedphys cannot handle them.
-            if ds_pseudo.SOPClassUID.name == "Comprehensive SR Storage":
-                ds_pseudo_full_path = \
-                    anonymised_patient_full_path.joinpath(
-                        ("SR." + ds_pseudo.SOPInstanceUID + ".dcm"))
-            else:
-                ds_pseudo_full_path = create_filename_from_dataset(
-                    ds_pseudo, anonymised_patient_full_path)
-            ds_pseudo.save_as(ds_pseudo_full_path)
+        _anonymise_files(new_dict_dataset, all_filepaths,
+                         anonymised_patient_full_path)
 
     print("\n\nThe New patient folder path is : ",
           anonymised_patient_full_path)
@@ -1063,6 +1317,8 @@ def _export_anonymised_spreadsheet_data(
         of identifying information. e.g. {"Directory
         Path":"/home/sweet/home",}
     """
+    import pandas as pd
+
     logging.debug("starting %s spreadsheet anonymisation",
                   spreadsheet_type_name)
 
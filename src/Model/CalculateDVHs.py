@@ -1,12 +1,18 @@
 import multiprocessing
+import os
+import shutil
+import struct
+import tempfile
+from pathlib import Path
 
 from dicompylercore.dvh import DVH
 import numpy as np
-import pandas as pd
-from dicompylercore import dvhcalc
+from pydicom import dcmread, dcmwrite
+from pydicom.dataelem import RawDataElement
 from pydicom.dataset import Dataset
 from pydicom.sequence import Sequence
 from pydicom.tag import Tag
+from pydicom.uid import DeflatedExplicitVRLittleEndian
 from src.Model.PatientDictContainer import PatientDictContainer
 
 
@@ -46,6 +52,8 @@ def multi_get_dvhs(rtss, dose, roi, queue, dose_limit=None):
     :param queue: The queue for multiprocessing tasks
     :param dose_limit:
     """
+    from dicompylercore import dvhcalc
+
     dvh = {}
     # Calculate dvh for the roi under dose_limit
     dvh[roi] = dvhcalc.get_dvh(rtss, dose, roi, dose_limit)
@@ -145,6 +153,8 @@ def dvh2pandas(dict_dvh, patient_id):
     :param patient_id: Patient Identifier
     :return: pddf, dvh data converted to pandas Dataframe
     """
+    import pandas as pd
+
     csv_header = []
     csv_header.append('Patient ID')
     csv_header.append('ROI')
@@ -204,13 +214,33 @@ def dvh2csv(dict_dvh, path, csv_name, patient_id):
     pddf_csv.to_csv(tar_path)
 
 
-def dvh2rtdose(dict_dvh):
+def format_dvh_data(dvh):
     """
-    Export dvh data to RT DOSE file.
+    Format the curve of a DVH as the value of a DVHData element.
+    :param dvh: DVH
+    :return: The DVHData value as bytes, alternating the width and the
+        volume of every bin as decimal strings.
+    """
+    widths = np.diff(np.asarray(dvh.bins, dtype=np.float64))
+    counts = np.asarray(dvh.counts, dtype=np.float64)
+    dvh_data = np.column_stack((widths, counts)).ravel()
+
+    # DS values are limited to 16 characters, which %.8g always fits in.
+    value = "\\".join(np.char.mod("%.8g", dvh_data).tolist())
+    if len(value) % 2:
+        value += " "
+    return value.encode("ascii")
+
+
+def create_dvh_sequence(dict_dvh, is_implicit_vr=False,
+                        is_little_endian=True):
+    """
+    Create the DVHSequence of an RT Dose.
     :param dict_dvh: A dictionary of DVH {ROINumber: DVH}
-    :param patient_id: Patient Identifier
+    :param is_implicit_vr: Whether the RT Dose is implicit VR.
+    :param is_little_endian: Whether the RT Dose is little endian.
+    :return: DVHSequence
     """
-    # Create DVH sequence
     dvh_sequence = Sequence([])
 
     # Add DVHs to the sequence
@@ -225,14 +255,15 @@ def dvh2rtdose(dict_dvh):
         new_ds.add_new(Tag("DVHDoseScaling"), "DS", "1.0")
         new_ds.add_new(Tag("DVHVolumeUnits"), "CS",
                        dict_dvh[ds].volume_units.upper())
-        new_ds.add_new(Tag("DVHNumberOfBins"), "IS", len(dict_dvh[ds].bins))
+        new_ds.add_new(Tag("DVHNumberOfBins"), "IS", len(dict_dvh[ds].counts))
 
-        # Calculate and add DVH data
-        dvh_data = []
-        for i in range(len(dict_dvh[ds].counts)):
-            dvh_data.append(str(dict_dvh[ds].bins[1]))
-            dvh_data.append(str(dict_dvh[ds].counts[i]))
-        new_ds.add_new(Tag("DVHData"), "DS", dvh_data)
+        # Add DVH data. The values are kept encoded, so that thousands of
+        # DS values are not created just to be written out again. They
+        # are decoded when the element is first accessed.
+        dvh_data = format_dvh_data(dict_dvh[ds])
+        new_ds[Tag("DVHData")] = RawDataElement(
+            Tag("DVHData"), "DS", len(dvh_data), dvh_data, 0,
+            is_implicit_vr, is_little_endian)
 
         # Reference ROI sequence dataset/sequence
         referenced_roi_sequence = Dataset()
@@ -245,12 +276,74 @@ def dvh2rtdose(dict_dvh):
         # Add new DVH dataset to DVH sequences
         dvh_sequence.append(new_ds)
 
-    # Save new RT DOSE
+    return dvh_sequence
+
+
+def write_dvh_sequence(path, dvh_sequence):
+    """
+    Replace the DVHSequence of an RT Dose file. Only the elements before
+    the pixel data are written again, the pixel data and anything after
+    it is copied from the original file as it is. The file is written to
+    a temporary file first, which then replaces the original, so that an
+    interrupted save leaves the original file intact.
+    :param path: Path of the RT Dose file.
+    :param dvh_sequence: The new DVHSequence.
+    """
+    path = Path(path)
+    with open(path, "rb") as original:
+        # Stopping before the pixels leaves the file at the start of the
+        # pixel data element, or at the end of the file without one.
+        header = dcmread(original, stop_before_pixels=True)
+        pixel_data_offset = original.tell()
+
+        tag_bytes = original.read(4)
+        original.seek(pixel_data_offset)
+        byte_order = "<" if header.is_little_endian else ">"
+        pixel_data_tag = struct.pack(byte_order + "HH", 0x7FE0, 0x0010)
+        if header.file_meta.get("TransferSyntaxUID") == DeflatedExplicitVRLittleEndian \
+                or tag_bytes not in (b"", pixel_data_tag):
+            raise ValueError("Pixel data of %s can not be copied" % path)
+
+        header.DVHSequence = dvh_sequence
+
+        file_descriptor, temp_path = tempfile.mkstemp(
+            prefix=path.name, suffix=".tmp", dir=path.parent)
+        try:
+            with os.fdopen(file_descriptor, "wb") as temp_file:
+                dcmwrite(temp_file, header, write_like_original=True)
+                shutil.copyfileobj(original, temp_file)
+            shutil.copymode(path, temp_path)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+
+def dvh2rtdose(dict_dvh):
+    """
+    Export dvh data to RT DOSE file.
+    :param dict_dvh: A dictionary of DVH {ROINumber: DVH}
+    """
     patient_dict_container = PatientDictContainer()
-    patient_dict_container.dataset['rtdose'].DVHSequence = dvh_sequence
+    rt_dose = patient_dict_container.dataset['rtdose']
+    dvh_sequence = create_dvh_sequence(dict_dvh, rt_dose.is_implicit_VR,
+                                       rt_dose.is_little_endian)
 
+    # Save new RT DOSE
+    rt_dose.DVHSequence = dvh_sequence
     path = patient_dict_container.filepaths['rtdose']
-    patient_dict_container.dataset['rtdose'].save_as(path)
+    try:
+        write_dvh_sequence(path, dvh_sequence)
+    except ValueError:
+        # Save the whole dataset instead, to a temporary file first.
+        temp_path = str(path) + ".tmp"
+        try:
+            rt_dose.save_as(temp_path)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
 
 
 def rtdose2dvh():
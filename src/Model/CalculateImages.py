@@ -1,4 +1,3 @@
-import cv2
 import numpy as np
 import pydicom
 from PySide6 import QtCore, QtGui
@@ -103,21 +102,7 @@ def scaled_pixmap(np_pixels, window, level, width, height,
     :param color: String for conversion of pixels to specified color map
     :return: pixmap, a QPixmap of the slice
     """
-
-    # Rescale pixel arrays
-    np_pixels = np_pixels.astype(np.int16)
-    if window != 0 and level != 0:
-        # Transformation applied to each individual pixel to unique
-        # contrast level
-        np_pixels = (np_pixels - level) / window * 255
-    else:
-        max_val = np.amax(np_pixels)
-        min_val = np.amin(np_pixels)
-        np_pixels = (np_pixels - min_val) / (max_val - min_val) * 255
-
-    np_pixels[np_pixels < 0] = 0
-    np_pixels[np_pixels > 255] = 255
-    np_pixels = np_pixels.astype(np.int8)
+    np_pixels = window_pixels(np_pixels, window, level)
 
     # Process heatmap for conversion of the np_pixels to rgb for the purpose
     # of displaying the PT/CT view in RGB colorspace.
@@ -150,6 +135,35 @@ def scaled_pixmap(np_pixels, window, level, width, height,
     return pixmap
 
 
+def window_pixels(np_pixels, window, level):
+    """
+    Apply the window and level to the numpy pixels of an image.
+
+    :param np_pixels: A pixel array
+    :param window: Window width of windowing function
+    :param level: Level value of windowing function
+    :return: np_pixels, a uint8 array of the windowed pixels
+    """
+    # Rescale pixel arrays. Floating point pixels, i.e. SUV, keep their
+    # fractions.
+    if np.issubdtype(np_pixels.dtype, np.floating):
+        np_pixels = np_pixels.astype(np.float32)
+    else:
+        np_pixels = np_pixels.astype(np.int16)
+    if window != 0 and level != 0:
+        # Transformation applied to each individual pixel to unique
+        # contrast level
+        np_pixels = (np_pixels - level) / window * 255
+    else:
+        max_val = np.amax(np_pixels)
+        min_val = np.amin(np_pixels)
+        np_pixels = (np_pixels - min_val) / (max_val - min_val) * 255
+
+    np_pixels[np_pixels < 0] = 0
+    np_pixels[np_pixels > 255] = 255
+    return np_pixels.astype(np.uint8)
+
+
 def convert_pt_to_heatmap(np_pixels):
     """
     Converts the grayscale of the pixel array associated with the PET images
@@ -158,6 +172,8 @@ def convert_pt_to_heatmap(np_pixels):
     Returns:
         qimage [Qimage]: The converted heatmap
     """
+    import cv2
+
     # Conversion of the array to UINT8, color spaces do not like int8.
     arr8 = np_pixels.astype(np.uint8)
 
@@ -195,7 +211,7 @@ def get_pixmaps(pixel_array, window, level, pixmap_aspect,
     :return: dict_pixmaps, a dictionary of all pixmaps within the patient.
     """
     # Convert pixel array to numpy 3d array
-    pixel_array_3d = np.array(pixel_array)
+    pixel_array_3d = np.asarray(pixel_array)
 
     # Pixmaps dictionaries of 3 views
     dict_pixmaps_axial = {}
@@ -0,0 +1,347 @@
+"""
+On-disk cache of calculated DVHs.
+
+Calculating the DVHs of every ROI is the slowest part of opening a
+patient, and used to be avoided by writing the DVHs into the DVHSequence
+of the RTDOSE file. Instead, DVHs are stored in a sqlite database in the
+hidden directory, keyed by a hash of the contour data of the ROI, the
+dose grid, the DVH bin width and the calculation parameters. Modifying
+an ROI, or opening a different RTDOSE, therefore misses the cache
+without any bookkeeping, and the clinical RTDOSE is left untouched.
+
+Example usage:
+dict_dvh = calc_dvhs_with_cache(dataset_rtss, dataset_rtdose, rois,
+                                dict_thickness, interrupt_flag)
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from src.Model.ForkPool import imap_forked
+
+# Version of the stored format. Changing it invalidates every stored DVH.
+CACHE_VERSION = 1
+
+# Width in Gy of the dose bins dicompylercore calculates DVHs with
+DVH_BIN_WIDTH = 0.01
+
+# Keywords of the RTDOSE that, together with the pixel data, define the
+# dose grid.
+DOSE_GRID_KEYWORDS = ['Rows', 'Columns', 'BitsAllocated',
+                      'PixelRepresentation', 'DoseGridScaling', 'DoseUnits',
+                      'ImagePositionPatient', 'ImageOrientationPatient',
+                      'PixelSpacing', 'GridFrameOffsetVector']
+
+
+def get_dose_grid_hash(dataset_rtdose):
+    """
+    :param dataset_rtdose: RTDOSE DICOM dataset object.
+    :return: Hex digest identifying the dose grid.
+    """
+    digest = hashlib.sha1()
+    for keyword in DOSE_GRID_KEYWORDS:
+        value = dataset_rtdose.get(keyword)
+        if value is not None and not isinstance(value, (str, int, float)):
+            value = [float(element) for element in value]
+        digest.update(json.dumps(value, default=str).encode())
+    digest.update(dataset_rtdose.PixelData)
+    return digest.hexdigest()
+
+
+def get_roi_contour_hashes(dataset_rtss):
+    """
+    :param dataset_rtss: RTSTRUCT DICOM dataset object.
+    :return: Dictionary of ROI number to the hex digest of the contour
+        data of the ROI.
+    """
+    roi_contour_hashes = {}
+    for roi_contour in dataset_rtss.ROIContourSequence:
+        digest = hashlib.sha1()
+        for contour in roi_contour.get("ContourSequence", []):
+            contour_data = np.asarray(contour.ContourData, dtype=np.float64)
+            digest.update(contour_data.tobytes())
+            # Separate the contours, so that moving a point from one
+            # contour to the next changes the hash.
+            digest.update(b"|")
+        roi_contour_hashes[roi_contour.ReferencedROINumber] = \
+            digest.hexdigest()
+    return roi_contour_hashes
+
+
+def get_dvh_keys(dataset_rtss, dataset_rtdose, rois, dict_thickness,
+                 dose_limit=None):
+    """
+    :param dataset_rtss: RTSTRUCT DICOM dataset object.
+    :param dataset_rtdose: RTDOSE DICOM dataset object.
+    :param rois: Dictionary of ROI information.
+    :param dict_thickness: Dictionary where the keys are ROI numbers and
+        the values are thicknesses of the ROI.
+    :param dose_limit: Limit of dose for DVH calculation.
+    :return: Dictionary of ROI number to cache key. ROIs without contour
+        data are left out.
+    """
+    dose_grid_hash = get_dose_grid_hash(dataset_rtdose)
+    roi_contour_hashes = get_roi_contour_hashes(dataset_rtss)
+
+    dvh_keys = {}
+    for roi in rois:
+        if roi not in roi_contour_hashes:
+            continue
+        key = json.dumps([CACHE_VERSION, roi_contour_hashes[roi],
+                          dose_grid_hash, DVH_BIN_WIDTH,
+                          dict_thickness.get(roi), dose_limit])
+        dvh_keys[roi] = hashlib.sha1(key.encode()).hexdigest()
+    return dvh_keys
+
+
+class DVHCache:
+    """
+    The sqlite database DVHs are stored in. A connection is opened for
+    every lookup, so that the cache can be used from worker threads.
+    """
+
+    def __init__(self, db_file_path=None):
+        """
+        :param db_file_path: Path of the database. Defaults to
+            DVHCache.db in the hidden directory.
+        """
+        if db_file_path is None:
+            if 'USER_ONKODICOM_HIDDEN' not in os.environ:
+                from src.Model.Configuration import set_up_hidden_dir
+                set_up_hidden_dir()
+            db_file_path = Path(
+                os.environ['USER_ONKODICOM_HIDDEN']).joinpath('DVHCache.db')
+        self.db_file_path = db_file_path
+        self.set_up_cache_db()
+
+    def set_up_cache_db(self):
+        """
+        Create the DVH table inside the SQLite database
+        """
+        connection = sqlite3.connect(self.db_file_path)
+        connection.execute("""
+                    CREATE TABLE IF NOT EXISTS DVH (
+                        key TEXT PRIMARY KEY,
+                        counts BLOB,
+                        bins BLOB,
+                        attributes TEXT
+                    );
+                """)
+        connection.commit()
+        connection.close()
+
+    def get_dvhs(self, dvh_keys):
+        """
+        :param dvh_keys: Dictionary of ROI number to cache key.
+        :return: Dictionary of ROI number to DVH, for the ROIs found in
+            the cache.
+        """
+        from dicompylercore.dvh import DVH
+
+        if not dvh_keys:
+            return {}
+
+        rois = {key: roi for roi, key in dvh_keys.items()}
+        connection = sqlite3.connect(self.db_file_path)
+        try:
+            placeholders = ",".join("?" * len(rois))
+            rows = connection.execute(
+                "SELECT key, counts, bins, attributes FROM DVH "
+                "WHERE key IN (" + placeholders + ")",
+                list(rois)).fetchall()
+        except sqlite3.Error:
+            rows = []
+        finally:
+            connection.close()
+
+        dict_dvh = {}
+        for key, counts, bins, attributes in rows:
+            attributes = json.loads(attributes)
+            dict_dvh[rois[key]] = DVH(
+                np.frombuffer(counts, dtype=np.float64).copy(),
+                np.frombuffer(bins, dtype=np.float64).copy(),
+                **attributes)
+        return dict_dvh
+
+    def put_dvhs(self, dvh_keys, dict_dvh):
+        """
+        :param dvh_keys: Dictionary of ROI number to cache key.
+        :param dict_dvh: Dictionary of ROI number to DVH.
+        """
+        rows = []
+        for roi, dvh in dict_dvh.items():
+            if roi not in dvh_keys:
+                continue
+            color = dvh.color
+            if color is not None:
+                color = [int(value) for value in color]
+            rx_dose = dvh.rx_dose
+            if rx_dose is not None:
+                rx_dose = float(rx_dose)
+            attributes = {
+                "dvh_type": dvh.dvh_type,
+                "dose_units": dvh.dose_units,
+                "volume_units": dvh.volume_units,
+                "rx_dose": rx_dose,
+                "name": dvh.name,
+                "color": color,
+            }
+            rows.append((dvh_keys[roi],
+                         np.asarray(dvh.counts, dtype=np.float64).tobytes(),
+                         np.asarray(dvh.bins, dtype=np.float64).tobytes(),
+                         json.dumps(attributes)))
+
+        connection = sqlite3.connect(self.db_file_path)
+        try:
+            connection.executemany(
+                "INSERT OR REPLACE INTO DVH (key, counts, bins, attributes) "
+                "VALUES (?, ?, ?, ?)", rows)
+            connection.commit()
+        except sqlite3.Error:
+            # The cache is only an optimisation, a DVH that can not be
+            # stored is calculated again next time.
+            pass
+        finally:
+            connection.close()
+
+
+def get_cached_dvhs(dataset_rtss, dataset_rtdose, rois, dict_thickness,
+                    dose_limit=None, dvh_cache=None, dvh_keys=None):
+    """
+    Look up the DVH of every ROI in the cache.
+    :param dataset_rtss: RTSTRUCT DICOM dataset object.
+    :param dataset_rtdose: RTDOSE DICOM dataset object.
+    :param rois: Dictionary of ROI information.
+    :param dict_thickness: Dictionary where the keys are ROI numbers and
+        the values are thicknesses of the ROI.
+    :param dose_limit: Limit of dose for DVH calculation.
+    :param dvh_cache: DVHCache to use, the default one if not given.
+    :param dvh_keys: Cache keys of the ROIs, computed if not given.
+    :return: Tuple (dict_dvh, missing_rois) of the DVHs found in the
+        cache, and the dictionary of ROI information of the ROIs that
+        were not found.
+    """
+    if dvh_cache is None:
+        dvh_cache = DVHCache()
+    if dvh_keys is None:
+        dvh_keys = get_dvh_keys(dataset_rtss, dataset_rtdose, rois,
+                                dict_thickness, dose_limit)
+
+    cached = dvh_cache.get_dvhs(dvh_keys)
+    # Keep the order of the ROIs
+    dict_dvh = {roi: cached[roi] for roi in rois if roi in cached}
+    for roi, dvh in dict_dvh.items():
+        # The ROI may have been renamed since the DVH was stored.
+        dvh.name = rois[roi]['name']
+    missing_rois = {roi: rois[roi] for roi in rois if roi not in dict_dvh}
+    return dict_dvh, missing_rois
+
+
+def calc_dvhs_with_cache(dataset_rtss, dataset_rtdose, rois, dict_thickness,
+                         interrupt_flag=None, dose_limit=None,
+                         dvh_cache=None):
+    """
+    Calculate the DVHs of the ROIs that are not in the cache, and store
+    them in it.
+    :param dataset_rtss: RTSTRUCT DICOM dataset object.
+    :param dataset_rtdose: RTDOSE DICOM dataset object.
+    :param rois: Dictionary of ROI information.
+    :param dict_thickness: Dictionary where the keys are ROI numbers and
+        the values are thicknesses of the ROI.
+    :param interrupt_flag: A threading.Event() object that tells the
+        function to stop calculation.
+    :param dose_limit: Limit of dose for DVH calculation.
+    :param dvh_cache: DVHCache to use, the default one if not given.
+    :return: Dictionary of all the DVHs of all the ROIs of the patient,
+        or None if the calculation was interrupted.
+    """
+    if dvh_cache is None:
+        dvh_cache = DVHCache()
+    if interrupt_flag is None:
+        interrupt_flag = threading.Event()
+
+    dvh_keys = get_dvh_keys(dataset_rtss, dataset_rtdose, rois,
+                            dict_thickness, dose_limit)
+    dict_dvh, missing_rois = get_cached_dvhs(
+        dataset_rtss, dataset_rtdose, rois, dict_thickness, dose_limit,
+        dvh_cache, dvh_keys)
+
+    if missing_rois:
+        calculated = {}
+        results = imap_forked(_calc_dvh, missing_rois,
+                              shared=(dataset_rtss, dataset_rtdose,
+                                      dict_thickness, dose_limit),
+                              chunksize=1)
+        for roi, dvh in zip(missing_rois, results):
+            if interrupt_flag.is_set():
+                # Closing the results terminates the pool
+                results.close()
+                return None
+            calculated[roi] = dvh
+
+        dvh_cache.put_dvhs(dvh_keys, calculated)
+        dict_dvh.update(calculated)
+
+    # Keep the order of the ROIs
+    return {roi: dict_dvh[roi] for roi in rois if roi in dict_dvh}
+
+
+def _calc_dvh(roi, dataset_rtss, dataset_rtdose, dict_thickness,
+              dose_limit):
+    """
+    Calculate the DVH of one ROI.
+    :param roi: ROI number.
+    :param dataset_rtss: RTSTRUCT DICOM dataset object.
+    :param dataset_rtdose: RTDOSE DICOM dataset object.
+    :param dict_thickness: Dictionary where the keys are ROI numbers and
+        the values are thicknesses of the ROI.
+    :param dose_limit: Limit of dose for DVH calculation.
+    :return: The DVH of the ROI.
+    """
+    from dicompylercore import dvhcalc
+
+    return dvhcalc.get_dvh(dataset_rtss, dataset_rtdose, roi, dose_limit,
+                           thickness=dict_thickness.get(roi))
+
+
+def update_dvhs(raw_dvh, modified_rois, dataset_rtss, dataset_rtdose, rois,
+                dict_thickness, interrupt_flag=None, dose_limit=None,
+                dvh_cache=None):
+    """
+    Recalculate the DVHs of the ROIs that were modified or have no DVH,
+    and keep the DVHs of the other ROIs.
+    :param raw_dvh: Dictionary of the current DVHs of the ROIs.
+    :param modified_rois: Set of ROI numbers of the modified ROIs.
+    :param dataset_rtss: RTSTRUCT DICOM dataset object.
+    :param dataset_rtdose: RTDOSE DICOM dataset object.
+    :param rois: Dictionary of ROI information.
+    :param dict_thickness: Dictionary where the keys are ROI numbers and
+        the values are thicknesses of the ROI.
+    :param interrupt_flag: A threading.Event() object that tells the
+        function to stop calculation.
+    :param dose_limit: Limit of dose for DVH calculation.
+    :param dvh_cache: DVHCache to use, the default one if not given.
+    :return: Dictionary of all the DVHs of all the ROIs of the patient,
+        or None if the calculation was interrupted. DVHs of deleted ROIs
+        are left out.
+    """
+    outdated_rois = {roi: rois[roi] for roi in rois
+                     if roi in modified_rois or roi not in raw_dvh}
+    calculated = calc_dvhs_with_cache(dataset_rtss, dataset_rtdose,
+                                      outdated_rois, dict_thickness,
+                                      interrupt_flag, dose_limit, dvh_cache)
+    if calculated is None:
+        return None
+
+    dict_dvh = {}
+    for roi in rois:
+        if roi in calculated:
+            dict_dvh[roi] = calculated[roi]
+        elif roi in raw_dvh:
+            dict_dvh[roi] = raw_dvh[roi]
+    return dict_dvh
@@ -0,0 +1,194 @@
+"""
+Dose-volume metrics of DVHs.
+
+The cumulative DVHs of all ROIs are stacked into one array with a row per
+ROI, so that each metric is evaluated for every ROI at once. Metrics are
+named like dicompyler-core's DVH statistics:
+    D<x>    dose in Gy received by at least x% of the volume, i.e. D95
+    D<x>cc  dose in Gy received by at least x cm3 of the volume, i.e. D2cc
+    V<x>Gy  percentage of the volume receiving at least x Gy, i.e. V20Gy
+    Dmean, Dmin, Dmax   mean, minimum and maximum dose in Gy
+Doses and volumes between bin edges are interpolated linearly.
+
+Example usage:
+metrics = calculate_dvh_metrics(dict_dvh, ['D95', 'V20Gy', 'Dmean'])
+"""
+import re
+
+import numpy as np
+
+DEFAULT_DVH_METRICS = ['D98', 'D95', 'D50', 'D2', 'D2cc', 'Dmean', 'Dmin',
+                       'Dmax', 'V5Gy', 'V20Gy']
+
+METRIC_PATTERN = re.compile(r'^(D|V)(\d+(?:\.\d+)?)(cc|Gy)?$', re.IGNORECASE)
+
+# Volume units of DVHs with relative volumes
+RELATIVE_UNITS = '%'
+
+
+def get_metric_unit(metric):
+    """
+    :param metric: Name of the metric.
+    :return: The unit of the metric's values.
+    """
+    return '%' if metric.upper().startswith('V') else 'Gy'
+
+
+def stack_dvh_curves(dict_dvh):
+    """
+    Stack the cumulative DVHs of the ROIs onto common dose bins.
+    :param dict_dvh: A dictionary of DVH {ROINumber: DVH}
+    :return: Tuple (edges, curves, absolute). edges are the dose bin
+        edges in Gy. curves has a row per ROI with the volume receiving
+        at least the dose of every edge, which is 0 at the last edge.
+        absolute tells for every ROI whether its volumes are in cm3
+        rather than in %.
+    """
+    cumulative = [dvh.cumulative for dvh in dict_dvh.values()]
+    if not cumulative:
+        return np.zeros(1), np.zeros((0, 1)), np.zeros(0, dtype=bool)
+
+    longest = max(cumulative, key=lambda dvh: len(dvh.bins))
+    edges = np.asarray(longest.bins, dtype=np.float64)
+    curves = np.zeros((len(cumulative), len(edges)))
+    for row, dvh in enumerate(cumulative):
+        bins = np.asarray(dvh.bins, dtype=np.float64)
+        counts = np.asarray(dvh.counts, dtype=np.float64)
+        if np.allclose(bins, edges[:len(bins)]):
+            curves[row, :len(counts)] = counts
+        elif len(counts):
+            # The bins of DVHs read from an RT Dose may differ
+            curves[row, :-1] = np.interp(edges[:-1], bins[:-1], counts,
+                                         right=0)
+
+    absolute = np.array([dvh.volume_units != RELATIVE_UNITS
+                         for dvh in cumulative])
+    return edges, curves, absolute
+
+
+def dose_at_volume(edges, curves, volume):
+    """
+    :param edges: Dose bin edges in Gy.
+    :param curves: Cumulative volumes at the edges, with a row per ROI.
+    :param volume: Volume in the units of curves.
+    :return: For every ROI the highest dose received by at least the
+        volume, 0 if the ROI is smaller than the volume.
+    """
+    rows = np.arange(len(curves))
+    # Cumulative curves do not increase, so the edges receiving at
+    # least the volume come first.
+    above = (curves >= volume).sum(axis=1)
+    before = np.clip(above - 1, 0, len(edges) - 1)
+    after = np.clip(above, 0, len(edges) - 1)
+
+    volume_before = curves[rows, before]
+    volume_after = curves[rows, after]
+    fraction = np.divide(volume_before - volume,
+                         volume_before - volume_after,
+                         out=np.zeros(len(curves)),
+                         where=volume_before != volume_after)
+    dose = edges[before] + fraction * (edges[after] - edges[before])
+    return np.where(above > 0, dose, 0.0)
+
+
+def volume_at_dose(edges, curves, dose):
+    """
+    :param edges: Dose bin edges in Gy.
+    :param curves: Cumulative volumes at the edges, with a row per ROI.
+    :param dose: Dose in Gy.
+    :return: For every ROI the volume receiving at least the dose.
+    """
+    if len(edges) < 2:
+        return curves[:, 0] if dose <= edges[0] else np.zeros(len(curves))
+    index = np.clip(np.searchsorted(edges, dose, side='right') - 1,
+                    0, len(edges) - 2)
+    fraction = np.clip((dose - edges[index])
+                       / (edges[index + 1] - edges[index]), 0, 1)
+    return curves[:, index] \
+        + fraction * (curves[:, index + 1] - curves[:, index])
+
+
+def calculate_dvh_metrics(dict_dvh, metrics=DEFAULT_DVH_METRICS):
+    """
+    Evaluate dose-volume metrics for all ROIs.
+    :param dict_dvh: A dictionary of DVH {ROINumber: DVH}
+    :param metrics: List of names of the metrics.
+    :return: Dictionary of metric name to a numpy array of the metric's
+        value for every ROI, in the order of dict_dvh. Volume is included
+        as the volume of the ROIs in cm3. Values that can not be
+        calculated, i.e. cc metrics of relative DVHs, are NaN.
+    """
+    edges, curves, absolute = stack_dvh_curves(dict_dvh)
+    volumes = curves[:, 0]
+    relative = np.divide(curves * 100, volumes[:, None],
+                         out=np.zeros_like(curves),
+                         where=volumes[:, None] > 0)
+
+    # Volume in every bin, and the ROIs receiving any dose
+    differential = curves[:, :-1] - curves[:, 1:]
+    occupied = differential > 0
+    has_dose = occupied.any(axis=1)
+    upper_edges = edges[1:]
+    centers = (edges[:-1] + edges[1:]) / 2
+
+    results = {'Volume': np.where(absolute, volumes, np.nan)}
+    for metric in metrics:
+        name = metric.lower()
+        if name == 'dmean':
+            total = differential.sum(axis=1)
+            values = np.divide((differential * centers).sum(axis=1), total,
+                               out=np.zeros(len(curves)), where=total > 0)
+        elif name == 'dmin':
+            values = upper_edges[occupied.argmax(axis=1)] \
+                if len(upper_edges) else np.zeros(len(curves))
+        elif name == 'dmax':
+            last = occupied.shape[1] - 1 - occupied[:, ::-1].argmax(axis=1)
+            values = upper_edges[last] \
+                if len(upper_edges) else np.zeros(len(curves))
+        else:
+            match = METRIC_PATTERN.match(metric)
+            if match is None:
+                raise ValueError("Unknown DVH metric %s" % metric)
+            kind, value, unit = match.groups()
+            value = float(value)
+            unit = (unit or '').lower()
+            if kind.upper() == 'D' and unit == 'cc':
+                values = np.where(absolute,
+                                  dose_at_volume(edges, curves, value),
+                                  np.nan)
+            elif kind.upper() == 'D' and not unit:
+                values = dose_at_volume(edges, relative, value)
+            elif kind.upper() == 'V' and unit == 'gy':
+                values = volume_at_dose(edges, relative, value)
+            else:
+                raise ValueError("Unknown DVH metric %s" % metric)
+
+        if name in ('dmin', 'dmax'):
+            values = np.where(has_dose, values, 0.0)
+        results[metric] = values
+
+    return results
+
+
+def dvh_metrics_table(dict_dvh, patient_id, metrics=DEFAULT_DVH_METRICS):
+    """
+    :param dict_dvh: A dictionary of DVH {ROINumber: DVH}
+    :param patient_id: Patient Identifier
+    :param metrics: List of names of the metrics.
+    :return: Tuple (header, rows) of a table with a row per ROI, and a
+        column per metric. Values are rounded to 2 decimals.
+    """
+    values = calculate_dvh_metrics(dict_dvh, metrics)
+
+    header = ['Patient ID', 'ROI', 'Volume (mL)']
+    header.extend('%s (%s)' % (metric, get_metric_unit(metric))
+                  for metric in metrics)
+
+    columns = np.round(np.stack([values['Volume']]
+                                + [values[metric] for metric in metrics],
+                                axis=1), 2)
+    rows = []
+    for dvh, row in zip(dict_dvh.values(), columns.tolist()):
+        rows.append([patient_id, dvh.name]
+                    + ['' if np.isnan(value) else value for value in row])
+    return header, rows
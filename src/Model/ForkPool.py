@@ -0,0 +1,93 @@
+"""
+Process pool of forked workers.
+
+The work of the parallel stages (i.e. tracing contours, outlining
+transferred ROIs, decoding pixel data, calculating DVHs and anonymising
+files) is done on large data, like a whole image volume, that is the
+same for every task. Instead of having it pickled for every task, the
+data is stored in this module before the pool is created, so that the
+forked workers inherit it.
+
+Example usage:
+contours = map_forked(find_slice_contours, indices, shared=(slices, levels))
+"""
+import itertools
+import os
+import platform
+from multiprocessing import get_context
+
+# Spawn-based platforms (i.e Windows and MacOS) have a large overhead
+# when creating a new process, so the process pool is only used on Linux.
+fork_safe_platforms = ['Linux']
+
+# Function and shared data of every running pool, inherited by the
+# forked workers. Keyed by a call ID so that pools can be created from
+# multiple threads at once.
+_worker_calls = {}
+_call_ids = itertools.count()
+
+
+def is_fork_safe():
+    """
+    :return: True if worker processes are created by forking on this
+        platform.
+    """
+    return platform.system() in fork_safe_platforms
+
+
+def imap_forked(func, items, shared=(), max_workers=None, chunksize=None):
+    """
+    Call func(item, *shared) for every item, in a pool of forked worker
+    processes. On platforms that are not fork-safe, for less than two
+    items, or with one worker, func is called in this process instead.
+    :param func: Module-level function to call.
+    :param items: List of the items to call the function with.
+    :param shared: Tuple of further arguments of the function, inherited
+        by the workers.
+    :param max_workers: Number of worker processes. Defaults to the CPU
+        count.
+    :param chunksize: Number of items sent to a worker at once. Defaults
+        to a quarter of the items per worker.
+    :return: Iterator over the results, in the order of the items.
+        Closing it before the end terminates the pool.
+    """
+    items = list(items)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if len(items) < 2 or max_workers == 1 or not is_fork_safe():
+        for item in items:
+            yield func(item, *shared)
+        return
+
+    processes = min(max_workers, len(items))
+    if chunksize is None:
+        chunksize = max(len(items) // (4 * processes), 1)
+
+    call_id = next(_call_ids)
+    _worker_calls[call_id] = (func, shared)
+    try:
+        with get_context("fork").Pool(processes=processes) as pool:
+            yield from pool.imap(_call_worker,
+                                 [(call_id, item) for item in items],
+                                 chunksize=chunksize)
+    finally:
+        del _worker_calls[call_id]
+
+
+def map_forked(func, items, shared=(), max_workers=None, chunksize=None):
+    """
+    Call func(item, *shared) for every item, as imap_forked(..).
+    :return: List of the results, in the order of the items.
+    """
+    return list(imap_forked(func, items, shared, max_workers, chunksize))
+
+
+def _call_worker(task):
+    """
+    Call the function of a pool in a worker process.
+    :param task: Tuple (call ID, item).
+    :return: The result of the function.
+    """
+    call_id, item = task
+    func, shared = _worker_calls[call_id]
+    return func(item, *shared)
@@ -2,6 +2,8 @@ import collections
 
 import pydicom
 
+from src.Model.SliceGeometry import SliceGeometry
+
 
 def get_tree(ds, label=0):
     """
@@ -68,22 +70,10 @@ def dict_instance_uid(dict_ds):
     Get a dictionary where key = index of the slice and value is the Instance
     UID
 
-    :param dict_ds:
-    :return:
+    :param dict_ds: Dictionary of PyDicom datasets.
+    :return: Dictionary of slice index to SOPInstanceUID.
     """
-    res = {}
-    non_img_type = ['rtdose', 'rtplan', 'rtss', 'rtimage']
-
-    for ds in dict_ds:
-        if ds not in non_img_type:
-            if isinstance(ds, str) and ds[0:3] == 'sr-':
-                continue
-            else:
-                index = int(ds)
-                img_ds = dict_ds[ds]
-                res[index] = img_ds.SOPInstanceUID
-
-    return res
+    return dict(SliceGeometry(dict_ds).slice_to_uid)
 
 
 # =========   This is a class for DICOM TREE   ===============
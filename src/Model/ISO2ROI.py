@@ -1,14 +1,29 @@
 from pathlib import Path
-from skimage import measure
+
+import numpy as np
+
 from src.Model import ImageLoading
+from src.Model import LevelContours
 from src.Model import ROI
 from src.Model.Isodose import get_dose_grid
 from src.Model.PatientDictContainer import PatientDictContainer
+from src.Model.SliceGeometry import get_slice_geometry
+
+# Isodose islands smaller than this volume in mL are not turned into ROIs
+DEFAULT_MIN_ISLAND_VOLUME = 0.1
 
 
 class ISO2ROI:
     """This class is for converting isodose levels to ROIs."""
 
+    def __init__(self, min_island_volume=DEFAULT_MIN_ISLAND_VOLUME):
+        """
+        :param min_island_volume: Minimum volume in mL of the 3D connected
+            components of an isodose level that are turned into ROIs. 0
+            keeps every contour.
+        """
+        self.min_island_volume = min_island_volume
+
     def start_conversion(self, interrupt_flag, progress_callback):
         """
         Goes the the steps of the iso2roi conversion.
@@ -90,29 +105,49 @@ class ISO2ROI:
         if not rt_dose_dose:
             return None
 
-        contours = {}
+        # Dose level of each isodose level in the units of the dose grid
+        dose_levels = {}
+        for item in isodose_levels:
+            if isodose_levels[item][0]:
+                dose_levels[item] = isodose_levels[item][1] / \
+                    (rt_plan_dose.DoseGridScaling * 100)
+            else:
+                dose_levels[item] = isodose_levels[item][1] * \
+                    rt_dose_dose / (rt_plan_dose.DoseGridScaling * 10000)
+        levels = sorted(set(dose_levels.values()))
+
+        # Get the dose grid of each slice as one volume, shared with the
+        # processes tracing the slices. Slices outside the dose grid have
+        # no dose.
+        dose_volume = np.zeros((slider_max - slider_min, rt_plan_dose.Rows,
+                                rt_plan_dose.Columns), dtype=np.float32)
+        for slider_id in range(slider_min, slider_max):
+            temp_ds = patient_dict_container.dataset[slider_id]
+            z = temp_ds.ImagePositionPatient[2]
+            grid = get_dose_grid(rt_plan_dose, float(z))
+            if grid is not None and np.size(grid):
+                dose_volume[slider_id - slider_min] = grid
+
+        # Calculate boundaries for all isodose levels of each slice at
+        # once
+        slice_contours = LevelContours.find_stack_level_contours(
+            dose_volume, levels)
+
+        # Drop the contours of small islands
+        if self.min_island_volume > 0:
+            slice_spacing = get_slice_geometry(patient_dict_container).spacing
+            voxel_volume = abs(slice_spacing) * float(
+                rt_plan_dose.PixelSpacing[0]) * float(
+                rt_plan_dose.PixelSpacing[1]) / 1000
+            LevelContours.remove_small_islands(
+                dose_volume, levels, slice_contours, voxel_volume,
+                self.min_island_volume)
 
+        contours = {}
         for item in isodose_levels:
-            # Calculate boundaries for each isodose level for each slice
-            contours[item] = []
-            for slider_id in range(slider_min, slider_max):
-                contours[item].append([])
-                temp_ds = patient_dict_container.dataset[slider_id]
-                z = temp_ds.ImagePositionPatient[2]
-                grid = get_dose_grid(rt_plan_dose, float(z))
-
-                if not (grid == []):
-                    if isodose_levels[item][0]:
-                        dose_level = isodose_levels[item][1] / \
-                                     (rt_plan_dose.DoseGridScaling * 100)
-                        contours[item][slider_id] =\
-                            (measure.find_contours(grid, dose_level))
-                    else:
-                        dose_level = isodose_levels[item][1] * \
-                                     rt_dose_dose / \
-                                     (rt_plan_dose.DoseGridScaling * 10000)
-                        contours[item][slider_id] = \
-                            (measure.find_contours(grid, dose_level))
+            index = levels.index(dose_levels[item])
+            contours[item] = [level_contours[index]
+                              for level_contours in slice_contours]
 
         # Return list of contours for each isodose level for each slice
         return contours
@@ -138,6 +173,9 @@ class ISO2ROI:
                 existing_rois.append(roi.ROIName)
 
         # Loop through each isodose level
+        dict_uid = patient_dict_container.get("dict_uid")
+        pixluts = patient_dict_container.get("pixluts")
+        dose_pixluts = patient_dict_container.get("dose_pixluts")
         for item in contours:
             # Delete ROI if it already exists to recreate it
             if item in existing_rois:
@@ -155,18 +193,16 @@ class ISO2ROI:
 
             # Calculate isodose ROI for each slice, skip if slice has no
             # contour data
+            roi_list = []
             for i in range(slider_min, slider_max):
                 if not len(contours[item][i]):
                     continue
 
                 # Get required data for calculating ROI
                 dataset = patient_dict_container.dataset[i]
-                pixlut = patient_dict_container.get("pixluts")
-                pixlut = pixlut[dataset.SOPInstanceUID]
+                pixlut = pixluts[dataset.SOPInstanceUID]
                 z_coord = dataset.SliceLocation
-                curr_slice_uid = patient_dict_container.get("dict_uid")[i]
-                dose_pixluts = patient_dict_container.get("dose_pixluts")
-                dose_pixluts = dose_pixluts[curr_slice_uid]
+                slice_dose_pixluts = dose_pixluts[dict_uid[i]]
 
                 # Loop through each contour for each slice.
                 # Convert the pixel points to RCS points, append z value
@@ -178,8 +214,8 @@ class ISO2ROI:
                     # Loop through every second point in the contour
                     for point in contours[item][i][j][::2]:
                         # Transform into dose pixel
-                        dose_pixels = [dose_pixluts[0][int(point[1])],
-                                       dose_pixluts[1][int(point[0])]]
+                        dose_pixels = [slice_dose_pixluts[0][int(point[1])],
+                                       slice_dose_pixluts[1][int(point[0])]]
                         # Transform into RCS pixel
                         rcs_pixels = ROI.pixel_to_rcs(pixlut,
                                                       round(dose_pixels[0]),
@@ -189,15 +225,17 @@ class ISO2ROI:
                         single_array[j].append(rcs_pixels[1])
                         single_array[j].append(z_coord)
 
-                # Create the ROI(s)
-                for array in single_array:
-                    rtss = ROI.create_roi(dataset_rtss, item,
-                                          [{'coords': array, 'ds': dataset}],
-                                          "DOSE_REGION")
+                roi_list.extend({'coords': array, 'ds': dataset}
+                                for array in single_array)
+
+            # Create the ROI with all of its contours at once
+            if roi_list:
+                dataset_rtss = ROI.create_roi(dataset_rtss, item, roi_list,
+                                              "DOSE_REGION")
 
-                    # Save the updated rtss
-                    patient_dict_container.set("dataset_rtss", rtss)
-                    patient_dict_container.set("rois",
-                                               ImageLoading.get_roi_info(rtss))
+                # Save the updated rtss
+                patient_dict_container.set("dataset_rtss", dataset_rtss)
+                patient_dict_container.set(
+                    "rois", ImageLoading.get_roi_info(dataset_rtss))
 
         progress_callback.emit(("Writing to RT Structure Set", 85))
@@ -1,23 +1,41 @@
 from PySide6 import QtCore, QtGui
 
 import json
+import logging
 import numpy as np
-import SimpleITK as sitk
 import datetime
 import pydicom
 import os
 
+from collections import OrderedDict
 from copy import deepcopy
 from pydicom.tag import Tag
 
-from src.constants import CT_RESCALE_INTERCEPT
+from src.constants import CT_RESCALE_INTERCEPT, DEFAULT_WINDOW_SIZE
 from src.Controller.PathHandler import resource_path
 
+from src.Model.ImageRegistration import apply_transform, \
+    linear_registration
 from src.Model.PatientDictContainer import PatientDictContainer
 from src.Model.MovingDictContainer import MovingDictContainer
-from platipy.imaging.registration.linear import linear_registration
-from platipy.imaging.visualisation.utils import generate_comparison_colormix, \
-    return_slice
+from src.Model.RegistrationCache import RegistrationCache, \
+    get_registration_key
+
+# Registration settings used when imageFusion.json does not exist
+DEFAULT_REGISTRATION_SETTINGS = {
+    "reg_method": "rigid",
+    "metric": "mean_squares",
+    "optimiser": "gradient_descent",
+    "shrink_factors": [8],
+    "smooth_sigmas": [10],
+    "sampling_rate": 0.25,
+    "final_interp": 2,
+    "number_of_iterations": 50,
+    "default_value": -1000,
+}
+
+# Number of fused pixmaps of every view kept in memory
+FUSED_PIXMAP_CACHE_SIZE = 32
 
 
 # Utility Functions
@@ -110,6 +128,8 @@ def convert_composite_to_affine_transform(composite_transform):
         combined_affine (sitk.AffineTransform): combined_affine
 
     """
+    import SimpleITK as sitk
+
     # Retrieve the 1st Transform
     transform_type = composite_transform.GetNthTransform(0)
 
@@ -312,218 +332,318 @@ def write_transform_to_dcm(affine_matrix):
     spatial_registration.save_as(filepath)
 
 
-def create_fused_model(old_images, new_image):
+def create_fused_model(old_images, new_image, recompute=False,
+                       preview=False, progress_callback=None,
+                       interrupt_flag=None, progress_range=(0, 100)):
     """
-    Performs the image fusion and stores fusion information.
-    
+    Performs the image fusion and stores fusion information. The
+    transform of the registration is reused from the RegistrationCache
+    if the same image sets were registered with the same settings before,
+    and the spatial registration DICOM file is only written if it does
+    not hold the registration already.
+
     Args:
         old_images(sitk): Image set from Primary/Fixed Image
         new_image(sitk): Image set from the Secondary/Moving Image
+        recompute(bool): Register the images even if the registration is
+        in the cache.
+        preview(bool): Only register the coarsest level of the pyramid.
+        progress_callback(Signal): receives the progress of the
+        registration
+        interrupt_flag(threading.Event): tells the registration to stop
+        progress_range(tuple): range of the percentages emitted
+    Return:
+        bool: False if the registration was interrupted.
     """
     patient_dict_container = PatientDictContainer()
-    fused_image = register_images(old_images, new_image)
+    settings = get_registration_settings(preview)
+    registration_cache = RegistrationCache()
+    key = get_registration_key(patient_dict_container, MovingDictContainer(),
+                               settings)
+
+    tfm = None if recompute else registration_cache.get_transform(key)
+    if tfm is None:
+        registration = register_images(old_images, new_image, settings,
+                                       progress_callback, interrupt_flag,
+                                       progress_range)
+        if registration is None:
+            return False
+        img_ct, tfm, levels = registration
+        registration_cache.put_transform(key, tfm)
+    else:
+        img_ct = apply_registration(old_images, new_image, tfm, settings)
+        levels = []
+    fused_image = (img_ct, tfm)
+    patient_dict_container.set("registration_levels", levels)
     patient_dict_container.set("fused_images", fused_image)
+    patient_dict_container.set("fused_arrays", None)
+
+    transform_path = os.path.join(patient_dict_container.path,
+                                  'transform.dcm')
+    if registration_cache.is_dcm_written(key, transform_path) \
+            and os.path.exists(transform_path):
+        return True
 
     # Throw Transform Object into function to write dcm file
     combined_affine = convert_composite_to_affine_transform(fused_image[1])
     # test = check_affine_conversion(fused_image[1], combined_affine)
     affine_matrix = convert_combined_affine_to_matrix(combined_affine)
     write_transform_to_dcm(affine_matrix)
+    registration_cache.set_dcm_written(key, transform_path)
+    return True
+
+
+def get_fused_arrays():
+    """
+    Get the fixed image and the moving image registered onto the grid of
+    the fixed image as numpy arrays. The arrays are extracted once per
+    registration and cached as "fused_arrays".
+
+    Return:
+        fixed_array (ndarray): float32 array of the fixed image
+        moving_array (ndarray): float32 array of the registered moving
+        image, with the shape of fixed_array
+    """
+    import SimpleITK as sitk
+
+    patient_dict_container = PatientDictContainer()
+    fused_arrays = patient_dict_container.get("fused_arrays")
+    if fused_arrays is None:
+        old_images = patient_dict_container.get("sitk_original")
+        fused_image = patient_dict_container.get("fused_images")
+        fused_arrays = (
+            sitk.GetArrayFromImage(old_images).astype(np.float32,
+                                                      copy=False),
+            sitk.GetArrayFromImage(fused_image[0]).astype(np.float32,
+                                                          copy=False))
+        patient_dict_container.set("fused_arrays", fused_arrays)
+    return fused_arrays
 
 
 def get_fused_window(level, window):
     """
     Apply windowing on the fixed and moving (linear-registered) images.
+    The pixmaps are not rendered here, but when a slice is displayed,
+    so changing the windowing only re-renders the visible slices.
     
     Args:
         level(int): the level (midpoint) of windowing
         window(any): the window (range) of windowing
     
     Return:
-        color_axial (QtGui.QPixmap): pixmap of the registered image from axial 
-        view
-        color_sagittal (QtGui.QPixmap): pixmap of the registered image from 
-        sagittal view
-        color_coronal (QtGui.QPixmap): pixmap of the registered image from 
-        coronal view
+        color_axial (FusedPixmaps): pixmaps of the registered image from
+        axial view
+        color_sagittal (FusedPixmaps): pixmaps of the registered image
+        from sagittal view
+        color_coronal (FusedPixmaps): pixmaps of the registered image
+        from coronal view
         tfm (sitk.CompositeTransform): transformation object containing data 
         that is a product from linear_registration
     """
-  
     patient_dict_container = PatientDictContainer()
-    old_images = patient_dict_container.get("sitk_original")
-    fused_image = patient_dict_container.get("fused_images")
-    tfm = fused_image[1]
-    array = sitk.GetArrayFromImage(old_images).shape
-
-    axial_slice_count = array[0]
-    coronal_slice_count = array[1]
-    sagittal_slice_count = array[1]
+    tfm = patient_dict_container.get("fused_images")[1]
+    fixed_array, moving_array = get_fused_arrays()
 
-    sp_plane, _, sp_slice = old_images.GetSpacing()
-    asp = (1.0 * sp_slice) / sp_plane
+    windowing = (int(level-CT_RESCALE_INTERCEPT), int(window))
 
-    color_axial = {}
-    color_sagittal = {}
-    color_coronal = {}
+    color_axial = FusedPixmaps(fixed_array, moving_array, "axial",
+                               windowing)
+    color_sagittal = FusedPixmaps(fixed_array, moving_array, "sagittal",
+                                  windowing)
+    color_coronal = FusedPixmaps(fixed_array, moving_array, "coronal",
+                                 windowing)
 
-    windowing = (int(level-CT_RESCALE_INTERCEPT), int(window))
+    return color_axial, color_sagittal, color_coronal, tfm
 
-    for i in range(axial_slice_count):
-        color_axial[i] = \
-            get_fused_pixmap(old_images, fused_image[0], asp, i, "axial",
-                             windowing)
 
-    for i in range(sagittal_slice_count):
-        color_sagittal[i] = \
-            get_fused_pixmap(old_images, fused_image[0], asp, i, "sagittal",
-                             windowing)
+class FusedPixmaps:
+    """
+    The pixmaps of the slices of a view of the fused images, rendered
+    when they are first displayed. The most recently displayed pixmaps
+    are kept, up to FUSED_PIXMAP_CACHE_SIZE of them. Used like the
+    dictionaries of slice number to pixmap of the other views.
+    """
 
-    for i in range(coronal_slice_count):
-        color_coronal[i] = \
-            get_fused_pixmap(old_images, fused_image[0], asp, i, "coronal",
-                             windowing)
+    def __init__(self, fixed_array, moving_array, view, windowing,
+                 cache_size=FUSED_PIXMAP_CACHE_SIZE):
+        """
+        Args:
+            fixed_array (ndarray): 3D array of the fixed image
+            moving_array (ndarray): 3D array of the registered moving
+            image, with the shape of fixed_array
+            view (String): axial, coronal or sagittal
+            windowing: lower bound and window of the fused image
+            cache_size (int): number of pixmaps kept
+        """
+        self.fixed_array = fixed_array
+        self.moving_array = moving_array
+        self.axis = {"axial": 0, "coronal": 1, "sagittal": 2}[view]
+        self.windowing = windowing
+        self.cache_size = cache_size
+        self.pixmaps = OrderedDict()
+
+    def __len__(self):
+        return self.fixed_array.shape[self.axis]
+
+    def __getitem__(self, slice_num):
+        pixmap = self.pixmaps.get(slice_num)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(slice_num)
+            return pixmap
+
+        if not 0 <= slice_num < len(self):
+            raise KeyError(slice_num)
+        index = [slice(None)] * 3
+        index[self.axis] = slice_num
+        pixmap = get_fused_pixmap(self.fixed_array[tuple(index)],
+                                  self.moving_array[tuple(index)],
+                                  self.windowing)
+
+        self.pixmaps[slice_num] = pixmap
+        if len(self.pixmaps) > self.cache_size:
+            self.pixmaps.popitem(last=False)
+        return pixmap
+
+
+def get_registration_settings(preview=False):
+    """
+    Reads the registration settings the user chose in the add-on options.
+    Args:
+        preview (bool): Only keep the coarsest level of the pyramid, for
+        a fast preview of the registration.
+    Return:
+        dict_fusion (dict): contents of imageFusion.json, or the
+        DEFAULT_REGISTRATION_SETTINGS if the file does not exist.
+    """
+    dict_fusion = dict(DEFAULT_REGISTRATION_SETTINGS)
+    # Check to see if the imageFusion.json file exists
+    if os.path.exists(resource_path('data/json/imageFusion.json')):
+        # If it exists, read data from file into the dictionary
+        with open(resource_path("data/json/imageFusion.json"),
+                  "r") as file_input:
+            dict_fusion.update(json.load(file_input))
 
-    return color_axial, color_sagittal, color_coronal, tfm
+    if preview:
+        dict_fusion["shrink_factors"] = dict_fusion["shrink_factors"][:1]
+        dict_fusion["smooth_sigmas"] = dict_fusion["smooth_sigmas"][:1]
+    return dict_fusion
 
 
-# Can be expanded to peform all of platipy's registrations
-def register_images(image_1, image_2):
+def register_images(image_1, image_2, dict_fusion=None,
+                    progress_callback=None, interrupt_flag=None,
+                    progress_range=(0, 100)):
     """
-    Registers the moving and fixed image.
+    Registers the moving and fixed image. The final metric value and the
+    wall time of every level of the pyramid are logged.
     Args:
         image_1 (Image Matrix)
         image_2 (Image Matrix)
+        dict_fusion (dict): registration settings, as returned by
+        get_registration_settings(). Defaults to
+        DEFAULT_REGISTRATION_SETTINGS.
+        progress_callback(Signal): receives the progress of the
+        registration
+        interrupt_flag(threading.Event): tells the registration to stop
+        progress_range(tuple): range of the percentages emitted
     Return:
         img_ct (Array)
         tfm (sitk.CompositeTransform)
+        levels (list): dictionary of every level of the pyramid
+        or None if the registration was interrupted.
+    """
+    if dict_fusion is None:
+        dict_fusion = DEFAULT_REGISTRATION_SETTINGS
+
+    registration = linear_registration(
+        image_1,
+        image_2,
+        reg_method=dict_fusion["reg_method"],
+        metric=dict_fusion["metric"],
+        optimiser=dict_fusion["optimiser"],
+        shrink_factors=dict_fusion["shrink_factors"],
+        smooth_sigmas=dict_fusion["smooth_sigmas"],
+        sampling_rate=dict_fusion["sampling_rate"],
+        final_interp=dict_fusion["final_interp"],
+        number_of_iterations=dict_fusion["number_of_iterations"],
+        default_value=dict_fusion["default_value"],
+        number_of_threads=dict_fusion.get("number_of_threads"),
+        progress_callback=progress_callback,
+        interrupt_flag=interrupt_flag,
+        progress_range=progress_range
+    )
+
+    if registration is not None:
+        for level in registration[2]:
+            logging.info("Registration level %s: %s iterations, metric %s, "
+                         "%.2f s", level["level"], level["iterations"],
+                         level["metric"], level["time"])
+    return registration
+
+
+def apply_registration(image_1, image_2, tfm, dict_fusion=None):
+    """
+    Resamples the moving image onto the fixed image with the transform of
+    a previous registration, as register_images(..) does after
+    registering the images.
+    Args:
+        image_1 (Image Matrix): fixed image
+        image_2 (Image Matrix): moving image
+        tfm (sitk.Transform): transform of the registration
+        dict_fusion (dict): registration settings the transform was
+        registered with.
+    Return:
+        img_ct (Array)
     """
+    if dict_fusion is None:
+        dict_fusion = DEFAULT_REGISTRATION_SETTINGS
+    return apply_transform(image_1, image_2, tfm,
+                           dict_fusion["final_interp"],
+                           dict_fusion["default_value"])
 
-    # Check to see if the imageWindowing.csv file exists
-    if os.path.exists(resource_path('data/json/imageFusion.json')):
-        # If it exists, read data from file into the dictionary
-        with open(resource_path("data/json/imageFusion.json"),
-                  "r") as file_input:
-            dict_fusion = json.load(file_input)
-
-        img_ct, tfm = linear_registration(
-            image_1,
-            image_2,
-            reg_method=dict_fusion["reg_method"],
-            metric=dict_fusion["metric"],
-            optimiser=dict_fusion["optimiser"],
-            shrink_factors=dict_fusion["shrink_factors"],
-            smooth_sigmas=dict_fusion["smooth_sigmas"],
-            sampling_rate=dict_fusion["sampling_rate"],
-            final_interp=dict_fusion["final_interp"],
-            number_of_iterations=dict_fusion["number_of_iterations"],
-            default_value=dict_fusion["default_value"],
-            verbose=False
-        )
-    else:
-        # If csv does not exist, initialize registration normally
-        img_ct, tfm = linear_registration(
-            image_1,
-            image_2,
-            shrink_factors=[8],
-            smooth_sigmas=[10],
-            reg_method='rigid',
-            verbose=False
-        )
 
-    return img_ct, tfm
+def generate_colormix(fixed_slice, moving_slice, windowing=(-250, 500)):
+    """
+    Blend a slice of the fixed image and of the registered moving image
+    into one RGB image. The fixed image is shown in magenta and the
+    moving image in green, so that where they agree the image is grey.
+    Args:
+        fixed_slice(ndarray): 2D array of the fixed image
+        moving_slice(ndarray): 2D array of the moving image
+        windowing: lower bound and window of the fused image
+    Returns:
+        rgb (ndarray): uint8 array of shape (rows, columns, 3)
+    """
+    lower, width = windowing
+    scale = 255 / width if width else 0
+    rgb = np.empty(fixed_slice.shape + (3,), dtype=np.uint8)
+    fixed = np.clip((fixed_slice - lower) * scale, 0, 255)
+    rgb[..., 0] = fixed
+    rgb[..., 1] = np.clip((moving_slice - lower) * scale, 0, 255)
+    rgb[..., 2] = fixed
+    return rgb
 
 
-def get_fused_pixmap(orig_image, fused_image, aspect,
-                     slice_num, view, windowing=(-250, 500)):
+def get_fused_pixmap(fixed_slice, moving_slice, windowing=(-250, 500)):
     """
-    Generates a colored pixmap of the array from the inputted view.
+    Generates a colored pixmap of a slice of the fused images.
     Args:
-        orig_image(ndarray): N dimension array containing signed int8 values
-        fused_image(ndarray): N dimension array containing signed int8 values
-        aspect(Any): currently not used
-        slice_num(int): slice number of the array
-        view(String): specified flag that can be sagittal, coronal or axial
-    windowing: target level and window of the fused image
+        fixed_slice(ndarray): 2D array of the fixed image
+        moving_slice(ndarray): 2D array of the registered moving image
+        windowing: lower bound and window of the fused image
     Returns:
         pixmap (QtGui.QPixmap): returns the pixmap of co-registered fixed and 
         moving images.
-    """    
-    # Get dimension /could also input dimensions as parameters
-    image_array = sitk.GetArrayFromImage(orig_image)
-    if view == "sagittal":
-        image_slice = return_slice("x", slice_num)
-
-        pixel_array_color = \
-            np.array(generate_comparison_colormix(
-                [orig_image, fused_image],
-                arr_slice=image_slice, window=windowing))
-
-        # resize dimensions to stop image stretch
-        pixel_array_color = np.resize(pixel_array_color, (512, 345, 3))
-
-        # first adjusts rgb (0,1) scale to greyscale (0,255)
-        # then converts type and formats it to color.
-        qimage2 = \
-            QtGui.QImage(((255 * pixel_array_color).astype(np.uint8)),
-                         image_array.shape[1], image_array.shape[0],
-                         QtGui.QImage.Format_RGB888)
-
-        # Then continues to convert to pixmap just like in onko
-        pixmap = QtGui.QPixmap(qimage2)
-
-        pixmap = pixmap.scaled(512,
-                               512,
-                               QtCore.Qt.IgnoreAspectRatio,
-                               QtCore.Qt.SmoothTransformation)
-    elif view == "coronal":
-        image_slice = return_slice("y", slice_num)
-
-        pixel_array_color = np.array(generate_comparison_colormix(
-            [orig_image, fused_image],
-            arr_slice=image_slice, window=windowing))
-
-        # resize dimensions to stop image stretch
-        pixel_array_color = np.resize(pixel_array_color, (512, 345, 3))
-
-        # first adjusts rgb (0,1) scale to greyscale (0,255)
-        # then converts type and formats it to color.
-        qimage2 = QtGui.QImage(((255 * pixel_array_color).astype(np.uint8)),
-                               image_array.shape[1],
-                               image_array.shape[0],
-                               QtGui.QImage.Format_RGB888)
-
-        # Then continues to convert to pixmap just like in onko
-        pixmap = QtGui.QPixmap(qimage2)
-        pixmap = pixmap.scaled(512,
-                               512,
-                               QtCore.Qt.IgnoreAspectRatio,
-                               QtCore.Qt.SmoothTransformation)
-    else:
-        image_slice = return_slice("z", slice_num)
-
-        pixel_array_color = np.array(generate_comparison_colormix(
-            [orig_image, fused_image],
-            arr_slice=image_slice, window=windowing))
-
-        # first adjusts rgb (0,1) scale to greyscale (0,255)
-        # then converts type and formats it to color.
-        qimage = QtGui.QImage(((255 * pixel_array_color).astype(np.uint8)),
-                              image_array.shape[1],
-                              image_array.shape[1],
-                              QtGui.QImage.Format_RGB888)
-
-        # Then continues to convert to pixmap just like in onko
-        pixmap = QtGui.QPixmap(qimage)
-        pixmap = pixmap.scaled(512,
-                               512,
-                               QtCore.Qt.IgnoreAspectRatio,
-                               QtCore.Qt.SmoothTransformation)
-
-    # Generates an rgb color overlaid image,
-    # convert to contiguous array,
-    # and also flip the array if it is a coronal (y) or sagittal (x)
-    return pixmap
+    """
+    rgb = generate_colormix(fixed_slice, moving_slice, windowing)
+    qimage = QtGui.QImage(rgb.data, rgb.shape[1], rgb.shape[0],
+                          3 * rgb.shape[1], QtGui.QImage.Format_RGB888)
+
+    # The image is copied into the pixmap, so the array may be freed
+    pixmap = QtGui.QPixmap.fromImage(qimage)
+    return pixmap.scaled(DEFAULT_WINDOW_SIZE,
+                         DEFAULT_WINDOW_SIZE,
+                         QtCore.Qt.IgnoreAspectRatio,
+                         QtCore.Qt.SmoothTransformation)
 
 
 def scaled_size(width, height):
@@ -19,15 +19,15 @@ not the case, however this alternative function promotes scalability and
 durability of the process).
 """
 import collections
-import math
 import re
 from multiprocessing import Queue, Process
 
 import numpy as np
-from dicompylercore import dvhcalc
 from pydicom import dcmread
 from pydicom.errors import InvalidDicomError
 
+from src.Model.SliceGeometry import SliceGeometry
+
 allowed_classes = {
     # CT Image
     "1.2.840.10008.5.1.4.1.1.2": {
@@ -267,76 +267,35 @@ def get_roi_info(dataset_rtss):
     return dict_roi
 
 
-def get_thickness_dict(dataset_rtss, read_data_dict):
+def get_thickness_dict(dataset_rtss, read_data_dict, slice_geometry=None):
     """
     Calculates and returns thicknesses for all ROIs in the RTSTRUCT that
     only contain one contour.
     The process used to calculate thickness is courtesy of @sjswerdloff
     :param dataset_rtss: RTSTRUCT DICOM dataset object.
-    :param read_data_dict:
+    :param read_data_dict: Dictionary of all DICOM dataset objects.
+    :param slice_geometry: SliceGeometry of the image stack. Built from
+        read_data_dict if not provided.
     :return: Dictionary of ROI thicknesses where the key is the ROI
         number and the value is the thickness.
     """
+    if slice_geometry is None:
+        slice_geometry = SliceGeometry(read_data_dict)
+
     # Generate a dict where keys are ROI numbers for structures with
-    # only one contour. Value of each key is the SOPInstanceUID of the
-    # CT slice the contour is positioned on.
+    # only one contour. Value of each key is the slice number of the
+    # image the contour is positioned on.
     single_contour_rois = {}
     for contour in dataset_rtss.ROIContourSequence:
-        try:
-            if len(contour.ContourSequence) == 1:
-                single_contour_rois[contour.ReferencedROINumber] = \
-                    contour.ContourSequence[0].ContourImageSequence[0]. \
-                    ReferencedSOPInstanceUID
-
-        except AttributeError:
-            pass
+        if len(contour.get("ContourSequence", [])) == 1:
+            single_contour_rois[contour.ReferencedROINumber] = \
+                slice_geometry.slice_of_contour(contour.ContourSequence[0])
 
     dict_thickness = {}
-    for roi_number, sop_instance_uid in single_contour_rois.items():
-        # Get the slice numbers the slices before and after the slice
-        # the ROI is positioned on.
-        slice_key = None
-        for key, ds in read_data_dict.items():
-            if ds.SOPInstanceUID == sop_instance_uid:
-                slice_key = key
-
-        # Get the Image Position (Patient) from the two slices.
-        try:
-            position_before = np.array(
-                read_data_dict[slice_key - 1].ImagePositionPatient)
-            position_after = np.array(
-                read_data_dict[slice_key + 1].ImagePositionPatient)
-
-            # Calculate displacement between slices
-            displacement = position_after - position_before
-
-        except KeyError:
-            # If the image slice is either at the top or bottom of the
-            # set, use the length of the displacement to the adjacent
-            # slice as the thickness.
-
-            # If the image slice is at the bottom of set.
-            if slice_key == 1:
-                position_current = np.array(
-                    read_data_dict[slice_key].ImagePositionPatient)
-                position_after = np.array(
-                    read_data_dict[slice_key + 1].ImagePositionPatient)
-                displacement = position_after - position_current
-            elif slice_key > 0:
-                position_current = np.array(
-                    read_data_dict[slice_key].ImagePositionPatient)
-                position_before = np.array(
-                    read_data_dict[slice_key - 1].ImagePositionPatient)
-                displacement = position_current - position_before
-            else:
-                continue
-
-        # Finally, calculate thickness.
-        thickness = math.sqrt(displacement[0] * displacement[0]
-                              + displacement[1] * displacement[1]
-                              + displacement[2] * displacement[2]) / 2
-
-        dict_thickness[roi_number] = thickness
+    for roi_number, slice_key in single_contour_rois.items():
+        thickness = slice_geometry.thickness(slice_key)
+        if thickness is not None:
+            dict_thickness[roi_number] = thickness
 
     return dict_thickness
 
@@ -354,6 +313,8 @@ def calc_dvhs(dataset_rtss, dataset_rtdose, rois, dict_thickness,
     :param dose_limit: Limit of dose for DVH calculation.
     :return: Dictionary of all the DVHs of all the ROIs of the patient.
     """
+    from dicompylercore import dvhcalc
+
     dict_dvh = {}
     roi_list = []
     for key in rois:
@@ -372,6 +333,8 @@ def calc_dvhs(dataset_rtss, dataset_rtdose, rois, dict_thickness,
 
 
 def calc_dvh_worker(rtss, dose, roi, queue, thickness, dose_limit=None):
+    from dicompylercore import dvhcalc
+
     dvh = {}
     dvh[roi] = \
         dvhcalc.get_dvh(rtss, dose, roi, dose_limit, thickness=thickness)
@@ -450,9 +413,11 @@ def converge_to_0_dvh(raw_dvh):
     return res
 
 
-def get_raw_contour_data(dataset_rtss):
+def get_raw_contour_data(dataset_rtss, slice_geometry=None):
     """
     :param dataset_rtss: RTSTRUCT DICOM dataset object.
+    :param slice_geometry: SliceGeometry of the image stack, used to
+        locate contours that have no ContourImageSequence.
     :return: Tuple (dict_roi, dict_numpoints) raw contour data of the
         ROIs.
     """
@@ -471,22 +436,41 @@ def get_raw_contour_data(dataset_rtss):
         roi_points_count = 0
         if 'ContourSequence' in roi:
             for roi_slice in roi.ContourSequence:
-                if 'ContourImageSequence' in roi_slice:
-                    for contour_img in roi_slice.ContourImageSequence:
-                        referenced_sop_instance_uid = \
-                            contour_img.ReferencedSOPInstanceUID
-                    contour_geometric_type = roi_slice.ContourGeometricType
-                    number_of_contour_points = roi_slice.NumberOfContourPoints
-                    roi_points_count += int(number_of_contour_points)
-                    contour_data = roi_slice.ContourData
-                    dict_contour[
-                        referenced_sop_instance_uid].append(contour_data)
+                referenced_sop_instance_uid = \
+                    get_contour_image_uid(roi_slice, slice_geometry)
+                if referenced_sop_instance_uid is None:
+                    continue
+                number_of_contour_points = roi_slice.NumberOfContourPoints
+                roi_points_count += int(number_of_contour_points)
+                contour_data = roi_slice.ContourData
+                dict_contour[
+                    referenced_sop_instance_uid].append(contour_data)
         dict_roi[roi_name] = dict_contour
         dict_numpoints[roi_name] = roi_points_count
 
     return dict_roi, dict_numpoints
 
 
+def get_contour_image_uid(contour, slice_geometry=None):
+    """
+    Get the SOPInstanceUID of the image a contour is drawn on.
+    :param contour: An item of the ContourSequence of an ROI.
+    :param slice_geometry: SliceGeometry of the image stack. If provided
+        it is used to locate contours that have no ContourImageSequence
+        and contours that reference images outside of the stack.
+    :return: SOPInstanceUID, or None if it cannot be determined.
+    """
+    if slice_geometry is not None:
+        return slice_geometry.uid_of_contour(contour)
+
+    referenced_sop_instance_uid = None
+    if 'ContourImageSequence' in contour:
+        for contour_img in contour.ContourImageSequence:
+            referenced_sop_instance_uid = \
+                contour_img.ReferencedSOPInstanceUID
+    return referenced_sop_instance_uid
+
+
 def calculate_matrix(img_ds):
     # Physical distance (in mm) between the center of each image pixel,
     # specified by a numeric pair
@@ -545,25 +529,16 @@ def get_pixluts(read_data_dict):
     return dict_pixluts
 
 
-def get_image_uid_list(dataset):
+def get_image_uid_list(dataset, slice_geometry=None):
     """
     Extract the SOPInstanceUIDs from every image dataset
     :param dataset: A dictionary of datasets of all the DICOM files of
         the patient
+    :param slice_geometry: SliceGeometry of the image stack. Built from
+        dataset if not provided.
     :return: uid_list, a list of SOPInstanceUIDs of all image slices of
         the patient
     """
-    non_img_list = ['rtss', 'rtdose', 'rtplan', 'rtimage']
-    uid_list = []
-
-    # Extract the SOPInstanceUID of every image (except RTSS, RTDOSE,
-    # RTPLAN)
-    for key in dataset:
-        if key not in non_img_list:
-            if isinstance(key, str):
-                if key[0:3] != 'sr-':
-                    uid_list.append(dataset[key].SOPInstanceUID)
-            else:
-                uid_list.append(dataset[key].SOPInstanceUID)
-
-    return uid_list
+    if slice_geometry is None:
+        slice_geometry = SliceGeometry(dataset)
+    return list(slice_geometry.uid_list)
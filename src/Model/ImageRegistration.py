@@ -0,0 +1,296 @@
+"""
+Linear registration of a moving image onto a fixed image.
+
+The registration is driven through an explicit sitk.ImageRegistrationMethod
+with a shrink/smooth pyramid, rather than through platipy, so that it can
+report its progress, be cancelled and run on every core. The moving image
+is first centred on the fixed image with an Euler3DTransform, and the
+transform of the registration method is optimised on top of it, so the
+result is the same composite transform platipy's linear_registration
+returns. Observers of the registration method:
+    emit the progress of every iteration through a progress callback,
+    i.e. WorkerSignals.progress, as a (message, percentage) tuple
+    stop the registration when the interrupt flag is set
+    record the final metric value and the wall time of every level of
+    the pyramid
+Registering with the coarsest level of the pyramid only is a fast preview
+of the registration.
+
+Example usage:
+image, transform, levels = linear_registration(
+    fixed_image, moving_image, shrink_factors=[8, 4], smooth_sigmas=[4, 2],
+    progress_callback=progress_callback, interrupt_flag=interrupt_flag)
+"""
+import os
+import time
+
+# Transforms optimised by the registration methods
+REGISTRATION_TRANSFORMS = {
+    "translation": "TranslationTransform",
+    "rigid": "VersorRigid3DTransform",
+    "similarity": "Similarity3DTransform",
+    "affine": "AffineTransform",
+    "scaleversor": "ScaleVersor3DTransform",
+    "scaleskewversor": "ScaleSkewVersor3DTransform",
+}
+
+# Seed of the random sampling of the metric, so that registering the same
+# images twice gives the same transform
+SAMPLING_SEED = 1
+
+
+class RegistrationMonitor:
+    """
+    Observes the iterations of a sitk.ImageRegistrationMethod, reporting
+    the progress, checking the interrupt flag and recording every level
+    of the pyramid.
+    """
+
+    def __init__(self, registration, number_of_levels, number_of_iterations,
+                 progress_callback=None, interrupt_flag=None,
+                 progress_range=(0, 100)):
+        """
+        :param registration: The sitk.ImageRegistrationMethod to observe.
+        :param number_of_levels: Number of levels of the pyramid.
+        :param number_of_iterations: Maximum number of iterations per
+            level.
+        :param progress_callback: A signal that receives the current
+            progress of the registration.
+        :param interrupt_flag: A threading.Event() object that tells the
+            registration to stop.
+        :param progress_range: Range of the percentages emitted.
+        """
+        self.registration = registration
+        self.number_of_levels = number_of_levels
+        self.number_of_iterations = max(number_of_iterations, 1)
+        self.progress_callback = progress_callback
+        self.interrupt_flag = interrupt_flag
+        self.progress_range = progress_range
+        self.levels = []
+        self.level_start = None
+        self.iterations = 0
+        self.metric = None
+
+    def add_observers(self):
+        """
+        Add the commands of the monitor to the registration method.
+        """
+        import SimpleITK as sitk
+
+        self.registration.AddCommand(sitk.sitkMultiResolutionIterationEvent,
+                                     self.start_level)
+        self.registration.AddCommand(sitk.sitkIterationEvent, self.iterate)
+
+    def start_level(self):
+        """
+        Called when the registration starts a level of the pyramid.
+        """
+        self.end_level()
+        self.level_start = time.perf_counter()
+        self.iterations = 0
+        self.metric = None
+        self.check_interrupt()
+
+    def end_level(self, metric=None):
+        """
+        Record the level being registered, if any.
+        :param metric: Final metric value of the level. Defaults to the
+            metric value of its last iteration.
+        """
+        if self.level_start is None:
+            return
+        if metric is None:
+            metric = self.metric
+        self.levels.append({
+            "level": len(self.levels) + 1,
+            "iterations": self.iterations,
+            "metric": metric,
+            "time": time.perf_counter() - self.level_start,
+        })
+        self.level_start = None
+
+    def iterate(self):
+        """
+        Called after every iteration of the optimiser.
+        """
+        self.iterations += 1
+        self.metric = self.registration.GetMetricValue()
+
+        if self.progress_callback is not None:
+            level = len(self.levels)
+            done = (level + min(self.iterations, self.number_of_iterations)
+                    / self.number_of_iterations) / self.number_of_levels
+            start, end = self.progress_range
+            self.progress_callback.emit((
+                "Registering images (level %s of %s)..."
+                % (level + 1, self.number_of_levels),
+                int(start + done * (end - start))))
+        self.check_interrupt()
+
+    def check_interrupt(self):
+        """
+        Stop the registration if the interrupt flag is set.
+        """
+        if self.interrupt_flag is not None and self.interrupt_flag.is_set():
+            self.registration.StopRegistration()
+
+
+def set_number_of_threads(number_of_threads=None):
+    """
+    Set the number of threads SimpleITK filters and registrations use.
+    :param number_of_threads: Number of threads. Defaults to the number
+        of cores.
+    """
+    import SimpleITK as sitk
+
+    if not number_of_threads:
+        number_of_threads = os.cpu_count() or 1
+    sitk.ProcessObject.SetGlobalDefaultNumberOfThreads(
+        int(number_of_threads))
+
+
+def set_metric(registration, metric):
+    """
+    :param registration: sitk.ImageRegistrationMethod
+    :param metric: Name of the similarity metric, as in imageFusion.json.
+    """
+    if metric == "correlation":
+        registration.SetMetricAsCorrelation()
+    elif metric == "mattes_mi":
+        registration.SetMetricAsMattesMutualInformation(
+            numberOfHistogramBins=50)
+    elif metric == "joint_hist_mi":
+        registration.SetMetricAsJointHistogramMutualInformation()
+    else:
+        registration.SetMetricAsMeanSquares()
+
+
+def set_optimiser(registration, optimiser, number_of_iterations):
+    """
+    :param registration: sitk.ImageRegistrationMethod
+    :param optimiser: Name of the optimiser, as in imageFusion.json.
+    :param number_of_iterations: Maximum number of iterations per level.
+    """
+    if optimiser == "lbfgsb":
+        registration.SetOptimizerAsLBFGSB(
+            gradientConvergenceTolerance=1e-5,
+            numberOfIterations=number_of_iterations,
+            maximumNumberOfCorrections=5,
+            maximumNumberOfFunctionEvaluations=1024,
+            costFunctionConvergenceFactor=1e7)
+    elif optimiser == "gradient_descent_line_search":
+        registration.SetOptimizerAsGradientDescentLineSearch(
+            learningRate=1.0, numberOfIterations=number_of_iterations)
+    else:
+        registration.SetOptimizerAsGradientDescent(
+            learningRate=1.0, numberOfIterations=number_of_iterations,
+            convergenceMinimumValue=1e-6, convergenceWindowSize=10)
+    registration.SetOptimizerScalesFromPhysicalShift()
+
+
+def create_transform(reg_method):
+    """
+    :param reg_method: Name of the registration method, as in
+        imageFusion.json.
+    :return: Identity SimpleITK transform of the registration method.
+    """
+    import SimpleITK as sitk
+
+    name = REGISTRATION_TRANSFORMS.get(reg_method,
+                                       REGISTRATION_TRANSFORMS["rigid"])
+    if name in ("TranslationTransform", "AffineTransform"):
+        return getattr(sitk, name)(3)
+    return getattr(sitk, name)()
+
+
+def apply_transform(fixed_image, moving_image, transform, final_interp=2,
+                    default_value=-1000):
+    """
+    Resample the moving image onto the grid of the fixed image.
+    :param fixed_image: SimpleITK image.
+    :param moving_image: SimpleITK image.
+    :param transform: Transform from the fixed to the moving image.
+    :param final_interp: SimpleITK interpolator, i.e. 2 for
+        sitk.sitkLinear.
+    :param default_value: Value of the voxels outside the moving image.
+    :return: SimpleITK image.
+    """
+    import SimpleITK as sitk
+
+    return sitk.Resample(moving_image, fixed_image, transform,
+                         int(final_interp), float(default_value))
+
+
+def linear_registration(fixed_image, moving_image, reg_method="rigid",
+                        metric="mean_squares", optimiser="gradient_descent",
+                        shrink_factors=(8,), smooth_sigmas=(10,),
+                        sampling_rate=0.25, final_interp=2,
+                        number_of_iterations=50, default_value=-1000,
+                        number_of_threads=None, progress_callback=None,
+                        interrupt_flag=None, progress_range=(0, 100)):
+    """
+    Register the moving image onto the fixed image.
+    :param fixed_image: SimpleITK image.
+    :param moving_image: SimpleITK image.
+    :param reg_method: Name of the transform to optimise, a key of
+        REGISTRATION_TRANSFORMS.
+    :param metric: Name of the similarity metric.
+    :param optimiser: Name of the optimiser.
+    :param shrink_factors: Shrink factor of every level of the pyramid,
+        from the coarsest level.
+    :param smooth_sigmas: Smoothing sigma in mm of every level.
+    :param sampling_rate: Fraction of the voxels the metric samples.
+    :param final_interp: SimpleITK interpolator of the registered image.
+    :param number_of_iterations: Maximum number of iterations per level.
+    :param default_value: Value of the voxels outside the moving image.
+    :param number_of_threads: Number of threads. Defaults to the number
+        of cores.
+    :param progress_callback: A signal that receives the current
+        progress of the registration.
+    :param interrupt_flag: A threading.Event() object that tells the
+        registration to stop.
+    :param progress_range: Range of the percentages emitted.
+    :return: Tuple (registered_image, transform, levels) of the moving
+        image resampled onto the fixed image, the sitk.CompositeTransform
+        from the fixed to the moving image and a dictionary per level with
+        its "level", "iterations", final "metric" value and wall "time"
+        in seconds, or None if the registration was interrupted.
+    """
+    import SimpleITK as sitk
+
+    set_number_of_threads(number_of_threads)
+    fixed_image = sitk.Cast(fixed_image, sitk.sitkFloat32)
+    moving_image = sitk.Cast(moving_image, sitk.sitkFloat32)
+
+    registration = sitk.ImageRegistrationMethod()
+    registration.SetShrinkFactorsPerLevel(list(shrink_factors))
+    registration.SetSmoothingSigmasPerLevel(list(smooth_sigmas))
+    registration.SmoothingSigmasAreSpecifiedInPhysicalUnitsOn()
+    set_metric(registration, metric)
+    registration.SetMetricSamplingStrategy(registration.RANDOM)
+    registration.SetMetricSamplingPercentage(sampling_rate, SAMPLING_SEED)
+    registration.SetInterpolator(sitk.sitkLinear)
+    set_optimiser(registration, optimiser, number_of_iterations)
+
+    # Centre the moving image on the fixed image before optimising
+    initial_transform = sitk.CenteredTransformInitializer(
+        fixed_image, moving_image, sitk.Euler3DTransform(),
+        sitk.CenteredTransformInitializerFilter.GEOMETRY)
+    registration.SetMovingInitialTransform(initial_transform)
+    registration.SetInitialTransform(create_transform(reg_method))
+
+    monitor = RegistrationMonitor(
+        registration, len(shrink_factors), number_of_iterations,
+        progress_callback, interrupt_flag, progress_range)
+    monitor.add_observers()
+    output_transform = registration.Execute(fixed_image, moving_image)
+    monitor.end_level(registration.GetMetricValue())
+
+    if interrupt_flag is not None and interrupt_flag.is_set():
+        return None
+
+    transform = sitk.CompositeTransform([initial_transform,
+                                         output_transform])
+    registered_image = apply_transform(fixed_image, moving_image, transform,
+                                       final_interp, default_value)
+    return registered_image, transform, monitor.levels
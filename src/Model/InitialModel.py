@@ -5,11 +5,11 @@ import pydicom
 from src.Controller.PathHandler import resource_path
 from src.Model import ImageLoading
 from src.Model.CalculateImages import convert_raw_data, get_pixmaps
-from src.Model.GetPatientInfo import get_basic_info, DicomTree, \
-    dict_instance_uid
+from src.Model.GetPatientInfo import get_basic_info, DicomTree
 from src.Model.Isodose import get_dose_pixluts, calculate_rx_dose_in_cgray
 from src.Model.PatientDictContainer import PatientDictContainer
 from src.Model.ROI import ordered_list_rois
+from src.Model.SliceGeometry import get_slice_geometry
 from src.Model import ImageLoading
 from src.Controller.PathHandler import resource_path
 from src.constants import CT_RESCALE_INTERCEPT
@@ -105,13 +105,15 @@ def create_initial_model():
     basic_info = get_basic_info(dataset[0])
     patient_dict_container.set("basic_info", basic_info)
 
-    patient_dict_container.set("dict_uid", dict_instance_uid(dataset))
+    slice_geometry = get_slice_geometry(patient_dict_container)
+    patient_dict_container.set("dict_uid", slice_geometry.slice_to_uid)
 
     # Set RTSS attributes
     patient_dict_container.set("file_rtss", filepaths['rtss'])
     patient_dict_container.set("dataset_rtss", dataset['rtss'])
     dict_raw_contour_data, dict_numpoints = \
-        ImageLoading.get_raw_contour_data(dataset['rtss'])
+        ImageLoading.get_raw_contour_data(dataset['rtss'],
+                                          slice_geometry)
     patient_dict_container.set("raw_contour", dict_raw_contour_data)
 
     # dict_dicom_tree_rtss will be set in advance if the program
@@ -253,14 +255,16 @@ def create_initial_model_batch():
     basic_info = get_basic_info(dataset[0])
     patient_dict_container.set("basic_info", basic_info)
 
-    patient_dict_container.set("dict_uid", dict_instance_uid(dataset))
+    slice_geometry = get_slice_geometry(patient_dict_container)
+    patient_dict_container.set("dict_uid", slice_geometry.slice_to_uid)
 
     # Set RTSS attributes
     if patient_dict_container.has_modality("rtss"):
         patient_dict_container.set("file_rtss", filepaths['rtss'])
         patient_dict_container.set("dataset_rtss", dataset['rtss'])
         dict_raw_contour_data, dict_numpoints = \
-            ImageLoading.get_raw_contour_data(dataset['rtss'])
+            ImageLoading.get_raw_contour_data(dataset['rtss'],
+                                          slice_geometry)
         patient_dict_container.set("raw_contour", dict_raw_contour_data)
         dicom_tree_rtss = DicomTree(filepaths['rtss'])
         patient_dict_container.set("dict_dicom_tree_rtss",
@@ -0,0 +1,233 @@
+"""
+Quantification of PET lesions, i.e. of the ROIs generated by SUV2ROI.
+
+Every ROI is rasterised onto a mask grid cropped to the ROI (see
+ROIMask), and the SUV volume is cropped to the same box, so the cost of
+an ROI depends on its size rather than on the size of the PET volume.
+The ROI is optionally split into lesions, the 3D connected components of
+its mask, and the metrics of all lesions of an ROI are computed at once
+with bincount and scipy.ndimage's labelled statistics:
+    SUVmax  maximum SUV
+    SUVmean mean SUV
+    SUVpeak maximum of the mean SUV in a 1 cm3 sphere centred on a
+            voxel of the lesion
+    MTV     metabolic tumour volume in mL
+    TLG     total lesion glycolysis, SUVmean * MTV
+The mean SUV in a sphere around every voxel is computed once for the
+whole volume with an FFT convolution and cached in the dict container.
+
+Example usage:
+header, rows = lesion_metrics_table(PatientDictContainer(),
+                                    ['SUV-3', 'SUV-4'], patient_id)
+"""
+import math
+
+import numpy as np
+
+from src.Model import ROI
+from src.Model import ROIMask
+from src.Model.SliceGeometry import get_slice_geometry
+
+LESION_METRICS = ['SUVmax', 'SUVmean', 'SUVpeak', 'MTV', 'TLG']
+
+LESION_METRIC_UNITS = {'SUVmax': 'SUV', 'SUVmean': 'SUV', 'SUVpeak': 'SUV',
+                       'MTV': 'mL', 'TLG': 'SUV*mL'}
+
+# Volume of the sphere of SUVpeak in mL
+SUV_PEAK_VOLUME = 1.0
+
+
+def sphere_kernel(spacing, volume=SUV_PEAK_VOLUME):
+    """
+    :param spacing: (slice, row, column) spacing of the volume in mm.
+    :param volume: Volume of the sphere in mL.
+    :return: Boolean array of the voxels whose centre is inside a sphere
+        of the volume, centred on the middle voxel.
+    """
+    radius = (3 * volume * 1000 / (4 * math.pi)) ** (1 / 3)
+    half_size = [int(radius // step) if step > 0 else 0 for step in spacing]
+    axes = [np.arange(-size, size + 1) * step
+            for size, step in zip(half_size, spacing)]
+    z, y, x = np.meshgrid(*axes, indexing='ij', sparse=True)
+    return z ** 2 + y ** 2 + x ** 2 <= radius ** 2
+
+
+def calculate_suv_peak_volume(suv_volume, spacing, slice_order=None,
+                              volume=SUV_PEAK_VOLUME):
+    """
+    Calculate the mean SUV in a sphere around every voxel of a volume.
+    Voxels outside the volume count as 0.
+    :param suv_volume: 3D array of SUV with a slice per image.
+    :param spacing: (slice, row, column) spacing of the volume in mm.
+    :param slice_order: Order of the slices along the stack axis, i.e.
+        SliceGeometry.sorted_slices. Defaults to the order of the volume.
+    :param volume: Volume of the sphere in mL.
+    :return: float32 array of the shape of suv_volume.
+    """
+    from scipy.signal import fftconvolve
+
+    kernel = sphere_kernel(spacing, volume).astype(np.float32)
+    kernel /= kernel.sum()
+
+    if slice_order is None:
+        slice_order = np.arange(len(suv_volume))
+    peak_volume = np.empty(np.shape(suv_volume), dtype=np.float32)
+    if not peak_volume.size:
+        return peak_volume
+
+    # The sphere is symmetric, so the convolution is its mean
+    peak_volume[slice_order] = fftconvolve(
+        np.asarray(suv_volume, dtype=np.float32)[slice_order], kernel,
+        mode='same')
+    return peak_volume
+
+
+def get_suv_peak_volume(dict_container, suv_volume):
+    """
+    Get the mean SUV in a sphere of 1 cm3 around every voxel, calculating
+    it only if it is not cached in the dict container yet or the SUV
+    volume has changed. It is cached as "suv_peak_volume".
+    :param dict_container: The dict container of the PET images.
+    :param suv_volume: SUV volume of the images, as returned by
+        SUV.get_suv_volume(..).
+    :return: float32 array of the shape of suv_volume.
+    """
+    peak_volume = dict_container.get("suv_peak_volume")
+    if peak_volume is None \
+            or dict_container.get("suv_peak_source") is not suv_volume:
+        slice_geometry = get_slice_geometry(dict_container)
+        pixel_spacing = dict_container.dataset[0].PixelSpacing
+        spacing = (slice_geometry.spacing, float(pixel_spacing[0]),
+                   float(pixel_spacing[1]))
+        peak_volume = calculate_suv_peak_volume(
+            suv_volume, spacing, slice_geometry.sorted_slices)
+        dict_container.set("suv_peak_volume", peak_volume)
+        dict_container.set("suv_peak_source", suv_volume)
+    return peak_volume
+
+
+def quantify_mask(mask, suv, suv_peak, spacing, split_lesions=True):
+    """
+    Quantify the lesions of a mask.
+    :param mask: Boolean 3D array.
+    :param suv: SUV of the voxels of the mask, of the same shape.
+    :param suv_peak: Mean SUV in a sphere around the voxels of the mask,
+        of the same shape.
+    :param spacing: (slice, row, column) spacing of the mask in mm.
+    :param split_lesions: Quantify every 3D connected component of the
+        mask as a lesion. Otherwise the whole mask is one lesion.
+    :return: Dictionary of the names in LESION_METRICS to arrays with a
+        value per lesion. Lesions are ordered by their first voxel.
+    """
+    from scipy import ndimage
+
+    if split_lesions:
+        # Voxels touching at a corner belong to the same lesion
+        structure = ndimage.generate_binary_structure(3, 3)
+        labels, count = ndimage.label(mask, structure)
+    else:
+        labels = mask.astype(np.int32)
+        count = int(mask.any())
+
+    if not count:
+        return {metric: np.zeros(0) for metric in LESION_METRICS}
+
+    index = np.arange(1, count + 1)
+    voxels = np.bincount(labels.ravel(), minlength=count + 1)[1:]
+    suv_sum = np.bincount(labels.ravel(), weights=suv.ravel(),
+                          minlength=count + 1)[1:]
+    suv_mean = suv_sum / voxels
+    mtv = voxels * np.prod(spacing) / 1000
+    return {
+        'SUVmax': np.asarray(ndimage.maximum(suv, labels, index)),
+        'SUVmean': suv_mean,
+        'SUVpeak': np.asarray(ndimage.maximum(suv_peak, labels, index)),
+        'MTV': mtv,
+        'TLG': suv_mean * mtv
+    }
+
+
+def quantify_roi(dict_container, dict_roi_contours, suv_volume,
+                 suv_peak_volume, split_lesions=True, roi_name=None):
+    """
+    Quantify the lesions of an ROI.
+    :param dict_container: The dict container of the PET images.
+    :param dict_roi_contours: A dictionary with key-value pair
+        {slice-uid: contour sequence} of the ROI in pixel coordinates.
+    :param suv_volume: SUV volume of the images.
+    :param suv_peak_volume: Mean SUV in a sphere around every voxel, as
+        returned by get_suv_peak_volume(..).
+    :param split_lesions: Quantify every 3D connected component of the
+        ROI as a lesion.
+    :param roi_name: Name of the ROI in the mask cache of the images.
+    :return: Dictionary of the names in LESION_METRICS to arrays with a
+        value per lesion.
+    """
+    grid = ROIMask.create_mask_grid(dict_container, [dict_roi_contours])
+    mask = grid.roi_to_mask(dict_roi_contours, roi_name)
+    box = tuple(slice(start, start + size)
+                for start, size in zip(grid.origin, grid.shape))
+    return quantify_mask(mask, suv_volume[box], suv_peak_volume[box],
+                         grid.spacing, split_lesions)
+
+
+def quantify_rois(dict_container, roi_names, suv_volume=None,
+                  split_lesions=True):
+    """
+    Quantify the lesions of ROIs of the RT Struct of PET images.
+    :param dict_container: The dict container of the PET images and the
+        RT Struct, i.e. PatientDictContainer.
+    :param roi_names: List of the names of the ROIs.
+    :param suv_volume: SUV volume of the images. Defaults to the SUV
+        volume cached in the dict container.
+    :param split_lesions: Quantify every 3D connected component of an
+        ROI as a lesion.
+    :return: Dictionary of ROI name to the metrics of its lesions, as
+        returned by quantify_roi(..).
+    """
+    if suv_volume is None:
+        suv_volume = dict_container.get("suv_volume")
+    suv_peak_volume = get_suv_peak_volume(dict_container, suv_volume)
+
+    # The contours are read from the RT Struct, as the ROIs may have been
+    # generated after the raw contours were cached
+    raw_contour, _ = ROI.get_raw_contour_data(
+        dict_container.get("dataset_rtss"),
+        get_slice_geometry(dict_container))
+    roi_names = [name for name in roi_names if name in raw_contour]
+    rois_contours = ROI.get_roi_contour_pixel(
+        raw_contour, roi_names, dict_container.get("pixluts"))
+
+    return {name: quantify_roi(dict_container, rois_contours[name],
+                               suv_volume, suv_peak_volume, split_lesions,
+                               name)
+            for name in roi_names}
+
+
+def lesion_metrics_table(dict_container, roi_names, patient_id,
+                         split_lesions=True):
+    """
+    :param dict_container: The dict container of the PET images and the
+        RT Struct.
+    :param roi_names: List of the names of the ROIs.
+    :param patient_id: Patient Identifier
+    :param split_lesions: Quantify every 3D connected component of an
+        ROI as a lesion.
+    :return: Tuple (header, rows) of a table with a row per lesion, and
+        a column per metric. Values are rounded to 3 decimals.
+    """
+    roi_metrics = quantify_rois(dict_container, roi_names,
+                                split_lesions=split_lesions)
+
+    header = ['Patient ID', 'ROI', 'Lesion']
+    header.extend('%s (%s)' % (metric, LESION_METRIC_UNITS[metric])
+                  for metric in LESION_METRICS)
+
+    rows = []
+    for name, metrics in roi_metrics.items():
+        columns = np.round(np.stack([metrics[metric]
+                                     for metric in LESION_METRICS],
+                                    axis=1), 3)
+        for lesion, row in enumerate(columns.tolist(), 1):
+            rows.append([patient_id, name, lesion] + row)
+    return header, rows
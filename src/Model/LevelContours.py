@@ -0,0 +1,161 @@
+"""
+Contours of a stack of image slices at multiple threshold levels.
+
+Tracing every level with skimage's find_contours on the whole slice
+makes the cost grow with the number of levels, even though the higher
+levels of i.e. a hot lesion only cover a few pixels. Instead, every
+pixel is labelled once with the number of levels it reaches using
+np.digitize. The labels give the bounding box of the pixels reaching
+each level, and each level is traced on its bounding box only. Slices
+whose maximum is below the lowest level are skipped, and on fork-safe
+platforms the slices are traced in a pool of worker processes.
+Contours of islands that are too small to be of interest, i.e. the
+fragments around the edge of a dose cloud, can be removed afterwards
+with remove_small_islands.
+
+Example usage:
+contours = find_stack_level_contours(suv_volume, [1, 2, 3])
+"""
+import numpy as np
+
+from src.Model.ForkPool import imap_forked
+
+
+def find_level_contours(image, levels):
+    """
+    Find the contours of an image at multiple levels. The contours are
+    the same as those of skimage.measure.find_contours at each level.
+    :param image: 2D array.
+    :param levels: Ascending list of levels.
+    :return: List with the contours of every level. The contours are
+        arrays of (row, column) coordinates.
+    """
+    from skimage import measure
+
+    image = np.asarray(image)
+    contours = [[] for _ in levels]
+    if image.size == 0:
+        return contours
+
+    # Number of levels each pixel reaches, and its maximum on every row
+    # and column
+    labels = np.digitize(image, levels)
+    row_labels = labels.max(axis=1)
+    column_labels = labels.max(axis=0)
+
+    for index, level in enumerate(levels):
+        rows = np.flatnonzero(row_labels > index)
+        if not rows.size:
+            break
+        columns = np.flatnonzero(column_labels > index)
+
+        # Keep a margin of a pixel, so that the contours that close
+        # around the pixels reaching the level are traced the same as on
+        # the whole image
+        top = max(rows[0] - 1, 0)
+        left = max(columns[0] - 1, 0)
+        bottom = min(rows[-1] + 2, image.shape[0])
+        right = min(columns[-1] + 2, image.shape[1])
+        contours[index] = [
+            contour + (top, left) for contour in measure.find_contours(
+                image[top:bottom, left:right], level)]
+
+    return contours
+
+
+def find_stack_level_contours(slices, levels, slice_max=None,
+                              max_workers=None):
+    """
+    Find the contours of every slice of an image stack at multiple
+    levels.
+    :param slices: List of 2D arrays, or a 3D array. Empty slices have no
+        contours.
+    :param levels: Ascending list of levels.
+    :param slice_max: Array of the maximum of every slice. Calculated if
+        not given.
+    :param max_workers: Number of worker processes. Defaults to the CPU
+        count.
+    :return: List with for every slice the list of contours of every
+        level, as returned by find_level_contours.
+    """
+    levels = list(levels)
+    if slice_max is None:
+        slice_max = np.array([np.max(image) if np.size(image) else -np.inf
+                              for image in slices])
+    contours = [[[] for _ in levels] for _ in range(len(slices))]
+    if not levels:
+        return contours
+
+    # Only slices reaching the lowest level have contours
+    indices = np.flatnonzero(np.asarray(slice_max) > levels[0]).tolist()
+    results = imap_forked(_find_slice_level_contours, indices,
+                          shared=(slices, levels), max_workers=max_workers)
+    for index, slice_contours in zip(indices, results):
+        contours[index] = slice_contours
+    return contours
+
+
+def _find_slice_level_contours(index, slices, levels):
+    """
+    Find the contours of one slice of an image stack.
+    :param index: Index of the slice.
+    :param slices: List of 2D arrays, or a 3D array.
+    :param levels: Ascending list of levels.
+    :return: List with the contours of every level.
+    """
+    return find_level_contours(slices[index], levels)
+
+
+def remove_small_islands(volume, levels, contours, voxel_volume,
+                         min_volume):
+    """
+    Remove the contours of the islands of every level that are smaller
+    than a volume. The islands of a level are the 3D connected components
+    of the voxels reaching the level, where voxels touching at a corner
+    are connected.
+    :param volume: 3D array the contours were traced on.
+    :param levels: Ascending list of levels.
+    :param contours: Contours of every slice of the volume, as returned
+        by find_stack_level_contours. Updated in place.
+    :param voxel_volume: Volume of a voxel.
+    :param min_volume: Minimum volume of an island, in the units of
+        voxel_volume.
+    :return: The contours.
+    """
+    from scipy import ndimage
+
+    structure = ndimage.generate_binary_structure(3, 3)
+    for index, level in enumerate(levels):
+        traced = [slice_index for slice_index, slice_contours
+                  in enumerate(contours) if slice_contours[index]]
+        if not traced:
+            continue
+
+        labels, count = ndimage.label(volume >= level, structure)
+        small = np.bincount(labels.ravel()) * voxel_volume < min_volume
+        small[0] = False
+        if not small.any():
+            continue
+
+        for slice_index in traced:
+            slice_labels = labels[slice_index]
+            contours[slice_index][index] = [
+                contour for contour in contours[slice_index][index]
+                if not small[_contour_label(slice_labels, contour)]]
+    return contours
+
+
+def _contour_label(labels, contour):
+    """
+    Find the island a contour belongs to.
+    :param labels: 2D array of the islands of a slice.
+    :param contour: Array of (row, column) coordinates of the contour.
+    :return: Label of the island.
+    """
+    # The points of a contour lie on the edge between a pixel reaching
+    # the level and one that does not.
+    row, column = contour[0]
+    lower = labels[int(np.floor(row)), int(np.floor(column))]
+    upper = labels[min(int(np.ceil(row)), labels.shape[0] - 1),
+                   min(int(np.ceil(column)), labels.shape[1] - 1)]
+    return max(lower, upper)
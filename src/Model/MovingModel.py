@@ -1,18 +1,18 @@
 import os
-import SimpleITK as sitk
 import pydicom
 
 from src.constants import CT_RESCALE_INTERCEPT
 
 from src.Model.CalculateImages import convert_raw_data, get_pixmaps
-from src.Model.GetPatientInfo import get_basic_info, DicomTree, \
-    dict_instance_uid
+from src.Model.GetPatientInfo import get_basic_info, DicomTree
 from src.Model.Isodose import get_dose_pixluts, calculate_rx_dose_in_cgray
 
 from src.Model.PatientDictContainer import PatientDictContainer
 from src.Model.MovingDictContainer import MovingDictContainer
 
 from src.Model.ROI import ordered_list_rois
+from src.Model.SimpleITKImage import get_sitk_image
+from src.Model.SliceGeometry import get_slice_geometry
 from src.Controller.PathHandler import resource_path
 
 from src.Model.ImageFusion import create_fused_model, get_fused_window
@@ -110,7 +110,8 @@ def create_moving_model():
     basic_info = get_basic_info(dataset[0])
     moving_dict_container.set("basic_info", basic_info)
 
-    moving_dict_container.set("dict_uid", dict_instance_uid(dataset))
+    moving_dict_container.set(
+        "dict_uid", get_slice_geometry(moving_dict_container).slice_to_uid)
 
     # Set RTSS attributes
     if moving_dict_container.has_modality("rtss"):
@@ -148,17 +149,54 @@ def create_moving_model():
                                   dicom_tree_rtplan.dict)
 
 
-def read_images_for_fusion(level=0, window=0):
+def register_images_for_fusion(recompute=False, preview=False,
+                               progress_callback=None, interrupt_flag=None,
+                               progress_range=(0, 100)):
     """
-    Performs initial image fusion, this is by converting the old and
-    new images for transformations into SITK object. Images are co-registered 
-    using SITK library. Images and SITK.CompositeTransformation objects are 
-    added to the patient dataset.
+    Converts the old and new images into SITK objects, built from the
+    pixel values that are already loaded, and co-registers them. The
+    images and the SITK.CompositeTransformation object are added to the
+    patient dataset.
+
+    Args:
+        recompute(bool): register the images even if the registration of
+        the image sets is cached
+        preview(bool): only register the coarsest level of the pyramid
+        progress_callback(Signal): receives the progress of the
+        registration
+        interrupt_flag(threading.Event): tells the registration to stop
+        progress_range(tuple): range of the percentages emitted
+    Return:
+        bool: False if the registration was interrupted.
+    """
+    patient_dict_container = PatientDictContainer()
+    moving_dict_container = MovingDictContainer()
+
+    # The images are built from the pixel values already loaded, rather
+    # than read from disk again
+    orig_image = get_sitk_image(patient_dict_container)
+    patient_dict_container.set("sitk_original", orig_image)
+
+    new_image = get_sitk_image(moving_dict_container)
+    moving_dict_container.set("sitk_moving", new_image)
+
+    return create_fused_model(orig_image, new_image, recompute, preview,
+                              progress_callback, interrupt_flag,
+                              progress_range)
+
+
+def read_images_for_fusion(level=0, window=0, recompute=False):
+    """
+    Performs initial image fusion, registering the images unless they
+    were registered while loading the moving image set, and creates the
+    fused views of the images.
     
     Args:
         level(int): midpoint of window
         window(Any): range of values, should at least contain low bound and 
         high bound
+        recompute(bool): register the images even if the registration of
+        the image sets is cached
     """
     patient_dict_container = PatientDictContainer()
     moving_dict_container = MovingDictContainer()
@@ -166,31 +204,10 @@ def read_images_for_fusion(level=0, window=0):
         level = patient_dict_container.get("level")
         window = patient_dict_container.get("window")
 
-    amount = len(patient_dict_container.filepaths)
-    orig_fusion_list = []
-
-    for i in range(amount):
-        try:
-            orig_fusion_list.append(patient_dict_container.filepaths[i])
-        except KeyError:
-            continue
-
-    orig_image = sitk.ReadImage(orig_fusion_list)
-    patient_dict_container.set("sitk_original", orig_image)
-
-    amount = len(moving_dict_container.filepaths)
-    new_fusion_list = []
-
-    for i in range(amount):
-        try:
-            new_fusion_list.append(moving_dict_container.filepaths[i])
-        except KeyError:
-            continue
-
-    new_image = sitk.ReadImage(new_fusion_list)
-    moving_dict_container.set("sitk_moving", new_image)
+    if recompute or patient_dict_container.get("fused_images") is None \
+            or not moving_dict_container.has_attribute("sitk_moving"):
+        register_images_for_fusion(recompute)
 
-    create_fused_model(orig_image, new_image)
     color_axial, color_sagittal, color_coronal, tfm = \
         get_fused_window(level, window)
 
@@ -0,0 +1,232 @@
+"""
+Blending of the PET heatmap over the CT images of the PET/CT view.
+
+The CT slice on display is kept windowed as a uint8 numpy array, and the
+PET slice as an RGB uint8 heatmap on the grid of the CT slice. The PET
+slice is looked up in the PET volume resampled onto the CT grid by
+PTCTModel, or stretched over the CT slice when the image sets do not
+share a frame of reference. Both are only recomputed when the slice, the
+view or a window changes. Changing the opacity blends the two arrays with
+integer fixed point arithmetic into an output buffer that is reused
+between slices, and that a single QImage wraps without copying, instead
+of compositing two QImages with a QPainter.
+
+Example usage:
+blender = PTCTBlender(PTCTDictContainer())
+qimage = blender.blend("axial", slice_id, alpha)
+"""
+import numpy as np
+from PySide6 import QtGui
+
+from src.Model.CalculateImages import window_pixels
+
+# Number of fractional bits of the fixed point opacity
+ALPHA_BITS = 8
+
+# Slice views, and the axis of the pixel array each view slices along
+SLICE_AXES = {"axial": 0, "coronal": 1, "sagittal": 2}
+
+_heatmap_lut = None
+
+
+def get_heatmap_lut():
+    """
+    :return: (256, 3) uint8 array of the RGB colour of every windowed PET
+        pixel value, i.e. the HOT colormap of OpenCV.
+    """
+    global _heatmap_lut
+    if _heatmap_lut is None:
+        import cv2
+
+        grey = np.arange(256, dtype=np.uint8).reshape(256, 1)
+        heatmap = cv2.applyColorMap(grey, cv2.COLORMAP_HOT)
+        _heatmap_lut = np.ascontiguousarray(
+            cv2.cvtColor(heatmap, cv2.COLOR_BGR2RGB).reshape(256, 3))
+    return _heatmap_lut
+
+
+def get_view_slice(pixel_array_3d, slice_view, slice_id):
+    """
+    :param pixel_array_3d: 3D pixel array of an image set.
+    :param slice_view: "axial", "coronal" or "sagittal".
+    :param slice_id: Index of the slice in the view.
+    :return: 2D pixel array of the slice.
+    """
+    return np.take(pixel_array_3d, slice_id, axis=SLICE_AXES[slice_view])
+
+
+def get_slice_count(pixel_array_3d, slice_view):
+    """
+    :param pixel_array_3d: 3D pixel array of an image set.
+    :param slice_view: "axial", "coronal" or "sagittal".
+    :return: Number of slices in the view.
+    """
+    return pixel_array_3d.shape[SLICE_AXES[slice_view]]
+
+
+def get_interpolation_indexes(source_size, target_size):
+    """
+    :param source_size: Number of pixels of an axis of the source image.
+    :param target_size: Number of pixels of the axis in the target image.
+    :return: Tuple (lower, upper, weight) of the source pixels on either
+        side of the centre of every target pixel, and the weight of the
+        upper pixel.
+    """
+    position = (np.arange(target_size) + 0.5) * source_size / target_size \
+        - 0.5
+    position = np.clip(position, 0, source_size - 1)
+    lower = np.floor(position).astype(np.intp)
+    upper = np.minimum(lower + 1, source_size - 1)
+    return lower, upper, (position - lower).astype(np.float32)
+
+
+def resize_slice(np_pixels, height, width):
+    """
+    Resize a slice with bilinear interpolation.
+    :param np_pixels: 2D uint8 array of the slice.
+    :param height: Number of rows of the resized slice.
+    :param width: Number of columns of the resized slice.
+    :return: 2D uint8 array of the resized slice.
+    """
+    if np_pixels.shape == (height, width):
+        return np_pixels
+    lower, upper, weight = get_interpolation_indexes(np_pixels.shape[0],
+                                                     height)
+    pixels = np_pixels.astype(np.float32)
+    pixels = pixels[lower] + (pixels[upper] - pixels[lower]) \
+        * weight[:, np.newaxis]
+    lower, upper, weight = get_interpolation_indexes(np_pixels.shape[1],
+                                                     width)
+    pixels = pixels[:, lower] + (pixels[:, upper] - pixels[:, lower]) \
+        * weight
+    return np.rint(pixels).astype(np.uint8)
+
+
+def blend_slices(ct_slice, pt_slice, alpha, out=None, pt_scratch=None,
+                 ct_scratch=None):
+    """
+    Blend the PET heatmap over the CT slice, as painting it with an
+    opacity of alpha would, in fixed point arithmetic.
+    :param ct_slice: (rows, columns) uint8 array of the windowed CT.
+    :param pt_slice: (rows, columns, 3) uint8 array of the PET heatmap.
+    :param alpha: Opacity of the PET heatmap, from 0 to 1.
+    :param out: (rows, columns, 3) uint8 array the blended slice is
+        written to. Allocated when None.
+    :param pt_scratch: (rows, columns, 3) uint16 array of intermediate
+        values. Allocated when None.
+    :param ct_scratch: (rows, columns) uint16 array of intermediate
+        values. Allocated when None.
+    :return: out
+    """
+    if out is None:
+        out = np.empty(pt_slice.shape, dtype=np.uint8)
+    if pt_scratch is None:
+        pt_scratch = np.empty(pt_slice.shape, dtype=np.uint16)
+    if ct_scratch is None:
+        ct_scratch = np.empty(ct_slice.shape, dtype=np.uint16)
+
+    # The weights add up to 1 << ALPHA_BITS, so that a weighted sum of
+    # uint8 values fits in uint16
+    one = 1 << ALPHA_BITS
+    pt_weight = int(round(min(max(alpha, 0), 1) * one))
+    np.multiply(pt_slice, pt_weight, out=pt_scratch, dtype=np.uint16)
+    np.multiply(ct_slice, one - pt_weight, out=ct_scratch, dtype=np.uint16)
+    np.add(pt_scratch, ct_scratch[:, :, np.newaxis], out=pt_scratch)
+    np.add(pt_scratch, one >> 1, out=pt_scratch, dtype=np.uint16)
+    np.right_shift(pt_scratch, ALPHA_BITS, out=pt_scratch, dtype=np.uint16)
+    np.copyto(out, pt_scratch, casting="unsafe")
+    return out
+
+
+class PTCTBlender:
+    """
+    Blends the slices of the PET/CT view, keeping the windowed CT slice,
+    the PET heatmap and the blended slice on display.
+    """
+
+    def __init__(self, pt_ct_dict_container):
+        """
+        :param pt_ct_dict_container: PTCTDictContainer holding the pixel
+            values, windows and levels of the PET and CT images.
+        """
+        self.pt_ct_dict_container = pt_ct_dict_container
+        self.ct_pixel_array = np.asarray(
+            pt_ct_dict_container.get("ct_pixel_values"))
+        # The PET images resampled onto the CT grid share the slice
+        # indexes of the CT images
+        pt_pixel_values = pt_ct_dict_container.get("pt_ct_pixel_values")
+        if pt_pixel_values is None:
+            pt_pixel_values = pt_ct_dict_container.get("pt_pixel_values")
+        self.pt_pixel_array = np.asarray(pt_pixel_values)
+        self.slice_key = None
+        self.ct_slice = None
+        self.pt_slice = None
+        self.buffer = None
+        self.pt_scratch = None
+        self.ct_scratch = None
+        self.qimage = None
+
+    def get_slice_count(self, slice_view):
+        """
+        :param slice_view: "axial", "coronal" or "sagittal".
+        :return: Number of CT slices in the view.
+        """
+        return get_slice_count(self.ct_pixel_array, slice_view)
+
+    def update_slices(self, slice_view, slice_id):
+        """
+        Window the CT slice and create the PET heatmap of a slice, unless
+        they are on display with the current windows already.
+        :param slice_view: "axial", "coronal" or "sagittal".
+        :param slice_id: Index of the CT slice in the view.
+        """
+        container = self.pt_ct_dict_container
+        ct_window = container.get("ct_window")
+        ct_level = container.get("ct_level")
+        pt_suv_factor = container.get("pt_suv_factor") or 1
+        pt_window = container.get("pt_window") * pt_suv_factor
+        pt_level = container.get("pt_level") * pt_suv_factor
+        slice_key = (slice_view, slice_id, ct_window, ct_level, pt_window,
+                     pt_level)
+        if slice_key == self.slice_key:
+            return
+
+        ct_slice = window_pixels(
+            get_view_slice(self.ct_pixel_array, slice_view, slice_id),
+            ct_window, ct_level)
+
+        # The PET slice at the same fraction of the volume, stretched over
+        # the CT slice, unless it has been resampled onto the CT grid
+        ratio = get_slice_count(self.pt_pixel_array, slice_view) \
+            / self.get_slice_count(slice_view)
+        pt_slice = window_pixels(
+            get_view_slice(self.pt_pixel_array, slice_view,
+                           int(ratio * slice_id)),
+            pt_window, pt_level)
+        pt_slice = resize_slice(pt_slice, *ct_slice.shape)
+
+        self.ct_slice = ct_slice
+        self.pt_slice = get_heatmap_lut()[pt_slice]
+        if self.buffer is None or self.buffer.shape != self.pt_slice.shape:
+            self.buffer = np.empty(self.pt_slice.shape, dtype=np.uint8)
+            self.pt_scratch = np.empty(self.pt_slice.shape,
+                                       dtype=np.uint16)
+            self.ct_scratch = np.empty(ct_slice.shape, dtype=np.uint16)
+            height, width = ct_slice.shape
+            self.qimage = QtGui.QImage(self.buffer.data, width, height,
+                                       3 * width, QtGui.QImage.Format_RGB888)
+        self.slice_key = slice_key
+
+    def blend(self, slice_view, slice_id, alpha):
+        """
+        :param slice_view: "axial", "coronal" or "sagittal".
+        :param slice_id: Index of the CT slice in the view.
+        :param alpha: Opacity of the PET heatmap, from 0 to 1.
+        :return: QImage of the blended slice. It shares its memory with
+            the buffer of the blender, and is only valid until the next
+            call.
+        """
+        self.update_slices(slice_view, slice_id)
+        blend_slices(self.ct_slice, self.pt_slice, alpha, self.buffer,
+                     self.pt_scratch, self.ct_scratch)
+        return self.qimage
@@ -1,14 +1,146 @@
+import numpy as np
 import pydicom
 
 from src.constants import CT_RESCALE_INTERCEPT
 
-from src.Model.CalculateImages import convert_raw_data, get_pixmaps
-from src.Model.GetPatientInfo import get_basic_info, dict_instance_uid
+from src.Model.CalculateImages import convert_raw_data
+from src.Model.GetPatientInfo import get_basic_info
+from src.Model import SUV
+from src.Model.SliceGeometry import SliceGeometry
 
 from src.Model.PTCTDictContainer import PTCTDictContainer
 
 
-def create_pt_ct_model():
+def get_image_grid(dataset, slice_geometry):
+    """
+    :param dataset: Dictionary of the image datasets of an image set.
+    :param slice_geometry: SliceGeometry of the image set.
+    :return: Tuple (origins, row_step, column_step) of the position of
+        the first pixel of every slice, in the order of the pixel values,
+        and the displacement in mm from one row, and one column, of a
+        slice to the next.
+    """
+    keys = SUV.get_image_keys(dataset)
+    indexes = np.searchsorted(slice_geometry.slice_keys, keys)
+    origins = slice_geometry.positions[indexes]
+
+    orientation = np.array([float(value) for value
+                            in dataset[keys[0]].ImageOrientationPatient])
+    row_spacing, column_spacing = \
+        [float(value) for value in dataset[keys[0]].PixelSpacing]
+    return origins, orientation[3:6] * row_spacing, \
+        orientation[0:3] * column_spacing
+
+
+def get_image_coordinates(origin, row_step, column_step, direction,
+                          reference, spacing):
+    """
+    :param origin: Position of the first pixel of the slice.
+    :param row_step: Displacement from one row of the slice to the next.
+    :param column_step: Displacement from one column of the slice to the
+        next.
+    :param direction: Unit vector of a pixel axis of the other image.
+    :param reference: Position of the first pixel of the other image.
+    :param spacing: Pixel spacing of the other image along the axis.
+    :return: Tuple (offset, per_row, per_column) of the coordinate along
+        the axis, in pixels of the other image, of the first pixel of
+        the slice and its change per row and per column.
+    """
+    return (origin - reference).dot(direction) / spacing, \
+        row_step.dot(direction) / spacing, \
+        column_step.dot(direction) / spacing
+
+
+def resample_pt_to_ct(pt_pixel_array, pt_dataset, pt_slice_geometry,
+                      ct_shape, ct_dataset, ct_slice_geometry,
+                      interrupt_flag=None):
+    """
+    Resample the PET volume onto the grid of the CT volume with linear
+    interpolation, using the position and orientation of the slices of
+    both image sets in patient space. CT pixels outside the PET volume
+    are 0.
+    :param pt_pixel_array: 3D array of the PET pixel values.
+    :param pt_dataset: Dictionary of the PET image datasets.
+    :param pt_slice_geometry: SliceGeometry of the PET image set.
+    :param ct_shape: Shape of the 3D array of the CT pixel values.
+    :param ct_dataset: Dictionary of the CT image datasets.
+    :param ct_slice_geometry: SliceGeometry of the CT image set.
+    :param interrupt_flag: A threading.Event() object that tells the
+        function to stop.
+    :return: float32 array of the PET pixel values with the shape of the
+        CT volume, or None if interrupted.
+    """
+    from scipy import ndimage
+
+    pt_origins, pt_row_step, pt_column_step = \
+        get_image_grid(pt_dataset, pt_slice_geometry)
+    ct_origins, ct_row_step, ct_column_step = \
+        get_image_grid(ct_dataset, ct_slice_geometry)
+
+    # In-plane pixel axes of the PET image, and the PET slices sorted by
+    # their stack position for interpolating fractional slice indexes
+    row_spacing = np.linalg.norm(pt_row_step)
+    column_spacing = np.linalg.norm(pt_column_step)
+    row_direction = pt_row_step / row_spacing
+    column_direction = pt_column_step / column_spacing
+    normal = pt_slice_geometry.normal
+    pt_z = pt_origins.dot(normal)
+    order = np.argsort(pt_z, kind="stable")
+    sorted_z = pt_z[order]
+    half_spacing = pt_slice_geometry.spacing / 2
+
+    rows = np.arange(ct_shape[1], dtype=np.float64)[:, np.newaxis]
+    columns = np.arange(ct_shape[2], dtype=np.float64)[np.newaxis, :]
+    pt_pixel_array = np.asarray(pt_pixel_array, dtype=np.float32)
+    resampled = np.zeros(ct_shape, dtype=np.float32)
+
+    for i, ct_origin in enumerate(ct_origins):
+        if interrupt_flag is not None and interrupt_flag.is_set():
+            return None
+
+        # PET pixel coordinates of every CT pixel are affine in its row
+        # and column
+        coordinates = []
+        for direction, reference, spacing in (
+                (row_direction, pt_origins[order[0]], row_spacing),
+                (column_direction, pt_origins[order[0]], column_spacing),
+                (normal, np.zeros(3), 1.0)):
+            offset, per_row, per_column = get_image_coordinates(
+                ct_origin, ct_row_step, ct_column_step, direction,
+                reference, spacing)
+            coordinates.append(offset + rows * per_row
+                               + columns * per_column)
+        row_coordinates, column_coordinates, z = coordinates
+
+        # The end slices of the PET stack extend half a slice beyond
+        # their positions, and anything further is outside the stack
+        slice_coordinates = np.interp(z, sorted_z, order.astype(float))
+        outside = (z < sorted_z[0] - half_spacing) \
+            | (z > sorted_z[-1] + half_spacing)
+        slice_coordinates[outside] = -1
+
+        ndimage.map_coordinates(
+            pt_pixel_array,
+            [slice_coordinates, row_coordinates, column_coordinates],
+            output=resampled[i], order=1, mode="constant", cval=0)
+    return resampled
+
+
+def is_same_frame_of_reference(pt_dataset, ct_dataset):
+    """
+    :param pt_dataset: Dictionary of the PET image datasets.
+    :param ct_dataset: Dictionary of the CT image datasets.
+    :return: False if the image sets have different FrameOfReferenceUIDs,
+        meaning their positions in patient space do not correspond.
+    """
+    pt_uid = pt_dataset[SUV.get_image_keys(pt_dataset)[0]].get(
+        "FrameOfReferenceUID")
+    ct_uid = ct_dataset[SUV.get_image_keys(ct_dataset)[0]].get(
+        "FrameOfReferenceUID")
+    return pt_uid is None or ct_uid is None or pt_uid == ct_uid
+
+
+def create_pt_ct_model(interrupt_flag=None):
     """
     This function initializes all the attributes in the
     MovingDictContainer model required for the operation of the main
@@ -16,6 +148,8 @@ def create_pt_ct_model():
     main window's components are constructed, but after the initial
     values of the MovingDictContainer instance are set (i.e. dataset
     and filepaths).
+    :param interrupt_flag: A threading.Event() object that tells the
+        function to stop resampling the PET images.
     """
     ##############################
     #  LOAD PATIENT INFORMATION  #
@@ -53,6 +187,18 @@ def create_pt_ct_model():
     else:
         pt_pixel_values = convert_raw_data(pt_dataset, True)
 
+    # Display the PT images in SUV when possible, so that the heatmap
+    # shares its pixel values with the rest of OnkoDICOM. The window
+    # and level stay in Bq/mL and are scaled by the SUV factor.
+    pt_datasets = [pt_dataset[key] for key in SUV.get_image_keys(pt_dataset)]
+    try:
+        pt_pixel_values = SUV.get_suv_volume(
+            pt_ct_dict_container, pt_datasets, pt_pixel_values, True)
+        pt_suv_factor = pt_ct_dict_container.get("suv_factor")
+    except SUV.SUVError:
+        pt_suv_factor = 1
+    pt_ct_dict_container.set("pt_suv_factor", pt_suv_factor)
+
     # Calculate the ratio between x axis and y axis of 3 views
     pt_pixmap_aspect = {}
     pt_pixel_spacing = pt_dataset[0].PixelSpacing
@@ -60,21 +206,17 @@ def create_pt_ct_model():
     pt_pixmap_aspect["axial"] = pt_pixel_spacing[1] / pt_pixel_spacing[0]
     pt_pixmap_aspect["sagittal"] = pt_pixel_spacing[1] / pt_slice_thickness
     pt_pixmap_aspect["coronal"] = pt_slice_thickness / pt_pixel_spacing[0]
-    
-    # Pass in "heat" into the get_pixmaps function to produce
-    # a heatmap for the given images.
-    pt_pixmaps_axial, pt_pixmaps_coronal, pt_pixmaps_sagittal = \
-        get_pixmaps(pt_pixel_values, window, level, pt_pixmap_aspect,
-                    fusion=True, color="Heat")
-    pt_ct_dict_container.set("pt_pixmaps_axial", pt_pixmaps_axial)
-    pt_ct_dict_container.set("pt_pixmaps_coronal", pt_pixmaps_coronal)
-    pt_ct_dict_container.set("pt_pixmaps_sagittal", pt_pixmaps_sagittal)
-    pt_ct_dict_container.set("pt_pixel_values", pt_pixel_values)
+
+    # The PET heatmap of the slice on display is created from the pixel
+    # values by PETCTView, instead of a pixmap of every slice here.
+    pt_ct_dict_container.set("pt_pixel_values", np.asarray(pt_pixel_values))
     pt_ct_dict_container.set("pt_pixmap_aspect", pt_pixmap_aspect)
 
     basic_info = get_basic_info(pt_dataset[0])
     pt_ct_dict_container.set("pt_basic_info", basic_info)
-    pt_ct_dict_container.set("pt_dict_uid", dict_instance_uid(pt_dataset))
+    pt_slice_geometry = SliceGeometry(pt_dataset)
+    pt_ct_dict_container.set("pt_slice_geometry", pt_slice_geometry)
+    pt_ct_dict_container.set("pt_dict_uid", pt_slice_geometry.slice_to_uid)
 
     # Set up CT images
     if 'WindowWidth' in ct_dataset[0]:
@@ -112,16 +254,26 @@ def create_pt_ct_model():
     ct_pixmap_aspect["axial"] = ct_pixel_spacing[1] / ct_pixel_spacing[0]
     ct_pixmap_aspect["sagittal"] = ct_pixel_spacing[1] / ct_slice_thickness
     ct_pixmap_aspect["coronal"] = ct_slice_thickness / ct_pixel_spacing[0]
-    ct_pixmaps_axial, ct_pixmaps_coronal, ct_pixmaps_sagittal = \
-        get_pixmaps(ct_pixel_values, window, level, ct_pixmap_aspect,
-                    fusion=True)
-
-    pt_ct_dict_container.set("ct_pixmaps_axial", ct_pixmaps_axial)
-    pt_ct_dict_container.set("ct_pixmaps_coronal", ct_pixmaps_coronal)
-    pt_ct_dict_container.set("ct_pixmaps_sagittal", ct_pixmaps_sagittal)
-    pt_ct_dict_container.set("ct_pixel_values", ct_pixel_values)
+    pt_ct_dict_container.set("ct_pixel_values", np.asarray(ct_pixel_values))
     pt_ct_dict_container.set("ct_pixmap_aspect", ct_pixmap_aspect)
 
     basic_info = get_basic_info(ct_dataset[0])
     pt_ct_dict_container.set("ct_basic_info", basic_info)
-    pt_ct_dict_container.set("ct_dict_uid", dict_instance_uid(ct_dataset))
+    ct_slice_geometry = SliceGeometry(ct_dataset)
+    pt_ct_dict_container.set("ct_slice_geometry", ct_slice_geometry)
+    pt_ct_dict_container.set("ct_dict_uid", ct_slice_geometry.slice_to_uid)
+
+    # Resample the PET images onto the CT grid once, so that a CT slice
+    # and the PET slice at the same position share their index. PET/CT
+    # images of different frames of reference are stretched over each
+    # other by PETCTView instead.
+    if not pt_ct_dict_container.has_attribute("pt_ct_pixel_values") \
+            and is_same_frame_of_reference(pt_dataset, ct_dataset):
+        pt_ct_pixel_values = resample_pt_to_ct(
+            pt_ct_dict_container.get("pt_pixel_values"), pt_dataset,
+            pt_slice_geometry, pt_ct_dict_container.get(
+                "ct_pixel_values").shape,
+            ct_dataset, ct_slice_geometry, interrupt_flag)
+        if pt_ct_pixel_values is not None:
+            pt_ct_dict_container.set("pt_ct_pixel_values",
+                                     pt_ct_pixel_values)
@@ -0,0 +1,216 @@
+"""
+Decode stage for the pixel data of an image stack.
+
+Image slices stored with a compressed transfer syntax (JPEG 2000,
+JPEG-LS, RLE, ...) are decoded by pydicom's pixel data handlers the
+first time their pixel array is accessed. Doing this one slice at a time
+on the loader thread makes loading a compressed series far slower than
+loading an uncompressed one, so this module decodes the whole stack at
+once, fanning the slices out to a pool of workers. Every worker writes
+its slice directly into one preallocated volume buffer, and each
+dataset's pixel array becomes a view into that volume.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from multiprocessing import RawArray
+
+import numpy as np
+from pydicom import dcmread
+from pydicom.pixel_data_handlers.util import get_image_pixel_ids, \
+    pixel_dtype
+
+from src.Model.ForkPool import imap_forked, is_fork_safe
+
+
+def get_image_keys(dict_ds):
+    """
+    :param dict_ds: Dictionary of PyDicom datasets.
+    :return: Sorted list of the keys of the image slices.
+    """
+    return sorted(key for key in dict_ds if str(key).isnumeric())
+
+
+def is_compressed(ds):
+    """
+    :param ds: PyDicom dataset.
+    :return: True if the pixel data is stored with a compressed transfer
+        syntax.
+    """
+    file_meta = getattr(ds, "file_meta", None)
+    if file_meta is None or "TransferSyntaxUID" not in file_meta:
+        return False
+    return file_meta.TransferSyntaxUID.is_compressed
+
+
+def get_volume_layout(dict_ds, image_keys):
+    """
+    Determine the shape and data type of the volume the image slices
+    are decoded into.
+    :param dict_ds: Dictionary of PyDicom datasets.
+    :param image_keys: Keys of the image slices in dict_ds.
+    :return: Tuple (shape, dtype), or None if the slices can not share
+        one volume (e.g. they differ in size or hold multiple frames).
+    """
+    first = dict_ds[image_keys[0]]
+    layout = (first.Rows, first.Columns, first.BitsAllocated,
+              first.PixelRepresentation)
+    for key in image_keys:
+        ds = dict_ds[key]
+        if "PixelData" not in ds \
+                or ds.get("SamplesPerPixel", 1) != 1 \
+                or int(ds.get("NumberOfFrames", 1) or 1) != 1 \
+                or (ds.Rows, ds.Columns, ds.BitsAllocated,
+                    ds.PixelRepresentation) != layout:
+            return None
+
+    shape = (len(image_keys), first.Rows, first.Columns)
+    return shape, pixel_dtype(first)
+
+
+def decode_pixel_data(dict_ds, filepaths=None, progress_callback=None,
+                      interrupt_flag=None, max_workers=None):
+    """
+    Decode the pixel data of every image slice into one preallocated
+    volume. Compressed slices are decoded in parallel. On fork-safe
+    platforms, when the filepaths are given, a process pool is used so
+    that decoding is not serialised by the GIL; otherwise a thread pool
+    is used. After decoding, the pixel array of each dataset is a view
+    into the returned volume, so later calls to convert_pixel_data() or
+    pixel_array do not decode the slice again.
+    :param dict_ds: Dictionary of PyDicom datasets as produced by
+        ImageLoading.get_datasets(..).
+    :param filepaths: Dictionary of filepaths with the same keys as
+        dict_ds.
+    :param progress_callback: A signal that receives the current
+        progress of the decoding.
+    :param interrupt_flag: A threading.Event() object that tells the
+        function to stop decoding.
+    :param max_workers: Number of workers. Defaults to the CPU count.
+    :return: The decoded volume as a numpy array with the shape
+        (slices, rows, columns), or None if the slices could not be
+        decoded into a shared volume or decoding was interrupted.
+    """
+    image_keys = get_image_keys(dict_ds)
+    if not image_keys:
+        return None
+
+    layout = get_volume_layout(dict_ds, image_keys)
+    if layout is None:
+        return None
+    shape, dtype = layout
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    compressed = is_compressed(dict_ds[image_keys[0]])
+
+    # Uncompressed slices are cheap to decode and are not worth the
+    # overhead of a pool at all.
+    if not compressed or max_workers == 1:
+        volume = np.empty(shape, dtype=dtype)
+        completed = _decode_serial(dict_ds, image_keys, volume,
+                                   progress_callback, interrupt_flag)
+    elif filepaths is not None and is_fork_safe():
+        volume, completed = _decode_in_processes(
+            dict_ds, filepaths, image_keys, shape, dtype, max_workers,
+            progress_callback, interrupt_flag)
+    else:
+        volume = np.empty(shape, dtype=dtype)
+        completed = _decode_in_threads(dict_ds, image_keys, volume,
+                                       max_workers, progress_callback,
+                                       interrupt_flag)
+
+    if not completed:
+        return None
+    return volume
+
+
+def emit_decode_progress(progress_callback, decoded, total):
+    """
+    Report the progress of decoding through the progress callback.
+    :param progress_callback: A signal that receives the current
+        progress of the decoding.
+    :param decoded: Number of slices decoded so far.
+    :param total: Total number of slices.
+    """
+    if progress_callback is not None:
+        progress_callback.emit(
+            ("Decoding pixel data... (%d/%d)" % (decoded, total),
+             int(10 * decoded / total)))
+
+
+def _decode_slice(ds, volume, index):
+    """
+    Decode the pixel data of one dataset into the volume and make the
+    dataset's pixel array a view into it.
+    """
+    ds.convert_pixel_data()
+    volume[index] = ds._pixel_array
+    ds._pixel_array = volume[index]
+
+
+def _decode_serial(dict_ds, image_keys, volume, progress_callback,
+                   interrupt_flag):
+    total = len(image_keys)
+    for index, key in enumerate(image_keys):
+        if interrupt_flag is not None and interrupt_flag.is_set():
+            return False
+        _decode_slice(dict_ds[key], volume, index)
+        emit_decode_progress(progress_callback, index + 1, total)
+    return True
+
+
+def _decode_in_threads(dict_ds, image_keys, volume, max_workers,
+                       progress_callback, interrupt_flag):
+    total = len(image_keys)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_decode_slice, dict_ds[key], volume,
+                                   index)
+                   for index, key in enumerate(image_keys)]
+        for decoded, future in enumerate(as_completed(futures), 1):
+            future.result()
+            emit_decode_progress(progress_callback, decoded, total)
+            if interrupt_flag is not None and interrupt_flag.is_set():
+                for pending in futures:
+                    pending.cancel()
+                return False
+    return True
+
+
+def _decode_file(task, volume):
+    """
+    Read and decode one slice in a worker process, writing it into the
+    shared volume.
+    :param task: Tuple (index, filepath).
+    :param volume: Volume in shared memory.
+    """
+    index, filepath = task
+    volume[index] = dcmread(filepath).pixel_array
+
+
+def _decode_in_processes(dict_ds, filepaths, image_keys, shape, dtype,
+                         max_workers, progress_callback, interrupt_flag):
+    # The volume is allocated in shared memory, so that the slices the
+    # forked workers write into it are seen by this process.
+    dtype = np.dtype(dtype)
+    buffer = RawArray('b', int(np.prod(shape)) * dtype.itemsize)
+    volume = np.frombuffer(buffer, dtype=dtype).reshape(shape)
+
+    tasks = [(index, filepaths[key]) for index, key in enumerate(image_keys)]
+    total = len(tasks)
+    results = imap_forked(_decode_file, tasks, shared=(volume,),
+                          max_workers=max_workers)
+    for decoded, _ in enumerate(results, 1):
+        emit_decode_progress(progress_callback, decoded, total)
+        if interrupt_flag is not None and interrupt_flag.is_set():
+            # Closing the results terminates the pool
+            results.close()
+            return volume, False
+
+    # The datasets in this process still hold the encoded pixel data.
+    # Point their pixel arrays at the decoded volume.
+    for index, key in enumerate(image_keys):
+        ds = dict_ds[key]
+        ds._pixel_array = volume[index]
+        ds._pixel_id = get_image_pixel_ids(ds)
+
+    return volume, True
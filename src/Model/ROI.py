@@ -4,24 +4,30 @@ import random
 import logging
 from copy import deepcopy
 from pathlib import Path
+import numpy as np
 import pydicom
-from alphashape import alphashape
 from pydicom.uid import generate_uid
 from pydicom import Dataset, Sequence
 from pydicom.dataset import FileMetaDataset, validate_file_meta
 from pydicom.tag import Tag
 from pydicom.uid import generate_uid, ImplicitVRLittleEndian
-from scipy.spatial.qhull import QhullError
-from shapely.geometry import Polygon, MultiPolygon, GeometryCollection
-from shapely.validation import make_valid
 
 from src.Model.MovingDictContainer import MovingDictContainer
 from src.View.util.PatientDictContainerHelper import get_dict_slice_to_uid
 from src.constants import DEFAULT_WINDOW_SIZE
 from src.Model.CalculateImages import *
 from src.Model.PatientDictContainer import PatientDictContainer
+from src.Model.SliceGeometry import get_slice_geometry
 from src.Model.Transform import inv_linear_transform
 
+# Largest radius in pixels of the disk outlines of pixels are closed with
+MAX_CLOSING_RADIUS = 20
+
+# Radius in pixels of the disk outlines of pixels are closed with, and
+# maximum distance in pixels of the simplified outlines to the pixels
+DEFAULT_CLOSING_RADIUS = 2
+DEFAULT_OUTLINE_TOLERANCE = 0.5
+
 # Disable INFO logging of shapely
 logging.getLogger('shapely.geos').setLevel(logging.CRITICAL)
 
@@ -33,7 +39,32 @@ geometry_manipulation = {
 }
 
 
-def rename_roi(rtss, roi_id, new_name):
+def mark_roi_modified(roi_number, rtss_owner="PATIENT"):
+    """
+    Record that an ROI changed since its DVH was calculated, so that the
+    DVH tab only recalculates the DVHs of modified ROIs. Nothing is
+    recorded if the DVHs have not been calculated. The rasterised masks
+    of the ROI are dropped from the mask cache.
+    :param roi_number: ROINumber of the modified ROI
+    :param rtss_owner: the type of patient dict container (either PATIENT
+        or MOVING) the rtss belongs to
+    """
+    if rtss_owner == "MOVING":
+        patient_dict_container = MovingDictContainer()
+    else:
+        patient_dict_container = PatientDictContainer()
+
+    modified_rois = patient_dict_container.get("dvh_modified_rois")
+    if modified_rois is not None:
+        modified_rois.add(roi_number)
+
+    mask_cache = patient_dict_container.get("roi_mask_cache")
+    rois = patient_dict_container.get("rois")
+    if mask_cache is not None and rois and roi_number in rois:
+        mask_cache.invalidate(rois[roi_number]["name"])
+
+
+def rename_roi(rtss, roi_id, new_name, rtss_owner="PATIENT"):
     """
     Renames the given Region of Interest. Creates a csv file storing all
         the renamed ROIs for the given RTSTRUCT file.
@@ -41,10 +72,13 @@ def rename_roi(rtss, roi_id, new_name):
     :param roi_id: ID the structure produced by
         ImageLoading.get_rois(..)
     :param new_name: The structure's new name
+    :param rtss_owner: the type of patient dict container (either PATIENT
+        or MOVING) the rtss belongs to
     """
     for sequence in rtss.StructureSetROISequence:
         if sequence.ROINumber == roi_id:
             sequence.ROIName = new_name
+            mark_roi_modified(roi_id, rtss_owner)
 
     return rtss
 
@@ -62,11 +96,13 @@ def delete_list_of_rois(rtss, rois_to_delete):
     return rtss
 
 
-def delete_roi(rtss, roi_name):
+def delete_roi(rtss, roi_name, rtss_owner="PATIENT"):
     """
     Delete ROI by name
     :param rtss: dataset of RTSS
     :param roi_name: ROIName
+    :param rtss_owner: the type of patient dict container (either PATIENT
+        or MOVING) the rtss belongs to
     :return: rtss, updated rtss dataset
     """
     # ROINumber
@@ -87,16 +123,22 @@ def delete_roi(rtss, roi_name):
         if elem.ReferencedROINumber == roi_number:
             del rtss.RTROIObservationsSequence[i]
 
+    if roi_number != -1:
+        mark_roi_modified(roi_number, rtss_owner)
+
     return rtss
 
 
-def add_to_roi(rtss, roi_name, roi_coordinates, data_set):
+def add_to_roi(rtss, roi_name, roi_coordinates, data_set,
+               rtss_owner="PATIENT"):
     """
         Add new contour image sequence ROI to rtss
         :param rtss: dataset of RTSS
         :param roi_name: ROIName
         :param roi_coordinates: Coordinates of pixels for new ROI
         :param data_set: Data Set of selected DICOM image file
+        :param rtss_owner: the type of patient dict container (either
+            PATIENT or MOVING) the rtss belongs to
         :return: rtss, with added ROI
     """
 
@@ -151,6 +193,7 @@ def add_to_roi(rtss, roi_name, roi_coordinates, data_set):
             contour.add_new(Tag("ContourData"), "DS", roi_coordinates[0:-3])
 
     rtss.ROIContourSequence[position].ContourSequence.extend(contour_sequence)
+    mark_roi_modified(existing_roi_number, rtss_owner)
 
     return rtss
 
@@ -187,9 +230,13 @@ def create_roi(rtss, roi_name, roi_list,
             rtss = add_new_roi(rtss, roi_name, roi_coordinates, data_set,
                                rt_roi_interpreted_type)
             roi_exists = True
+            # The new ROI is appended to the StructureSetROISequence
+            mark_roi_modified(rtss.StructureSetROISequence[-1].ROINumber,
+                              rtss_owner)
         else:
             # Add contour image data to existing ROI
-            rtss = add_to_roi(rtss, roi_name, roi_coordinates, data_set)
+            rtss = add_to_roi(rtss, roi_name, roi_coordinates, data_set,
+                              rtss_owner)
 
     return rtss
 
@@ -333,13 +380,19 @@ def _is_closed_contour(roi_coordinates):
     return True
 
 
-def get_raw_contour_data(rtss):
+def get_raw_contour_data(rtss, slice_geometry=None):
     """
     Get raw contour data of ROI in RT Structure Set
     :param rtss: RTSS dataset
+    :param slice_geometry: SliceGeometry of the image stack, used to
+        locate contours that have no ContourImageSequence. Defaults to
+        the SliceGeometry of the PatientDictContainer.
     :return: dict_roi, a dictionary of ROI contours; dict_num_points,
         number of points of contours.
     """
+    if slice_geometry is None:
+        slice_geometry = get_slice_geometry(PatientDictContainer())
+
     # Retrieve a dictionary of roi_name & ROINumber pairs
     dict_id = {}
     for i, elem in enumerate(rtss.StructureSetROISequence):
@@ -355,10 +408,10 @@ def get_raw_contour_data(rtss):
         dict_contour = collections.defaultdict(list)
         roi_points_count = 0
         for roi_slice in roi.ContourSequence:
-            referenced_sop_instance_uid = None
-            for contour_img in roi_slice.ContourImageSequence:
-                referenced_sop_instance_uid = \
-                    contour_img.ReferencedSOPInstanceUID
+            referenced_sop_instance_uid = \
+                slice_geometry.uid_of_contour(roi_slice)
+            if referenced_sop_instance_uid is None:
+                continue
             number_of_contour_points = roi_slice.NumberOfContourPoints
             roi_points_count += int(number_of_contour_points)
             contour_data = roi_slice.ContourData
@@ -748,12 +801,35 @@ def convert_coordinates_map_to_polygon_of_rois(contours_map):
 
 
 def calculate_concave_hull_of_points(pixel_coords, alpha=0.2):
+    """
+        Return the outline of the highlighted pixels using the alpha
+        entered by the user. For an alpha above 0 the outline is traced
+        on a raster of the pixels, closed over gaps of about the size of
+        the alpha shape's circles, rather than calculated as an alpha
+        shape, which is much slower for dense sets of pixels. An alpha of
+        0 gives the convex hull.
+        :param pixel_coords: the coordinates of the contour pixels
+        :param alpha: alpha value of the alpha shape
+        :return: List of lists of points ordered to form polygon(s).
+        """
+    if alpha > 0:
+        closing_radius = min(int(round(1 / alpha)), MAX_CLOSING_RADIUS)
+        return trace_pixel_outlines(pixel_coords, closing_radius)
+    return calculate_alpha_shape_of_points(pixel_coords, alpha)
+
+
+def calculate_alpha_shape_of_points(pixel_coords, alpha=0.2):
     """
         Return the alpha shape of the highlighted pixels using the alpha
         entered by the user.
         :param pixel_coords: the coordinates of the contour pixels
+        :param alpha: alpha value of the alpha shape
         :return: List of lists of points ordered to form polygon(s).
         """
+    from alphashape import alphashape
+    from scipy.spatial import QhullError
+    from shapely.geometry import Polygon, MultiPolygon
+
     # Get all the pixels in the drawing window's list of highlighted
     # pixels, excluding the removed pixels.
     target_pixel_coords = [(item[0] + 1, item[1] + 1) for item in
@@ -770,11 +846,64 @@ def calculate_concave_hull_of_points(pixel_coords, alpha=0.2):
     if isinstance(hull, Polygon):
         polygon_list.append(hull_to_points(hull))
     elif isinstance(hull, MultiPolygon):
-        for polygon in hull:
+        for polygon in hull.geoms:
             polygon_list.append(hull_to_points(polygon))
     return polygon_list
 
 
+def trace_pixel_outlines(pixel_coords, closing_radius=DEFAULT_CLOSING_RADIUS,
+                         tolerance=DEFAULT_OUTLINE_TOLERANCE):
+    """
+    Outline a set of pixels by splatting them into a mask of their
+    bounding box, closing the gaps between them with a disk and tracing
+    the boundary of the mask with find_contours. Holes are filled, as
+    only the exterior of an outline is kept.
+    :param pixel_coords: the (x, y) coordinates of the pixels
+    :param closing_radius: radius in pixels of the disk the mask is
+        closed with. Gaps narrower than about twice the radius are
+        bridged.
+    :param tolerance: maximum distance in pixels of the simplified
+        outline to the traced outline.
+    :return: List of lists of points ordered to form polygon(s), with
+        the same 1-based pixel coordinates as
+        calculate_alpha_shape_of_points(..).
+    """
+    from scipy import ndimage
+    from skimage.measure import approximate_polygon, find_contours
+
+    points = np.rint(np.asarray(pixel_coords, dtype=float)).astype(int)
+    if points.size == 0:
+        return []
+    points = points.reshape(-1, 2)
+
+    # Pad the bounding box, so that the closing is not cut off by it and
+    # the outlines are closed
+    closing_radius = max(int(closing_radius), 0)
+    padding = closing_radius + 1
+    origin = points.min(axis=0) - padding
+    columns, rows = points.max(axis=0) - origin + padding + 1
+    mask = np.zeros((rows, columns), dtype=bool)
+    mask[points[:, 1] - origin[1], points[:, 0] - origin[0]] = True
+
+    if closing_radius:
+        y, x = np.ogrid[-closing_radius:closing_radius + 1,
+                        -closing_radius:closing_radius + 1]
+        disk = x ** 2 + y ** 2 <= closing_radius ** 2
+        mask = ndimage.binary_closing(mask, structure=disk)
+    mask = ndimage.binary_fill_holes(mask)
+
+    polygon_list = []
+    for contour in find_contours(mask.astype(np.uint8), 0.5):
+        if tolerance > 0:
+            contour = approximate_polygon(contour, tolerance)
+        if len(contour) < 4:
+            continue
+        # (row, column) to 1-based (x, y) pixel coordinates
+        outline = np.rint(contour[:, ::-1] + origin + 1).astype(int)
+        polygon_list.append(outline.tolist())
+    return polygon_list
+
+
 def hull_to_points(hull):
     """
     This function converts hull data to pixel coordinates
@@ -1105,6 +1234,9 @@ def roi_to_geometry(dict_rois_contours):
     {slice-uid: contour sequence}
     :return: A dictionary with key-value pair {slice-uid: Geometry object}
     """
+    from shapely.geometry import Polygon, MultiPolygon
+    from shapely.validation import make_valid
+
     dict_geometry = {}
 
     for slice_uid, contour_sequence in dict_rois_contours.items():
@@ -1125,6 +1257,8 @@ def rois_difference(geom1, geom2):
     :param geom2: shapely Geometry
     :return: shapely Geometry
     """
+    from shapely.geometry import MultiPolygon
+
     if geom2.geom_type in ['MultiPolygon', 'GeometryCollection'] and \
             not geom2.is_empty:
         inner_geoms = []
@@ -1152,6 +1286,8 @@ def manipulate_rois(first_geometry_dict, second_geometry_dict, operation):
     :param operation: A string specifying the operation
     :return: A dictionary with key-value pair {slice-uid: Geometry Object}
     """
+    from shapely.geometry import Polygon
+
     image_uids = first_geometry_dict.keys() | second_geometry_dict.keys()
     result_geometry_dict = {}
 
@@ -1194,6 +1330,8 @@ def add_rois(geom1, geom2):
     :param geom2: Second geometry
     :return: GeometryCollection
     """
+    from shapely.geometry import GeometryCollection
+
     polygon_list = list([geom1]
                         if geom1.geom_type == 'Polygon'
                         else geom1) + \
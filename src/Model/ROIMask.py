@@ -0,0 +1,298 @@
+"""
+Raster backend for ROI manipulation.
+
+ROI.manipulate_rois, ROI.scale_roi and ROI.rind_roi operate on shapely
+geometries slice by slice. This module provides the same operations on
+boolean masks instead: the contours of an ROI are rasterised onto a
+(optionally supersampled) grid cropped to the ROIs involved, unions,
+intersections and differences become numpy bitwise operations, and
+margins are computed with a Euclidean distance transform, which expands
+or contracts the ROI across slices as well as within them. The result is
+converted back to contours with find_contours. The masks of grids created
+by create_mask_grid(..) are shared through the ROIMaskCache of the image
+set, so an ROI is only rasterised once.
+
+Example usage:
+grid = create_mask_grid(patient_dict_container, [dict_rois_contours],
+                        margin=5)
+mask = grid.roi_to_mask(dict_rois_contours)
+new_contours = grid.mask_to_roi(scale_mask(mask, 5, grid.spacing))
+"""
+import math
+
+import numpy as np
+
+from src.Model.ROIMaskCache import get_roi_mask_cache
+from src.Model.SliceGeometry import get_slice_geometry
+
+# Functions combining two masks for ROI Manipulation
+mask_manipulation = {
+    'INTERSECTION': lambda mask_1, mask_2: mask_1 & mask_2,
+    'UNION': lambda mask_1, mask_2: mask_1 | mask_2,
+    'DIFFERENCE': lambda mask_1, mask_2: mask_1 & ~mask_2
+}
+
+
+class MaskGrid:
+    """
+    The grid ROIs are rasterised onto. It covers a box of image slices,
+    rows and columns, where each pixel is split into
+    supersampling x supersampling cells.
+    """
+
+    def __init__(self, origin, size, pixel_spacing, slice_spacing,
+                 slice_to_uid, supersampling=1, image_size=None,
+                 mask_cache=None):
+        """
+        :param origin: (slice, row, column) of the first image pixel
+            covered by the grid.
+        :param size: Number of (slices, rows, columns) of image pixels
+            covered by the grid.
+        :param pixel_spacing: (row spacing, column spacing) of the image
+            in mm.
+        :param slice_spacing: Distance between slices in mm.
+        :param slice_to_uid: Dictionary of slice index to SOPInstanceUID.
+        :param supersampling: Number of cells each pixel is split into
+            along the rows and along the columns.
+        :param image_size: Number of (slices, rows, columns) of the
+            image. Defaults to the size of the grid.
+        :param mask_cache: ROIMaskCache of the image set masks are
+            requested from. Masks are rasterised by the grid if None.
+        """
+        self.origin = tuple(int(value) for value in origin)
+        self.image_size = tuple(int(value) for value in
+                                (size if image_size is None else image_size))
+        self.pixel_spacing = tuple(pixel_spacing)
+        self.slice_spacing = slice_spacing
+        self.mask_cache = mask_cache
+        self.supersampling = supersampling
+        self.shape = (int(size[0]), int(size[1]) * supersampling,
+                      int(size[2]) * supersampling)
+        self.spacing = (slice_spacing if slice_spacing > 0 else 1.0,
+                        pixel_spacing[0] / supersampling,
+                        pixel_spacing[1] / supersampling)
+        self.slice_to_uid = slice_to_uid
+        self.uid_to_slice = {uid: slice_index for slice_index, uid
+                             in slice_to_uid.items()}
+
+    def to_grid(self, value, axis):
+        """
+        Convert an image pixel coordinate to a grid coordinate.
+        :param value: Pixel coordinate, or numpy array of coordinates.
+        :param axis: 1 for rows, 2 for columns.
+        """
+        offset = (self.supersampling - 1) / 2
+        return (value - self.origin[axis]) * self.supersampling + offset
+
+    def to_image(self, value, axis):
+        """
+        Convert a grid coordinate to an image pixel coordinate.
+        :param value: Grid coordinate, or numpy array of coordinates.
+        :param axis: 1 for rows, 2 for columns.
+        """
+        offset = (self.supersampling - 1) / 2
+        return (value - offset) / self.supersampling + self.origin[axis]
+
+    def full_grid(self):
+        """
+        :return: MaskGrid covering the whole image, with the
+            supersampling of this grid.
+        """
+        return MaskGrid((0, 0, 0), self.image_size, self.pixel_spacing,
+                        self.slice_spacing, self.slice_to_uid,
+                        self.supersampling, mask_cache=self.mask_cache)
+
+    def rasterise_slice(self, contour_sequence):
+        """
+        Rasterise the contours of an ROI in a slice. Contours are
+        combined with exclusive or, so that a contour inside another
+        contour is a hole.
+        :param contour_sequence: List of contours, where each contour is
+            a list of [x, y] pixel coordinates.
+        :return: 2D boolean numpy array with the shape of a grid slice.
+        """
+        from skimage.draw import polygon
+
+        slice_mask = np.zeros(self.shape[1:], dtype=bool)
+        for contour_data in contour_sequence:
+            if len(contour_data) < 3:
+                continue
+            points = np.asarray(contour_data, dtype=float)
+            rows, columns = polygon(self.to_grid(points[:, 1], 1),
+                                    self.to_grid(points[:, 0], 2),
+                                    self.shape[1:])
+            slice_mask[rows, columns] ^= True
+        return slice_mask
+
+    def roi_to_mask(self, dict_roi_contours, roi_name=None):
+        """
+        Rasterise the contours of an ROI, or get its mask from the mask
+        cache of the grid.
+        :param dict_roi_contours: A dictionary with key-value pair
+            {slice-uid: contour sequence}, where each contour is a list
+            of [x, y] pixel coordinates.
+        :param roi_name: Name of the ROI, used by the mask cache to drop
+            the masks of its previous contours.
+        :return: Boolean numpy array with the shape of the grid.
+        """
+        if self.mask_cache is not None:
+            return self.mask_cache.get_mask(self, dict_roi_contours,
+                                            roi_name)
+
+        mask = np.zeros(self.shape, dtype=bool)
+        for slice_uid, contour_sequence in dict_roi_contours.items():
+            grid_slice = self.uid_to_slice[slice_uid] - self.origin[0]
+            if not 0 <= grid_slice < self.shape[0]:
+                continue
+            mask[grid_slice] = self.rasterise_slice(contour_sequence)
+        return mask
+
+    def mask_to_roi(self, mask):
+        """
+        Extract the contours of a mask.
+        :param mask: Boolean numpy array with the shape of the grid.
+        :return: A dictionary with key-value pair {slice-uid: contour
+            sequence}, in the same format as ROI.geometry_to_roi(..).
+        """
+        from skimage.measure import find_contours
+
+        roi_contour_sequence = {}
+        for grid_slice in np.flatnonzero(mask.any(axis=(1, 2))):
+            # Pad the slice so that contours touching the edge of the
+            # grid are closed.
+            padded = np.pad(mask[grid_slice], 1).astype(np.uint8)
+            contour_sequence = []
+            for contour in find_contours(padded, 0.5):
+                rows = np.rint(self.to_image(contour[:, 0] - 1, 1))
+                columns = np.rint(self.to_image(contour[:, 1] - 1, 2))
+                points = np.stack((columns, rows), axis=1).astype(int)
+
+                # Supersampled contours have runs of points that round to
+                # the same pixel.
+                keep = np.ones(len(points), dtype=bool)
+                keep[1:] = np.any(points[1:] != points[:-1], axis=1)
+                points = points[keep]
+                if len(points) >= 3:
+                    contour_sequence.append(points.tolist())
+
+            slice_uid = self.slice_to_uid[grid_slice + self.origin[0]]
+            if contour_sequence:
+                roi_contour_sequence[slice_uid] = contour_sequence
+        return roi_contour_sequence
+
+
+def create_mask_grid(patient_dict_container, rois_contours, margin=0,
+                     supersampling=1):
+    """
+    Create the grid covering a set of ROIs, padded so that expanding them
+    by the margin stays inside the grid.
+    :param patient_dict_container: PatientDictContainer of the image set.
+    :param rois_contours: List of dictionaries with key-value pair
+        {slice-uid: contour sequence} of the ROIs.
+    :param margin: Margin in mm the grid is padded by.
+    :param supersampling: Number of cells each pixel is split into along
+        the rows and along the columns.
+    :return: MaskGrid
+    """
+    slice_geometry = get_slice_geometry(patient_dict_container)
+    image_ds = patient_dict_container.dataset[0]
+    pixel_spacing = [float(value) for value in image_ds.PixelSpacing]
+    image_size = (len(slice_geometry), image_ds.Rows, image_ds.Columns)
+
+    slices = []
+    points = []
+    for dict_roi_contours in rois_contours:
+        for slice_uid, contour_sequence in dict_roi_contours.items():
+            slices.append(slice_geometry.uid_to_slice[slice_uid])
+            points.extend(point for contour_data in contour_sequence
+                          for point in contour_data)
+    mask_cache = get_roi_mask_cache(patient_dict_container)
+    if not points:
+        return MaskGrid((0, 0, 0), (0, 0, 0), pixel_spacing,
+                        slice_geometry.spacing, slice_geometry.slice_to_uid,
+                        supersampling, image_size, mask_cache)
+
+    # Bounding box of the ROIs as (slice, row, column)
+    points = np.asarray(points)
+    lower = [min(slices), points[:, 1].min(), points[:, 0].min()]
+    upper = [max(slices), points[:, 1].max(), points[:, 0].max()]
+
+    spacing = [slice_geometry.spacing] + pixel_spacing
+    origin = []
+    size = []
+    for axis in range(3):
+        padding = math.ceil(margin / spacing[axis]) + 1 \
+            if spacing[axis] > 0 else 0
+        start = max(int(lower[axis]) - padding, 0)
+        end = min(int(upper[axis]) + padding + 1, image_size[axis])
+        origin.append(start)
+        size.append(end - start)
+
+    return MaskGrid(origin, size, pixel_spacing, slice_geometry.spacing,
+                    slice_geometry.slice_to_uid, supersampling, image_size,
+                    mask_cache)
+
+
+def create_image_mask_grid(dict_container, supersampling=1):
+    """
+    Create the grid covering the whole image set.
+    :param dict_container: Dict container of the image set, i.e.
+        PatientDictContainer or MovingDictContainer.
+    :param supersampling: Number of cells each pixel is split into along
+        the rows and along the columns.
+    :return: MaskGrid
+    """
+    slice_geometry = get_slice_geometry(dict_container)
+    image_ds = dict_container.dataset[0]
+    pixel_spacing = [float(value) for value in image_ds.PixelSpacing]
+    image_size = (len(slice_geometry), image_ds.Rows, image_ds.Columns)
+    return MaskGrid((0, 0, 0), image_size, pixel_spacing,
+                    slice_geometry.spacing, slice_geometry.slice_to_uid,
+                    supersampling, mask_cache=get_roi_mask_cache(
+                        dict_container))
+
+
+def manipulate_masks(first_mask, second_mask, operation):
+    """
+    Combine the masks of two ROIs.
+    :param first_mask: The mask of the first ROI
+    :param second_mask: The mask of the second ROI
+    :param operation: A string specifying the operation
+    :return: Boolean numpy array
+    """
+    try:
+        return mask_manipulation[operation](first_mask, second_mask)
+    except KeyError:
+        raise Exception("Invalid operation string")
+
+
+def scale_mask(mask, millimetres, spacing):
+    """
+    Expand or contract a mask by a margin in every direction, including
+    across slices.
+    :param mask: Boolean numpy array
+    :param millimetres: positive means expansion, negative means
+        contraction
+    :param spacing: (slice, row, column) spacing of the mask in mm
+    :return: Boolean numpy array
+    """
+    from scipy.ndimage import distance_transform_edt
+
+    if millimetres >= 0:
+        # Distance from every cell outside the mask to the mask
+        return distance_transform_edt(~mask, sampling=spacing) \
+            <= millimetres
+    # Distance from every cell inside the mask to the outside
+    return distance_transform_edt(mask, sampling=spacing) > -millimetres
+
+
+def rind_mask(mask, millimetres, spacing):
+    """
+    Create Inner/Outer Rind for a mask
+    :param mask: Boolean numpy array
+    :param millimetres: positive means outer rind, negative means inner
+        rind
+    :param spacing: (slice, row, column) spacing of the mask in mm
+    :return: Boolean numpy array
+    """
+    return mask ^ scale_mask(mask, millimetres, spacing)
@@ -0,0 +1,216 @@
+"""
+Shared cache of rasterised ROI masks.
+
+ROI manipulation, lesion statistics, ROI transfer and radiomics each
+used to rasterise the contours of an ROI themselves, so the same ROI
+could be rasterised several times per session. They now request masks through
+MaskGrid.roi_to_mask(..), which rasterises an ROI once per grid of the
+image set, i.e. the image grid or a supersampled image grid, and keeps
+the mask as runs of set cells along the rows of every slice. Any grid of
+the image set cropped to a box (see ROIMask.create_mask_grid) is decoded
+from the runs.
+
+Masks are keyed by a hash of the contours of the ROI, so an edited ROI
+can never be served the mask of its previous contours. The masks of an
+ROI are also dropped when it is modified (see ROI.mark_roi_modified), or
+when it is requested by name with different contours. The cache lives in
+the dict container of the image set, so it is cleared with the patient.
+
+Example usage:
+mask_cache = get_roi_mask_cache(PatientDictContainer())
+mask = mask_cache.get_mask(grid, dict_roi_contours, roi_name)
+"""
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+# Maximum number of masks kept, the least recently used are dropped first
+MAX_CACHED_MASKS = 256
+
+
+def get_contours_hash(dict_roi_contours):
+    """
+    :param dict_roi_contours: A dictionary with key-value pair
+        {slice-uid: contour sequence} of an ROI in pixel coordinates.
+    :return: Hex digest identifying the contours.
+    """
+    sha1 = hashlib.sha1()
+    for slice_uid in sorted(dict_roi_contours, key=str):
+        sha1.update(str(slice_uid).encode())
+        for contour_data in dict_roi_contours[slice_uid]:
+            points = np.asarray(contour_data, dtype=np.float64)
+            sha1.update(str(points.shape).encode())
+            sha1.update(points.tobytes())
+    return sha1.hexdigest()
+
+
+class RunLengthMask:
+    """
+    A mask of the full grid of an image set, stored as the runs of set
+    cells along the rows of every slice.
+    """
+
+    def __init__(self, shape):
+        """
+        :param shape: (slices, rows, columns) of the grid.
+        """
+        self.shape = tuple(shape)
+        # Slice index to the (rows, starts, ends) arrays of its runs
+        self.runs = {}
+
+    def set_slice(self, slice_index, slice_mask):
+        """
+        :param slice_index: Index of the slice in the grid.
+        :param slice_mask: 2D boolean array of the slice.
+        """
+        padded = np.zeros((slice_mask.shape[0], slice_mask.shape[1] + 2),
+                          dtype=np.int8)
+        padded[:, 1:-1] = slice_mask
+        changes = np.diff(padded, axis=1)
+        rows, starts = np.nonzero(changes == 1)
+        _, ends = np.nonzero(changes == -1)
+        if len(rows):
+            self.runs[slice_index] = (rows.astype(np.int32),
+                                      starts.astype(np.int32),
+                                      ends.astype(np.int32))
+        else:
+            self.runs.pop(slice_index, None)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for runs in self.runs.values()
+                   for array in runs)
+
+    def to_mask(self, origin=(0, 0, 0), shape=None):
+        """
+        Decode the box of the mask.
+        :param origin: (slice, row, column) of the first cell of the box.
+        :param shape: (slices, rows, columns) of the box. Defaults to the
+            rest of the grid.
+        :return: Boolean numpy array of the box.
+        """
+        if shape is None:
+            shape = [size - start for size, start
+                     in zip(self.shape, origin)]
+        mask = np.zeros(shape, dtype=bool)
+        row_start, column_start = origin[1], origin[2]
+        for slice_index, (rows, starts, ends) in self.runs.items():
+            box_slice = slice_index - origin[0]
+            if not 0 <= box_slice < shape[0]:
+                continue
+            rows = rows - row_start
+            starts = np.clip(starts - column_start, 0, shape[2])
+            ends = np.clip(ends - column_start, 0, shape[2])
+            keep = (rows >= 0) & (rows < shape[1]) & (starts < ends)
+            if not np.any(keep):
+                continue
+
+            # Runs of a row do not touch, so every start and end is a
+            # distinct cell of the cumulative sum
+            changes = np.zeros((shape[1], shape[2] + 1), dtype=np.int8)
+            changes[rows[keep], starts[keep]] += 1
+            changes[rows[keep], ends[keep]] -= 1
+            mask[box_slice] = np.cumsum(changes[:, :-1], axis=1) > 0
+        return mask
+
+
+class ROIMaskCache:
+    """
+    The rasterised masks of the ROIs of an image set.
+    """
+
+    def __init__(self, max_masks=MAX_CACHED_MASKS):
+        """
+        :param max_masks: Maximum number of masks kept.
+        """
+        self.max_masks = max_masks
+        # (contours hash, supersampling) to RunLengthMask
+        self.masks = OrderedDict()
+        # ROI name to the contours hash of its masks
+        self.roi_hashes = {}
+
+    def get_run_length_mask(self, grid, dict_roi_contours, roi_name=None):
+        """
+        :param grid: MaskGrid of the image set.
+        :param dict_roi_contours: A dictionary with key-value pair
+            {slice-uid: contour sequence} of the ROI in pixel coordinates.
+        :param roi_name: Name of the ROI, used to drop the masks of its
+            previous contours.
+        :return: RunLengthMask of the ROI on the full grid of the image
+            set with the supersampling of the grid.
+        """
+        contours_hash = get_contours_hash(dict_roi_contours)
+        if roi_name is not None:
+            previous_hash = self.roi_hashes.get(roi_name)
+            if previous_hash not in (None, contours_hash):
+                self.drop_hash(previous_hash)
+            self.roi_hashes[roi_name] = contours_hash
+
+        key = (contours_hash, grid.supersampling)
+        if key in self.masks:
+            self.masks.move_to_end(key)
+            return self.masks[key]
+
+        full_grid = grid.full_grid()
+        run_length_mask = RunLengthMask(full_grid.shape)
+        for slice_uid, contour_sequence in dict_roi_contours.items():
+            slice_index = full_grid.uid_to_slice.get(slice_uid)
+            if slice_index is None \
+                    or not 0 <= slice_index < full_grid.shape[0]:
+                continue
+            run_length_mask.set_slice(
+                slice_index, full_grid.rasterise_slice(contour_sequence))
+
+        self.masks[key] = run_length_mask
+        while len(self.masks) > self.max_masks:
+            self.masks.popitem(last=False)
+        return run_length_mask
+
+    def get_mask(self, grid, dict_roi_contours, roi_name=None):
+        """
+        :param grid: MaskGrid of the image set, possibly cropped.
+        :param dict_roi_contours: A dictionary with key-value pair
+            {slice-uid: contour sequence} of the ROI in pixel coordinates.
+        :param roi_name: Name of the ROI, used to drop the masks of its
+            previous contours.
+        :return: Boolean numpy array with the shape of the grid.
+        """
+        run_length_mask = self.get_run_length_mask(grid, dict_roi_contours,
+                                                   roi_name)
+        origin = (grid.origin[0], grid.origin[1] * grid.supersampling,
+                  grid.origin[2] * grid.supersampling)
+        return run_length_mask.to_mask(origin, grid.shape)
+
+    def drop_hash(self, contours_hash):
+        """
+        Drop the masks of contours on every grid.
+        :param contours_hash: Hash of the contours.
+        """
+        for key in [key for key in self.masks if key[0] == contours_hash]:
+            del self.masks[key]
+
+    def invalidate(self, roi_name=None):
+        """
+        Drop the masks of a modified ROI.
+        :param roi_name: Name of the ROI. Every mask is dropped if None.
+        """
+        if roi_name is None:
+            self.masks.clear()
+            self.roi_hashes.clear()
+        elif roi_name in self.roi_hashes:
+            self.drop_hash(self.roi_hashes.pop(roi_name))
+
+
+def get_roi_mask_cache(dict_container):
+    """
+    Get the ROIMaskCache of a dict container, creating it on first use.
+    :param dict_container: Dict container holding the image datasets,
+        i.e. PatientDictContainer or MovingDictContainer.
+    :return: ROIMaskCache of the image set of the container.
+    """
+    mask_cache = dict_container.get("roi_mask_cache")
+    if mask_cache is None:
+        mask_cache = ROIMaskCache()
+        dict_container.set("roi_mask_cache", mask_cache)
+    return mask_cache
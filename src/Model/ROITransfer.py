@@ -1,16 +1,271 @@
-import SimpleITK as sitk
 from pathlib import Path
 
 import pydicom
 import numpy as np
-import SimpleITK as sitk
 
 from loguru import logger
-from platipy.dicom.io.rtstruct_to_nifti import fix_missing_data
-from skimage.draw import polygon
 
+from src.Model.ForkPool import map_forked
 from src.View.util.ProgressWindowHelper import check_interrupt_flag
 
+# Largest angle in degrees between the transformed contour planes and the
+# slices of the target image set for which contours are transferred
+# directly. Beyond it the ROIs are transferred through masks.
+MAX_CONTOUR_TILT = 10
+
+# Decimals of the transferred contour coordinates in mm
+CONTOUR_DECIMALS = 2
+
+# Number of ROIs packed into the bits of a label volume
+LABEL_BITS = 64
+
+
+def get_affine_transform(transform):
+    """
+    Get the affine matrix of a linear (rigid or affine) transform.
+
+    Args:
+        transform (sitk.Transform): The transform
+    Returns:
+        tuple: (matrix, offset) with transform.TransformPoint(p) equal to
+        matrix @ p + offset, or None if the transform is not linear, i.e.
+        deformable.
+    """
+    if not transform.IsLinear():
+        return None
+    offset = np.array(transform.TransformPoint((0.0, 0.0, 0.0)))
+    matrix = np.stack([np.array(transform.TransformPoint(tuple(axis)))
+                       - offset for axis in np.eye(3)], axis=1)
+    return matrix, offset
+
+
+def invert_affine_transform(matrix, offset):
+    """
+    Args:
+        matrix (np.ndarray): 3x3 matrix of an affine transform
+        offset (np.ndarray): offset of the transform
+    Returns:
+        tuple: (matrix, offset) of the inverse transform
+    """
+    inverse = np.linalg.inv(matrix)
+    return inverse, -inverse.dot(offset)
+
+
+def get_roi_contour_data(dicom_struct, roi_names):
+    """
+    Args:
+        dicom_struct (pydicom.Dataset): The DICOM RTSTRUCT
+        roi_names: the names of the ROIs
+    Returns:
+        dict: name of every ROI of roi_names in the RTSTRUCT to the list
+        of the ContourData of its contours
+    """
+    roi_numbers = {}
+    for roi in dicom_struct.StructureSetROISequence:
+        if roi.ROIName in roi_names:
+            roi_numbers[roi.ROINumber] = roi.ROIName
+
+    roi_contour_data = {}
+    for roi_contour in dicom_struct.ROIContourSequence:
+        name = roi_numbers.get(roi_contour.ReferencedROINumber)
+        if name is None:
+            continue
+        roi_contour_data[name] = [
+            contour.ContourData for contour
+            in roi_contour.get("ContourSequence", [])
+            if contour.get("ContourData")]
+    return roi_contour_data
+
+
+def transform_contours(contours, matrix, offset, source_geometry,
+                       target_geometry):
+    """
+    Transfer the contours of an ROI to another image set without
+    rasterising them. The vertices of every contour are transformed at
+    once, and every contour is taken to fill the slab of its slice, as
+    the contours of an RTSTRUCT do. The transformed slab is intersected
+    with the slice planes of the target image set, and the contour is
+    projected onto every slice plane inside it.
+
+    Args:
+        contours: list of the ContourData of the ROI in the source image
+            set
+        matrix (np.ndarray): 3x3 matrix of the affine transform of the
+            points of the source image set to the target image set
+        offset (np.ndarray): offset of the transform
+        source_geometry (SliceGeometry): of the source image set
+        target_geometry (SliceGeometry): of the target image set
+    Returns:
+        dict: slice number of the target image set to the list of the
+        (N, 3) arrays of the contours on the slice, or None if the
+        transform tilts the contours by more than MAX_CONTOUR_TILT.
+    """
+    normal = target_geometry.normal / np.linalg.norm(target_geometry.normal)
+    source_normal = matrix.dot(source_geometry.normal)
+    normal_length = np.linalg.norm(source_normal)
+    if not normal_length or abs(source_normal.dot(normal)) / normal_length \
+            < np.cos(np.radians(MAX_CONTOUR_TILT)):
+        return None
+
+    # Half the thickness of the slab of a contour along the target normal
+    spacing = source_geometry.spacing or target_geometry.spacing
+    half_thickness = abs(source_normal.dot(normal)) * spacing / 2
+
+    slice_contours = {}
+    for contour_data in contours:
+        points = np.asarray(contour_data, dtype=np.float64).reshape(-1, 3)
+        points = points.dot(matrix.T) + offset
+        depths = points.dot(normal)
+        depth = depths.mean()
+
+        # The target slices inside [depth - half, depth + half), so that
+        # the slabs of adjacent contours share no slice
+        start, end = np.searchsorted(
+            target_geometry.sorted_z,
+            [depth - half_thickness, depth + half_thickness])
+        for index in range(start, end):
+            slice_key = int(target_geometry.sorted_slices[index])
+            offsets = target_geometry.sorted_z[index] - depths
+            slice_contours.setdefault(slice_key, []).append(
+                points + offsets[:, np.newaxis] * normal)
+    return slice_contours
+
+
+def contours_to_roi_list(slice_contours, dict_container):
+    """
+    Args:
+        slice_contours (dict): slice number to the list of the (N, 3)
+            arrays of the contours on the slice, as returned by
+            transform_contours(..)
+        dict_container: container of the target image set
+    Returns:
+        list: contours of the ROI, in the format of ROI.create_roi(..)
+    """
+    roi_list = []
+    for slice_key in sorted(slice_contours):
+        for points in slice_contours[slice_key]:
+            # The first point is repeated to mark the contour as closed
+            points = np.round(np.vstack((points, points[:1])),
+                              CONTOUR_DECIMALS)
+            roi_list.append({
+                'ds': dict_container.dataset[slice_key],
+                'coords': points.ravel().tolist()
+            })
+    return roi_list
+
+
+def get_struct_name(roi_name):
+    """
+    Args:
+        roi_name: ROIName of an ROI
+    Returns:
+        str: the name of the ROI with its whitespace replaced by
+        underscores, as the ROIs are named in struct_name_sequence
+    """
+    return "_".join(roi_name.split())
+
+
+def get_roi_indexes(dicom_struct, struct_name_sequence):
+    """
+    Args:
+        dicom_struct (pydicom.Dataset): The DICOM RTSTRUCT
+        struct_name_sequence: the name of ROIs, with the whitespace of
+            the names replaced by underscores
+    Returns:
+        dict: name of every ROI found to its index in the
+        ROIContourSequence
+    """
+    all_name_sequence = [
+        get_struct_name(i.ROIName)
+        for i in dicom_struct.StructureSetROISequence
+    ]
+    # find corresponding rois in roi contour sequence
+    roi_indexes = {}
+    for index, roi_name in enumerate(all_name_sequence):
+        if roi_name in struct_name_sequence:
+            roi_indexes[roi_name] = index
+    return roi_indexes
+
+
+def rasterise_roi(dicom_image, roi_contour, struct_name,
+                  interrupt_flag=None):
+    """
+    Rasterise the contours of an ROI onto the grid of an image. The
+    vertices of every contour are converted to indexes of the image at
+    once.
+
+    Args:
+        dicom_image (sitk.Image): The reference image
+        roi_contour (pydicom.Dataset): item of the ROIContourSequence
+        struct_name: the name of the ROI, for logging
+        interrupt_flag: interrupt flag to stop the process
+    Returns:
+        np.ndarray: boolean mask of the ROI in the array order of the
+        image, None if the ROI has no contours, or False if the process
+        was interrupted.
+    """
+    from platipy.dicom.io.rtstruct_to_nifti import fix_missing_data
+    from skimage.draw import polygon
+
+    if not hasattr(roi_contour, "ContourSequence"):
+        logger.debug(
+            "No contour sequence found for this structure, skipping.")
+        return None
+
+    if len(roi_contour.ContourSequence) == 0:
+        logger.debug(
+            "Contour sequence empty for this structure, skipping.")
+        return None
+
+    size = dicom_image.GetSize()
+    mask = np.zeros(size[::-1], dtype=bool)
+
+    # Physical points are converted to continuous indexes with the
+    # inverse of the direction scaled by the spacing of the image
+    direction = np.array(dicom_image.GetDirection()).reshape(3, 3)
+    physical_to_index = np.linalg.inv(
+        direction * np.array(dicom_image.GetSpacing()))
+    origin = np.array(dicom_image.GetOrigin())
+
+    for contour in roi_contour.ContourSequence:
+        if interrupt_flag is not None and \
+                not check_interrupt_flag(interrupt_flag):
+            return False
+
+        contour_data = fix_missing_data(contour.ContourData)
+        vertex_arr_physical = np.array(
+            contour_data, dtype=np.double).reshape(-1, 3)
+
+        # Rounded as TransformPhysicalPointToIndex rounds
+        point_arr = np.floor(
+            (vertex_arr_physical - origin).dot(physical_to_index.T)
+            + 0.5).astype(int).T
+
+        [x_vertex_arr_image, y_vertex_arr_image] = point_arr[[0, 1]]
+        z_index = point_arr[2][0]
+        if np.any(point_arr[2] != z_index):
+            logger.debug(
+                "Error: axial slice index varies in contour. Skipping "
+                "contour.")
+            logger.debug("Structure:   {0}".format(struct_name))
+            logger.debug("Slice index: {0}".format(z_index))
+            continue
+
+        if not 0 <= z_index < size[2]:
+            logger.debug(
+                "Warning: Slice index outside of image size. Skipping "
+                "slice.")
+            logger.debug("Structure:   {0}".format(struct_name))
+            logger.debug("Slice index: {0}".format(z_index))
+            continue
+
+        filled_indices_x, filled_indices_y = polygon(
+            x_vertex_arr_image, y_vertex_arr_image, shape=mask.shape[-2:]
+        )
+        mask[z_index, filled_indices_y, filled_indices_x] = True
+
+    return mask
+
 
 def transform_point_set_from_dicom_struct(dicom_image, dicom_struct,
                                           struct_name_sequence,
@@ -31,6 +286,8 @@ def transform_point_set_from_dicom_struct(dicom_image, dicom_struct,
         tuple: Returns a list of masks and a list of structure names
 
     """
+    import SimpleITK as sitk
+
     if spacing_override:
         current_spacing = list(dicom_image.GetSpacing())
         new_spacing = tuple(
@@ -43,15 +300,7 @@ def transform_point_set_from_dicom_struct(dicom_image, dicom_struct,
         dicom_image.SetSpacing(new_spacing)
 
     struct_point_sequence = dicom_struct.ROIContourSequence
-    all_name_sequence = [
-        "_".join(i.ROIName.split()) for i in
-        dicom_struct.StructureSetROISequence
-    ]
-    # find corresponding rois in roi contour sequence
-    roi_indexes = {}
-    for index, roi_name in enumerate(all_name_sequence):
-        if roi_name in struct_name_sequence:
-            roi_indexes[roi_name] = index
+    roi_indexes = get_roi_indexes(dicom_struct, struct_name_sequence)
 
     struct_list = []
     final_struct_name_sequence = []
@@ -62,77 +311,193 @@ def transform_point_set_from_dicom_struct(dicom_image, dicom_struct,
             return [], []
 
         struct_index = roi_indexes[struct_name]
-        image_blank = np.zeros(dicom_image.GetSize()[::-1], dtype=np.uint8)
         logger.debug(
             "Converting structure {0} with name: {1}".format(struct_index,
                                                              struct_name))
-
-        if not hasattr(struct_point_sequence[struct_index], "ContourSequence"):
-            logger.debug(
-                "No contour sequence found for this structure, skipping.")
+        mask = rasterise_roi(dicom_image,
+                             struct_point_sequence[struct_index],
+                             struct_name, interrupt_flag)
+        if mask is False:
+            return [], []
+        if mask is None:
             continue
 
-        if len(struct_point_sequence[struct_index].ContourSequence) == 0:
-            logger.debug(
-                "Contour sequence empty for this structure, skipping.")
+        struct_image = sitk.GetImageFromArray(mask.astype(np.uint8))
+        struct_image.CopyInformation(dicom_image)
+        struct_list.append(struct_image)
+        final_struct_name_sequence.append(struct_name)
+
+    return struct_list, final_struct_name_sequence
+
+
+def get_roi_masks(dict_container, dicom_struct, roi_indexes,
+                  interrupt_flag=None):
+    """
+    Get the masks of ROIs from the mask cache of an image set, which
+    rasterises the ROIs it has not rasterised yet.
+
+    Args:
+        dict_container: container of the image set of the RTSTRUCT, i.e.
+            PatientDictContainer or MovingDictContainer
+        dicom_struct (pydicom.Dataset): The DICOM RTSTRUCT
+        roi_indexes: name of ROIs, with the whitespace of the names
+            replaced by underscores, to their index in the
+            ROIContourSequence, as returned by get_roi_indexes(..)
+        interrupt_flag: interrupt flag to stop the process
+    Yields:
+        tuple: (struct_name, mask) of every ROI with contours, where mask
+        is the boolean mask of the ROI in the array order of the image,
+        or (None, False) if the process was interrupted.
+    """
+    from src.Model import ROI
+    from src.Model.ROIMask import create_image_mask_grid
+    from src.Model.SliceGeometry import get_slice_geometry
+
+    pixluts = dict_container.get("pixluts")
+    if pixluts is None:
+        pixluts = ROI.get_pixluts(dict_container.dataset)
+        dict_container.set("pixluts", pixluts)
+    raw_contour, _ = ROI.get_raw_contour_data(
+        dicom_struct, get_slice_geometry(dict_container))
+    grid = create_image_mask_grid(dict_container)
+
+    for struct_name, struct_index in roi_indexes.items():
+        if interrupt_flag is not None and \
+                not check_interrupt_flag(interrupt_flag):
+            yield None, False
+            return
+
+        roi_name = dicom_struct.StructureSetROISequence[struct_index].ROIName
+        if not raw_contour.get(roi_name):
             continue
+        roi_contours = ROI.get_roi_contour_pixel(raw_contour, [roi_name],
+                                                 pixluts)[roi_name]
+        yield struct_name, grid.roi_to_mask(roi_contours, roi_name)
 
-        if len(struct_point_sequence[struct_index].ContourSequence) == 0:
-            logger.debug(
-                "Contour sequence empty for this structure, skipping.")
+
+def create_label_volumes(dicom_image, dicom_struct, struct_name_sequence,
+                         interrupt_flag=None, dict_container=None):
+    """
+    Rasterise ROIs into bit-packed label volumes, where bit i of a voxel
+    is set if the voxel is inside the i-th ROI of the volume. A volume
+    holds up to LABEL_BITS ROIs, so all ROIs are resampled at once
+    instead of one by one.
+
+    Args:
+        dicom_image (sitk.Image): The reference image
+        dicom_struct (pydicom.Dataset): The DICOM RTSTRUCT
+        struct_name_sequence: the name of ROIs to be transformed
+        interrupt_flag: interrupt flag to stop the process
+        dict_container: container of the image set of the reference
+            image. If given, the masks of the ROIs are shared with the
+            other users of its mask cache.
+    Returns:
+        list: (label_image, struct_names) tuple of every volume, with the
+        sitk label image and the names of the ROIs of its bits, or None
+        if the process was interrupted.
+    """
+    import SimpleITK as sitk
+
+    struct_point_sequence = dicom_struct.ROIContourSequence
+    roi_indexes = get_roi_indexes(dicom_struct, struct_name_sequence)
+    if dict_container is not None:
+        roi_masks = get_roi_masks(dict_container, dicom_struct, roi_indexes,
+                                  interrupt_flag)
+    else:
+        roi_masks = ((struct_name,
+                      rasterise_roi(dicom_image,
+                                    struct_point_sequence[struct_index],
+                                    struct_name, interrupt_flag))
+                     for struct_name, struct_index in roi_indexes.items())
+
+    label_volumes = []
+    for struct_name, mask in roi_masks:
+        if mask is False:
+            return None
+        if mask is None:
             continue
 
-        for sl in range(
-                len(struct_point_sequence[struct_index].ContourSequence)):
-
-            if interrupt_flag is not None and \
-                    not check_interrupt_flag(interrupt_flag):
-                return [], []
-
-            contour_data = fix_missing_data(
-                struct_point_sequence[struct_index].ContourSequence[
-                    sl].ContourData
-            )
-
-            struct_slice_contour_data = np.array(contour_data, dtype=np.double)
-            vertex_arr_physical = struct_slice_contour_data.reshape(
-                struct_slice_contour_data.shape[0] // 3, 3
-            )
-
-            point_arr = np.array(
-                [dicom_image.TransformPhysicalPointToIndex(i) for i in
-                 vertex_arr_physical]
-            ).T
-
-            [x_vertex_arr_image, y_vertex_arr_image] = point_arr[[0, 1]]
-            z_index = point_arr[2][0]
-            if np.any(point_arr[2] != z_index):
-                logger.debug(
-                    "Error: axial slice index varies in contour. Quitting now.")
-                logger.debug("Structure:   {0}".format(struct_name))
-                logger.debug("Slice index: {0}".format(z_index))
-                quit()
-
-            if z_index >= dicom_image.GetSize()[2]:
-                logger.debug(
-                    "Warning: Slice index greater than image size. Skipping "
-                    "slice.")
-                logger.debug("Structure:   {0}".format(struct_name))
-                logger.debug("Slice index: {0}".format(z_index))
-                continue
-
-            slice_arr = np.zeros(image_blank.shape[-2:], dtype=np.uint8)
-
-            filled_indices_x, filled_indices_y = polygon(
-                x_vertex_arr_image, y_vertex_arr_image, shape=slice_arr.shape
-            )
-            slice_arr[filled_indices_y, filled_indices_x] = 1
-
-            image_blank[z_index] += slice_arr
-
-        struct_image = sitk.GetImageFromArray(1 * (image_blank > 0))
-        struct_image.CopyInformation(dicom_image)
-        struct_list.append(sitk.Cast(struct_image, sitk.sitkUInt8))
-        final_struct_name_sequence.append(struct_name)
+        if not label_volumes or len(label_volumes[-1][1]) == LABEL_BITS:
+            label_volumes.append(
+                (np.zeros(mask.shape, dtype=np.uint64), []))
+        labels, struct_names = label_volumes[-1]
+        labels[mask] |= np.uint64(1) << np.uint64(len(struct_names))
+        struct_names.append(struct_name)
+
+    label_images = []
+    for labels, struct_names in label_volumes:
+        label_image = sitk.GetImageFromArray(labels)
+        label_image.CopyInformation(dicom_image)
+        label_images.append((label_image, struct_names))
+    return label_images
+
+
+def transfer_label_volumes(label_volumes, transform, reference_image):
+    """
+    Resample bit-packed label volumes onto the grid of another image with
+    nearest neighbour interpolation, which keeps the bits of the voxels.
+
+    Args:
+        label_volumes: (label_image, struct_names) tuples, as returned by
+            create_label_volumes(..)
+        transform (sitk.Transform): transform from the reference image
+            to the labelled image
+        reference_image (sitk.Image): image to resample onto
+    Returns:
+        list: (labels, struct_names) tuple of every volume, with the
+        uint64 array of the resampled labels.
+    """
+    import SimpleITK as sitk
+
+    transferred = []
+    for label_image, struct_names in label_volumes:
+        resampled = sitk.Resample(label_image, reference_image, transform,
+                                  sitk.sitkNearestNeighbor, 0,
+                                  label_image.GetPixelID())
+        transferred.append((sitk.GetArrayFromImage(resampled),
+                            struct_names))
+    return transferred
+
+
+def extract_roi_polygons(labels, number_of_rois, max_workers=None):
+    """
+    Outline every ROI of a bit-packed label volume with the concave hull
+    of its voxels on every slice. On fork-safe platforms the ROIs are
+    outlined in a pool of worker processes.
+
+    Args:
+        labels (np.ndarray): 3D bit-packed label array
+        number_of_rois (int): number of ROIs in the bits of the labels
+        max_workers (int): number of worker processes. Defaults to the
+            CPU count.
+    Returns:
+        list: dictionary for every ROI of the array index of the slices
+        of the ROI to the list of the polygons of the ROI on the slice,
+        in pixel coordinates.
+    """
+    return map_forked(_roi_polygons, range(number_of_rois),
+                      shared=(labels,), max_workers=max_workers,
+                      chunksize=1)
+
+
+def _roi_polygons(roi, labels):
+    """
+    Args:
+        roi (int): bit of the ROI
+        labels (np.ndarray): 3D bit-packed label array
+    Returns:
+        dict: array index of the slices of the ROI to the list of the
+        polygons of the ROI on the slice.
+    """
+    from src.Model.ROI import calculate_concave_hull_of_points
+
+    mask = (labels & (np.uint64(1) << np.uint64(roi))) != 0
+    polygons = {}
+    for z_index in np.flatnonzero(mask.any(axis=(1, 2))):
+        rows, columns = np.nonzero(mask[z_index])
+        polygon_list = calculate_concave_hull_of_points(
+            list(zip(columns.tolist(), rows.tolist())))
+        if polygon_list:
+            polygons[int(z_index)] = polygon_list
+    return polygons
 
-    return struct_list, final_struct_name_sequence
@@ -1,62 +1,69 @@
 import os
-import pandas as pd
-import platform
-from radiomics import featureextractor
 
+import numpy as np
 
-def convert_to_nrrd(path, nrrd_output_path):
-    """
-    Convert dicom files to nrrd.
-    :param path: Path to patient directory (str)
-    :param nrrd_file_path: Path to nrrd folder (str)
-    """
-    path = '"' + path + '"'
-    nrrd_file_path = '"' + nrrd_output_path + '"'
-
-    # Command to convert dicom files to nrrd
-    # Writes the result from the processing into a temporary file
-    # rather than the terminal
-    cmd_for_nrrd = 'plastimatch convert --input ' + path + \
-                   ' --output-img ' + nrrd_file_path + ' 1>' + path + '/NUL'
+from src.Model import SUV
+from src.Model.SimpleITKImage import get_sitk_image
 
-    # Command to delete the temporary file generated before
-    cmd_del_nul = 'rm ' + path[:-1] + '/NUL' + '"'
 
-    os.system(cmd_for_nrrd)
+def convert_to_nrrd(dict_container, nrrd_file_path):
+    """
+    Write the images of an image set to an nrrd file. The image is built
+    from the pixel values that are already loaded, with the slices in
+    the order of their position along the normal of the images, the same
+    as the ROI masks of convert_rois_to_nrrd(..). The radiomics of PET
+    images are calculated in SUV, unless the SUV can not be calculated.
+    :param dict_container: Dict container of the image set, i.e.
+                           PatientDictContainer.
+    :param nrrd_file_path: Path to nrrd file (str)
+    """
+    import SimpleITK as sitk
 
-    if os.path.exists(path[1:-1] + '/NUL'):
-        if platform.system() != "Windows":
-            os.system(cmd_del_nul)
-        else:
-            cmd_del_nul = 'del ' + path[:-1] + '/NUL' + '"'
-            os.system(cmd_del_nul)
+    volume = None
+    if SUV.is_pet(dict_container.dataset[0]):
+        try:
+            volume = SUV.get_patient_suv_volume()
+        except SUV.SUVError:
+            pass
+    image = get_sitk_image(dict_container, volume, ascending=True)
+    sitk.WriteImage(image, nrrd_file_path)
 
 
-def convert_rois_to_nrrd(path, rtss_path, mask_folder_path):
+def convert_rois_to_nrrd(dict_container, dataset_rtss, mask_folder_path,
+                         interrupt_flag=None):
     """
-    Generate an nrrd file for each region of interest using Plastimatch.
-    :param path:                Path to patient directory (str)
-    :param rtss_path:           Path to RT-Struct file (str)
+    Generate an nrrd file for each region of interest with contours,
+    named after the ROI with the whitespace of its name replaced by
+    underscores. The masks are taken from the ROIMaskCache of the image
+    set, so ROIs that were already rasterised are not rasterised again.
+    :param dict_container:      Dict container of the image set, i.e.
+                                PatientDictContainer.
+    :param dataset_rtss:        RT-Struct dataset of the image set.
     :param mask_folder_path:    Folder to which the segmentation masks
                                 will be saved(str)
+    :param interrupt_flag:      A threading.Event() object that tells the
+                                function to stop.
+    :return:                    False if the process was interrupted.
     """
-    path = '"' + path + '"'
-    mask_folder_path = '"' + mask_folder_path + '"'
-    rtss_path = '"' + rtss_path + '"'
-    # Command for generating an nrrd file for each region of interest
-    cmd_for_segmask = 'plastimatch convert --input ' + rtss_path + \
-        ' --output-prefix ' + mask_folder_path + \
-        ' --prefix-format nrrd --referenced-ct ' + path + ' 1>' + \
-        path + '/NUL'
-    cmd_del_nul = 'rm ' + path[:-1] + '/NUL' + '"'
-    os.system(cmd_for_segmask)
-
-    if os.path.exists(path[1:-1] + '/NUL'):
-        if platform.system() != "Windows":
-            os.system(cmd_del_nul)
-        else:
-            cmd_del_nul = 'del ' + path[:-1] + '/NUL' + '"'
-            os.system(cmd_del_nul)
+    import SimpleITK as sitk
+    from src.Model.ROITransfer import get_roi_indexes, get_roi_masks, \
+        get_struct_name
+
+    if not os.path.exists(mask_folder_path):
+        os.makedirs(mask_folder_path)
+
+    roi_indexes = get_roi_indexes(
+        dataset_rtss, [get_struct_name(roi.ROIName)
+                       for roi in dataset_rtss.StructureSetROISequence])
+    for struct_name, mask in get_roi_masks(dict_container, dataset_rtss,
+                                           roi_indexes, interrupt_flag):
+        if struct_name is None:
+            return False
+        image = get_sitk_image(dict_container, mask.astype(np.uint8),
+                               ascending=True)
+        sitk.WriteImage(image, os.path.join(mask_folder_path,
+                                            struct_name + '.nrrd'))
+    return True
 
 
 def get_radiomics_df(path, patient_hash, nrrd_file_path, mask_folder_path):
@@ -69,6 +76,8 @@ def get_radiomics_df(path, patient_hash, nrrd_file_path, mask_folder_path):
     :param mask_folder_path: Path to ROI nrrd files.
     :return: Pandas dataframe.
     """
+    import pandas as pd
+    from radiomics import featureextractor
 
     # Initialize feature extractor using default pyradiomics settings
     extractor = featureextractor.RadiomicsFeatureExtractor()
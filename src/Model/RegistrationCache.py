@@ -0,0 +1,244 @@
+"""
+On-disk cache of image fusion registrations.
+
+Registering the moving image onto the fixed image is the slowest part of
+image fusion, and used to be repeated every time the same pair of image
+sets was fused. The transform of a registration is stored in a sqlite
+database in the hidden directory instead, keyed by the SeriesInstanceUIDs
+of the fixed and the moving image set, a hash of the registration
+settings of imageFusion.json and the modification times of the image
+files. Changing a setting, or replacing a file of either image set,
+therefore misses the cache without any bookkeeping. Every moving image
+set fused with a patient writes the same spatial registration DICOM
+file, so the database also records which registration each file was
+last written for, so that it is only rewritten when it holds another
+registration.
+
+Example usage:
+key = get_registration_key(PatientDictContainer(), MovingDictContainer(),
+                           settings)
+transform = RegistrationCache().get_transform(key)
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+from pathlib import Path
+
+# Version of the stored format. Changing it invalidates every stored
+# registration.
+CACHE_VERSION = 1
+
+
+def get_settings_hash(settings):
+    """
+    :param settings: Dictionary of the registration settings, i.e. the
+        contents of imageFusion.json, or None for the defaults.
+    :return: Hex digest identifying the settings.
+    """
+    text = json.dumps(settings, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def get_image_set_id(dict_container):
+    """
+    :param dict_container: Dict container holding the image datasets,
+        i.e. PatientDictContainer or MovingDictContainer.
+    :return: Tuple (series_uid, mtimes) of the SeriesInstanceUID of the
+        image set and the modification times of its image files, in the
+        order of the slice numbers. Files that can not be found have a
+        modification time of None.
+    """
+    series_uid = dict_container.dataset[0].get("SeriesInstanceUID")
+    mtimes = []
+    for key in sorted(key for key in dict_container.filepaths
+                      if isinstance(key, int)):
+        try:
+            mtimes.append(
+                os.path.getmtime(dict_container.filepaths[key]))
+        except OSError:
+            mtimes.append(None)
+    return series_uid, mtimes
+
+
+def get_registration_key(fixed_container, moving_container, settings):
+    """
+    :param fixed_container: Dict container of the fixed image set, i.e.
+        PatientDictContainer.
+    :param moving_container: Dict container of the moving image set,
+        i.e. MovingDictContainer.
+    :param settings: Dictionary of the registration settings, or None
+        for the defaults.
+    :return: Cache key of the registration of the image sets.
+    """
+    fixed_uid, fixed_mtimes = get_image_set_id(fixed_container)
+    moving_uid, moving_mtimes = get_image_set_id(moving_container)
+    key = json.dumps([CACHE_VERSION, fixed_uid, moving_uid,
+                      get_settings_hash(settings), fixed_mtimes,
+                      moving_mtimes])
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def transform_to_text(transform):
+    """
+    :param transform: SimpleITK transform.
+    :return: The transform in the text format of ITK transform files.
+    """
+    import SimpleITK as sitk
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, "transform.tfm")
+        sitk.WriteTransform(transform, file_path)
+        with open(file_path, "r") as transform_file:
+            return transform_file.read()
+
+
+def transform_from_text(text):
+    """
+    :param text: A transform in the text format of ITK transform files,
+        as returned by transform_to_text(..).
+    :return: SimpleITK transform, downcast to its type.
+    """
+    import SimpleITK as sitk
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, "transform.tfm")
+        with open(file_path, "w") as transform_file:
+            transform_file.write(text)
+        return sitk.ReadTransform(file_path).Downcast()
+
+
+class RegistrationCache:
+    """
+    The sqlite database registrations are stored in. A connection is
+    opened for every lookup, so that the cache can be used from worker
+    threads.
+    """
+
+    def __init__(self, db_file_path=None):
+        """
+        :param db_file_path: Path of the database. Defaults to
+            RegistrationCache.db in the hidden directory.
+        """
+        if db_file_path is None:
+            if 'USER_ONKODICOM_HIDDEN' not in os.environ:
+                from src.Model.Configuration import set_up_hidden_dir
+                set_up_hidden_dir()
+            db_file_path = Path(os.environ['USER_ONKODICOM_HIDDEN'])\
+                .joinpath('RegistrationCache.db')
+        self.db_file_path = db_file_path
+        self.set_up_cache_db()
+
+    def set_up_cache_db(self):
+        """
+        Create the REGISTRATION and TRANSFORM_DCM tables inside the
+        SQLite database
+        """
+        connection = sqlite3.connect(self.db_file_path)
+        connection.execute("""
+                    CREATE TABLE IF NOT EXISTS REGISTRATION (
+                        key TEXT PRIMARY KEY,
+                        transform TEXT
+                    );
+                """)
+        connection.execute("""
+                    CREATE TABLE IF NOT EXISTS TRANSFORM_DCM (
+                        path TEXT PRIMARY KEY,
+                        key TEXT
+                    );
+                """)
+        connection.commit()
+        connection.close()
+
+    def execute(self, statement, parameters=()):
+        """
+        Execute a statement, ignoring errors of the database, as the
+        cache is only an optimisation.
+        :param statement: SQL statement.
+        :param parameters: Parameters of the statement.
+        :return: The rows the statement returns, an empty list if it
+            failed.
+        """
+        connection = sqlite3.connect(self.db_file_path)
+        try:
+            rows = connection.execute(statement, parameters).fetchall()
+            connection.commit()
+        except sqlite3.Error:
+            rows = []
+        finally:
+            connection.close()
+        return rows
+
+    def get_transform_text(self, key):
+        """
+        :param key: Cache key of the registration.
+        :return: The stored transform as text, or None if the
+            registration is not in the cache.
+        """
+        rows = self.execute(
+            "SELECT transform FROM REGISTRATION WHERE key = ?", (key,))
+        return rows[0][0] if rows else None
+
+    def put_transform_text(self, key, text):
+        """
+        Store the transform of a registration. The spatial registration
+        DICOM files written for the registration are marked as outdated.
+        :param key: Cache key of the registration.
+        :param text: The transform as text.
+        """
+        self.execute(
+            "INSERT OR REPLACE INTO REGISTRATION (key, transform) "
+            "VALUES (?, ?)", (key, text))
+        self.execute("DELETE FROM TRANSFORM_DCM WHERE key = ?", (key,))
+
+    def get_transform(self, key):
+        """
+        :param key: Cache key of the registration.
+        :return: The stored SimpleITK transform, or None if the
+            registration is not in the cache.
+        """
+        text = self.get_transform_text(key)
+        if text is None:
+            return None
+        try:
+            return transform_from_text(text)
+        except RuntimeError:
+            return None
+
+    def put_transform(self, key, transform):
+        """
+        :param key: Cache key of the registration.
+        :param transform: SimpleITK transform of the registration.
+        """
+        self.put_transform_text(key, transform_to_text(transform))
+
+    def is_dcm_written(self, key, dcm_path):
+        """
+        :param key: Cache key of the registration.
+        :param dcm_path: Path of the spatial registration DICOM file.
+        :return: True if the file was last written for the registration.
+        """
+        rows = self.execute(
+            "SELECT key FROM TRANSFORM_DCM WHERE path = ?",
+            (str(dcm_path),))
+        return bool(rows) and rows[0][0] == key
+
+    def set_dcm_written(self, key, dcm_path):
+        """
+        Record that the spatial registration DICOM file was written for
+        the registration, replacing the registration it held before.
+        :param key: Cache key of the registration.
+        :param dcm_path: Path of the spatial registration DICOM file.
+        """
+        self.execute(
+            "INSERT OR REPLACE INTO TRANSFORM_DCM (path, key) "
+            "VALUES (?, ?)", (str(dcm_path), key))
+
+    def clear(self):
+        """
+        Delete every stored registration, so that image sets are
+        registered again the next time they are fused.
+        """
+        self.execute("DELETE FROM REGISTRATION")
+        self.execute("DELETE FROM TRANSFORM_DCM")
@@ -0,0 +1,216 @@
+"""
+Standardised uptake values (SUV) of PET images.
+
+The SUV volume of a PET image set is calculated once, as a float32 array
+with a slice per image, and cached in the dict container of the images.
+The PET heatmap, SUV2ROI, radiomics on PET and the SUV readout of the
+axial view all read this one array.
+
+    SUV = activity concentration (Bq/mL) * patient weight (g) / dose (Bq)
+
+where the injected dose is decay corrected to the time the activity in
+the images is decay corrected to.
+
+Example usage:
+suv_volume = get_patient_suv_volume(patient_weight=70000)
+"""
+import re
+
+import numpy as np
+
+from src.Model.CalculateImages import get_rescale
+from src.Model.PatientDictContainer import PatientDictContainer
+
+PET_SOP_CLASS_UID = "1.2.840.10008.5.1.4.1.1.128"
+
+# HHMMSS.FFFFFF, where minutes, seconds and fractions are optional
+TIME_PATTERN = re.compile(r'^(\d{2})(\d{2})?(\d{2}(?:\.\d*)?)?')
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class SUVError(Exception):
+    """
+    Raised when the SUV of PET images can not be calculated. reason is
+    one of UNIT (activity not in Bq/mL), DECY (images not decay
+    corrected), WEIGHT (patient weight unknown) or DOSE (injected dose
+    unknown).
+    """
+
+    def __init__(self, reason):
+        super(SUVError, self).__init__(reason)
+        self.reason = reason
+
+
+def is_pet(ds):
+    """
+    :param ds: An image dataset.
+    :return: True if the dataset is a PET image.
+    """
+    return ds.get('SOPClassUID') == PET_SOP_CLASS_UID
+
+
+def get_image_keys(dict_ds):
+    """
+    :param dict_ds: Dictionary of datasets where the image slices are
+        keyed by their slice number.
+    :return: Slice numbers in the order of the pixel values of the
+        image slices.
+    """
+    return [key for key in dict_ds if isinstance(key, int)]
+
+
+def get_dataset_weight(ds):
+    """
+    :param ds: A PET image dataset.
+    :return: Patient weight in grams, or None if the dataset does not
+        contain it.
+    """
+    weight = ds.get('PatientWeight')
+    if weight is None or float(weight) <= 0:
+        return None
+    return float(weight) * 1000
+
+
+def time_to_seconds(value):
+    """
+    :param value: DICOM time (TM) string.
+    :return: Seconds since midnight, or None if the value is empty.
+    """
+    match = TIME_PATTERN.match(str(value).replace(':', '').strip())
+    if match is None:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes or 0) * 60 + float(seconds or 0)
+
+
+def get_injected_dose(ds):
+    """
+    Get the injected dose, decay corrected to the reference time of the
+    decay correction of the images. Images decay corrected to the
+    administration time (ADMIN) use the injected dose as is. The dose is
+    not decay corrected if the half life or the times are missing.
+    :param ds: A PET image dataset.
+    :return: Injected dose in Bq.
+    """
+    try:
+        info = ds.RadiopharmaceuticalInformationSequence[0]
+        dose = float(info.RadionuclideTotalDose)
+    except (AttributeError, IndexError, TypeError, ValueError):
+        raise SUVError("DOSE")
+    if dose <= 0:
+        raise SUVError("DOSE")
+
+    if ds.get('DecayCorrection', 'START') == 'ADMIN':
+        return dose
+
+    if 'RadiopharmaceuticalStartDateTime' in info:
+        injection_time = time_to_seconds(
+            str(info.RadiopharmaceuticalStartDateTime)[8:])
+    else:
+        injection_time = time_to_seconds(
+            info.get('RadiopharmaceuticalStartTime', ''))
+    reference_time = time_to_seconds(
+        ds.get('SeriesTime', '') or ds.get('AcquisitionTime', ''))
+    half_life = info.get('RadionuclideHalfLife')
+    if injection_time is None or reference_time is None or not half_life:
+        return dose
+
+    # Scans starting after midnight were injected the day before
+    elapsed = (reference_time - injection_time) % SECONDS_PER_DAY
+    return dose * 2 ** (-elapsed / float(half_life))
+
+
+def get_suv_factor(ds, patient_weight):
+    """
+    Get the factor that converts activity concentration in Bq/mL to SUV.
+    Only PET images in Bq/mL that are decay corrected are supported.
+    :param ds: A PET image dataset.
+    :param patient_weight: Patient weight in grams.
+    :return: Patient weight over decay corrected injected dose.
+    """
+    if ds.get('Units') != 'BQML':
+        raise SUVError("UNIT")
+    if ds.get('DecayCorrection') not in ('START', 'ADMIN') \
+            and 'DECY' not in ds.get('CorrectedImage', []):
+        raise SUVError("DECY")
+    if patient_weight is None:
+        raise SUVError("WEIGHT")
+    return patient_weight / get_injected_dose(ds)
+
+
+def calculate_suv_volume(datasets, pixel_values, rescaled, patient_weight):
+    """
+    Convert the pixel values of PET images to SUV.
+    :param datasets: List of the PET image datasets.
+    :param pixel_values: List of the pixel arrays of the datasets.
+    :param rescaled: True if the pixel values have been rescaled to Bq/mL
+        already, i.e. by CalculateImages.convert_raw_data.
+    :param patient_weight: Patient weight in grams.
+    :return: Tuple (suv_volume, suv_factor). suv_volume is a float32
+        array with a slice per dataset. suv_factor converts Bq/mL to SUV.
+    """
+    suv_factor = get_suv_factor(datasets[0], patient_weight)
+    suv_volume = np.empty((len(pixel_values),) + np.shape(pixel_values[0]),
+                          dtype=np.float32)
+    for i, (ds, pixels) in enumerate(zip(datasets, pixel_values)):
+        slope, intercept = (1, 0) if rescaled else get_rescale(ds, False)
+        np.multiply(pixels, slope * suv_factor, out=suv_volume[i],
+                    casting='unsafe')
+        if intercept:
+            suv_volume[i] += intercept * suv_factor
+    return suv_volume, suv_factor
+
+
+def get_suv_volume(dict_container, datasets, pixel_values, rescaled,
+                   patient_weight=None):
+    """
+    Get the SUV volume of PET images, calculating it only if it is not
+    cached in the dict container yet or the patient weight has changed.
+    The volume and its factor are cached as "suv_volume" and
+    "suv_factor".
+    :param dict_container: The dict container of the PET images.
+    :param datasets: List of the PET image datasets.
+    :param pixel_values: List of the pixel arrays of the datasets.
+    :param rescaled: True if the pixel values have been rescaled to Bq/mL
+        already.
+    :param patient_weight: Patient weight in grams. Defaults to the weight
+        of the cached volume, or else the weight in the datasets.
+    :return: float32 array of SUV with a slice per dataset.
+    """
+    cached_weight = dict_container.get("suv_patient_weight")
+    if patient_weight is None:
+        patient_weight = cached_weight
+    if patient_weight is None:
+        patient_weight = get_dataset_weight(datasets[0])
+
+    suv_volume = dict_container.get("suv_volume")
+    if suv_volume is None or patient_weight != cached_weight:
+        suv_volume, suv_factor = calculate_suv_volume(
+            datasets, pixel_values, rescaled, patient_weight)
+        dict_container.set("suv_volume", suv_volume)
+        dict_container.set("suv_factor", suv_factor)
+        dict_container.set("suv_patient_weight", patient_weight)
+    return suv_volume
+
+
+def get_patient_suv_volume(patient_weight=None):
+    """
+    Get the SUV volume of the PET images in the PatientDictContainer.
+    The slices of the volume are in the order of the slice numbers.
+    :param patient_weight: Patient weight in grams. Defaults to the weight
+        of the cached volume, or else the weight in the datasets.
+    :return: float32 array of SUV with a slice per image.
+    """
+    patient_dict_container = PatientDictContainer()
+    dataset = patient_dict_container.dataset
+    datasets = [dataset[key] for key in get_image_keys(dataset)]
+    pixel_values = patient_dict_container.get("pixel_values")
+    if pixel_values is None:
+        pixel_values = [ds.pixel_array for ds in datasets]
+
+    # The pixel arrays of the datasets are rescaled in place when the
+    # images are loaded for display.
+    return get_suv_volume(
+        patient_dict_container, datasets, pixel_values,
+        patient_dict_container.has_attribute("scaled"), patient_weight)
@@ -1,7 +1,8 @@
 import numpy
-from skimage import measure
 from src.Model import ImageLoading
+from src.Model import LevelContours
 from src.Model import ROI
+from src.Model import SUV
 from src.Model.PatientDictContainer import PatientDictContainer
 from src.View.InputDialogs import PatientWeightDialog
 
@@ -12,7 +13,6 @@ class SUV2ROI:
     """
     def __init__(self):
         self.patient_weight = None
-        self.weight_over_dose = None
         self.suv2roi_status = False
         self.failure_reason = None
 
@@ -84,12 +84,10 @@ class SUV2ROI:
         patient's weight in grams.
         :param dataset: a DICOM PET dataset.
         """
-        # Try get patient weight from dataset. An AttributeError will be
-        # raised if the dataset does not contain patient weight
-        try:
-            self.patient_weight = dataset.PatientWeight * 1000
-            return
-        except AttributeError:
+        # Try get patient weight from dataset. It is None if the dataset
+        # does not contain patient weight
+        self.patient_weight = SUV.get_dataset_weight(dataset)
+        if self.patient_weight is None:
             # Since weight is not present, keep prompting the user for
             # it until they enter a valid number or close the dialog box
             dialog = PatientWeightDialog()
@@ -107,56 +105,19 @@ class SUV2ROI:
         """
         self.patient_weight = weight_in_grams
 
-    def pet2suv(self, dataset):
+    def get_suv_volume(self):
         """
-        Converts DICOM PET pixel array values to SUV values. Currently
-        only handles PET datasets in Bq/mL that are attenuation and
-        decay corrected.
-        :param dataset: the DICOM PET dataset.
-        :return: DICOM PET pixel data in SUV.
+        Gets the SUV of the PET images as one volume, which is
+        calculated once and shared with the rest of OnkoDICOM. Sets the
+        class' failure_reason variable if the SUV can not be calculated.
+        :return: float32 array of SUV with a slice per image, or None.
         """
-        # Return if units are not Bq/mL
-        if not dataset.Units == "BQML":
-            self.failure_reason = "UNIT"
-            return None
-
-        # Return if CorrectedImage does not contain DECY, and
-        # decay correction is not START
-        if (["DECY"] not in dataset.CorrectedImage) and \
-                (dataset.DecayCorrection != "START"):
-            self.failure_reason = "DECY"
-            return None
-
-        # Return if patient weight not set
-        if self.patient_weight is None:
-            self.failure_reason = "WEIGHT"
+        try:
+            return SUV.get_patient_suv_volume(self.patient_weight)
+        except SUV.SUVError as error:
+            self.failure_reason = error.reason
             return None
 
-        # Get radiopharmaceutical information
-        radiopharmaceutical_info = \
-            dataset.RadiopharmaceuticalInformationSequence[0]
-
-        # Calculate patient weight divided by total dose once
-        if self.weight_over_dose is None:
-            radionuclide_total_dose = \
-                radiopharmaceutical_info['RadionuclideTotalDose'].value
-            self.weight_over_dose = \
-                self.patient_weight / radionuclide_total_dose
-
-        # Get rescale slope and intercept
-        rescale_slope = dataset.RescaleSlope
-        rescale_intercept = dataset.RescaleIntercept
-
-        # Get pixel data
-        pixel_array = dataset.pixel_array
-
-        # Convert Bq/ml to SUV
-        suv = (pixel_array * rescale_slope + rescale_intercept) \
-            * self.weight_over_dose
-
-        # Return SUV data
-        return suv
-
     def calculate_contours(self):
         """
         Calculate SUV boundaries for each slice from an SUV value of 1
@@ -168,37 +129,30 @@ class SUV2ROI:
         # Create dictionary to store contour data
         contour_data = {}
 
-        # Initialise variables needed for function
-        patient_dict_container = PatientDictContainer()
-        slider_min = 0
-        slider_max = len(patient_dict_container.get("pixmaps_axial"))
-
-        # Loop through each PET image in the dataset
-        for slider_id in range(slider_min, slider_max):
-            # Get SUV data from PET file
-            temp_ds = patient_dict_container.dataset[slider_id]
-            suv_data = self.pet2suv(temp_ds)
-
-            # Return None if PET 2 SUV failed
-            if suv_data is None:
-                return None
+        # Get SUV data of all PET images, return None if it failed
+        suv_volume = self.get_suv_volume()
+        if suv_volume is None:
+            return None
 
-            # Set current and max SUV for the current slice
-            current_suv = 1
-            max_suv = numpy.amax(suv_data)
+        # Calculate SUV contours of every integer SUV from 1 up to the
+        # max SUV of the slices, tracing all SUVs of a slice at once
+        slice_max = suv_volume.max(axis=(1, 2))
+        levels = list(range(1, int(numpy.ceil(slice_max.max()))))
+        contours = LevelContours.find_stack_level_contours(
+            suv_volume, levels, slice_max)
 
-            # Continue calculating SUV contours for the slice until the
-            # max SUV has been reached.
-            while current_suv < max_suv:
-                # Find the contours for the SUV (i)
-                contours = measure.find_contours(suv_data, current_suv)
+        # Loop through each PET image in the dataset
+        for slider_id, slice_contours in enumerate(contours):
+            for current_suv, suv_contours in zip(levels, slice_contours):
+                # Stop at the max SUV of the slice
+                if current_suv >= slice_max[slider_id]:
+                    break
 
                 # Get the SUV name
                 name = "SUV-" + str(current_suv)
                 if name not in contour_data:
                     contour_data[name] = []
-                contour_data[name].append((slider_id, contours))
-                current_suv += 1
+                contour_data[name].append((slider_id, suv_contours))
 
         # Return contour data
         return contour_data
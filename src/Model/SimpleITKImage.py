@@ -0,0 +1,131 @@
+"""
+SimpleITK images of the image sets that are already loaded.
+
+Image fusion, ROI transfer and radiomics used to re-read every slice of
+an image set from disk with sitk.ReadImage. The pixel values of the
+slices are in the dict container already, so the SimpleITK image is
+built from them instead, with the origin, spacing and direction taken
+from the SliceGeometry of the image set. The voxel values are the
+modality values of the images, i.e. Hounsfield units for CT, the same
+as sitk.ReadImage produces.
+
+Example usage:
+fixed_image = get_sitk_image(PatientDictContainer())
+"""
+import numpy as np
+
+from src.constants import CT_RESCALE_INTERCEPT
+from src.Model.CalculateImages import get_rescale
+from src.Model.SliceGeometry import get_slice_geometry
+
+
+def get_image_volume(dict_container):
+    """
+    Stack the pixel values of the image slices of a dict container.
+    :param dict_container: Dict container holding the image datasets,
+        i.e. PatientDictContainer or MovingDictContainer.
+    :return: float32 array of the modality values with a slice per
+        image, in the order of the slice numbers.
+    """
+    dataset = dict_container.dataset
+    slice_keys = get_slice_geometry(dict_container).slice_keys
+    pixel_values = dict_container.get("pixel_values")
+    if pixel_values is None:
+        pixel_values = [dataset[key].pixel_array for key in slice_keys]
+
+    volume = np.empty((len(slice_keys),) + np.shape(pixel_values[0]),
+                      dtype=np.float32)
+    for i, pixels in enumerate(pixel_values):
+        volume[i] = pixels
+
+    if dict_container.has_attribute("scaled"):
+        # The pixel values of CT images are shifted by
+        # CT_RESCALE_INTERCEPT when they are rescaled for display
+        if dataset[0].get('Modality') == "CT":
+            volume -= CT_RESCALE_INTERCEPT
+    else:
+        for i, key in enumerate(slice_keys):
+            slope, intercept = get_rescale(dataset[key], False)
+            if slope != 1:
+                volume[i] *= float(slope)
+            if intercept:
+                volume[i] += intercept
+    return volume
+
+
+def create_sitk_image(volume, slice_geometry, image_ds, order=None):
+    """
+    Create a SimpleITK image of an image stack.
+    :param volume: Array with a slice per image, in the order of the
+        slice numbers.
+    :param slice_geometry: SliceGeometry of the image stack.
+    :param image_ds: A dataset of the image stack, for the pixel spacing
+        and the orientation of the images.
+    :param order: Indices of the slices of the volume in the order of
+        the slices of the image. Defaults to the order of the slice
+        numbers, which is how sitk.ReadImage orders the files of the
+        image stack.
+    :return: SimpleITK image.
+    """
+    import SimpleITK as sitk
+
+    if order is None:
+        order = np.arange(len(volume))
+    else:
+        volume = volume[order]
+    image = sitk.GetImageFromArray(volume)
+
+    # The axes of the image are the direction of the rows, the direction
+    # of the columns and the direction from the first to the last slice
+    orientation = np.array([float(value) for value
+                            in image_ds.ImageOrientationPatient])
+    pixel_spacing = image_ds.PixelSpacing
+    first = slice_geometry.positions[order[0]]
+    last = slice_geometry.positions[order[-1]]
+    distance = np.linalg.norm(last - first)
+    if len(order) > 1 and distance > 0:
+        slice_direction = (last - first) / distance
+        slice_spacing = distance / (len(order) - 1)
+    else:
+        slice_direction = slice_geometry.normal
+        slice_spacing = 1.0
+
+    image.SetOrigin(first.tolist())
+    image.SetSpacing((float(pixel_spacing[1]), float(pixel_spacing[0]),
+                      float(slice_spacing)))
+    image.SetDirection(np.stack(
+        (orientation[:3], orientation[3:], slice_direction),
+        axis=1).flatten().tolist())
+    return image
+
+
+def get_sitk_image(dict_container, volume=None, ascending=False):
+    """
+    Get the SimpleITK image of the image set of a dict container. The
+    image of the pixel values in the order of the slice numbers is
+    cached as "sitk_image".
+    :param dict_container: Dict container holding the image datasets,
+        i.e. PatientDictContainer or MovingDictContainer.
+    :param volume: Array with a slice per image to use as the voxel
+        values, i.e. the SUV volume of PET images. Defaults to the
+        modality values of the images.
+    :param ascending: Order the slices along the normal of the images,
+        as Plastimatch does, instead of by slice number.
+    :return: SimpleITK image.
+    """
+    cache = volume is None and not ascending
+    if cache and dict_container.has_attribute("sitk_image"):
+        return dict_container.get("sitk_image")
+
+    slice_geometry = get_slice_geometry(dict_container)
+    order = None
+    if ascending:
+        order = np.searchsorted(slice_geometry.slice_keys,
+                                slice_geometry.sorted_slices)
+    if volume is None:
+        volume = get_image_volume(dict_container)
+    image = create_sitk_image(volume, slice_geometry,
+                              dict_container.dataset[0], order)
+    if cache:
+        dict_container.set("sitk_image", image)
+    return image
@@ -0,0 +1,189 @@
+import numpy as np
+
+
+class SliceGeometry:
+    """
+    Index of the geometry of an image stack. It is built once from the
+    dictionary of datasets produced by ImageLoading.get_datasets(..) and
+    holds every mapping that was previously rebuilt by each consumer:
+    SOPInstanceUID -> slice index, slice index -> SOPInstanceUID, slice
+    index -> stack position (the Z coordinate for axial images), and a
+    sorted array of stack positions for nearest-slice lookups.
+
+    Example usage:
+    slice_geometry = get_slice_geometry(PatientDictContainer())
+    slice_index = slice_geometry.uid_to_slice[sop_instance_uid]
+    """
+
+    def __init__(self, dict_ds):
+        """
+        :param dict_ds: Dictionary of PyDicom datasets where the image
+            slices are keyed by their slice number.
+        """
+        self.slice_to_uid = {}
+        self.uid_to_slice = {}
+        self.uid_list = []
+
+        slice_keys = sorted(int(key) for key in dict_ds
+                            if str(key).isnumeric())
+        positions = []
+        orientation = None
+        for key in slice_keys:
+            img_ds = dict_ds[key]
+            uid = img_ds.SOPInstanceUID
+            self.slice_to_uid[key] = uid
+            self.uid_to_slice[uid] = key
+            self.uid_list.append(uid)
+            positions.append([float(value) for value
+                              in img_ds.ImagePositionPatient])
+            if orientation is None:
+                orientation = img_ds.ImageOrientationPatient
+
+        self.slice_keys = np.array(slice_keys, dtype=int)
+        self.positions = np.array(positions, dtype=float).reshape(-1, 3)
+
+        # The stack axis is perpendicular to the image plane. For axial
+        # images it is the Z axis and the stack position is the Z
+        # coordinate of the slice.
+        if orientation is not None:
+            orientation = np.array([float(value) for value in orientation])
+            self.normal = np.cross(orientation[0:3], orientation[3:6])
+        else:
+            self.normal = np.array([0.0, 0.0, 1.0])
+        self.z_positions = self.positions.dot(self.normal)
+
+        # Sorted stack positions and the slice indices they belong to,
+        # used by np.searchsorted for nearest-slice lookups.
+        order = np.argsort(self.z_positions, kind="stable")
+        self.sorted_z = self.z_positions[order]
+        self.sorted_slices = self.slice_keys[order]
+
+        # Typical distance between adjacent slices, used as the tolerance
+        # when locating contours by their stack position.
+        if len(self.sorted_z) > 1:
+            self.spacing = float(np.median(np.diff(self.sorted_z)))
+        else:
+            self.spacing = 0.0
+
+    def __len__(self):
+        return len(self.slice_to_uid)
+
+    def z_position(self, slice_index):
+        """
+        :param slice_index: Slice number of the image.
+        :return: Stack position of the slice.
+        """
+        return self.z_positions[slice_index]
+
+    def nearest_slice(self, z, tolerance=None):
+        """
+        Find the slice whose stack position is closest to the given one.
+        :param z: Stack position (the Z coordinate for axial images).
+        :param tolerance: Optional maximum distance in mm between z and
+            the slice found. None means any distance is accepted.
+        :return: Slice number of the nearest slice, or None if the stack
+            is empty or no slice is within the tolerance.
+        """
+        if not len(self.sorted_z):
+            return None
+
+        position = np.searchsorted(self.sorted_z, z)
+        if position == 0:
+            nearest = 0
+        elif position == len(self.sorted_z):
+            nearest = len(self.sorted_z) - 1
+        elif z - self.sorted_z[position - 1] <= self.sorted_z[position] - z:
+            nearest = position - 1
+        else:
+            nearest = position
+
+        if tolerance is not None \
+                and abs(self.sorted_z[nearest] - z) > tolerance:
+            return None
+        return int(self.sorted_slices[nearest])
+
+    def nearest_slices(self, z_array):
+        """
+        Vectorised variant of nearest_slice(..).
+        :param z_array: Array of stack positions.
+        :return: Array of slice numbers of the nearest slices.
+        """
+        z_array = np.asarray(z_array, dtype=float)
+        if len(self.sorted_z) < 2:
+            return np.full(z_array.shape, self.sorted_slices[0]
+                           if len(self.sorted_slices) else -1)
+        position = np.searchsorted(self.sorted_z, z_array)
+        position = np.clip(position, 1, len(self.sorted_z) - 1)
+        lower = self.sorted_z[position - 1]
+        upper = self.sorted_z[position]
+        position -= ((z_array - lower) <= (upper - z_array)).astype(int)
+        return self.sorted_slices[position]
+
+    def slice_of_contour(self, contour):
+        """
+        Find the slice a contour of an RTSTRUCT is drawn on. The
+        ContourImageSequence is used where present, otherwise the slice
+        is located from the stack position of the first contour point.
+        :param contour: An item of the ContourSequence of an ROI.
+        :return: Slice number, or None if it cannot be determined.
+        """
+        if 'ContourImageSequence' in contour:
+            for contour_img in contour.ContourImageSequence:
+                uid = contour_img.ReferencedSOPInstanceUID
+                if uid in self.uid_to_slice:
+                    return self.uid_to_slice[uid]
+
+        contour_data = contour.get("ContourData")
+        if not contour_data or len(contour_data) < 3:
+            return None
+        point = np.array([float(value) for value in contour_data[0:3]])
+        tolerance = self.spacing / 2 if self.spacing > 0 else None
+        return self.nearest_slice(point.dot(self.normal), tolerance)
+
+    def uid_of_contour(self, contour):
+        """
+        :param contour: An item of the ContourSequence of an ROI.
+        :return: SOPInstanceUID of the slice the contour is drawn on, or
+            None if it cannot be determined.
+        """
+        slice_index = self.slice_of_contour(contour)
+        if slice_index is None:
+            return None
+        return self.slice_to_uid[slice_index]
+
+    def thickness(self, slice_index):
+        """
+        Thickness of an ROI that only has a contour on the given slice.
+        The process used to calculate thickness is courtesy of
+        @sjswerdloff
+        :param slice_index: Slice number of the image.
+        :return: Thickness of the slice in mm, or None if the stack only
+            has one slice.
+        """
+        last = len(self.positions) - 1
+        if last < 1 or slice_index is None:
+            return None
+
+        # Use the slices before and after the current slice. If the
+        # slice is either at the top or bottom of the set, use the
+        # displacement to the adjacent slice.
+        before = max(slice_index - 1, 0)
+        after = min(slice_index + 1, last)
+        displacement = self.positions[after] - self.positions[before]
+
+        return float(np.linalg.norm(displacement)) / 2
+
+
+def get_slice_geometry(dict_container):
+    """
+    Get the SliceGeometry of a dict container (e.g. PatientDictContainer
+    or MovingDictContainer), building it on first use so that it is only
+    built once per loaded patient.
+    :param dict_container: Dict container holding the image datasets.
+    :return: SliceGeometry of the container's image stack.
+    """
+    slice_geometry = dict_container.get("slice_geometry")
+    if slice_geometry is None:
+        slice_geometry = SliceGeometry(dict_container.dataset)
+        dict_container.set("slice_geometry", slice_geometry)
+    return slice_geometry
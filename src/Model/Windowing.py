@@ -36,37 +36,20 @@ def windowing_model(text, init):
         patient_dict_container.set("window", window)
         patient_dict_container.set("level", level)
 
-    # Update CT
+    # Update CT. The PET/CT view windows the slice on display when it is
+    # updated.
     if init[2]:
-        ct_pixel_values = pt_ct_dict_container.get("ct_pixel_values")
-        ct_pixmap_aspect = pt_ct_dict_container.get("ct_pixmap_aspect")
-        ct_pixmaps_axial, ct_pixmaps_coronal, ct_pixmaps_sagittal = \
-            get_pixmaps(ct_pixel_values, window, level, ct_pixmap_aspect,
-                        fusion=True)
-
-        pt_ct_dict_container.set("ct_pixmaps_axial", ct_pixmaps_axial)
-        pt_ct_dict_container.set("ct_pixmaps_coronal", ct_pixmaps_coronal)
-        pt_ct_dict_container.set("ct_pixmaps_sagittal", ct_pixmaps_sagittal)
         pt_ct_dict_container.set("ct_window", window)
         pt_ct_dict_container.set("ct_level", level)
 
     # Update PT
     if init[1]:
-        pt_pixel_values = pt_ct_dict_container.get("pt_pixel_values")
-        pt_pixmap_aspect = pt_ct_dict_container.get("pt_pixmap_aspect")
-        pt_pixmaps_axial, pt_pixmaps_coronal, pt_pixmaps_sagittal = \
-            get_pixmaps(pt_pixel_values, window, level, pt_pixmap_aspect,
-                        fusion=True, color="Heat")
-
-        pt_ct_dict_container.set("pt_pixmaps_axial", pt_pixmaps_axial)
-        pt_ct_dict_container.set("pt_pixmaps_coronal", pt_pixmaps_coronal)
-        pt_ct_dict_container.set("pt_pixmaps_sagittal", pt_pixmaps_sagittal)
         pt_ct_dict_container.set("pt_window", window)
         pt_ct_dict_container.set("pt_level", level)
 
     # Update Fusion
     if init[3]:
-        fusion_axial, fusion_coronal, fusion_sagittal, tfm = \
+        fusion_axial, fusion_sagittal, fusion_coronal, tfm = \
             get_fused_window(level, window)
         patient_dict_container.set("color_axial", fusion_axial)
         patient_dict_container.set("color_coronal", fusion_coronal)
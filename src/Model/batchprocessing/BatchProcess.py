@@ -1,3 +1,4 @@
+import csv
 import os
 from pathlib import Path
 from pydicom import dcmread
@@ -6,6 +7,7 @@ from src.Model import ImageLoading
 from src.Model import ROI
 from src.Model.GetPatientInfo import DicomTree
 from src.Model.PatientDictContainer import PatientDictContainer
+from src.Model.SliceGeometry import get_slice_geometry
 
 
 class BatchProcess:
@@ -108,7 +110,8 @@ class BatchProcess:
             dataset_rtss = dcmread(file_names_dict['rtss'])
             rois = ImageLoading.get_roi_info(dataset_rtss)
             dict_raw_contour_data, dict_numpoints = \
-                ImageLoading.get_raw_contour_data(dataset_rtss)
+                ImageLoading.get_raw_contour_data(
+                    dataset_rtss, get_slice_geometry(patient_dict_container))
             dict_pixluts = ImageLoading.get_pixluts(read_data_dict)
 
             # Add RT Struct values to PatientDictContainer
@@ -260,7 +263,8 @@ class BatchProcess:
         # Create RT Struct file
         progress_callback.emit(("Generating RT Structure Set", 60))
         ct_uid_list = ImageLoading.get_image_uid_list(
-            patient_dict_container.dataset)
+            patient_dict_container.dataset,
+            get_slice_geometry(patient_dict_container))
         ds = ROI.create_initial_rtss_from_ct(
             patient_dict_container.dataset[0], file_path, ct_uid_list)
         ds.save_as(file_path)
@@ -301,3 +305,19 @@ class BatchProcess:
         patient_dict_container = PatientDictContainer()
         rtss_directory = Path(patient_dict_container.get("file_rtss"))
         patient_dict_container.get("dataset_rtss").save_as(rtss_directory)
+
+    @staticmethod
+    def write_csv(tar_path, csv_header, rows):
+        """
+        Append rows to a csv file in one write, adding the header if the
+        file is new.
+        :param tar_path: Path of the csv file
+        :param csv_header: List of column names
+        :param rows: List of rows
+        """
+        create_header = not os.path.isfile(tar_path)
+        with open(tar_path, 'a', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            if create_header:
+                writer.writerow(csv_header)
+            writer.writerows(rows)
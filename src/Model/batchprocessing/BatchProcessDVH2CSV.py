@@ -1,9 +1,14 @@
 import os
+
+import numpy as np
+
 from src.Model import CalculateDVHs
 from src.Model import ImageLoading
+from src.Model.DVHCache import calc_dvhs_with_cache
+from src.Model.DVHMetrics import DEFAULT_DVH_METRICS, dvh_metrics_table
 from src.Model.batchprocessing.BatchProcess import BatchProcess
 from src.Model.PatientDictContainer import PatientDictContainer
-import pandas as pd
+from src.Model.SliceGeometry import get_slice_geometry
 
 
 class BatchProcessDVH2CSV(BatchProcess):
@@ -47,6 +52,7 @@ class BatchProcessDVH2CSV(BatchProcess):
         self.ready = self.load_images(patient_files, self.required_classes)
         self.output_path = output_path
         self.filename = "DVHs_.csv"
+        self.dvh_metrics = list(DEFAULT_DVH_METRICS)
 
     def start(self):
         """
@@ -93,11 +99,12 @@ class BatchProcessDVH2CSV(BatchProcess):
             rois = self.patient_dict_container.get("rois")
             try:
                 dict_thickness = \
-                    ImageLoading.get_thickness_dict(dataset_rtss,
-                                                    read_data_dict)
-                raw_dvh = ImageLoading.calc_dvhs(dataset_rtss, dataset_rtdose,
-                                                 rois, dict_thickness,
-                                                 self.interrupt_flag)
+                    ImageLoading.get_thickness_dict(
+                        dataset_rtss, read_data_dict,
+                        get_slice_geometry(self.patient_dict_container))
+                raw_dvh = calc_dvhs_with_cache(dataset_rtss, dataset_rtdose,
+                                               rois, dict_thickness,
+                                               self.interrupt_flag)
             except TypeError:
                 self.summary = "DVH_TYPE_ERROR"
                 return False
@@ -121,12 +128,14 @@ class BatchProcessDVH2CSV(BatchProcess):
         if not os.path.isdir(path):
             os.mkdir(path)
 
-        # Save the DVH to a CSV file
-        self.progress_callback.emit(("Exporting DVH to RT Dose...", 95))
+        # Save the DVH to a CSV file. The RT Dose is left untouched, the
+        # calculated DVHs are kept in the DVH cache.
         self.dvh2csv(raw_dvh, path, self.filename, patient_id)
 
-        # Save the DVH to the RT Dose
-        CalculateDVHs.dvh2rtdose(raw_dvh)
+        # Save the dose-volume metrics of the DVH to a second CSV file
+        self.progress_callback.emit(("Exporting DVH metrics to CSV...", 95))
+        self.dvh_metrics2csv(raw_dvh, path, self.get_metrics_filename(),
+                             patient_id)
 
         return True
 
@@ -139,49 +148,55 @@ class BatchProcessDVH2CSV(BatchProcess):
         :param csv_name: CSV file name
         :param patient_id: Patient Identifier
         """
-        # full path of the target csv file
-        tar_path = path + csv_name
+        csv_header = ['Patient ID', 'ROI', 'Volume (mL)']
+        dvh_csv_list = []
 
-        create_header = not os.path.isfile(tar_path)
+        # Relative volume at every 10 cGy
+        dose_columns = 0
+        for dvh in dict_dvh.values():
+            dose = np.round(dvh.relative_volume.counts[::10], 2)
+            dvh_csv_list.append([patient_id, dvh.name,
+                                 round(float(dvh.volume), 2)]
+                                + dose.tolist())
+            dose_columns = max(dose_columns, len(dose))
 
-        dvh_csv_list = []
+        csv_header.extend(str(i * 10) + 'cGy' for i in range(dose_columns))
 
-        csv_header = []
-        csv_header.append('Patient ID')
-        csv_header.append('ROI')
-        csv_header.append('Volume (mL)')
-
-        max_roi_dose = 0
-
-        for i in dict_dvh:
-            dvh_roi_list = []
-            dvh = dict_dvh[i]
-            name = dvh.name
-            volume = dvh.volume
-            dvh_roi_list.append(patient_id)
-            dvh_roi_list.append(name)
-            dvh_roi_list.append(volume)
-            dose = dvh.relative_volume.counts
-
-            for i in range(0, len(dose), 10):
-                dvh_roi_list.append(dose[i])
-                # Update the maximum dose value, if current dose
-                # exceeds the current maximum dose
-                if i > max_roi_dose:
-                    max_roi_dose = i
-
-            dvh_csv_list.append(dvh_roi_list)
-
-        for i in range(0, max_roi_dose + 1, 10):
-            csv_header.append(str(i) + 'cGy')
-
-        # Convert the list into pandas dataframe, with 2 digit rounding.
-        pddf_csv = pd.DataFrame(dvh_csv_list, columns=csv_header).round(2)
         # Fill empty blocks with 0.0
-        pddf_csv.fillna(0.0, inplace=True)
-        pddf_csv.set_index('Patient ID', inplace=True)
-        # Convert and export pandas dataframe to CSV file
-        pddf_csv.to_csv(tar_path, mode='a', header=create_header)
+        for dvh_roi_list in dvh_csv_list:
+            dvh_roi_list.extend(
+                [0.0] * (len(csv_header) - len(dvh_roi_list)))
+
+        self.write_csv(path + csv_name, csv_header, dvh_csv_list)
+
+    def dvh_metrics2csv(self, dict_dvh, path, csv_name, patient_id):
+        """
+        Export the dose-volume metrics of the DVHs to csv file, with a row
+        per ROI.
+        Append to existing file
+        :param dict_dvh: A dictionary of DVH {ROINumber: DVH}
+        :param path: Target path of CSV export
+        :param csv_name: CSV file name
+        :param patient_id: Patient Identifier
+        """
+        csv_header, rows = dvh_metrics_table(dict_dvh, patient_id,
+                                             self.dvh_metrics)
+        self.write_csv(path + csv_name, csv_header, rows)
+
+    def get_metrics_filename(self):
+        """
+        :return: File name of the DVH metrics CSV, based on the file name
+        of the DVH CSV.
+        """
+        root, extension = os.path.splitext(self.filename)
+        return root + '_metrics' + (extension or '.csv')
+
+    def set_dvh_metrics(self, metrics):
+        """
+        Set the dose-volume metrics exported for every ROI.
+        :param metrics: List of metric names, as in DVHMetrics.
+        """
+        self.dvh_metrics = list(metrics)
 
     def set_filename(self, name):
         if name != '':
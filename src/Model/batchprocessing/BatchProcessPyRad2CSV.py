@@ -1,10 +1,8 @@
 import os
 import platform
-from radiomics import featureextractor
 from src.Model import Radiomics
 from src.Model.PatientDictContainer import PatientDictContainer
 from src.Model.batchprocessing.BatchProcess import BatchProcess
-import pandas as pd
 
 
 class BatchProcessPyRad2CSV(BatchProcess):
@@ -63,7 +61,6 @@ class BatchProcessPyRad2CSV(BatchProcess):
             self.summary = "SKIP"
             return False
 
-        rtss_path = self.patient_dict_container.filepaths.get('rtss')
         patient_id = self.patient_dict_container.dataset.get('rtss').PatientID
         patient_id = Radiomics.clean_patient_id(patient_id)
         patient_path = self.patient_dict_container.path
@@ -86,7 +83,8 @@ class BatchProcessPyRad2CSV(BatchProcess):
         self.progress_callback.emit(("Converting dicom to nrrd..", 25))
 
         # Convert dicom files to nrrd for pyradiomics processing
-        Radiomics.convert_to_nrrd(patient_path, patient_nrrd_file_path)
+        Radiomics.convert_to_nrrd(self.patient_dict_container,
+                                  patient_nrrd_file_path)
 
         # Stop loading
         if self.interrupt_flag.is_set():
@@ -103,7 +101,9 @@ class BatchProcessPyRad2CSV(BatchProcess):
 
         # Convert ROIs to nrrd
         Radiomics.convert_rois_to_nrrd(
-            patient_path, rtss_path, mask_folder_path)
+            self.patient_dict_container,
+            self.patient_dict_container.dataset['rtss'], mask_folder_path,
+            self.interrupt_flag)
 
         # Stop loading
         if self.interrupt_flag.is_set():
@@ -62,7 +62,6 @@ class BatchProcessPyRad2PyRadSR(BatchProcess):
             self.summary = "SKIP"
             return False
 
-        rtss_path = self.patient_dict_container.filepaths.get('rtss')
         patient_id = self.patient_dict_container.dataset.get(
             'rtss').PatientID
         patient_id = Radiomics.clean_patient_id(patient_id)
@@ -86,7 +85,8 @@ class BatchProcessPyRad2PyRadSR(BatchProcess):
         self.progress_callback.emit(("Converting dicom to nrrd..", 25))
 
         # Convert dicom files to nrrd for pyradiomics processing
-        Radiomics.convert_to_nrrd(patient_path, patient_nrrd_file_path)
+        Radiomics.convert_to_nrrd(self.patient_dict_container,
+                                  patient_nrrd_file_path)
 
         # Stop loading
         if self.interrupt_flag.is_set():
@@ -102,8 +102,10 @@ class BatchProcessPyRad2PyRadSR(BatchProcess):
         self.progress_callback.emit(("Converting ROIs to nrrd..", 45))
 
         # Convert ROIs to nrrd
-        Radiomics.convert_rois_to_nrrd(patient_path, rtss_path,
-                                       mask_folder_path)
+        Radiomics.convert_rois_to_nrrd(
+            self.patient_dict_container,
+            self.patient_dict_container.dataset['rtss'], mask_folder_path,
+            self.interrupt_flag)
 
         # Stop loading
         if self.interrupt_flag.is_set():
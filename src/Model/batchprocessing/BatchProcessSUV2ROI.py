@@ -1,5 +1,8 @@
+import os
+
 from src.Model import InitialModel
 from src.Model import ImageLoading
+from src.Model.LesionQuantification import lesion_metrics_table
 from src.Model.PatientDictContainer import PatientDictContainer
 from src.Model.SUV2ROI import SUV2ROI
 from src.Model.batchprocessing.BatchProcess import BatchProcess
@@ -25,7 +28,7 @@ class BatchProcessSUV2ROI(BatchProcess):
     }
 
     def __init__(self, progress_callback, interrupt_flag, patient_files,
-                 patient_weight):
+                 patient_weight, output_path=None):
         """
         Class initialiser function.
         :param progress_callback: A signal that receives the current
@@ -34,6 +37,8 @@ class BatchProcessSUV2ROI(BatchProcess):
                                function to stop loading.
         :param patient_files: List of patient files.
         :param patient_weight: Weight of the patient in grams.
+        :param output_path: Directory of the resulting lesion .csv file.
+                            No lesions are exported if None.
         """
         # Call the parent class
         super(BatchProcessSUV2ROI, self).__init__(progress_callback,
@@ -45,6 +50,8 @@ class BatchProcessSUV2ROI(BatchProcess):
         self.required_classes = ['pet']
         self.ready = self.load_images(patient_files, self.required_classes)
         self.patient_weight = patient_weight
+        self.output_path = output_path
+        self.filename = "SUVs_.csv"
 
     def start(self):
         """
@@ -117,4 +124,33 @@ class BatchProcessSUV2ROI(BatchProcess):
         # Save new RTSS
         self.progress_callback.emit(("Saving RT Struct...", 90))
         self.save_rtss()
+
+        # Export the lesions of the SUV ROIs to CSV
+        if self.output_path:
+            self.progress_callback.emit(("Exporting lesions to CSV...", 95))
+            path = self.output_path + '/CSV/'
+            if not os.path.isdir(path):
+                os.mkdir(path)
+            self.lesions2csv(list(contour_data), path, self.filename)
         return True
+
+    def lesions2csv(self, roi_names, path, csv_name):
+        """
+        Export the SUVmax, SUVmean, SUVpeak, MTV and TLG of every lesion
+        of the ROIs to csv file, with a row per lesion.
+        Append to existing file
+        :param roi_names: List of the names of the ROIs
+        :param path: Target path of CSV export
+        :param csv_name: CSV file name
+        """
+        patient_id = self.patient_dict_container.dataset[0].PatientID
+        csv_header, rows = lesion_metrics_table(
+            self.patient_dict_container, roi_names, patient_id)
+
+        self.write_csv(path + csv_name, csv_header, rows)
+
+    def set_filename(self, name):
+        if name != '':
+            self.filename = name
+        else:
+            self.filename = "SUVs_.csv"
@@ -238,6 +238,7 @@ class UIBatchProcessingWindow(object):
 
         self.dvh2csv_tab.set_dvh_output_location(self.file_path, False)
         self.pyrad2csv_tab.set_pyrad_output_location(self.file_path, False)
+        self.suv2roi_tab.set_suv_output_location(self.file_path, False)
 
         self.begin_button.setEnabled(False)
 
@@ -308,6 +309,7 @@ class UIBatchProcessingWindow(object):
             "dvh_output_path": self.dvh2csv_tab.get_dvh_output_location(),
             "pyrad_output_path":
                 self.pyrad2csv_tab.get_pyrad_output_location(),
+            "suv_output_path": self.suv2roi_tab.get_suv_output_location(),
             'clinical_data_input_path':
                 self.csv2clinicaldatasr_tab.get_csv_input_location(),
             'clinical_data_output_path':
@@ -1,14 +1,17 @@
 import os
-import platform
 from pathlib import Path
 
 from PySide6 import QtCore
 from pydicom import dcmread
 
 from src.Model import ImageLoading
+from src.Model.DVHCache import calc_dvhs_with_cache
 from src.Model.MovingDictContainer import MovingDictContainer
-from src.Model.MovingModel import create_moving_model
+from src.Model.MovingModel import create_moving_model, \
+    register_images_for_fusion
+from src.Model.PixelDecoding import decode_pixel_data
 from src.Model.ROI import create_initial_rtss_from_ct
+from src.Model.SliceGeometry import get_slice_geometry
 from src.Model.GetPatientInfo import DicomTree
 
 from src.View.ImageLoader import ImageLoader
@@ -55,6 +58,9 @@ class MovingImageLoader(ImageLoader):
             file_names_dict,
             existing_rtss_files=self.existing_rtss
         )
+        slice_geometry = get_slice_geometry(moving_dict_container)
+        decode_pixel_data(read_data_dict, file_names_dict,
+                          progress_callback, interrupt_flag)
 
         if interrupt_flag.is_set():
             print("stopped")
@@ -65,8 +71,8 @@ class MovingImageLoader(ImageLoader):
                 self.update_calc_dvh)
             self.signal_request_calc_dvh.emit()
 
-            while not self.advised_calc_dvh:
-                pass
+            if not self.wait_for_calc_dvh_advice(interrupt_flag):
+                return False
 
         if 'rtss' in file_names_dict:
             dataset_rtss = dcmread(file_names_dict['rtss'])
@@ -80,11 +86,12 @@ class MovingImageLoader(ImageLoader):
 
             progress_callback.emit(("Getting contour data...", 30))
             dict_raw_contour_data, dict_numpoints = \
-                ImageLoading.get_raw_contour_data(dataset_rtss)
+                ImageLoading.get_raw_contour_data(dataset_rtss,
+                                                  slice_geometry)
 
             # Determine which ROIs are one slice thick
             dict_thickness = ImageLoading.get_thickness_dict(
-                dataset_rtss, read_data_dict)
+                dataset_rtss, read_data_dict, slice_geometry)
 
             if interrupt_flag.is_set():  # Stop loading.
                 print("stopped")
@@ -106,28 +113,14 @@ class MovingImageLoader(ImageLoader):
             if 'rtdose' in file_names_dict and self.calc_dvh:
                 dataset_rtdose = dcmread(file_names_dict['rtdose'])
 
-                # Spawn-based platforms (i.e Windows and MacOS) have a large
-                # overhead when creating a new process, which ends up making
-                # multiprocessing on these platforms more expensive than linear
-                # calculation. As such, multiprocessing is only available on
-                # Linux until a better solution is found.
-                fork_safe_platforms = ['Linux']
-                if platform.system() in fork_safe_platforms:
-                    progress_callback.emit(("Calculating DVHs...", 60))
-                    raw_dvh = ImageLoading.multi_calc_dvh(dataset_rtss,
-                                                          dataset_rtdose,
-                                                          rois,
-                                                          dict_thickness)
-                else:
-                    progress_callback.emit(
-                        ("Calculating DVHs... (This may take a while)", 60))
-                    raw_dvh = ImageLoading.calc_dvhs(dataset_rtss,
-                                                     dataset_rtdose,
-                                                     rois,
-                                                     dict_thickness,
-                                                     interrupt_flag)
+                # Only the DVHs of ROIs that are not in the DVH cache are
+                # calculated.
+                progress_callback.emit(("Calculating DVHs...", 60))
+                raw_dvh = calc_dvhs_with_cache(dataset_rtss, dataset_rtdose,
+                                               rois, dict_thickness,
+                                               interrupt_flag)
 
-                if interrupt_flag.is_set():  # Stop loading.
+                if raw_dvh is None or interrupt_flag.is_set():  # Stop loading.
                     print("stopped")
                     return False
 
@@ -152,6 +145,14 @@ class MovingImageLoader(ImageLoader):
             progress_callback.emit(("Stopping", 85))
             return False
 
+        # Register the images on this thread, so that the registration
+        # reports its progress and can be stopped
+        if not register_images_for_fusion(
+                progress_callback=progress_callback,
+                interrupt_flag=interrupt_flag, progress_range=(85, 95)):
+            progress_callback.emit(("Stopping", 85))
+            return False
+
         return True
 
     def load_temp_rtss(self, path, progress_callback, interrupt_flag):
@@ -168,7 +169,8 @@ class MovingImageLoader(ImageLoader):
         moving_dict_container = MovingDictContainer()
         rtss_path = Path(path).joinpath('rtss.dcm')
         uid_list = ImageLoading.get_image_uid_list(
-            moving_dict_container.dataset)
+            moving_dict_container.dataset,
+            get_slice_geometry(moving_dict_container))
         rtss = create_initial_rtss_from_ct(
             moving_dict_container.dataset[0], rtss_path, uid_list)
 
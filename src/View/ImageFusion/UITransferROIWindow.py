@@ -1,22 +1,22 @@
 import platform
 import traceback
 
-import SimpleITK as sitk
-import numpy as np
 from PySide6 import QtCore, QtGui
 from PySide6.QtGui import Qt, QIcon, QPixmap
 from PySide6.QtWidgets import QGridLayout, QWidget, QLabel, QPushButton, \
     QCheckBox, QHBoxLayout, QListWidget, QListWidgetItem, QMessageBox
-from platipy.imaging.registration.utils import apply_linear_transform
 
 from src.Controller.PathHandler import resource_path
 from src.Model import ROI
 from src.Model.MovingDictContainer import MovingDictContainer
 from src.Model.PatientDictContainer import PatientDictContainer
-from src.Model.ROITransfer import transform_point_set_from_dicom_struct
+from src.Model.ROITransfer import contours_to_roi_list, \
+    create_label_volumes, extract_roi_polygons, get_affine_transform, \
+    get_roi_contour_data, get_struct_name, invert_affine_transform, \
+    transfer_label_volumes, transform_contours
+from src.Model.SimpleITKImage import get_sitk_image
+from src.Model.SliceGeometry import get_slice_geometry
 from src.View.ProgressWindow import ProgressWindow
-from src.View.util.PatientDictContainerHelper import get_dict_slice_to_uid, \
-    read_dicom_image_to_sitk
 from src.View.util.ProgressWindowHelper import check_interrupt_flag
 from src.View.util.SaveROIHelper import generate_non_duplicated_name
 
@@ -454,84 +454,153 @@ class UITransferROIWindow:
             return False
 
         rtss = self.patient_dict_container.get("dataset_rtss")
+        moving_rtss = self.moving_dict_container.get("dataset_rtss")
+        tfm = self.moving_dict_container.get("tfm")
 
-        # get sitk for the fixed image
-        dicom_image = read_dicom_image_to_sitk(
-            self.patient_dict_container.filepaths)
-
-        if not check_interrupt_flag(interrupt_flag):
-            return False
+        # Rigid and affine transforms move the contours directly, only
+        # deformable transforms need the ROIs to be rasterised
+        affine_transform = get_affine_transform(tfm)
+        if affine_transform is not None:
+            progress_callback.emit(
+                ("Transfering ROIs from moving \nto fixed image set", 40))
+            # The transform maps the fixed image onto the moving image
+            moving_to_fixed_rois = self.transfer_roi_contours(
+                self.moving_to_fixed_rois, moving_rtss,
+                invert_affine_transform(*affine_transform),
+                self.moving_dict_container, self.patient_dict_container)
+
+            if not check_interrupt_flag(interrupt_flag):
+                return False
+
+            progress_callback.emit(
+                ("Transfering ROIs from fixed \nto moving image set", 60))
+            fixed_to_moving_rois = self.transfer_roi_contours(
+                self.fixed_to_moving_rois, rtss, affine_transform,
+                self.patient_dict_container, self.moving_dict_container)
+        else:
+            moving_to_fixed_rois = None
+            fixed_to_moving_rois = None
 
-        # get array of roi indexes from sitk images
-        rois_images_fixed = transform_point_set_from_dicom_struct(
-            dicom_image, rtss, self.fixed_to_moving_rois.keys(),
-            spacing_override=None, interrupt_flag=interrupt_flag)
+        if moving_to_fixed_rois is None or fixed_to_moving_rois is None:
+            transferred_rois = self.transfer_rois_through_masks(
+                tfm, rtss, moving_rtss, interrupt_flag, progress_callback)
+            if transferred_rois is None:
+                return False
+            moving_to_fixed_rois, fixed_to_moving_rois = transferred_rois
 
-        moving_rtss = self.moving_dict_container.get("dataset_rtss")
+        progress_callback.emit(
+            ("Saving ROIs to RTSS", 80))
 
+        # check if interrupt flag is set
         if not check_interrupt_flag(interrupt_flag):
             return False
 
-        # get sitk for the moving image
-        moving_dicom_image = read_dicom_image_to_sitk(
-            self.moving_dict_container.filepaths)
+        # Every image set's RTSS is updated once with all its ROIs
+        self.save_rois_to_dict_container(moving_to_fixed_rois,
+                                         self.patient_dict_container)
+        self.save_rois_to_dict_container(fixed_to_moving_rois,
+                                         self.moving_dict_container)
 
-        if not check_interrupt_flag(interrupt_flag):
-            return False
+        progress_callback.emit(("Reloading window", 90))
+        return True
 
-        # get array of roi indexes from sitk images
-        progress_callback \
-            .emit(("Retrieving ROIs from \nboth image sets", 20))
+    def transfer_roi_contours(self, transfer_dict, rtss, affine_transform,
+                              source_container, target_container):
+        """
+        Transferring the contours of ROIs from one image set to another
+        with a rigid or affine transform, without rasterising them.
+        :param transfer_dict: dictionary of rois to be transfer.
+        key is original roi names, value is the name after transferred.
+        :param rtss: the rtss of the source image set.
+        :param affine_transform: (matrix, offset) of the transform of the
+        points of the source image set to the target image set.
+        :param source_container: container of the source image set.
+        :param target_container: container of the target image set.
+        :return: dictionary of transferred roi names to the contours of
+        the rois, in the format of ROI.create_roi(..), or None if the
+        transform tilts the slices too much to transfer the contours.
+        """
+        if not transfer_dict or not rtss:
+            return {}
+
+        source_geometry = get_slice_geometry(source_container)
+        target_geometry = get_slice_geometry(target_container)
+        roi_contour_data = get_roi_contour_data(rtss, transfer_dict.keys())
+
+        rois = {}
+        for roi_name, new_roi_name in transfer_dict.items():
+            if roi_name not in roi_contour_data:
+                continue
+            slice_contours = transform_contours(
+                roi_contour_data[roi_name], *affine_transform,
+                source_geometry, target_geometry)
+            if slice_contours is None:
+                return None
+            rois[new_roi_name] = contours_to_roi_list(slice_contours,
+                                                      target_container)
+        return rois
+
+    def transfer_rois_through_masks(self, tfm, rtss, moving_rtss,
+                                    interrupt_flag, progress_callback):
+        """
+        Transferring ROIs between the image sets by resampling masks of
+        the ROIs, for deformable transforms. The ROIs of an image set are
+        packed into one label volume that is resampled once.
+        :param tfm: the tfm that contains information for transferring rois
+        :param rtss: the rtss of the fixed image set.
+        :param moving_rtss: the rtss of the moving image set.
+        :param interrupt_flag: interrupt flag to stop process
+        :param progress_callback: signal that receives the current
+                                  progress of the loading.
+        :return: tuple of the dictionaries of the rois transferred to the
+        fixed and to the moving image set, or None if interrupted.
+        """
+        # get sitk for the fixed and the moving image
+        dicom_image = get_sitk_image(self.patient_dict_container)
+        moving_dicom_image = get_sitk_image(self.moving_dict_container)
 
-        # check if interrupt flag is set
         if not check_interrupt_flag(interrupt_flag):
-            return False
+            return None
 
+        # get label volumes of the rois from sitk images
+        progress_callback \
+            .emit(("Retrieving ROIs from \nboth image sets", 20))
+        label_volumes_fixed = create_label_volumes(
+            dicom_image, rtss,
+            [get_struct_name(name) for name in self.fixed_to_moving_rois],
+            interrupt_flag, self.patient_dict_container)
         if moving_rtss:
-            rois_images_moving = transform_point_set_from_dicom_struct(
-                moving_dicom_image,
-                moving_rtss,
-                self.moving_to_fixed_rois.keys(),
-                spacing_override=None,
-                interrupt_flag=interrupt_flag)
+            label_volumes_moving = create_label_volumes(
+                moving_dicom_image, moving_rtss,
+                [get_struct_name(name) for name in self.moving_to_fixed_rois],
+                interrupt_flag, self.moving_dict_container)
         else:
-            rois_images_moving = ([], [])
+            label_volumes_moving = []
 
-        if not check_interrupt_flag(interrupt_flag):
-            return False
-
-        tfm = self.moving_dict_container.get("tfm")
+        if label_volumes_fixed is None or label_volumes_moving is None \
+                or not check_interrupt_flag(interrupt_flag):
+            return None
 
         progress_callback.emit(
             ("Transfering ROIs from moving \nto fixed image set", 40))
 
-        # check if interrupt flag is set
-        if not check_interrupt_flag(interrupt_flag):
-            return False
-
         # transform roi from moving_dict to fixed_dict
-        self.transfer_rois(self.moving_to_fixed_rois, tfm, dicom_image,
-                           rois_images_moving, self.patient_dict_container)
+        moving_to_fixed_rois = self.transfer_rois(
+            self.moving_to_fixed_rois, tfm, dicom_image,
+            label_volumes_moving, self.patient_dict_container)
 
         progress_callback.emit(
             ("Transfering ROIs from fixed \nto moving image set", 60))
 
         if not check_interrupt_flag(interrupt_flag):
-            return False
+            return None
 
-        # transform roi from moving_dict to fixed_dict
-        self.transfer_rois(self.fixed_to_moving_rois, tfm.GetInverse(),
-                           moving_dicom_image,
-                           rois_images_fixed, self.moving_dict_container)
-
-        progress_callback.emit(
-            ("Saving ROIs to RTSS", 80))
-
-        # check if interrupt flag is set
-        if not check_interrupt_flag(interrupt_flag):
-            return False
-        progress_callback.emit(("Reloading window", 90))
-        return True
+        # transform roi from fixed_dict to moving_dict
+        fixed_to_moving_rois = self.transfer_rois(
+            self.fixed_to_moving_rois, tfm.GetInverse(),
+            moving_dicom_image, label_volumes_fixed,
+            self.moving_dict_container)
+        return moving_to_fixed_rois, fixed_to_moving_rois
 
     def transfer_roi_clicked(self):
         """
@@ -575,82 +644,69 @@ class UITransferROIWindow:
         self.closeWindow()
 
     def transfer_rois(self, transfer_dict, tfm, reference_image,
-                      original_roi_list, patient_dict_container):
+                      label_volumes, patient_dict_container):
         """
-        Converting (transferring) ROIs from one image set to another and save
-        the transferred rois to rtss.
+        Converting (transferring) ROIs from one image set to another.
+        The label volumes are resampled once, and the ROIs are outlined
+        in parallel.
         :param transfer_dict: dictionary of rois to be transfer.
         key is original roi names, value is the name after transferred.
-        :param original_roi_list: tuple of sitk rois from the base image.
         :param tfm: the tfm that contains information for transferring rois
         :param reference_image: the reference (base) image
+        :param label_volumes: label volumes of the rois of the base image
+        set, as returned by ROITransfer.create_label_volumes(..)
         :param patient_dict_container: container of the transfer image set.
-
-        """
-        for roi_name, new_roi_name in transfer_dict.items():
-            for index, name in enumerate(original_roi_list[1]):
-                if name == roi_name:
-                    sitk_image = original_roi_list[0][index]
-                    new_contour = apply_linear_transform(
-                        input_image=sitk_image, transform=tfm,
-                        reference_image=reference_image, is_structure=True)
-                    contour = sitk.GetArrayViewFromImage(new_contour)
-                    contours = np.transpose(contour.nonzero())
-                    self.save_roi_to_patient_dict_container(
-                        contours,
-                        new_roi_name,
-                        patient_dict_container)
-
-    def save_roi_to_patient_dict_container(self, contours, roi_name,
-                                           patient_dict_container):
-        """
-        Save the transferred ROI to the corresponding rtss.
-
-        :param contours: np array of coordinates of the ROI to be saved.
-        :param roi_name: name of the ROI to be saved
+        :return: dictionary of transferred roi names to the contours of
+        the rois, in the format of ROI.create_roi(..)
+        """
+        # The slices of the sitk image are in the order of the slice
+        # numbers
+        slice_keys = get_slice_geometry(patient_dict_container).slice_keys
+
+        rois = {}
+        for labels, struct_names in transfer_label_volumes(
+                label_volumes, tfm, reference_image):
+            polygons = extract_roi_polygons(labels, len(struct_names))
+            for name, roi_polygons in zip(struct_names, polygons):
+                rois_to_save = {}
+                for z_index, polygon_list in roi_polygons.items():
+                    key = int(slice_keys[z_index])
+                    rois_to_save[key] = {
+                        'ds': patient_dict_container.dataset[key],
+                        'coords': polygon_list
+                    }
+                for roi_name, new_roi_name in transfer_dict.items():
+                    if get_struct_name(roi_name) == name:
+                        rois[new_roi_name] = \
+                            ROI.convert_hull_list_to_contours_data(
+                                rois_to_save, patient_dict_container)
+        return rois
+
+    def save_rois_to_dict_container(self, rois, patient_dict_container):
+        """
+        Save the transferred ROIs to the corresponding rtss, updating
+        the rtss of the container once.
+
+        :param rois: dictionary of roi names to the contours of the rois,
+        in the format of ROI.create_roi(..)
         :param patient_dict_container: container of the transfer image set.
-
         """
-        pixels_coords_dict = {}
-        slice_ids_dict = get_dict_slice_to_uid(patient_dict_container)
-        total_slices = len(slice_ids_dict)
-        for contour in contours:
-            curr_slice_id = total_slices - contour[0]
-            if curr_slice_id >= total_slices:
-                curr_slice_id = 0
-            if curr_slice_id not in pixels_coords_dict:
-                pixels_coords_dict[curr_slice_id] = [
-                    tuple([contour[2], contour[1]])]
-            else:
-                pixels_coords_dict[curr_slice_id].append(
-                    tuple([contour[2], contour[1]]))
-
-        rois_to_save = {}
-        for key in pixels_coords_dict.keys():
-            coords = pixels_coords_dict[key]
-            polygon_list = ROI.calculate_concave_hull_of_points(coords)
-            if len(polygon_list) > 0:
-                rois_to_save[key] = {
-                    'ds': patient_dict_container.dataset[key],
-                    'coords': polygon_list
-                }
-        roi_list = ROI.convert_hull_list_to_contours_data(
-            rois_to_save, patient_dict_container)
-
-        if len(roi_list) > 0:
-            print("Saving ", roi_name)
-            if isinstance(patient_dict_container, MovingDictContainer):
-                new_rtss = ROI.create_roi(
-                    patient_dict_container.get("dataset_rtss"),
-                    roi_name, roi_list, rtss_owner="MOVING")
-                self.moving_dict_container.set("dataset_rtss", new_rtss)
-                self.moving_dict_container.set("rtss_modified", True)
-            else:
-                new_rtss = ROI.create_roi(
-                    patient_dict_container.get("dataset_rtss"),
-                    roi_name, roi_list)
-                self.patient_dict_container.set("dataset_rtss", new_rtss)
-                self.patient_dict_container.set("rtss_modified", True)
+        if isinstance(patient_dict_container, MovingDictContainer):
+            rtss_owner = "MOVING"
+        else:
+            rtss_owner = "PATIENT"
+
+        new_rtss = patient_dict_container.get("dataset_rtss")
+        modified = False
+        for roi_name, roi_list in rois.items():
+            if len(roi_list) > 0:
+                new_rtss = ROI.create_roi(new_rtss, roi_name, roi_list,
+                                          rtss_owner=rtss_owner)
+                modified = True
+
+        if modified:
+            patient_dict_container.set("dataset_rtss", new_rtss)
+            patient_dict_container.set("rtss_modified", True)
 
     def closeWindow(self):
         """
@@ -1,14 +1,19 @@
 import os
-import platform
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from PySide6 import QtCore
 from pydicom import dcmread
 
 from src.Model import ImageLoading
-from src.Model.CalculateDVHs import dvh2rtdose, rtdose2dvh
+from src.Model.CalculateDVHs import rtdose2dvh
+from src.Model.CalculateImages import convert_raw_data
+from src.Model.DVHCache import get_cached_dvhs
 from src.Model.PatientDictContainer import PatientDictContainer
+from src.Model.PixelDecoding import decode_pixel_data
 from src.Model.ROI import create_initial_rtss_from_ct
+from src.Model.SliceGeometry import get_slice_geometry
 from src.Model.GetPatientInfo import DicomTree
 
 
@@ -28,7 +33,7 @@ class ImageLoader(QtCore.QObject):
         self.parent_window = parent_window
         self.existing_rtss = existing_rtss
         self.calc_dvh = False
-        self.advised_calc_dvh = False
+        self.advised_calc_dvh = threading.Event()
 
     def load(self, interrupt_flag, progress_callback):
         """
@@ -56,6 +61,7 @@ class ImageLoader(QtCore.QObject):
             file_names_dict,
             existing_rtss_files=self.existing_rtss
         )
+        slice_geometry = get_slice_geometry(patient_dict_container)
 
         # As there is no way to interrupt a QRunnable, this method must
         # check after every step whether or not the interrupt flag has been
@@ -70,104 +76,157 @@ class ImageLoader(QtCore.QObject):
             print("stopped")
             return False
 
-        if 'rtss' in file_names_dict:
-            dataset_rtss = dcmread(file_names_dict['rtss'])
-
-            progress_callback.emit(("Getting ROI info...", 10))
-            rois = ImageLoading.get_roi_info(dataset_rtss)
+        # The remaining stages only depend on the datasets and the slice
+        # geometry, so they run concurrently:
+        #   pixel values: decode the pixel data and rescale it, so that
+        #       the pixmaps can be created straight away on the GUI thread
+        #   pixel LUTs
+        #   RTSS: ROI info, contour data and ROI thickness
+        # The DVH depends on the RTSS stage and is left to the DVH tab, so
+        # that the main window does not wait for it.
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            pixel_values_stage = executor.submit(
+                self.load_pixel_values, read_data_dict, file_names_dict,
+                progress_callback, interrupt_flag)
+            pixluts_stage = executor.submit(ImageLoading.get_pixluts,
+                                            read_data_dict)
+            if 'rtss' in file_names_dict:
+                rtss_stage = executor.submit(
+                    self.load_rtss, file_names_dict['rtss'], slice_geometry)
+
+            if 'rtss' in file_names_dict:
+                dataset_rtss, rois, dict_raw_contour_data, dict_numpoints = \
+                    rtss_stage.result()
+                progress_callback.emit(("Getting contour data...", 30))
+
+            dict_pixluts = pixluts_stage.result()
+            progress_callback.emit(("Getting pixel LUTs...", 50))
 
-            if interrupt_flag.is_set():  # Stop loading.
+            if not pixel_values_stage.result():  # Stop loading.
                 return False
 
-            progress_callback.emit(("Getting contour data...", 30))
-            dict_raw_contour_data, dict_numpoints = \
-                ImageLoading.get_raw_contour_data(dataset_rtss)
+        if interrupt_flag.is_set():  # Stop loading.
+            return False
 
-            # Determine which ROIs are one slice thick
-            dict_thickness = ImageLoading.get_thickness_dict(
-                dataset_rtss, read_data_dict)
+        patient_dict_container.set("pixluts", dict_pixluts)
+        if 'rtss' not in file_names_dict:
+            self.load_temp_rtss(path, progress_callback, interrupt_flag)
+            return True
 
-            if interrupt_flag.is_set():  # Stop loading.
-                return False
+        # Add RTSS values to PatientDictContainer
+        patient_dict_container.set("rois", rois)
+        patient_dict_container.set("raw_contour", dict_raw_contour_data)
+        patient_dict_container.set("num_points", dict_numpoints)
+
+        if 'rtdose' in file_names_dict:
+            # Check to see if DVH data exists in the RT Dose. If
+            # it is there, return (it will be populated later). If
+            # not, ask if the user wants it calculated.
+            try:
+                dvh_data = rtdose2dvh()
+                if bool(dvh_data) and not dvh_data["diff"]:
+                    return True
+            except KeyError:
+                pass
 
-            progress_callback.emit(("Getting pixel LUTs...", 50))
-            dict_pixluts = ImageLoading.get_pixluts(read_data_dict)
+            # DVHs calculated before are found in the DVH cache, in which
+            # case there is nothing to ask the user.
+            if self.load_cached_dvhs(dataset_rtss, read_data_dict, rois,
+                                     slice_geometry):
+                return True
+
+            self.parent_window.signal_advise_calc_dvh.connect(
+                self.update_calc_dvh)
+            self.signal_request_calc_dvh.emit()
 
-            if interrupt_flag.is_set():  # Stop loading.
+            if not self.wait_for_calc_dvh_advice(interrupt_flag):
                 return False
 
-            # Add RTSS values to PatientDictContainer
-            patient_dict_container.set("rois", rois)
-            patient_dict_container.set("raw_contour", dict_raw_contour_data)
-            patient_dict_container.set("num_points", dict_numpoints)
-            patient_dict_container.set("pixluts", dict_pixluts)
+            # The DVH tab calculates the DVHs in the background once the
+            # main window is open.
+            if self.calc_dvh:
+                patient_dict_container.set("dvh_calculation_requested",
+                                           True)
 
-            if 'rtdose' in file_names_dict:
-                # Check to see if DVH data exists in the RT Dose. If
-                # it is there, return (it will be populated later). If
-                # not, ask if the user wants it calculated.
-                try:
-                    dvh_data = rtdose2dvh()
-                    if bool(dvh_data) and not dvh_data["diff"]:
-                        return True
-                except KeyError:
-                    pass
-
-                self.parent_window.signal_advise_calc_dvh.connect(
-                    self.update_calc_dvh)
-                self.signal_request_calc_dvh.emit()
-
-                while not self.advised_calc_dvh:
-                    pass
-
-                # Calculate DVHs
-                if self.calc_dvh:
-                    dataset_rtdose = dcmread(file_names_dict['rtdose'])
-
-                    # Spawn-based platforms (i.e Windows and MacOS) have
-                    # a large overhead when creating a new process, which
-                    # ends up making multiprocessing on these platforms more
-                    # expensive than linear calculation. As such,
-                    # multiprocessing is only available on Linux until a better
-                    # solution is found.
-                    fork_safe_platforms = ['Linux']
-                    if platform.system() in fork_safe_platforms:
-                        progress_callback.emit(("Calculating DVHs...", 60))
-                        raw_dvh = \
-                            ImageLoading.multi_calc_dvh(dataset_rtss,
-                                                        dataset_rtdose, rois,
-                                                        dict_thickness)
-                    else:
-                        progress_callback.emit(
-                            ("Calculating DVHs... (This may take a while)",
-                             60))
-                        raw_dvh = \
-                            ImageLoading.calc_dvhs(dataset_rtss,
-                                                   dataset_rtdose, rois,
-                                                   dict_thickness,
-                                                   interrupt_flag)
-
-                    if interrupt_flag.is_set():  # Stop loading.
-                        return False
-
-                    progress_callback.emit(("Converging to zero...", 80))
-                    dvh_x_y = ImageLoading.converge_to_0_dvh(raw_dvh)
-
-                    if interrupt_flag.is_set():  # Stop loading.
-                        return False
-
-                    # Add DVH values to PatientDictContainer
-                    patient_dict_container.set("raw_dvh", raw_dvh)
-                    patient_dict_container.set("dvh_x_y", dvh_x_y)
-                    patient_dict_container.set("dvh_outdated", False)
-
-                    # Write DVH data to the RT Dose
-                    dvh2rtdose(raw_dvh)
+        return True
 
-                    return True
-        else:
-            self.load_temp_rtss(path, progress_callback, interrupt_flag)
+    def load_pixel_values(self, read_data_dict, file_names_dict,
+                          progress_callback, interrupt_flag):
+        """
+        Decode the pixel data of all image slices and rescale it to the
+        values that are displayed, so that this does not need to be done
+        on the GUI thread when the patient window is created.
+        :param read_data_dict: Dictionary of image datasets.
+        :param file_names_dict: Dictionary of filepaths.
+        :param progress_callback: A signal that receives the current
+        progress of the loading.
+        :param interrupt_flag: A threading.Event() object that tells the
+        function to stop loading.
+        :return: False if loading was interrupted, otherwise True.
+        """
+        decode_pixel_data(read_data_dict, file_names_dict,
+                          progress_callback, interrupt_flag)
+        if interrupt_flag.is_set():
+            return False
 
+        patient_dict_container = PatientDictContainer()
+        is_ct = read_data_dict[0].Modality == "CT"
+        convert_raw_data(read_data_dict, False, is_ct)
+        patient_dict_container.set("scaled", True)
+        return True
+
+    def load_rtss(self, rtss_path, slice_geometry):
+        """
+        Read the RTSS and get its ROI info and contour data.
+        :param rtss_path: Path of the RTSS file.
+        :param slice_geometry: SliceGeometry of the image set.
+        :return: Tuple (dataset_rtss, rois, dict_raw_contour_data,
+        dict_numpoints)
+        """
+        dataset_rtss = dcmread(rtss_path)
+        rois = ImageLoading.get_roi_info(dataset_rtss)
+        dict_raw_contour_data, dict_numpoints = \
+            ImageLoading.get_raw_contour_data(dataset_rtss, slice_geometry)
+        return dataset_rtss, rois, dict_raw_contour_data, dict_numpoints
+
+    def load_cached_dvhs(self, dataset_rtss, read_data_dict, rois,
+                         slice_geometry):
+        """
+        Look up the DVHs of all ROIs in the DVH cache.
+        :param dataset_rtss: RTSTRUCT DICOM dataset object.
+        :param read_data_dict: Dictionary of all DICOM dataset objects.
+        :param rois: Dictionary of ROI information.
+        :param slice_geometry: SliceGeometry of the image set.
+        :return: True if the DVHs of all ROIs were found, in which case
+        they are set in the PatientDictContainer, otherwise False.
+        """
+        dict_thickness = ImageLoading.get_thickness_dict(
+            dataset_rtss, read_data_dict, slice_geometry)
+        raw_dvh, missing_rois = get_cached_dvhs(
+            dataset_rtss, read_data_dict['rtdose'], rois, dict_thickness)
+        if missing_rois or not raw_dvh:
+            return False
+
+        patient_dict_container = PatientDictContainer()
+        patient_dict_container.set("raw_dvh", raw_dvh)
+        patient_dict_container.set(
+            "dvh_x_y", ImageLoading.converge_to_0_dvh(raw_dvh))
+        patient_dict_container.set("dvh_outdated", False)
+        patient_dict_container.set("dvh_modified_rois", set())
+        return True
+
+    def wait_for_calc_dvh_advice(self, interrupt_flag):
+        """
+        Block until the user has answered whether or not the DVHs should
+        be calculated.
+        :param interrupt_flag: A threading.Event() object that tells the
+        function to stop loading.
+        :return: False if loading was interrupted while waiting, otherwise
+        True.
+        """
+        while not self.advised_calc_dvh.wait(0.1):
+            if interrupt_flag.is_set():
+                return False
         return True
 
     def load_temp_rtss(self, path, progress_callback, interrupt_flag):
@@ -184,7 +243,8 @@ class ImageLoader(QtCore.QObject):
         patient_dict_container = PatientDictContainer()
         rtss_path = Path(path).joinpath('rtss.dcm')
         uid_list = ImageLoading.get_image_uid_list(
-            patient_dict_container.dataset)
+            patient_dict_container.dataset,
+            get_slice_geometry(patient_dict_container))
         rtss = create_initial_rtss_from_ct(
             patient_dict_container.dataset[0], rtss_path, uid_list)
 
@@ -197,9 +257,11 @@ class ImageLoader(QtCore.QObject):
         rois = ImageLoading.get_roi_info(rtss)
         patient_dict_container.set("rois", rois)
 
-        # Set pixluts
-        dict_pixluts = ImageLoading.get_pixluts(patient_dict_container.dataset)
-        patient_dict_container.set("pixluts", dict_pixluts)
+        # Set pixluts, unless they have been calculated already
+        if not patient_dict_container.has_attribute("pixluts"):
+            dict_pixluts = ImageLoading.get_pixluts(
+                patient_dict_container.dataset)
+            patient_dict_container.set("pixluts", dict_pixluts)
 
         # Add RT Struct file path and dataset to patient dict container
         patient_dict_container.filepaths['rtss'] = rtss_path
@@ -213,5 +275,5 @@ class ImageLoader(QtCore.QObject):
         patient_dict_container.set("selected_rois", [])
 
     def update_calc_dvh(self, advice):
-        self.advised_calc_dvh = True
         self.calc_dvh = advice
+        self.advised_calc_dvh.set()
@@ -1,6 +1,8 @@
 from PySide6 import QtCore, QtGui, QtWidgets
-from PySide6.QtGui import QPainter
 from PySide6.QtWidgets import (QPushButton, QRadioButton)
+
+from src.constants import DEFAULT_WINDOW_SIZE
+from src.Model.PTCTBlending import PTCTBlender
 from src.Model.PTCTDictContainer import PTCTDictContainer
 
 
@@ -29,6 +31,7 @@ class PetCtView(QtWidgets.QWidget):
 
         # Create variables to be initialised later
         self.pt_ct_dict_container = None
+        self.blender = None
         self.iso_color = None
         self.zoom = None
         self.current_slice_number = None
@@ -45,6 +48,7 @@ class PetCtView(QtWidgets.QWidget):
         self.pt_label = None
         self.ct_label = None
         self.scene = None
+        self.image_item = None
         self.axial_button = None
         self.coronal_button = None
         self.sagittal_button = None
@@ -67,6 +71,7 @@ class PetCtView(QtWidgets.QWidget):
         Loads the PET/CT GUI after data has been added to PTCTDictContainer
         """
         self.pt_ct_dict_container = PTCTDictContainer()
+        self.blender = PTCTBlender(self.pt_ct_dict_container)
         self.iso_color = iso_color
         self.zoom = 1
         self.current_slice_number = None
@@ -96,6 +101,9 @@ class PetCtView(QtWidgets.QWidget):
 
         self.init_view()
         self.scene = QtWidgets.QGraphicsScene()
+        self.image_item = QtWidgets.QGraphicsPixmapItem()
+        self.image_item.setTransformationMode(QtCore.Qt.SmoothTransformation)
+        self.scene.addItem(self.image_item)
         # radio buttons
         self.coronal_button = QRadioButton("Coronal")
         self.coronal_button.setChecked(False)
@@ -137,11 +145,10 @@ class PetCtView(QtWidgets.QWidget):
         """
         Create a slider for the DICOM Image View.
         """
-        pixmaps = self.pt_ct_dict_container.get(
-            "ct_pixmaps_" + self.slice_view)
+        slice_count = self.blender.get_slice_count(self.slice_view)
         self.slider.setMinimum(0)
-        self.slider.setMaximum(len(pixmaps) - 1)
-        self.slider.setValue(int(len(pixmaps) / 2))
+        self.slider.setMaximum(slice_count - 1)
+        self.slider.setValue(int(slice_count / 2))
         self.slider.setTickPosition(QtWidgets.QSlider.TicksLeft)
         self.slider.setTickInterval(1)
         self.slider.valueChanged.connect(self.value_changed)
@@ -174,10 +181,9 @@ class PetCtView(QtWidgets.QWidget):
         toggled = self.sender()
         if toggled.isChecked():
             self.slice_view = toggled.text().lower()
-            pixmaps = self.pt_ct_dict_container.get(
-                "ct_pixmaps_" + self.slice_view)
-            self.slider.setMaximum(len(pixmaps) - 1)
-            self.slider.setValue(int(len(pixmaps) / 2))
+            slice_count = self.blender.get_slice_count(self.slice_view)
+            self.slider.setMaximum(slice_count - 1)
+            self.slider.setValue(int(slice_count / 2))
 
         self.update_view()
 
@@ -203,35 +209,19 @@ class PetCtView(QtWidgets.QWidget):
 
     def image_display(self):
         """
-        Update the ct_image to be displayed on the DICOM View.
+        Update the blended PT/CT image to be displayed on the DICOM View.
+        Only the slice on display is blended, and the windowed CT and PT
+        slices are reused while the slider of the opacity is moved.
         """
-        # Lead CT
-        ct_pixmaps = self.pt_ct_dict_container.get(
-            "ct_pixmaps_" + self.slice_view)
         slider_id = self.slider.value()
-        ct_image = ct_pixmaps[slider_id].toImage()
-
-        # Load PT
-        pt_pixmaps = self.pt_ct_dict_container.get(
-            "pt_pixmaps_" + self.slice_view)
-        m = float(len(pt_pixmaps)) / len(ct_pixmaps)
-        pt_image = pt_pixmaps[int(m * slider_id)].toImage()
-
-        # Get alpha
         alpha = float(self.alpha_slider.value() / 100)
+        merged_image = self.blender.blend(self.slice_view, slider_id, alpha)
 
-        # Merge Images
-        painter = QPainter()
-        painter.begin(ct_image)
-        painter.setOpacity(alpha)
-        painter.drawImage(0, 0, pt_image)
-        painter.end()
-
-        # Load merged images
-        merged_pixmap = QtGui.QPixmap.fromImage(ct_image)
-        label = QtWidgets.QGraphicsPixmapItem(merged_pixmap)
-        self.scene = QtWidgets.QGraphicsScene()
-        self.scene.addItem(label)
+        # Stretch the slice over the window, as both images used to be
+        self.image_item.setPixmap(QtGui.QPixmap.fromImage(merged_image))
+        self.image_item.setTransform(QtGui.QTransform().scale(
+            DEFAULT_WINDOW_SIZE / merged_image.width(),
+            DEFAULT_WINDOW_SIZE / merged_image.height()))
 
     def zoom_in(self):
         """
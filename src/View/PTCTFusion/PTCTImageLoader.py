@@ -5,6 +5,7 @@ from PySide6 import QtCore
 from src.Model import ImageLoading
 from src.Model.PTCTDictContainer import PTCTDictContainer
 from src.Model.PTCTModel import create_pt_ct_model
+from src.Model.PixelDecoding import decode_pixel_data
 
 from src.View.ImageLoader import ImageLoader
 
@@ -66,11 +67,20 @@ class PTCTImageLoader(ImageLoader):
             progress_callback.emit(("Stopping", 50))
             return False
 
+        progress_callback.emit(("Decoding PT and CT images...", 50))
+        decode_pixel_data(pt_data_dict, pt_names_dict,
+                          interrupt_flag=interrupt_flag)
+        decode_pixel_data(ct_data_dict, ct_names_dict,
+                          interrupt_flag=interrupt_flag)
+        if interrupt_flag.is_set():
+            progress_callback.emit(("Stopping", 55))
+            return False
+
         progress_callback.emit(("Storing PT and CT data...", 60))
         pt_ct_dict_container.set_sorted_files(pt_data_dict, pt_names_dict,
                                               ct_data_dict, ct_names_dict)
         progress_callback.emit(("Loading Images", 75))
-        create_pt_ct_model()
+        create_pt_ct_model(interrupt_flag)
         if interrupt_flag.is_set():  # Stop loading.
             progress_callback.emit(("Stopping", 87.5))
             return False
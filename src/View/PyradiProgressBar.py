@@ -7,12 +7,11 @@ import csv
 import os
 import shutil
 
-import pandas as pd
 from pathlib import Path
 from PySide6 import QtCore
 from pydicom import dcmread
-from radiomics import featureextractor
 from src.Model import DICOMStructuredReport
+from src.Model import Radiomics
 from src.Model.PatientDictContainer import PatientDictContainer
 
 
@@ -36,8 +35,6 @@ class PyradiExtended(QtCore.QThread):
         self.my_callback(0, '')
         # Read one ct file, done to later obtain patient hash
         ct_file = dcmread(self.filepaths[0], force=True)
-        # Read RT-Struct file
-        rtss_path = self.filepaths['rtss']
 
         if self.target_path == '':
             patient_hash = os.path.basename(ct_file.PatientID)
@@ -64,12 +61,11 @@ class PyradiExtended(QtCore.QThread):
             # Create folder
             os.makedirs(nrrd_folder_path)
 
-        self.convert_to_nrrd(self.path, nrrd_file_path, self.my_callback)
+        self.convert_to_nrrd(nrrd_file_path, self.my_callback)
 
         # Location of folder where converted masks saved
         mask_folder_path = nrrd_folder_path + 'structures'
-        self.convert_rois_to_nrrd(self.path, rtss_path, mask_folder_path,
-                                  self.my_callback)
+        self.convert_rois_to_nrrd(mask_folder_path, self.my_callback)
 
         # Something went wrong, in this case PyRadiomics will also log an error
         if nrrd_file_path is None or nrrd_folder_path is None:
@@ -100,49 +96,31 @@ class PyradiExtended(QtCore.QThread):
         """
         self.copied_percent_signal.emit(percent, roi_name)
 
-    def convert_to_nrrd(self, path, nrrd_file_path, callback):
+    def convert_to_nrrd(self, nrrd_file_path, callback):
         """
-        Convert dicom files to nrrd using Plastimatch.
+        Write the images of the patient to an nrrd file, from the pixel
+        values that are already loaded.
 
-        :param path:            Path to patient directory (str)
-        :param nrrd_file_path:  Path to nrrd folder (str)
+        :param nrrd_file_path:  Path to nrrd file (str)
         :param callback:        Function to update progress bar
         """
-        path = '"' + path + '"'
-        nrrd_file_path = '"' + nrrd_file_path + '"'
-        # Command to convert dicom files to nrrd
-        # Writes the result from the processing into a temporary file
-        # rather than the terminal
-        cmd_for_nrrd = 'plastimatch convert --input ' + path + \
-            ' --output-img ' + nrrd_file_path + ' 1>' + path + '/NUL'
-        # Command to delete the temporary file generated before
-        cmd_del_nul = 'rm ' + path + '/NUL'
-        os.system(cmd_for_nrrd)
-        os.system(cmd_del_nul)
+        Radiomics.convert_to_nrrd(PatientDictContainer(), nrrd_file_path)
         # Set completed percentage to 25% and blank for ROI name
         callback(25, '')
 
-    def convert_rois_to_nrrd(self, path, rtss_path, mask_folder_path, callback):
+    def convert_rois_to_nrrd(self, mask_folder_path, callback):
         """
-        Generate an nrrd file for each region of interest using Plastimatch.
+        Generate an nrrd file for each region of interest, from the
+        masks of the ROIMaskCache of the patient.
 
-        :param path:                Path to patient directory (str)
-        :param rtss_path:           Path to RT-Struct file (str)
         :param mask_folder_path:    Folder to which the segmentation masks
                                     will be saved(str)
         :param callback:            Function to update progress bar
         """
-        path = '"' + path + '"'
-        mask_folder_path = '"' + mask_folder_path + '"'
-        rtss_path = '"' + rtss_path + '"'
-        # Command for generating an nrrd file for each region of interest
-        cmd_for_segmask = 'plastimatch convert --input ' + rtss_path + \
-            ' --output-prefix ' + mask_folder_path + \
-            ' --prefix-format nrrd --referenced-ct ' + path + ' 1>' + \
-            path + '/NUL'
-        cmd_del_nul = 'rm ' + path + '/NUL'
-        os.system(cmd_for_segmask)
-        os.system(cmd_del_nul)
+        patient_dict_container = PatientDictContainer()
+        Radiomics.convert_rois_to_nrrd(
+            patient_dict_container,
+            patient_dict_container.get("dataset_rtss"), mask_folder_path)
         # Set progress bar percentage to 50%
         callback(50, '')
 
@@ -159,6 +137,8 @@ class PyradiExtended(QtCore.QThread):
         :param callback:            Function to update progress bar
         :return:                    Pandas dataframe
         """
+        import pandas as pd
+        from radiomics import featureextractor
 
         # Initialize feature extractor using default pyradiomics settings
         # Default features:
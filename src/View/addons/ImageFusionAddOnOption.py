@@ -7,6 +7,7 @@ from PySide6.QtWidgets import QWidget, QLayout, QLabel, QSpinBox, \
 from src.Model.GetPatientInfo import DicomTree
 from src.Model.MovingDictContainer import MovingDictContainer
 from src.Model.PatientDictContainer import PatientDictContainer
+from src.Model.RegistrationCache import RegistrationCache
 
 
 class ImageFusionOptions(object):
@@ -293,8 +294,21 @@ class ImageFusionOptions(object):
             QtGui.QCursor(QtCore.Qt.PointingHandCursor))
         self.fast_mode_button.clicked.connect(self.set_fast_mode)
 
+        # Button for clearing the saved registrations
+        self.clear_registrations_button = QtWidgets.QPushButton(
+            "Clear Saved Registrations")
+        self.clear_registrations_button.setCursor(
+            QtGui.QCursor(QtCore.Qt.PointingHandCursor))
+        self.clear_registrations_button.setToolTip(
+            "Registrations are saved and reused when the same image sets "
+            "are fused with the same parameters. Clear them to register "
+            "the image sets again.")
+        self.clear_registrations_button.clicked.connect(
+            self.clear_registrations)
+
         # Add Widgets to the vertical layout
         self.vertical_layout.addWidget(self.fast_mode_button)
+        self.vertical_layout.addWidget(self.clear_registrations_button)
         self.vertical_layout.addWidget(self.gridLayoutWidget)
         self.vertical_layout.addWidget(self.warning_label)
 
@@ -443,3 +457,11 @@ class ImageFusionOptions(object):
         self.interp_order_spinbox.setValue(2)
         self.no_of_iterations_spinBox.setValue(50)
         self.default_number_spinBox.setValue(-1000)
+
+    def clear_registrations(self):
+        """
+        Delete the saved registrations, so that image sets are registered
+        again the next time they are fused.
+        """
+        RegistrationCache().clear()
+        self.warning_label.setText("Saved registrations cleared.")
@@ -109,6 +109,9 @@ class BatchSummaryWindow(QtWidgets.QDialog):
                     elif patient_summary[process][4:] == "WEIGHT":
                         summary_text += "Patient weight could not be found " \
                                         "or not provided."
+                    # No injected dose
+                    elif patient_summary[process][4:] == "DOSE":
+                        summary_text += "Injected dose could not be found."
                 # DVH2CSV could not calculate
                 elif patient_summary[process] == "DVH_TYPE_ERROR":
                     summary_text += process.upper() \
@@ -1,4 +1,5 @@
 import platform
+from os.path import expanduser
 from pydicom import dcmread
 from PySide6 import QtCore, QtGui, QtWidgets
 from src.Controller.PathHandler import resource_path
@@ -42,6 +43,7 @@ class SUV2ROIOptions(QtWidgets.QWidget):
 
         self.main_layout.addWidget(self.info_label)
         self.create_table_view()
+        self.create_output_location()
         self.setLayout(self.main_layout)
 
     def create_table_view(self):
@@ -78,6 +80,71 @@ class SUV2ROIOptions(QtWidgets.QWidget):
         # Add table to the main layout
         self.main_layout.addWidget(self.table_pet_weight)
 
+    def create_output_location(self):
+        """
+        Create the directory selection for the CSV file the SUVmax,
+        SUVmean, SUVpeak, MTV and TLG of the lesions are exported to.
+        """
+        label = QtWidgets.QLabel(
+            "Please choose the location for the resulting lesion CSV file:")
+        label.setStyleSheet(self.stylesheet)
+
+        self.directory_layout = QtWidgets.QFormLayout()
+
+        # Directory text box
+        self.directory_input = QtWidgets.QLineEdit("No directory selected")
+        self.directory_input.setStyleSheet(self.stylesheet)
+        self.directory_input.setEnabled(False)
+
+        # Change button
+        self.change_button = QtWidgets.QPushButton("Change")
+        self.change_button.setMaximumWidth(100)
+        self.change_button.clicked.connect(self.show_file_browser)
+        self.change_button.setObjectName("NormalButton")
+        self.change_button.setStyleSheet(self.stylesheet)
+
+        self.directory_layout.addWidget(label)
+        self.directory_layout.addRow(self.directory_input)
+        self.directory_layout.addRow(self.change_button)
+
+        self.main_layout.addLayout(self.directory_layout)
+
+    def set_suv_output_location(self, path, enable=True,
+                                change_if_modified=False):
+        """
+        Set the location for the SUV2ROI resulting lesion .csv file.
+        :param path: desired path.
+        :param enable: Enable the directory text bar.
+        :param change_if_modified: Change the directory if already been
+        changed.
+        """
+        if not self.directory_input.isEnabled() or change_if_modified:
+            self.directory_input.setText(path)
+            self.directory_input.setEnabled(enable)
+
+    def get_suv_output_location(self):
+        """
+        Get the location of the desired output directory.
+        """
+        return self.directory_input.text()
+
+    def show_file_browser(self):
+        """
+        Show the file browser for selecting a folder for the lesion CSV
+        file.
+        """
+        # Open a file dialog and return chosen directory
+        path = QtWidgets.QFileDialog.getExistingDirectory(
+            None, 'Choose Directory ..', '')
+
+        # If chosen directory is nothing (user clicked cancel) set to
+        # user home
+        if path == "":
+            path = expanduser("~")
+
+        # Update file path
+        self.set_suv_output_location(path, change_if_modified=True)
+
     def populate_table(self, dicom_structure):
         """
         Populates the table with patient IDs and line edits once datasets
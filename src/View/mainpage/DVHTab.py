@@ -4,14 +4,14 @@ import threading
 import numpy as np
 from pathlib import Path
 
-import matplotlib.pylab as plt
 from PySide6 import QtWidgets, QtCore, QtGui
-from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
 
 from src.Controller.PathHandler import resource_path
 from src.Model import ImageLoading
 from src.Model.CalculateDVHs import dvh2csv, dvh2rtdose, rtdose2dvh
+from src.Model.DVHCache import update_dvhs
 from src.Model.PatientDictContainer import PatientDictContainer
+from src.Model.SliceGeometry import get_slice_geometry
 from src.Model.Worker import Worker
 
 
@@ -26,23 +26,34 @@ class DVHTab(QtWidgets.QWidget):
         self.raw_dvh = None
         self.dvh_x_y = None
         self.plot = None
+        self.dvh_lines = {}
+        self.modified_indicator_widget = None
 
         self.selected_rois = self.patient_dict_container.get("selected_rois")
 
         self.dvh_tab_layout = QtWidgets.QVBoxLayout()
 
-        try:
-            # Import the DVH from RT Dose
-            self.import_rtdose()
-        except (AttributeError, KeyError):
-            # Construct the layout based on whether or not the DVH has
-            # already been calculated.
-            # TODO: convert to logging
-            print("DVH data not in RT Dose.")
-            if self.dvh_calculated:
-                self.init_layout_dvh()
-            else:
-                self.init_layout_no_dvh()
+        if self.patient_dict_container.get("dvh_calculation_requested"):
+            # The DVHs were requested while the patient was loading, and
+            # are calculated now that the main window is open.
+            self.calculate_dvh_in_background()
+        elif self.dvh_calculated:
+            # The DVHs were found in the DVH cache while the patient was
+            # loading.
+            self.init_layout_dvh()
+        else:
+            try:
+                # Import the DVH from RT Dose
+                self.import_rtdose()
+            except (AttributeError, KeyError):
+                # Construct the layout based on whether or not the DVH has
+                # already been calculated.
+                # TODO: convert to logging
+                print("DVH data not in RT Dose.")
+                if self.dvh_calculated:
+                    self.init_layout_dvh()
+                else:
+                    self.init_layout_no_dvh()
 
         self.setLayout(self.dvh_tab_layout)
 
@@ -50,11 +61,14 @@ class DVHTab(QtWidgets.QWidget):
         """
         Initialise the DVH tab's layout when DVH data exists.
         """
+        from matplotlib.backends.backend_qtagg import \
+            FigureCanvasQTAgg as FigureCanvas
+
         self.raw_dvh = self.patient_dict_container.get("raw_dvh")
         self.dvh_x_y = self.patient_dict_container.get("dvh_x_y")
 
         self.plot = self.plot_dvh()
-        widget_plot = FigureCanvas(self.plot)
+        self.canvas = FigureCanvas(self.plot)
 
         button_layout = QtWidgets.QHBoxLayout()
 
@@ -62,13 +76,20 @@ class DVHTab(QtWidgets.QWidget):
         button_export.clicked.connect(self.export_csv)
         button_layout.addWidget(button_export)
 
+        # Writing the DVHs into the RT Dose modifies the clinical file, so
+        # it is only done on request. Calculated DVHs are kept in the DVH
+        # cache instead.
+        button_export_rtdose = QtWidgets.QPushButton("Export DVH to RT Dose")
+        button_export_rtdose.clicked.connect(self.export_rtdose)
+        button_layout.addWidget(button_export_rtdose)
+
         # Added Recalculate button
         button_calc_dvh = QtWidgets.QPushButton("Recalculate DVH")
         button_calc_dvh.clicked.connect(self.prompt_calc_dvh)
         button_layout.addWidget(button_calc_dvh)
 
         self.dvh_tab_layout.setAlignment(QtCore.Qt.Alignment())
-        self.dvh_tab_layout.addWidget(widget_plot)
+        self.dvh_tab_layout.addWidget(self.canvas)
         self.dvh_tab_layout.addLayout(button_layout)
 
     def init_layout_no_dvh(self):
@@ -81,6 +102,42 @@ class DVHTab(QtWidgets.QWidget):
         self.dvh_tab_layout.setAlignment(QtCore.Qt.AlignCenter | QtCore.Qt.AlignCenter)
         self.dvh_tab_layout.addWidget(button_calc_dvh)
 
+    def init_layout_calculating_dvh(self):
+        """
+        Initialise the DVH tab's layout while the DVH is being calculated.
+        """
+        label_calculating = QtWidgets.QLabel(
+            "Calculating DVHs... (This may take several minutes)")
+
+        self.dvh_tab_layout.setAlignment(QtCore.Qt.AlignCenter | QtCore.Qt.AlignCenter)
+        self.dvh_tab_layout.addWidget(label_calculating)
+
+    def calculate_dvh_in_background(self):
+        """
+        Calculate the DVHs on a separate thread, leaving the rest of the
+        main window usable in the meantime.
+        """
+        self.patient_dict_container.set("dvh_calculation_requested", False)
+        self.init_layout_calculating_dvh()
+
+        self.threadpool = QtCore.QThreadPool()
+        self.interrupt_flag = threading.Event()
+        worker = create_calc_dvh_worker(self.patient_dict_container,
+                                        self.interrupt_flag)
+        worker.signals.result.connect(self.dvh_calculated_in_background)
+        self.threadpool.start(worker)
+
+    def dvh_calculated_in_background(self, result):
+        """
+        Store the DVHs calculated by calculate_dvh_in_background().
+        :param result: A dictionary of DVH {ROINumber: DVH}, or None if
+        the calculation was interrupted.
+        """
+        if not store_calculated_dvhs(self.patient_dict_container, result):
+            return
+        self.patient_dict_container.set("dvh_outdated", False)
+        self.dvh_calculation_finished()
+
     def clear_layout(self):
         """
         Clear the layout of the DVH tab.
@@ -97,46 +154,79 @@ class DVHTab(QtWidgets.QWidget):
         """
         :return: DVH plot using Matplotlib library.
         """
-        # Initialisation of the plots
-        fig, ax = plt.subplots()
-        fig.subplots_adjust(0.1, 0.15, 1, 1)
-        # Maximum value for x axis
-        max_xlim = 0
+        from matplotlib.figure import Figure
+
+        # Initialisation of the plots. The figure is not created through
+        # pyplot, as it is kept and updated rather than recreated.
+        fig = Figure()
+        self.axes = fig.add_subplot()
+        fig.subplots_adjust(0.1, 0.3, 1, 1)
+        self.axes.set_xlabel('Dose [%s]' % 'cGy')
+        self.axes.set_ylabel('Volume [%s]' % '%')
 
         # Plot for all the ROIs selected in the left column of the window
+        self.dvh_lines = {}
         for roi in self.selected_rois:
-            dvh = self.raw_dvh[int(roi)]
-
-            # Plot only the ROIs whose volume is non equal to 0
-            if dvh.volume != 0:
-                # Bincenters, obtained from the dvh object, give the x axis values
-                # (Doses originally in Gy unit)
-                bincenters = self.dvh_x_y[roi]['bincenters']
-                # print(self.dvh_x_y[roi])
-
-                # Counts, obtained from the dvh object, give the y axis values
-                # (values between 0 and dvh.volume)
-                counts = self.dvh_x_y[roi]['counts']
-
-                # Color of the line is the same as the color shown in the left column of the window
-                color = self.patient_dict_container.get("roi_color_dict")[roi]
-                color_R = color.red() / 255
-                color_G = color.green() / 255
-                color_B = color.blue() / 255
-
-                plt.plot(100 * bincenters,
-                         100 * counts / dvh.volume,
-                         label=dvh.name,
-                         color=[color_R, color_G, color_B])
-
-                # Update the maximum value for x axis (usually different between ROIs)
-                if (100 * bincenters[-1]) > max_xlim:
-                    max_xlim = 100 * bincenters[-1]
-
-                plt.xlabel('Dose [%s]' % 'cGy')
-                plt.ylabel('Volume [%s]' % '%')
-                if dvh.name:
-                    plt.legend(loc='lower center', bbox_to_anchor=(0, 1, 5, 5))
+            if int(roi) in self.raw_dvh:
+                self.plot_dvh_line(roi)
+        self.update_axes()
+
+        return fig
+
+    def plot_dvh_line(self, roi):
+        """
+        Add the line of an ROI to the plot.
+        :param roi: ROI number
+        """
+        dvh = self.raw_dvh[int(roi)]
+
+        # Plot only the ROIs whose volume is non equal to 0
+        if dvh.volume == 0:
+            return
+
+        # Bincenters, obtained from the dvh object, give the x axis values
+        # (Doses originally in Gy unit)
+        bincenters = self.dvh_x_y[roi]['bincenters']
+
+        # Counts, obtained from the dvh object, give the y axis values
+        # (values between 0 and dvh.volume)
+        counts = self.dvh_x_y[roi]['counts']
+
+        # Color of the line is the same as the color shown in the left column of the window
+        color = self.patient_dict_container.get("roi_color_dict")[roi]
+        color_R = color.red() / 255
+        color_G = color.green() / 255
+        color_B = color.blue() / 255
+
+        line, = self.axes.plot(100 * bincenters,
+                               100 * counts / dvh.volume,
+                               label=dvh.name,
+                               color=[color_R, color_G, color_B])
+
+        # The DVH is kept with the line, so that the line is redrawn once
+        # the DVH is recalculated.
+        self.dvh_lines[roi] = (dvh, line)
+
+    def remove_dvh_line(self, roi):
+        """
+        Remove the line of an ROI from the plot.
+        :param roi: ROI number
+        """
+        dvh, line = self.dvh_lines.pop(roi)
+        line.remove()
+
+    def update_axes(self):
+        """
+        Fit the axes and the legend to the lines of the plot.
+        """
+        ax = self.axes
+
+        # Maximum value for x axis (usually different between ROIs)
+        max_xlim = 0
+        for dvh, line in self.dvh_lines.values():
+            x_data = line.get_xdata()
+            if len(x_data) and x_data[-1] > max_xlim:
+                max_xlim = x_data[-1]
 
         # Set the range values for x and y axis
         ax.set_ylim([0, 105])
@@ -155,13 +245,12 @@ class DVHTab(QtWidgets.QWidget):
         ax.grid(which='major', alpha=0.5)
 
         # Add the legend at the bottom left of the graph
-        if len(self.selected_rois) != 0:
+        legend = ax.get_legend()
+        if legend is not None:
+            legend.remove()
+        if len(self.dvh_lines) != 0:
             ax.legend(loc='upper left', bbox_to_anchor=(-0.1, -0.15), ncol=4)
 
-        plt.subplots_adjust(bottom=0.3)
-
-        return fig
-
     def prompt_calc_dvh(self):
         """
         Prompt for DVH calculation.
@@ -183,8 +272,6 @@ class DVHTab(QtWidgets.QWidget):
                     self.dvh_calculation_finished)
                 self.patient_dict_container.set("dvh_outdated", False)
                 progress_window.exec_()
-
-                self.export_rtdose()
         else:
             stylesheet_path = ""
 
@@ -223,29 +310,63 @@ class DVHTab(QtWidgets.QWidget):
                 self.patient_dict_container.set("dvh_outdated", False)
                 progress_window.exec_()
 
-                self.export_rtdose()
-
     def dvh_calculation_finished(self):
-        # Clear the screen
-        self.clear_layout()
         self.dvh_calculated = True
-        self.init_layout_dvh()
+        if self.plot is None:
+            # Clear the screen
+            self.clear_layout()
+            self.modified_indicator_widget = None
+            self.init_layout_dvh()
+            self.update_outdated_indicator()
+        else:
+            self.update_plot()
 
     def update_plot(self):
-        if self.dvh_calculated:
-            # Get new list of selected rois that have DVHs calculated
-            self.selected_rois = [roi for roi in self.patient_dict_container.get("selected_rois")
-                                  if roi in self.raw_dvh.keys()]
+        """
+        Update the plot after the selection of ROIs or the DVHs changed.
+        Only the lines of ROIs that were selected, deselected, renamed or
+        recalculated are redrawn.
+        """
+        if not self.dvh_calculated:
+            return
 
-            # Clear the current layout
-            self.clear_layout()
+        self.raw_dvh = self.patient_dict_container.get("raw_dvh")
+        self.dvh_x_y = self.patient_dict_container.get("dvh_x_y")
 
-            # If the DVH has become outdated, show the user an indicator advising them such.
-            if self.patient_dict_container.get("dvh_outdated"):
-                self.display_outdated_indicator()
+        # Get new list of selected rois that have DVHs calculated
+        self.selected_rois = [roi for roi in self.patient_dict_container.get("selected_rois")
+                              if roi in self.raw_dvh.keys()]
 
-            # Re-draw the plot and add to layout
-            self.init_layout_dvh()
+        if self.plot is None:
+            self.dvh_calculation_finished()
+            return
+
+        for roi in list(self.dvh_lines):
+            dvh, line = self.dvh_lines[roi]
+            if roi not in self.selected_rois \
+                    or self.raw_dvh[roi] is not dvh \
+                    or line.get_label() != dvh.name:
+                self.remove_dvh_line(roi)
+        for roi in self.selected_rois:
+            if roi not in self.dvh_lines:
+                self.plot_dvh_line(roi)
+
+        self.update_axes()
+        self.canvas.draw_idle()
+
+        # If the DVH has become outdated, show the user an indicator advising them such.
+        self.update_outdated_indicator()
+
+    def update_outdated_indicator(self):
+        """
+        Show the outdated indicator while the DVHs are outdated.
+        """
+        outdated = self.patient_dict_container.get("dvh_outdated")
+        if outdated and self.modified_indicator_widget is None:
+            self.display_outdated_indicator()
+        elif not outdated and self.modified_indicator_widget is not None:
+            self.modified_indicator_widget.setParent(None)
+            self.modified_indicator_widget = None
 
     def export_csv(self):
         path = self.patient_dict_container.path
@@ -286,10 +407,12 @@ class DVHTab(QtWidgets.QWidget):
             self.patient_dict_container.set("raw_dvh", result)
             self.patient_dict_container.set("dvh_x_y", dvh_x_y)
 
-            # If incomplete, tell the user about this
+            # If incomplete, tell the user about this. Otherwise changes
+            # to the ROIs are tracked from now on.
             if incomplete:
                 self.patient_dict_container.set("dvh_outdated", True)
-                self.display_outdated_indicator()
+            else:
+                self.patient_dict_container.set("dvh_modified_rois", set())
 
             # Initialise the display
             self.dvh_calculation_finished()
@@ -315,7 +438,63 @@ class DVHTab(QtWidgets.QWidget):
 
         self.modified_indicator_widget.setLayout(modified_indicator_layout)
 
-        self.dvh_tab_layout.addWidget(self.modified_indicator_widget, QtCore.Qt.AlignTop | QtCore.Qt.AlignTop)
+        self.dvh_tab_layout.insertWidget(0, self.modified_indicator_widget, 0, QtCore.Qt.AlignTop | QtCore.Qt.AlignTop)
+
+
+def create_calc_dvh_worker(patient_dict_container, interrupt_flag):
+    """
+    Create a worker that calculates the DVHs of all ROIs of the patient.
+    If the DVHs were calculated before, only the DVHs of ROIs modified
+    since then are recalculated.
+    :param patient_dict_container: PatientDictContainer of the patient.
+    :param interrupt_flag: A threading.Event() object that tells the
+    calculation to stop.
+    :return: Worker whose result is a dictionary of DVH {ROINumber: DVH},
+    or None if the calculation was interrupted
+    """
+    dataset_rtss = patient_dict_container.dataset["rtss"]
+    dataset_rtdose = patient_dict_container.dataset["rtdose"]
+    rois = patient_dict_container.get("rois")
+
+    dict_thickness = ImageLoading.get_thickness_dict(
+        dataset_rtss, patient_dict_container.dataset,
+        get_slice_geometry(patient_dict_container))
+
+    # ROIs are only tracked once the DVHs have been calculated, otherwise
+    # it is unknown which DVHs are outdated.
+    raw_dvh = patient_dict_container.get("raw_dvh")
+    modified_rois = patient_dict_container.get("dvh_modified_rois")
+    if raw_dvh is None or modified_rois is None:
+        raw_dvh = {}
+        modified_rois = set()
+
+    # Changes made from now on are outdated again
+    patient_dict_container.set("dvh_modified_rois", set())
+
+    # Of the remaining ROIs, only the DVHs that are not in the DVH cache
+    # are calculated.
+    return Worker(update_dvhs, raw_dvh, modified_rois, dataset_rtss,
+                  dataset_rtdose, rois, dict_thickness, interrupt_flag)
+
+
+def store_calculated_dvhs(patient_dict_container, result):
+    """
+    Store the DVHs calculated by a worker from create_calc_dvh_worker(..)
+    :param patient_dict_container: PatientDictContainer of the patient.
+    :param result: A dictionary of DVH {ROINumber: DVH}, or None if the
+    calculation was interrupted.
+    :return: True if the DVHs were stored.
+    """
+    if result is None:
+        # The ROIs modified before the calculation are unknown now, so
+        # the next calculation includes all of them.
+        patient_dict_container.set("dvh_modified_rois", None)
+        return False
+
+    dvh_x_y = ImageLoading.converge_to_0_dvh(result)
+    patient_dict_container.set("raw_dvh", result)
+    patient_dict_container.set("dvh_x_y", dvh_x_y)
+    return True
 
 
 class CalculateDVHProgressWindow(QtWidgets.QDialog):
@@ -333,26 +512,16 @@ class CalculateDVHProgressWindow(QtWidgets.QDialog):
         self.threadpool = QtCore.QThreadPool()
         self.patient_dict_container = PatientDictContainer()
 
-        dataset_rtss = self.patient_dict_container.dataset["rtss"]
-        dataset_rtdose = self.patient_dict_container.dataset["rtdose"]
-        rois = self.patient_dict_container.get("rois")
-
-        dict_thickness = ImageLoading.get_thickness_dict(dataset_rtss, self.patient_dict_container.dataset)
-
         interrupt_flag = threading.Event()
-        fork_safe_platforms = ['Linux']
-        if platform.system() in fork_safe_platforms:
-            worker = Worker(ImageLoading.multi_calc_dvh, dataset_rtss, dataset_rtdose, rois, dict_thickness)
-        else:
-            worker = Worker(ImageLoading.calc_dvhs, dataset_rtss, dataset_rtdose, rois, dict_thickness, interrupt_flag)
-
+        worker = create_calc_dvh_worker(self.patient_dict_container,
+                                        interrupt_flag)
         worker.signals.result.connect(self.dvh_calculated)
 
         self.threadpool.start(worker)
 
     def dvh_calculated(self, result):
-        dvh_x_y = ImageLoading.converge_to_0_dvh(result)
-        self.patient_dict_container.set("raw_dvh", result)
-        self.patient_dict_container.set("dvh_x_y", dvh_x_y)
+        if not store_calculated_dvhs(self.patient_dict_container, result):
+            self.close()
+            return
         self.signal_dvh_calculated.emit()
         self.close()
@@ -1,7 +1,7 @@
 from PySide6 import QtWidgets, QtCore, QtGui
-from skimage import measure
 
 from src.View.mainpage.DicomView import DicomView
+from src.Model import SUV
 from src.Model.Isodose import get_dose_grid
 from src.Model.PatientDictContainer import PatientDictContainer
 from src.Controller.PathHandler import resource_path
@@ -27,6 +27,7 @@ class DicomAxialView(DicomView):
         """
         self.metadata_formatted = metadata_formatted
         self.slice_view = 'axial'
+        self.suv_readout = False
         super(DicomAxialView, self).__init__(
             roi_color=roi_color, iso_color=iso_color,
             cut_line_color=cut_line_color)
@@ -42,6 +43,7 @@ class DicomAxialView(DicomView):
         self.label_image_size = QtWidgets.QLabel()
         self.label_zoom = QtWidgets.QLabel()
         self.label_patient_pos = QtWidgets.QLabel()
+        self.label_suv = QtWidgets.QLabel()
         self.button_suv2roi = QtWidgets.QPushButton()
         self.init_metadata()
 
@@ -63,6 +65,8 @@ class DicomAxialView(DicomView):
             QtCore.Qt.AlignBottom | QtCore.Qt.AlignBottom)
         self.label_patient_pos.setAlignment(
             QtCore.Qt.AlignRight | QtCore.Qt.AlignRight)
+        self.label_suv.setAlignment(
+            QtCore.Qt.AlignRight | QtCore.Qt.AlignRight)
 
         # SUV2ROI button (only when PET is opened)
         patient_dict_container = PatientDictContainer()
@@ -88,6 +92,10 @@ class DicomAxialView(DicomView):
                 QtGui.QCursor(QtCore.Qt.PointingHandCursor))
             self.button_suv2roi.clicked.connect(self.suv2roi_handler)
 
+            # Show the SUV under the cursor
+            self.suv_readout = True
+            self.view.viewport().setMouseTracking(True)
+
         # Set all labels to white
         stylesheet = "QLabel { color : white; }"
         self.format_metadata_labels(stylesheet)
@@ -111,6 +119,9 @@ class DicomAxialView(DicomView):
         top_right = QtWidgets.QVBoxLayout(top_right_widget)
         top_right.addWidget(
             self.label_wl, QtCore.Qt.AlignTop | QtCore.Qt.AlignTop)
+        if self.suv_readout:
+            top_right.addWidget(
+                self.label_suv, QtCore.Qt.AlignTop | QtCore.Qt.AlignTop)
 
         # Create a widget to contain the two top widgets
         top_widget = QtWidgets.QWidget()
@@ -185,6 +196,7 @@ class DicomAxialView(DicomView):
         self.label_image_size.setStyleSheet(stylesheet)
         self.label_zoom.setStyleSheet(stylesheet)
         self.label_patient_pos.setStyleSheet(stylesheet)
+        self.label_suv.setStyleSheet(stylesheet)
 
     def format_metadata_margin(self):
         """
@@ -223,6 +235,39 @@ class DicomAxialView(DicomView):
                 stylesheet = "QLabel { color : white; }"
             self.format_metadata_labels(stylesheet)
 
+    def image_display(self):
+        """
+        Update the image to be displayed on the DICOM View, and follow
+        the cursor on it for the SUV readout.
+        """
+        super().image_display()
+        if self.suv_readout:
+            self.scene.cursor_moved.connect(self.update_suv_readout)
+
+    def update_suv_readout(self, position):
+        """
+        Show the SUV of the pixel under the cursor. The SUV is read from
+        the SUV volume that is shared with SUV2ROI, and is not shown when
+        it can not be calculated, i.e. the patient weight is unknown.
+        :param position: Scene position of the cursor.
+        """
+        slider_id = self.slider.value()
+        dataset = self.patient_dict_container.dataset[slider_id]
+        pixmap = self.patient_dict_container.get("pixmaps_axial")[slider_id]
+        row = int(position.y() / pixmap.height() * dataset.Rows)
+        column = int(position.x() / pixmap.width() * dataset.Columns)
+        if not (0 <= row < dataset.Rows and 0 <= column < dataset.Columns):
+            self.label_suv.setText("")
+            return
+
+        try:
+            suv_volume = SUV.get_patient_suv_volume()
+        except SUV.SUVError:
+            self.label_suv.setText("")
+            return
+        self.label_suv.setText(
+            "SUV: %.2f" % suv_volume[slider_id, row, column])
+
     def update_view(self, zoom_change=False):
         """
             Update the view of the DICOM Image.
@@ -289,6 +334,8 @@ class DicomAxialView(DicomView):
         """
         Display isodoses on the DICOM Image.
         """
+        from skimage import measure
+
         slider_id = self.slider.value()
         curr_slice_uid = self.patient_dict_container.get("dict_uid")[slider_id]
         z = self.patient_dict_container.dataset[slider_id].ImagePositionPatient[2]
@@ -5,6 +5,8 @@ class GraphicsScene(QtWidgets.QGraphicsScene):
     """
     A child class of the QGraphicsScene that contains the pixmaps and the cut lines
     """
+    # Emitted with the scene position of the cursor when it moves
+    cursor_moved = QtCore.Signal(QtCore.QPointF)
 
     def __init__(self, label: QtWidgets.QGraphicsPixmapItem, horizontal_view, vertical_view):
         super(GraphicsScene, self).__init__()
@@ -76,7 +78,12 @@ class GraphicsScene(QtWidgets.QGraphicsScene):
             self.update_slider(vertical_line_x, horizontal_line_y)
 
     def mouseMoveEvent(self, event: QtWidgets.QGraphicsSceneMouseEvent) -> None:
-        if self.horizontal_view is not None and self.vertical_view is not None:
+        self.cursor_moved.emit(event.scenePos())
+        # The view may track the mouse, so only drag the cut lines while
+        # a button is pressed
+        if event.buttons() != QtCore.Qt.NoButton \
+                and self.horizontal_view is not None \
+                and self.vertical_view is not None:
             self.remove_cut_lines()
             current_position = event.scenePos()
             vertical_line_x = current_position.x()
@@ -1,22 +1,21 @@
 import numpy as np
-import vtk
 from PySide6 import QtWidgets
 from PySide6.QtWidgets import QPushButton
-from vtkmodules.util import numpy_support
-from vtkmodules.util.vtkConstants import VTK_INT
-from vtkmodules.vtkCommonDataModel import vtkImageData, vtkPiecewiseFunction
-from vtkmodules.vtkRenderingCore import vtkColorTransferFunction, \
-    vtkRenderer, vtkVolumeProperty, vtkVolume
-from vtkmodules.vtkRenderingVolume import vtkFixedPointVolumeRayCastMapper
 
 from src.Model.PatientDictContainer import PatientDictContainer
-from src.View.util.QVTKRenderWindowInteractor import QVTKRenderWindowInteractor
+
+# Frames per second to aim for while the volume is being rotated
+INTERACTIVE_UPDATE_RATE = 10.0
+
+# Largest dimension of the subsampled volume rendered while rotating
+LOD_MAX_DIMENSION = 128
 
 
 class DicomView3D(QtWidgets.QWidget):
     """
     This class is responsible for displaying the 3D construction
-    of DICOM image slices
+    of DICOM image slices. VTK is only imported once the user starts the
+    3D interaction, as most sessions never use this view.
     """
 
     def __init__(self):
@@ -42,6 +41,9 @@ class DicomView3D(QtWidgets.QWidget):
         """
         Initialize vtk widget for displaying 3D volume on PySide6
         """
+        from vtkmodules.vtkRenderingCore import vtkRenderer
+        from src.View.util.QVTKRenderWindowInteractor import \
+            QVTKRenderWindowInteractor
 
         # Create the renderer, the render window, and the interactor.
         # The renderer draws into the render window,
@@ -53,54 +55,48 @@ class DicomView3D(QtWidgets.QWidget):
         self.vtk_widget.GetRenderWindow().AddRenderer(self.renderer)
         self.vtk_widget.GetRenderWindow().FullScreenOff()
 
-    def convert_pixel_values_to_vtk_3d_array(self):
+    def get_volume_array(self):
         """
-        Scale pixel_values based on W/L and
-        convert it to a vtk 3D array
+        Copy pixel_values into a single 3D array once. The array is
+        Fortran ordered so that VTK, which expects the first axis to vary
+        fastest, can use its memory directly.
+        :return: 3D numpy array of the pixel values
         """
-
-        three_dimension_np_array = np.array(self.patient_dict_container.
-                                            additional_data["pixel_values"])
-        three_dimension_np_array = three_dimension_np_array.astype(np.int16)
-        three_dimension_np_array = (three_dimension_np_array -
-                                    (self.patient_dict_container.get("level"))) / \
-            self.patient_dict_container.get("window") * 255
-        three_dimension_np_array[three_dimension_np_array < 0] = 0
-        three_dimension_np_array[three_dimension_np_array > 255] = 255
-        three_dimension_np_array = three_dimension_np_array.astype(np.int8)
-        self.depth_array = numpy_support.numpy_to_vtk(three_dimension_np_array.
-                                                      ravel(order="F"),
-                                                      deep=True,
-                                                      array_type=VTK_INT)
-        self.shape = three_dimension_np_array.shape
+        pixel_values = self.patient_dict_container.get("pixel_values")
+        shape = (len(pixel_values),) + np.shape(pixel_values[0])
+        volume_array = np.empty(shape, dtype=np.int16, order="F")
+        for i, slice_values in enumerate(pixel_values):
+            volume_array[i] = slice_values
+        return volume_array
 
     def update_volume_by_window_level(self):
         """
-        Update volume input data when window level is changed
+        Update the transfer functions when window level is changed. The
+        voxels themselves are left untouched.
         """
-
-        # Convert pixel_values in patient_dict_container into a 3D numpy array
-        self.convert_pixel_values_to_vtk_3d_array()
-
-        # Convert 3d pixel array into vtkImageData to display as vtkVolume
-        self.imdata.GetPointData().SetScalars(self.depth_array)
-        self.volume_mapper.SetInputData(self.imdata)
-        self.volume.SetMapper(self.volume_mapper)
-
-        # Add the volume to the renderer
-        self.renderer.ResetCamera()
-        self.renderer.RemoveVolume(self.volume)
-        self.renderer.AddVolume(self.volume)
+        self.update_transfer_functions()
+        self.vtk_widget.GetRenderWindow().Render()
 
     def populate_volume_data(self):
         """
         Populate volume data
         """
+        from vtkmodules.util import numpy_support
+        from vtkmodules.util.vtkConstants import VTK_SHORT
+        from vtkmodules.vtkCommonDataModel import vtkImageData
+        from vtkmodules.vtkImagingCore import vtkImageShrink3D
+        from vtkmodules.vtkRenderingCore import vtkLODProp3D
+        from vtkmodules.vtkRenderingVolume import \
+            vtkFixedPointVolumeRayCastMapper
+
+        # Wrap the volume in vtkImageData without copying it. A reference
+        # to the array is kept, as VTK does not own the memory.
+        self.volume_array = self.get_volume_array()
+        self.shape = self.volume_array.shape
+        self.depth_array = numpy_support.numpy_to_vtk(
+            self.volume_array.ravel(order="F"), deep=False,
+            array_type=VTK_SHORT)
 
-        # Convert pixel_values in patient_dict_container into a 3D numpy array
-        self.convert_pixel_values_to_vtk_3d_array()
-
-        # Convert 3d pixel array into vtkImageData to display as vtkVolume
         self.imdata = vtkImageData()
         self.imdata.SetDimensions(self.shape)
         self.imdata.GetPointData().SetScalars(self.depth_array)
@@ -110,10 +106,27 @@ class DicomView3D(QtWidgets.QWidget):
         self.volume_mapper.SetInputData(self.imdata)
 
         # The vtkLODProp3D controls the position and orientation
-        # of the volume in world coordinates.
-        self.volume = vtkVolume()
-        self.volume.SetMapper(self.volume_mapper)
-        self.volume.SetProperty(self.volume_property)
+        # of the volume in world coordinates. While the volume is being
+        # rotated it renders a subsampled copy of the volume if the full
+        # resolution one can not be rendered fast enough.
+        self.volume = vtkLODProp3D()
+        self.volume.AddLOD(self.volume_mapper, self.volume_property, 0.0)
+
+        shrink_factors = [max(1, int(np.ceil(dimension / LOD_MAX_DIMENSION)))
+                          for dimension in self.shape]
+        if max(shrink_factors) > 1:
+            self.volume_shrink = vtkImageShrink3D()
+            self.volume_shrink.SetInputData(self.imdata)
+            self.volume_shrink.SetShrinkFactors(*shrink_factors)
+            self.volume_shrink.AveragingOff()
+
+            self.lod_volume_mapper = vtkFixedPointVolumeRayCastMapper()
+            self.lod_volume_mapper.SetBlendModeToComposite()
+            self.lod_volume_mapper.SetInputConnection(
+                self.volume_shrink.GetOutputPort())
+            self.volume.AddLOD(self.lod_volume_mapper, self.volume_property,
+                               0.0)
+
         self.volume.SetScale(
             self.patient_dict_container.get("pixmap_aspect")["axial"],
             self.patient_dict_container.get("pixmap_aspect")["sagittal"],
@@ -140,20 +153,15 @@ class DicomView3D(QtWidgets.QWidget):
         """
         Initialize volume color
         """
+        from vtkmodules.vtkCommonDataModel import vtkPiecewiseFunction
+        from vtkmodules.vtkRenderingCore import vtkColorTransferFunction, \
+            vtkVolumeProperty
 
         # The colorTransferFunction maps voxel intensities to colors.
-
         self.volume_color = vtkColorTransferFunction()
-        self.volume_color.AddRGBPoint(-127, 1.0, 1.0, 1.0)
-        self.volume_color.AddRGBPoint(0, 0, 0, 0)
-        self.volume_color.AddRGBPoint(128, 1.0, 1.0, 1.0)
         # The opacityTransferFunction is used to control the opacity
         # of different tissue types.
         self.volume_scalar_opacity = vtkPiecewiseFunction()
-        self.volume_scalar_opacity.AddPoint(-127, 1)
-        self.volume_scalar_opacity.AddPoint(0, 0)
-        self.volume_scalar_opacity.AddPoint(128, 1)
-
         # The gradient opacity function is used to decrease the
         # opacity in the "flat" regions of the volume while
         # maintaining the opacity at the boundaries between tissue
@@ -161,9 +169,8 @@ class DicomView3D(QtWidgets.QWidget):
         # the intensity changes over unit distance. For most
         # medical data, the unit distance is 1mm.
         self.volume_gradient_opacity = vtkPiecewiseFunction()
-        self.volume_gradient_opacity.AddPoint(-127, 1)
-        self.volume_gradient_opacity.AddPoint(0, 0)
-        self.volume_gradient_opacity.AddPoint(128, 1)
+        self.update_transfer_functions()
+
         # The VolumeProperty attaches the color and opacity
         # functions to the volume, and sets other volume properties.
         # The interpolation should be set to linear
@@ -183,13 +190,35 @@ class DicomView3D(QtWidgets.QWidget):
         self.volume_property.SetDiffuse(0.6)
         self.volume_property.SetSpecular(0.5)
 
+    def update_transfer_functions(self):
+        """
+        Apply the current window and level to the transfer functions.
+        Voxels below the level are transparent and black, and voxels at
+        the top of the window are opaque and white.
+        """
+        level = self.patient_dict_container.get("level")
+        window = self.patient_dict_container.get("window")
+
+        self.volume_color.RemoveAllPoints()
+        self.volume_color.AddRGBPoint(level, 0, 0, 0)
+        self.volume_color.AddRGBPoint(level + window, 1.0, 1.0, 1.0)
+
+        self.volume_scalar_opacity.RemoveAllPoints()
+        self.volume_scalar_opacity.AddPoint(level, 0)
+        self.volume_scalar_opacity.AddPoint(level + window, 1)
+
+        # Gradients are in the same units as the voxels, so they are
+        # scaled with the window as well.
+        self.volume_gradient_opacity.RemoveAllPoints()
+        self.volume_gradient_opacity.AddPoint(0, 0)
+        self.volume_gradient_opacity.AddPoint(window / 2, 1)
+
     def update_view(self):
         """
         Update volume when there is change in window level
         """
         if self.is_rendered:
             self.update_volume_by_window_level()
-            self.volume.Update()
 
     def start_interaction(self):
         """
@@ -207,7 +236,9 @@ class DicomView3D(QtWidgets.QWidget):
         self.dicom_view_layout.removeWidget(self.start_interaction_button)
         self.dicom_view_layout.addWidget(self.vtk_widget)
 
-        # Start interaction
+        # Start interaction. The desired update rate makes the volume
+        # switch to its subsampled level of detail while rotating.
+        self.iren.SetDesiredUpdateRate(INTERACTIVE_UPDATE_RATE)
         self.iren.Initialize()
         self.iren.Start()
         self.vtk_widget.focusWidget()
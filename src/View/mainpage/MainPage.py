@@ -467,6 +467,10 @@ class UIMainWindow:
                     "PET is not decay corrected. OnkoDICOM can currently " \
                     "only\nperform SUV2ROI on PET images that are decay " \
                     "corrected."
+            elif self.suv2roi.failure_reason == "DOSE":
+                failure_reason = \
+                    "The injected dose of the PET images could not be " \
+                    "found.\nOnkoDICOM needs it to calculate SUVs."
             else:
                 failure_reason = "The SUV2ROI process has failed."
             button_reply = \
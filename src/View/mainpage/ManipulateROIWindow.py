@@ -6,7 +6,7 @@ from PySide6.QtWidgets import QMessageBox, QVBoxLayout, QHBoxLayout, QComboBox,
     QLineEdit, QSizePolicy, QPushButton, \
     QLabel, QWidget, QFormLayout
 
-from src.Model import ROI
+from src.Model import ROI, ROIMask
 from src.Model.PatientDictContainer import PatientDictContainer
 from src.View.util.PatientDictContainerHelper import get_dict_slice_to_uid
 from src.View.util.ProgressWindowHelper import connectSaveROIProgress
@@ -41,6 +41,10 @@ class UIManipulateROIWindow:
         self.operation_names = self.multiple_roi_operation_names + \
                                self.single_roi_operation_names
 
+        # Geometric mode manipulates polygons in each slice, raster mode
+        # manipulates masks of the whole ROI (margins are applied in 3D)
+        self.mode_names = ["Geometric", "Raster"]
+
         self.new_ROI_contours = None
         self.manipulate_roi_window_instance = manipulate_roi_window_instance
 
@@ -81,6 +85,8 @@ class UIManipulateROIWindow:
             "ManipulateRoiWindowInstanceCancelButton", "Cancel"))
         self.margin_label.setText(_translate("MarginLabel",
                                              "Margin (mm): "))
+        self.mode_label.setText(_translate("ModeLabel", "Mode"))
+        self.mode_dropdown_list.addItems(self.mode_names)
         self.new_roi_name_label.setText(_translate("NewROINameLabel",
                                                    "New ROI Name"))
         self.ROI_view_box_label.setText("ROI")
@@ -186,6 +192,20 @@ class UIManipulateROIWindow:
         self.manipulate_roi_window_input_container_box.addRow(
             self.margin_label, self.margin_line_edit)
 
+        # Create a label for denoting the mode
+        self.mode_label = QLabel()
+        self.mode_label.setObjectName("ModeLabel")
+        # Create an dropdown list for the mode
+        self.mode_dropdown_list = QComboBox()
+        self.mode_dropdown_list.setObjectName("ModeDropdownList")
+        self.mode_dropdown_list.setSizePolicy(QSizePolicy.Minimum,
+                                              QSizePolicy.Minimum)
+        self.mode_dropdown_list.resize(
+            self.mode_dropdown_list.sizeHint().width(),
+            self.mode_dropdown_list.sizeHint().height())
+        self.manipulate_roi_window_input_container_box.addRow(
+            self.mode_label, self.mode_dropdown_list)
+
         # Create a label for denoting the new ROI name
         self.new_roi_name_label = QLabel()
         self.new_roi_name_label.setObjectName("NewROINameLabel")
@@ -406,9 +426,16 @@ class UIManipulateROIWindow:
                 self.patient_dict_container.get("raw_contour"),
                 [roi_1],
                 self.patient_dict_container.get("pixluts"))
-            roi_geometry = ROI.roi_to_geometry(dict_rois_contours[roi_1])
             margin = float(self.margin_line_edit.text())
 
+            if self.mode_dropdown_list.currentText() == "Raster":
+                self.new_ROI_contours = self.manipulate_roi_masks(
+                    [dict_rois_contours[roi_1]], selected_operation, margin,
+                    [roi_1])
+                self.draw_roi()
+                return True
+
+            roi_geometry = ROI.roi_to_geometry(dict_rois_contours[roi_1])
             if selected_operation == self.single_roi_operation_names[0]:
                 new_geometry = ROI.scale_roi(roi_geometry, margin)
             elif selected_operation == self.single_roi_operation_names[1]:
@@ -428,6 +455,14 @@ class UIManipulateROIWindow:
                 self.patient_dict_container.get("raw_contour"),
                 [roi_1, roi_2],
                 self.patient_dict_container.get("pixluts"))
+
+            if self.mode_dropdown_list.currentText() == "Raster":
+                self.new_ROI_contours = self.manipulate_roi_masks(
+                    [dict_rois_contours[roi_1], dict_rois_contours[roi_2]],
+                    selected_operation, roi_names=[roi_1, roi_2])
+                self.draw_roi()
+                return True
+
             roi_1_geometry = ROI.roi_to_geometry(dict_rois_contours[roi_1])
             roi_2_geometry = ROI.roi_to_geometry(dict_rois_contours[roi_2])
 
@@ -443,6 +478,38 @@ class UIManipulateROIWindow:
         self.warning_message.setVisible(True)
         return False
 
+    def manipulate_roi_masks(self, rois_contours, selected_operation,
+                             margin=0, roi_names=None):
+        """
+        Execute the selected operation on the masks of the ROIs.
+        :param rois_contours: List of dictionaries with key-value pair
+        {slice-uid: contour sequence} of the selected ROIs.
+        :param selected_operation: Name of the selected operation.
+        :param margin: Margin in mm of single ROI operations.
+        :param roi_names: Names of the selected ROIs.
+        :return: A dictionary with key-value pair {slice-uid: contour
+        sequence} of the new ROI.
+        """
+        grid = ROIMask.create_mask_grid(self.patient_dict_container,
+                                        rois_contours, margin)
+        if roi_names is None:
+            roi_names = [None] * len(rois_contours)
+        masks = [grid.roi_to_mask(roi_contours, roi_name)
+                 for roi_contours, roi_name in zip(rois_contours, roi_names)]
+
+        if selected_operation == self.single_roi_operation_names[0]:
+            new_mask = ROIMask.scale_mask(masks[0], margin, grid.spacing)
+        elif selected_operation == self.single_roi_operation_names[1]:
+            new_mask = ROIMask.scale_mask(masks[0], -margin, grid.spacing)
+        elif selected_operation == self.single_roi_operation_names[2]:
+            new_mask = ROIMask.rind_mask(masks[0], -margin, grid.spacing)
+        elif selected_operation == self.single_roi_operation_names[3]:
+            new_mask = ROIMask.rind_mask(masks[0], margin, grid.spacing)
+        else:
+            new_mask = ROIMask.manipulate_masks(masks[0], masks[1],
+                                                selected_operation.upper())
+        return grid.mask_to_roi(new_mask)
+
     def onSaveClicked(self):
         """ Save the new ROI """
         # Get the name of the new ROI
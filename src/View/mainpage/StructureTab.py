@@ -9,10 +9,10 @@ from src.Controller.ROIOptionsController import ROIDelOption, ROIDrawOption, \
     ROIManipulateOption
 from src.Model.DICOMStructure import Series
 from src.Model import ImageLoading
-from src.Model.CalculateDVHs import dvh2rtdose
 from src.Model.GetPatientInfo import DicomTree
 from src.Model.PatientDictContainer import PatientDictContainer
 from src.Model.MovingDictContainer import MovingDictContainer
+from src.Model.SliceGeometry import get_slice_geometry
 from src.Model.ROI import ordered_list_rois, get_roi_contour_pixel, \
     calc_roi_polygon, transform_rois_contours, merge_rtss
 from src.View.mainpage.StructureWidget import StructureWidget
@@ -277,7 +277,8 @@ class StructureTab(QtWidgets.QWidget):
         self.moving_dict_container.set(
             "rois", ImageLoading.get_roi_info(new_dataset))
         self.rois = self.moving_dict_container.get("rois")
-        contour_data = ImageLoading.get_raw_contour_data(new_dataset)
+        contour_data = ImageLoading.get_raw_contour_data(
+            new_dataset, get_slice_geometry(self.moving_dict_container))
         self.moving_dict_container.set("raw_contour", contour_data[0])
         self.moving_dict_container.set("num_points", contour_data[1])
         pixluts = ImageLoading.get_pixluts(self.moving_dict_container.dataset)
@@ -372,7 +373,8 @@ class StructureTab(QtWidgets.QWidget):
         self.patient_dict_container.set(
             "rois", ImageLoading.get_roi_info(new_dataset))
         self.rois = self.patient_dict_container.get("rois")
-        contour_data = ImageLoading.get_raw_contour_data(new_dataset)
+        contour_data = ImageLoading.get_raw_contour_data(
+            new_dataset, get_slice_geometry(self.patient_dict_container))
         self.patient_dict_container.set("raw_contour", contour_data[0])
         self.patient_dict_container.set("num_points", contour_data[1])
         pixluts = ImageLoading.get_pixluts(self.patient_dict_container.dataset)
@@ -408,7 +410,6 @@ class StructureTab(QtWidgets.QWidget):
                         break
 
                 self.patient_dict_container.set("raw_dvh", new_raw_dvh)
-                dvh2rtdose(new_raw_dvh)
 
             # Remove structures from DVH list - the only visible effect of
             # this section is the exported DVH csv
@@ -421,7 +422,6 @@ class StructureTab(QtWidgets.QWidget):
                 for key in list_of_deleted:
                     new_raw_dvh.pop(key)
                 self.patient_dict_container.set("raw_dvh", new_raw_dvh)
-                dvh2rtdose(new_raw_dvh)
 
         # Refresh ROIs in DVH tab and DICOM View
         self.request_update_structures.emit()
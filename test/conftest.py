@@ -2,9 +2,11 @@ import os
 import sqlite3
 from pathlib import Path
 import pytest
+from pydicom import dataset
 from PySide6.QtWidgets import QApplication
 
 from src.Model.Configuration import Configuration
+from src.Model.PatientDictContainer import PatientDictContainer
 
 
 @pytest.fixture(scope="module", autouse=True)
@@ -22,3 +24,67 @@ def init_config(request):
 
     request.addfinalizer(tear_down)
     return connection
+
+
+def create_axial_image_stack(z_positions, origin=(0, 0), pixel_spacing=None,
+                             size=None, **attributes):
+    """
+    Create a dictionary of axial image datasets in the same format as
+    the one produced by ImageLoading.get_datasets(..).
+    :param z_positions: List of the Z coordinates of the slices, in slice
+        number order.
+    :param origin: (x, y) coordinates of the first pixel of the slices.
+    :param pixel_spacing: PixelSpacing of the slices, left out if None.
+    :param size: Rows and Columns of the slices, left out if None.
+    :param attributes: Any other attributes of every slice, e.g.
+        Modality="CT".
+    :return: Dictionary of image datasets keyed by slice number, where
+        slice i has the SOPInstanceUID "1.2.3.i".
+    """
+    dict_ds = {}
+    for i, z in enumerate(z_positions):
+        image_ds = dataset.Dataset()
+        image_ds.SOPInstanceUID = "1.2.3." + str(i)
+        image_ds.ImagePositionPatient = [origin[0], origin[1], z]
+        image_ds.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+        if pixel_spacing is not None:
+            image_ds.PixelSpacing = list(pixel_spacing)
+        if size is not None:
+            image_ds.Rows = size
+            image_ds.Columns = size
+        for keyword, value in attributes.items():
+            setattr(image_ds, keyword, value)
+        dict_ds[i] = image_ds
+    return dict_ds
+
+
+@pytest.fixture
+def axial_image_stack():
+    """
+    Factory of dictionaries of axial image datasets, taking the
+    parameters of create_axial_image_stack(..).
+    """
+    return create_axial_image_stack
+
+
+@pytest.fixture
+def axial_patient_dict_container():
+    """
+    Factory populating the PatientDictContainer with a stack of axial
+    images, taking the parameters of create_axial_image_stack(..) and the
+    pixel values of the images. The PatientDictContainer is cleared after
+    the test.
+    """
+    def create(z_positions, pixel_values=None, **kwargs):
+        dict_ds = create_axial_image_stack(z_positions, **kwargs)
+        patient_dict_container = PatientDictContainer()
+        patient_dict_container.clear()
+        if pixel_values is None:
+            patient_dict_container.set_initial_values("", dict_ds, {})
+        else:
+            patient_dict_container.set_initial_values(
+                "", dict_ds, {}, pixel_values=pixel_values)
+        return patient_dict_container
+
+    yield create
+    PatientDictContainer().clear()
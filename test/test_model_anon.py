@@ -7,7 +7,11 @@ Created on Fri Aug  21 12:33:04 2020
 import os
 import pathlib
 import tempfile
+from types import SimpleNamespace
+
 import pytest
+from pydicom import dcmread
+from pydicom.dataset import Dataset
 
 from src.Model.Anon import (
     _check_identity_mapping_file_exists,
@@ -117,3 +121,143 @@ def test_create_hash_csv():
             os.chdir(orig_cwd_path)
     finally:
         os.chdir(orig_cwd_path)
+
+
+def create_patient_files(directory, number_of_images=3):
+    """
+    :return: Tuple (datasets, file_paths) of CT images and a structure
+        set referring to them, as ImageLoading creates them.
+    """
+    from pydicom.dataset import FileMetaDataset
+    from pydicom.uid import CTImageStorage, ExplicitVRLittleEndian, \
+        RTStructureSetStorage, generate_uid
+
+    def create_dataset(sop_class_uid, modality):
+        ds = Dataset()
+        ds.file_meta = FileMetaDataset()
+        ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+        ds.file_meta.MediaStorageSOPClassUID = sop_class_uid
+        ds.SOPClassUID = sop_class_uid
+        ds.SOPInstanceUID = generate_uid()
+        ds.file_meta.MediaStorageSOPInstanceUID = ds.SOPInstanceUID
+        ds.StudyInstanceUID = study_uid
+        ds.SeriesInstanceUID = generate_uid()
+        ds.FrameOfReferenceUID = frame_of_reference_uid
+        ds.Modality = modality
+        ds.PatientName = "LAST^FIRST"
+        ds.PatientID = "ABC123"
+        return ds
+
+    study_uid = generate_uid()
+    frame_of_reference_uid = generate_uid()
+    datasets = {}
+    file_paths = {}
+    series_uid = generate_uid()
+    for i in range(number_of_images):
+        ds = create_dataset(CTImageStorage, "CT")
+        ds.SeriesInstanceUID = series_uid
+        ds.InstanceNumber = i + 1
+        ds.Rows = ds.Columns = 4
+        ds.BitsAllocated = ds.BitsStored = 16
+        ds.HighBit = 15
+        ds.PixelRepresentation = 0
+        ds.SamplesPerPixel = 1
+        ds.PhotometricInterpretation = "MONOCHROME2"
+        ds.PixelData = bytes(range(i, i + 32))
+        datasets[i] = ds
+
+    rtss = create_dataset(RTStructureSetStorage, "RTSTRUCT")
+    contour_image = Dataset()
+    contour_image.ReferencedSOPClassUID = CTImageStorage
+    contour_image.ReferencedSOPInstanceUID = datasets[1].SOPInstanceUID
+    contour = Dataset()
+    contour.ContourImageSequence = [contour_image]
+    roi_contour = Dataset()
+    roi_contour.ContourSequence = [contour]
+    rtss.ROIContourSequence = [roi_contour]
+    datasets["rtss"] = rtss
+
+    for key, ds in datasets.items():
+        file_paths[key] = os.path.join(directory, str(key) + ".dcm")
+        ds.save_as(file_paths[key], write_like_original=False)
+        datasets[key] = dcmread(file_paths[key])
+    return datasets, file_paths
+
+
+def test_anonymise_files_keeps_references_and_pixel_data():
+    pytest.importorskip("pymedphys")
+    from src.Model import Anon
+
+    Anon._import_pymedphys()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        datasets, file_paths = create_patient_files(tmpdir)
+        uids = {key: ds.SOPInstanceUID for key, ds in datasets.items()}
+
+        for max_workers in [1, 2]:
+            output_path = pathlib.Path(tmpdir).joinpath(str(max_workers))
+            os.makedirs(output_path)
+            anonymised_paths = Anon._anonymise_files(
+                datasets, file_paths, output_path, max_workers)
+            anonymised = {key: dcmread(anonymised_path) for key,
+                          anonymised_path in zip(datasets, anonymised_paths)}
+
+            # The datasets of the patient are left unchanged
+            assert datasets["rtss"].SOPInstanceUID == uids["rtss"]
+            for key, ds in anonymised.items():
+                assert ds.PatientID != "ABC123"
+                assert ds.SOPInstanceUID != uids[key]
+                assert ds.file_meta.MediaStorageSOPInstanceUID \
+                    == ds.SOPInstanceUID
+                assert ds.StudyInstanceUID == anonymised[0].StudyInstanceUID
+                assert ds.FrameOfReferenceUID \
+                    == anonymised[0].FrameOfReferenceUID
+            for key in range(3):
+                assert anonymised[key].PixelData == datasets[key].PixelData
+            referenced_image = anonymised["rtss"].ROIContourSequence[0] \
+                .ContourSequence[0].ContourImageSequence[0]
+            assert referenced_image.ReferencedSOPInstanceUID \
+                == anonymised[1].SOPInstanceUID
+
+
+def test_uid_map_replaces_references_with_the_same_pseudonym(monkeypatch):
+    from src.Model import Anon
+
+    # Pseudonymise UIDs without pymedphys, counting the calls
+    pseudonymised = []
+
+    def pseudonymise_uid(uid):
+        pseudonymised.append(uid)
+        return "2.25.%d" % len(pseudonymised)
+
+    monkeypatch.setattr(Anon, "pseudonymise", SimpleNamespace(
+        pseudonymisation_dispatch={"UI": pseudonymise_uid}))
+
+    uid_keywords = Anon._get_uid_keywords(
+        ["PatientID", "SOPInstanceUID", "StudyInstanceUID",
+         "SeriesInstanceUID", "FrameOfReferenceUID",
+         "ReferencedSOPInstanceUID"])
+    assert "PatientID" not in uid_keywords
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        datasets, _ = create_patient_files(tmpdir)
+    rtss = datasets["rtss"]
+    image_uid = datasets[1].SOPInstanceUID
+
+    uid_map = Anon._create_uid_map(datasets, uid_keywords)
+
+    # Every UID is pseudonymised once, whichever files it is in
+    assert sorted(pseudonymised) == sorted(uid_map)
+    assert len(set(uid_map.values())) == len(uid_map)
+    assert image_uid in uid_map
+
+    Anon._replace_uids_in_place(rtss, uid_map, uid_keywords)
+    referenced_image = rtss.ROIContourSequence[0].ContourSequence[0] \
+        .ContourImageSequence[0]
+    assert referenced_image.ReferencedSOPInstanceUID == uid_map[image_uid]
+    assert rtss.StudyInstanceUID \
+        == uid_map[datasets[0].StudyInstanceUID]
+    # Attributes that are not pseudonymised are left unchanged
+    assert referenced_image.ReferencedSOPClassUID \
+        == datasets[1].SOPClassUID
+    assert rtss.PatientID == "ABC123"
+    assert len(pseudonymised) == len(uid_map)
@@ -189,15 +189,18 @@ def test_batch_dvh2csv(test_object):
         process.set_filename(filename)
 
         # Start the process
+        modified_times = {path: os.path.getmtime(path) for path in
+                          test_object.batch_dir.rglob('*.dcm')}
         process.start()
 
         # Assert the resulting .csv file exists
         assert os.path.isfile(Path.joinpath(test_object.batch_dir, 'CSV',
                                             filename))
 
-        # Assert that there is DVH data in the RT Dose
-        rtdose = process.patient_dict_container.dataset['rtdose']
-        assert len(rtdose.DVHSequence) > 0
+        # Assert that the RT Dose was not modified
+        rtdose_path = process.patient_dict_container.filepaths['rtdose']
+        assert os.path.getmtime(rtdose_path) == \
+            modified_times[Path(rtdose_path)]
 
 
 def test_batch_pyrad2csv(test_object):
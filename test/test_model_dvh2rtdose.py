@@ -1,4 +1,5 @@
 import os
+import numpy as np
 import pytest
 
 from pathlib import Path
@@ -100,3 +101,31 @@ def test_dvh_to_rtdose(test_object):
     assert dvh_length >= len(test_object.patient_dict_container
                              .dataset['rtdose'].DVHSequence)
     assert last_modified < rt_dose.stat().st_mtime
+
+
+def test_dvh_to_rtdose_keeps_pixel_data(test_object):
+    """
+    Test that saving DVH data to an RT Dose file leaves its pixel data
+    unchanged, and that the DVH data can be read back.
+    :param test_object: test_object function, for accessing the shared
+                        TestDvh2RtDose object.
+    """
+    rt_dose_path = test_object.patient_dict_container.filepaths['rtdose']
+    pixel_data = dcmread(rt_dose_path).PixelData
+    dvh_data = rtdose2dvh()
+    dvh_data.pop("diff")
+
+    dvh2rtdose(dvh_data)
+
+    rt_dose = dcmread(rt_dose_path)
+    assert rt_dose.PixelData == pixel_data
+    assert len(rt_dose.DVHSequence) == len(dvh_data)
+
+    # The new file replaced the original, no temporary file is left over
+    rt_dose_dir = Path(rt_dose_path).parent
+    assert not list(rt_dose_dir.glob('*.tmp'))
+
+    test_object.patient_dict_container.dataset['rtdose'] = rt_dose
+    for roi, dvh in rtdose2dvh().items():
+        if roi != "diff":
+            assert np.allclose(dvh.counts, dvh_data[roi].counts, rtol=1e-6)
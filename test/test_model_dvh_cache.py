@@ -0,0 +1,136 @@
+import numpy as np
+from dicompylercore.dvh import DVH
+from pydicom import dataset
+
+from src.Model import DVHCache, ForkPool
+
+
+def create_rtss(contours):
+    """
+    :param contours: Dictionary of ROI number to a list of ContourData.
+    :return: RTSTRUCT dataset with the contours.
+    """
+    rtss = dataset.Dataset()
+    rtss.ROIContourSequence = []
+    for roi_number, contour_data_list in contours.items():
+        roi_contour = dataset.Dataset()
+        roi_contour.ReferencedROINumber = roi_number
+        roi_contour.ContourSequence = []
+        for contour_data in contour_data_list:
+            contour = dataset.Dataset()
+            contour.ContourData = contour_data
+            roi_contour.ContourSequence.append(contour)
+        rtss.ROIContourSequence.append(roi_contour)
+    return rtss
+
+
+def create_rtdose(pixel_data=b"\x00\x01" * 16):
+    rtdose = dataset.Dataset()
+    rtdose.Rows = 4
+    rtdose.Columns = 4
+    rtdose.DoseGridScaling = 0.001
+    rtdose.ImagePositionPatient = [0, 0, 0]
+    rtdose.PixelSpacing = [2, 2]
+    rtdose.GridFrameOffsetVector = [0]
+    rtdose.PixelData = pixel_data
+    return rtdose
+
+
+def create_dvh(name):
+    return DVH(np.array([10.0, 8.0, 2.0]), np.array([0.0, 0.01, 0.02, 0.03]),
+               name=name)
+
+
+ROIS = {1: {'name': 'PTV'}, 2: {'name': 'BODY'}}
+
+CONTOURS = {1: [[0, 0, 0, 10, 0, 0, 10, 10, 0]],
+            2: [[0, 0, 0, 20, 0, 0, 20, 20, 0]]}
+
+
+def test_dvh_keys_change_with_contours_and_dose():
+    rtss = create_rtss(CONTOURS)
+    rtdose = create_rtdose()
+    keys = DVHCache.get_dvh_keys(rtss, rtdose, ROIS, {})
+
+    moved = create_rtss({1: [[0, 0, 0, 10, 0, 0, 10, 11, 0]],
+                         2: CONTOURS[2]})
+    moved_keys = DVHCache.get_dvh_keys(moved, rtdose, ROIS, {})
+    assert moved_keys[1] != keys[1]
+    assert moved_keys[2] == keys[2]
+
+    other_dose = create_rtdose(b"\x00\x02" * 16)
+    other_dose_keys = DVHCache.get_dvh_keys(rtss, other_dose, ROIS, {})
+    assert other_dose_keys[1] != keys[1]
+    assert other_dose_keys[2] != keys[2]
+
+    thickness_keys = DVHCache.get_dvh_keys(rtss, rtdose, ROIS, {1: 3.0})
+    assert thickness_keys[1] != keys[1]
+    assert thickness_keys[2] == keys[2]
+
+
+def test_dvh_cache_round_trip(tmp_path):
+    dvh_cache = DVHCache.DVHCache(tmp_path.joinpath("DVHCache.db"))
+    dvh = create_dvh("PTV")
+    dvh_cache.put_dvhs({1: "key"}, {1: dvh})
+
+    cached = dvh_cache.get_dvhs({1: "key", 2: "missing"})
+    assert list(cached.keys()) == [1]
+    assert np.array_equal(cached[1].counts, dvh.counts)
+    assert np.array_equal(cached[1].bins, dvh.bins)
+    assert cached[1].name == "PTV"
+    assert cached[1].volume == dvh.volume
+
+
+def test_calc_dvhs_with_cache_only_calculates_misses(tmp_path, monkeypatch):
+    dvh_cache = DVHCache.DVHCache(tmp_path.joinpath("DVHCache.db"))
+    rtss = create_rtss(CONTOURS)
+    rtdose = create_rtdose()
+    calculated_rois = []
+
+    def calc_dvh(roi, *args):
+        calculated_rois.append(roi)
+        return create_dvh(ROIS[roi]['name'])
+
+    # Calculate in this process to record the calculated ROIs
+    monkeypatch.setattr(ForkPool, "fork_safe_platforms", [])
+    monkeypatch.setattr(DVHCache, "_calc_dvh", calc_dvh)
+
+    first = DVHCache.calc_dvhs_with_cache(rtss, rtdose, ROIS, {},
+                                          dvh_cache=dvh_cache)
+    assert calculated_rois == [1, 2]
+
+    # Modify the first ROI and rename the second
+    rois = {1: {'name': 'PTV'}, 2: {'name': 'EXTERNAL'}}
+    rtss = create_rtss({1: [[0, 0, 0, 5, 0, 0, 5, 5, 0]], 2: CONTOURS[2]})
+    calculated_rois.clear()
+    second = DVHCache.calc_dvhs_with_cache(rtss, rtdose, rois, {},
+                                           dvh_cache=dvh_cache)
+
+    assert calculated_rois == [1]
+    assert list(second.keys()) == list(first.keys())
+    assert second[2].name == "EXTERNAL"
+
+
+def test_update_dvhs_keeps_unmodified_dvhs(tmp_path, monkeypatch):
+    dvh_cache = DVHCache.DVHCache(tmp_path.joinpath("DVHCache.db"))
+    rtss = create_rtss(CONTOURS)
+    rtdose = create_rtdose()
+    raw_dvh = {1: create_dvh("PTV"), 2: create_dvh("BODY"),
+               3: create_dvh("DELETED")}
+    calculated_rois = []
+
+    def calc_dvh(roi, *args):
+        calculated_rois.append(roi)
+        return create_dvh(ROIS[roi]['name'])
+
+    # Calculate in this process to record the calculated ROIs
+    monkeypatch.setattr(ForkPool, "fork_safe_platforms", [])
+    monkeypatch.setattr(DVHCache, "_calc_dvh", calc_dvh)
+
+    result = DVHCache.update_dvhs(raw_dvh, {1, 3}, rtss, rtdose, ROIS, {},
+                                  dvh_cache=dvh_cache)
+
+    assert calculated_rois == [1]
+    assert list(result.keys()) == [1, 2]
+    assert result[1] is not raw_dvh[1]
+    assert result[2] is raw_dvh[2]
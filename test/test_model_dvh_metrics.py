@@ -0,0 +1,54 @@
+import numpy as np
+from dicompylercore.dvh import DVH
+
+from src.Model.DVHMetrics import calculate_dvh_metrics, dvh_metrics_table
+
+
+def create_linear_dvh(name, volume=10.0, max_dose=50.0):
+    """
+    :return: Cumulative DVH of an ROI whose volume is spread evenly over
+        doses from 0 to max_dose Gy in 1 cGy bins.
+    """
+    bins = np.arange(0, max_dose + 0.005, 0.01)
+    counts = np.linspace(volume, 0, len(bins) - 1, endpoint=False)
+    return DVH(counts, bins, name=name)
+
+
+def test_metrics_agree_with_dvh_statistics():
+    dict_dvh = {1: create_linear_dvh("PTV"),
+                2: create_linear_dvh("OAR", volume=4.0, max_dose=20.0)}
+    metrics = calculate_dvh_metrics(
+        dict_dvh, ['D95', 'D50', 'D2cc', 'Dmean', 'Dmin', 'Dmax', 'V10Gy'])
+
+    for row, dvh in enumerate(dict_dvh.values()):
+        assert np.isclose(metrics['Volume'][row], dvh.volume)
+        assert np.isclose(metrics['D95'][row], dvh.statistic('D95').value,
+                          atol=0.01)
+        assert np.isclose(metrics['D50'][row], dvh.statistic('D50').value,
+                          atol=0.01)
+        assert np.isclose(metrics['D2cc'][row],
+                          dvh.statistic('D2cc').value, atol=0.01)
+        assert np.isclose(metrics['Dmean'][row], dvh.mean)
+        assert np.isclose(metrics['Dmin'][row], dvh.min)
+        assert np.isclose(metrics['Dmax'][row], dvh.max)
+        assert np.isclose(
+            metrics['V10Gy'][row],
+            100 * dvh.statistic('V10Gy').value / dvh.volume, atol=0.1)
+
+
+def test_metrics_of_roi_smaller_than_volume():
+    dict_dvh = {1: create_linear_dvh("SMALL", volume=1.0)}
+    metrics = calculate_dvh_metrics(dict_dvh, ['D2cc'])
+
+    assert metrics['D2cc'][0] == 0
+
+
+def test_dvh_metrics_table():
+    dict_dvh = {1: create_linear_dvh("PTV"),
+                2: create_linear_dvh("OAR", volume=4.0, max_dose=20.0)}
+    header, rows = dvh_metrics_table(dict_dvh, "123", ['D95', 'V10Gy'])
+
+    assert header == ['Patient ID', 'ROI', 'Volume (mL)', 'D95 (Gy)',
+                      'V10Gy (%)']
+    assert rows == [["123", "PTV", 10.0, 2.5, 80.0],
+                    ["123", "OAR", 4.0, 1.0, 50.0]]
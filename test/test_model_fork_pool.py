@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+
+from src.Model import ForkPool
+from src.Model.ForkPool import imap_forked, map_forked
+
+
+def get_row_sum(index, volume, offset):
+    """
+    :return: Tuple (sum of a row of the volume plus the offset, process
+        ID).
+    """
+    return int(volume[index].sum()) + offset, os.getpid()
+
+
+def test_map_forked_keeps_order_of_items():
+    volume = np.arange(40).reshape(10, 4)
+    expected = [int(row.sum()) + 1 for row in volume]
+
+    for max_workers in [1, 3]:
+        results = map_forked(get_row_sum, range(10), shared=(volume, 1),
+                             max_workers=max_workers)
+        assert [result for result, _ in results] == expected
+
+    # The shared data is released once the pool is finished
+    assert ForkPool._worker_calls == {}
+
+
+def test_map_forked_calls_in_this_process_when_not_fork_safe(monkeypatch):
+    monkeypatch.setattr(ForkPool, "fork_safe_platforms", [])
+    volume = np.ones((5, 2))
+
+    results = map_forked(get_row_sum, range(5), shared=(volume, 0),
+                         max_workers=4)
+
+    assert results == [(2, os.getpid())] * 5
+
+
+def test_imap_forked_releases_shared_data_when_closed():
+    volume = np.ones((8, 2))
+
+    results = imap_forked(get_row_sum, range(8), shared=(volume, 0),
+                          max_workers=2)
+    assert next(results)[0] == 2
+    results.close()
+
+    assert ForkPool._worker_calls == {}
@@ -0,0 +1,46 @@
+import numpy as np
+
+from src.Model import ImageFusion
+
+
+def test_colormix_is_grey_where_images_agree():
+    fixed = np.array([[-300, 0], [250, 1000]], dtype=np.float32)
+    rgb = ImageFusion.generate_colormix(fixed, fixed, (-250, 500))
+
+    assert rgb.dtype == np.uint8
+    assert np.array_equal(rgb[..., 0], [[0, 127], [255, 255]])
+    assert np.array_equal(rgb[..., 0], rgb[..., 1])
+    assert np.array_equal(rgb[..., 0], rgb[..., 2])
+
+    rgb = ImageFusion.generate_colormix(fixed, fixed + 250, (-250, 500))
+    assert rgb[0, 1, 1] > rgb[0, 1, 0]
+
+
+def test_fused_pixmaps_render_lazily(monkeypatch):
+    rendered = []
+
+    def get_fused_pixmap(fixed_slice, moving_slice, windowing):
+        rendered.append(fixed_slice.shape)
+        return fixed_slice.sum() + moving_slice.sum()
+
+    monkeypatch.setattr(ImageFusion, "get_fused_pixmap", get_fused_pixmap)
+    fixed = np.arange(24, dtype=np.float32).reshape(2, 3, 4)
+    moving = np.ones_like(fixed)
+
+    sagittal = ImageFusion.FusedPixmaps(fixed, moving, "sagittal",
+                                        (0, 100), cache_size=2)
+    assert len(sagittal) == 4
+    assert not rendered
+
+    assert sagittal[1] == fixed[:, :, 1].sum() + 6
+    assert sagittal[1] == fixed[:, :, 1].sum() + 6
+    assert rendered == [(2, 3)]
+
+    # The least recently displayed pixmap is dropped
+    sagittal[2]
+    sagittal[1]
+    sagittal[3]
+    sagittal[1]
+    assert len(rendered) == 3
+    sagittal[2]
+    assert len(rendered) == 4
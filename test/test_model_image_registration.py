@@ -0,0 +1,92 @@
+import threading
+
+import numpy as np
+import pytest
+
+from src.Model.ImageRegistration import RegistrationMonitor, \
+    linear_registration
+
+
+class FakeRegistration:
+    """
+    Stands in for a sitk.ImageRegistrationMethod, with a metric value
+    that decreases with every iteration.
+    """
+
+    def __init__(self):
+        self.metric = 10.0
+        self.stopped = False
+
+    def GetMetricValue(self):
+        self.metric -= 1
+        return self.metric
+
+    def StopRegistration(self):
+        self.stopped = True
+
+
+class ProgressSignal:
+    def __init__(self):
+        self.progress = []
+
+    def emit(self, progress):
+        self.progress.append(progress)
+
+
+def test_monitor_records_levels_and_progress():
+    registration = FakeRegistration()
+    progress_callback = ProgressSignal()
+    monitor = RegistrationMonitor(registration, 2, 4, progress_callback,
+                                  progress_range=(50, 100))
+    for _ in range(2):
+        monitor.start_level()
+        for _ in range(4):
+            monitor.iterate()
+    monitor.end_level()
+
+    assert [level["level"] for level in monitor.levels] == [1, 2]
+    assert [level["iterations"] for level in monitor.levels] == [4, 4]
+    assert [level["metric"] for level in monitor.levels] == [6, 2]
+    assert all(level["time"] >= 0 for level in monitor.levels)
+    percentages = [progress[1] for progress in progress_callback.progress]
+    assert percentages == sorted(percentages)
+    assert percentages[0] > 50 and percentages[-1] == 100
+    assert not registration.stopped
+
+
+def test_monitor_stops_when_interrupted():
+    registration = FakeRegistration()
+    interrupt_flag = threading.Event()
+    monitor = RegistrationMonitor(registration, 1, 10,
+                                  interrupt_flag=interrupt_flag)
+    monitor.start_level()
+    monitor.iterate()
+    assert not registration.stopped
+    interrupt_flag.set()
+    monitor.iterate()
+    assert registration.stopped
+
+
+def test_linear_registration_recovers_translation():
+    sitk = pytest.importorskip("SimpleITK")
+    z, y, x = np.mgrid[0:32, 0:48, 0:48]
+    volume = 1000 * np.exp(-((z - 16) ** 2 + (y - 20) ** 2
+                             + (x - 26) ** 2) / 60.0)
+    fixed_image = sitk.GetImageFromArray(volume.astype(np.float32))
+    moving_image = sitk.GetImageFromArray(volume.astype(np.float32))
+    moving_image.SetOrigin((3, -2, 1))
+
+    registration = linear_registration(
+        fixed_image, moving_image, reg_method="translation",
+        shrink_factors=[2, 1], smooth_sigmas=[1, 0], sampling_rate=1,
+        number_of_iterations=100)
+    _, transform, levels = registration
+
+    assert len(levels) == 2
+    assert np.allclose(transform.TransformPoint((26, 20, 16)),
+                       (29, 18, 17), atol=0.5)
+
+    interrupt_flag = threading.Event()
+    interrupt_flag.set()
+    assert linear_registration(fixed_image, moving_image,
+                               interrupt_flag=interrupt_flag) is None
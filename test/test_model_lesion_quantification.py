@@ -0,0 +1,58 @@
+import numpy as np
+
+from src.Model import LesionQuantification
+
+
+def test_sphere_kernel_volume():
+    for spacing in [(1, 1, 1), (3, 2, 2), (2, 0.5, 0.5)]:
+        kernel = LesionQuantification.sphere_kernel(spacing)
+        volume = kernel.sum() * np.prod(spacing) / 1000
+        assert abs(volume - 1) < 0.15
+        assert kernel[tuple(np.array(kernel.shape) // 2)]
+
+
+def test_quantify_mask_splits_lesions():
+    suv = np.zeros((6, 20, 20), dtype=np.float32)
+    mask = np.zeros(suv.shape, dtype=bool)
+    mask[1:3, 2:6, 2:6] = True
+    suv[1:3, 2:6, 2:6] = 4
+    suv[1, 3, 3] = 8
+    mask[3:6, 10:15, 10:15] = True
+    suv[3:6, 10:15, 10:15] = 2
+    spacing = (2, 2, 2)
+
+    metrics = LesionQuantification.quantify_mask(mask, suv, suv, spacing)
+    assert np.allclose(metrics['SUVmax'], [8, 2])
+    assert np.allclose(metrics['SUVmean'], [(31 * 4 + 8) / 32, 2])
+    assert np.allclose(metrics['MTV'], [32 * 0.008, 75 * 0.008])
+    assert np.allclose(metrics['TLG'],
+                       metrics['SUVmean'] * metrics['MTV'])
+
+    whole = LesionQuantification.quantify_mask(mask, suv, suv, spacing,
+                                               split_lesions=False)
+    assert np.allclose(whole['MTV'], [107 * 0.008])
+    assert np.allclose(whole['SUVmax'], [8])
+
+
+def test_quantify_roi_of_uniform_volume(axial_patient_dict_container):
+    # Ten slices 2mm apart, of 40x40 pixels of 2mm
+    patient_dict_container = axial_patient_dict_container(
+        range(20, 0, -2), pixel_spacing=(2, 2), size=40)
+    suv_volume = np.full((10, 40, 40), 3, dtype=np.float32)
+    suv_peak_volume = LesionQuantification.get_suv_peak_volume(
+        patient_dict_container, suv_volume)
+    assert LesionQuantification.get_suv_peak_volume(
+        patient_dict_container, suv_volume) is suv_peak_volume
+
+    square = [[10, 10], [20, 10], [20, 20], [10, 20], [10, 10]]
+    roi = {"1.2.3." + str(i): [square] for i in range(3, 7)}
+    metrics = LesionQuantification.quantify_roi(
+        patient_dict_container, roi, suv_volume, suv_peak_volume)
+
+    assert len(metrics['MTV']) == 1
+    assert np.allclose(metrics['SUVmax'], 3)
+    assert np.allclose(metrics['SUVmean'], 3)
+    # The sphere fits inside the volume, so its mean is the uniform SUV
+    assert np.allclose(metrics['SUVpeak'], 3, atol=1e-4)
+    voxels = metrics['MTV'][0] * 1000 / 8
+    assert 4 * 10 * 10 <= voxels <= 4 * 11 * 11
@@ -0,0 +1,63 @@
+import numpy as np
+from skimage import measure
+
+from src.Model import LevelContours
+
+
+def create_hot_spots(size=64):
+    """
+    :return: Image with two hot spots, of maximum 10 and 4.
+    """
+    rows, columns = np.mgrid[0:size, 0:size]
+    return 10 * np.exp(-((rows - 20) ** 2 + (columns - 25) ** 2) / 50) \
+        + 4 * np.exp(-((rows - 45) ** 2 + (columns - 40) ** 2) / 80)
+
+
+def assert_same_contours(contours, expected):
+    assert len(contours) == len(expected)
+    for contour, expected_contour in zip(contours, expected):
+        assert np.allclose(contour, expected_contour)
+
+
+def test_level_contours_match_find_contours():
+    image = create_hot_spots()
+    levels = [1, 2, 3, 5, 8, 12]
+    contours = LevelContours.find_level_contours(image, levels)
+
+    for level, level_contours in zip(levels, contours):
+        assert_same_contours(level_contours,
+                             measure.find_contours(image, level))
+    assert contours[-1] == []
+
+
+def test_stack_level_contours_skip_cold_slices():
+    image = create_hot_spots()
+    slices = [image, np.zeros_like(image), [], image / 2]
+    levels = [1, 3, 6]
+
+    for max_workers in [1, 2]:
+        contours = LevelContours.find_stack_level_contours(
+            slices, levels, max_workers=max_workers)
+
+        assert len(contours) == len(slices)
+        assert contours[1] == [[], [], []]
+        assert contours[2] == [[], [], []]
+        for level_contours, level in zip(contours[3], levels):
+            assert_same_contours(level_contours,
+                                 measure.find_contours(image / 2, level))
+
+
+def test_remove_small_islands():
+    # A large hot spot through all slices, and a single hot pixel
+    volume = np.stack([create_hot_spots()] * 4)
+    volume[2, 55, 10] = 5
+    levels = [1, 3]
+    contours = LevelContours.find_stack_level_contours(volume, levels,
+                                                       max_workers=1)
+    assert len(contours[2][1]) == 3
+
+    LevelContours.remove_small_islands(volume, levels, contours, 1, 10)
+    assert_same_contours(contours[2][1],
+                         measure.find_contours(volume[1], 3))
+    assert_same_contours(contours[2][0],
+                         measure.find_contours(volume[1], 1))
@@ -0,0 +1,79 @@
+import numpy as np
+from pydicom import dcmread
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, RLELossless, generate_uid
+
+from src.Model.PixelDecoding import decode_pixel_data
+
+
+class ProgressCallback:
+    """
+    Stand-in for WorkerSignals.progress that records what is emitted.
+    """
+
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, progress):
+        self.emitted.append(progress)
+
+
+def create_rle_series(directory, number_of_slices=8, size=32):
+    """
+    Write a synthetic RLE Lossless CT series to the given directory.
+    :return: Tuple (dict_ds, filepaths, pixel_arrays)
+    """
+    dict_ds = {}
+    filepaths = {}
+    pixel_arrays = []
+    rng = np.random.default_rng(0)
+    for i in range(number_of_slices):
+        arr = rng.integers(0, 4096, (size, size), dtype=np.uint16)
+        pixel_arrays.append(arr)
+
+        ds = Dataset()
+        ds.file_meta = FileMetaDataset()
+        ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+        ds.SOPClassUID = "1.2.840.10008.5.1.4.1.1.2"
+        ds.SOPInstanceUID = generate_uid()
+        ds.Modality = "CT"
+        ds.Rows = size
+        ds.Columns = size
+        ds.SamplesPerPixel = 1
+        ds.PhotometricInterpretation = "MONOCHROME2"
+        ds.BitsAllocated = 16
+        ds.BitsStored = 16
+        ds.HighBit = 15
+        ds.PixelRepresentation = 0
+        ds.compress(RLELossless, arr)
+
+        filepath = str(directory.joinpath("ct.%d.dcm" % i))
+        ds.save_as(filepath, write_like_original=False)
+        dict_ds[i] = dcmread(filepath)
+        filepaths[i] = filepath
+
+    return dict_ds, filepaths, pixel_arrays
+
+
+def test_decode_pixel_data_in_threads(tmp_path):
+    dict_ds, _, pixel_arrays = create_rle_series(tmp_path)
+    progress_callback = ProgressCallback()
+
+    volume = decode_pixel_data(dict_ds, progress_callback=progress_callback,
+                               max_workers=4)
+
+    assert volume.shape == (8, 32, 32)
+    for i, arr in enumerate(pixel_arrays):
+        assert np.array_equal(volume[i], arr)
+        assert np.shares_memory(dict_ds[i].pixel_array, volume)
+    assert len(progress_callback.emitted) == 8
+
+
+def test_decode_pixel_data_in_processes(tmp_path):
+    dict_ds, filepaths, pixel_arrays = create_rle_series(tmp_path)
+
+    volume = decode_pixel_data(dict_ds, filepaths, max_workers=4)
+
+    for i, arr in enumerate(pixel_arrays):
+        assert np.array_equal(volume[i], arr)
+        assert np.array_equal(dict_ds[i].pixel_array, arr)
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from src.Model.PTCTBlending import PTCTBlender, blend_slices, resize_slice
+
+
+class DictContainer:
+    """
+    Stands in for a PTCTDictContainer.
+    """
+
+    def __init__(self, **attributes):
+        self.attributes = attributes
+
+    def get(self, name):
+        return self.attributes.get(name)
+
+
+def test_blend_slices_matches_painting_with_opacity():
+    rng = np.random.default_rng(0)
+    ct_slice = rng.integers(0, 256, (20, 30), dtype=np.uint8)
+    pt_slice = rng.integers(0, 256, (20, 30, 3), dtype=np.uint8)
+    out = np.empty((20, 30, 3), dtype=np.uint8)
+
+    for alpha in [0, 0.25, 0.5, 0.73, 1]:
+        blended = blend_slices(ct_slice, pt_slice, alpha, out)
+        assert blended is out
+        expected = ct_slice[:, :, np.newaxis] * (1 - alpha) + pt_slice * alpha
+        assert np.abs(blended - expected).max() <= 1
+    assert np.array_equal(blend_slices(ct_slice, pt_slice, 0),
+                          np.repeat(ct_slice[:, :, np.newaxis], 3, axis=2))
+    assert np.array_equal(blend_slices(ct_slice, pt_slice, 1), pt_slice)
+
+
+def test_resize_slice_interpolates_linearly():
+    pixels = np.array([[0, 80, 160, 240]], dtype=np.uint8)
+    resized = resize_slice(pixels, 2, 8)
+    assert resized.shape == (2, 8)
+    assert list(resized[0]) == [0, 20, 60, 100, 140, 180, 220, 240]
+    assert np.array_equal(resized[0], resized[1])
+    assert resize_slice(pixels, 1, 4) is pixels
+
+
+def test_blender_reuses_slices_and_buffer():
+    pytest.importorskip("cv2")
+    ct_pixel_values = np.arange(4 * 6 * 8, dtype=np.int16).reshape(4, 6, 8)
+    pt_pixel_values = np.ones((2, 3, 4), dtype=np.float32)
+    container = DictContainer(
+        ct_pixel_values=ct_pixel_values, pt_pixel_values=pt_pixel_values,
+        ct_window=200, ct_level=1, pt_window=2, pt_level=1)
+    blender = PTCTBlender(container)
+    assert blender.get_slice_count("coronal") == 6
+
+    qimage = blender.blend("axial", 3, 0.5)
+    assert (qimage.width(), qimage.height()) == (8, 6)
+    ct_slice = blender.ct_slice
+    buffer = blender.buffer
+
+    # Changing the opacity only blends the slices again
+    assert blender.blend("axial", 3, 0.2) is qimage
+    assert blender.ct_slice is ct_slice and blender.buffer is buffer
+
+    # Changing the window recomputes the slices
+    container.attributes["ct_window"] = 100
+    blender.blend("axial", 3, 0.2)
+    assert blender.ct_slice is not ct_slice
+    assert blender.buffer is buffer
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from src.Model.PTCTModel import is_same_frame_of_reference, \
+    resample_pt_to_ct
+from src.Model.SliceGeometry import SliceGeometry
+
+
+@pytest.fixture
+def create_image_set(axial_image_stack):
+    """
+    Factory of tuples (dict_ds, slice_geometry) of axial slices with the
+    given origin, (slice, row, column) spacing and shape.
+    """
+    def create(origin, spacing, shape, frame_of_reference="1.2.3"):
+        dict_ds = axial_image_stack(
+            [origin[2] + i * spacing[0] for i in range(shape[0])],
+            origin=origin[:2], pixel_spacing=spacing[1:],
+            FrameOfReferenceUID=frame_of_reference)
+        return dict_ds, SliceGeometry(dict_ds)
+
+    return create
+
+
+def linear_values(origin, spacing, shape):
+    """
+    :return: Volume whose pixel values are x + 2y + 3z of their positions.
+    """
+    z, y, x = np.meshgrid(*[origin[2 - axis] + np.arange(shape[axis])
+                            * spacing[axis] for axis in range(3)],
+                          indexing="ij")
+    return (x + 2 * y + 3 * z).astype(np.float32)
+
+
+def test_resample_pt_to_ct_aligns_patient_positions(create_image_set):
+    pytest.importorskip("scipy")
+    pt_origin, pt_spacing, pt_shape = (-10, -10, -8), (4, 2, 2), (6, 12, 12)
+    ct_origin, ct_spacing, ct_shape = (-5, -4, -4), (1, 1, 1), (12, 8, 10)
+    pt_dataset, pt_geometry = create_image_set(pt_origin, pt_spacing,
+                                               pt_shape)
+    ct_dataset, ct_geometry = create_image_set(ct_origin, ct_spacing,
+                                               ct_shape)
+
+    resampled = resample_pt_to_ct(
+        linear_values(pt_origin, pt_spacing, pt_shape), pt_dataset,
+        pt_geometry, ct_shape, ct_dataset, ct_geometry)
+
+    assert resampled.shape == ct_shape
+    assert np.allclose(resampled,
+                       linear_values(ct_origin, ct_spacing, ct_shape),
+                       atol=1e-3)
+
+
+def test_resample_pt_to_ct_leaves_outside_empty(create_image_set):
+    pytest.importorskip("scipy")
+    pt_dataset, pt_geometry = create_image_set((0, 0, 0), (2, 1, 1),
+                                               (3, 4, 4))
+    ct_dataset, ct_geometry = create_image_set((0, 0, -4), (1, 1, 1),
+                                               (12, 4, 4))
+
+    resampled = resample_pt_to_ct(
+        np.ones((3, 4, 4)), pt_dataset, pt_geometry, (12, 4, 4),
+        ct_dataset, ct_geometry)
+
+    # The PET stack covers z from -1 to 5
+    assert np.all(resampled[:3] == 0) and np.all(resampled[10:] == 0)
+    assert np.allclose(resampled[3:10], 1)
+
+
+def test_is_same_frame_of_reference(create_image_set):
+    pt_dataset, _ = create_image_set((0, 0, 0), (1, 1, 1), (1, 1, 1))
+    ct_dataset, _ = create_image_set((0, 0, 0), (1, 1, 1), (1, 1, 1))
+    assert is_same_frame_of_reference(pt_dataset, ct_dataset)
+
+    other_dataset, _ = create_image_set((0, 0, 0), (1, 1, 1), (1, 1, 1),
+                                        "1.2.4")
+    assert not is_same_frame_of_reference(pt_dataset, other_dataset)
@@ -0,0 +1,72 @@
+import os
+
+import numpy as np
+import pytest
+from pydicom import dataset
+
+from src.Model import Radiomics
+from src.Model.ROIMaskCache import get_roi_mask_cache
+from src.Model.SimpleITKImage import get_sitk_image
+
+
+def create_rtss(contours):
+    """
+    :param contours: Dictionary of ROI name to a list of ContourData.
+    :return: RTSTRUCT dataset with the contours.
+    """
+    rtss = dataset.Dataset()
+    rtss.StructureSetROISequence = []
+    rtss.ROIContourSequence = []
+    for roi_number, (roi_name, contour_data_list) in enumerate(
+            contours.items(), 1):
+        structure_set_roi = dataset.Dataset()
+        structure_set_roi.ROINumber = roi_number
+        structure_set_roi.ROIName = roi_name
+        rtss.StructureSetROISequence.append(structure_set_roi)
+
+        roi_contour = dataset.Dataset()
+        roi_contour.ReferencedROINumber = roi_number
+        roi_contour.ContourSequence = []
+        for contour_data in contour_data_list:
+            contour = dataset.Dataset()
+            contour.ContourData = contour_data
+            contour.NumberOfContourPoints = len(contour_data) // 3
+            roi_contour.ContourSequence.append(contour)
+        rtss.ROIContourSequence.append(roi_contour)
+    return rtss
+
+
+def test_convert_rois_to_nrrd_writes_cached_masks(
+        axial_patient_dict_container, tmp_path):
+    sitk = pytest.importorskip("SimpleITK")
+    patient_dict_container = axial_patient_dict_container(
+        [8, 6, 4, 2], pixel_spacing=(1, 1), size=16)
+    # Pixel centres of the images, which are at the origin with a pixel
+    # spacing of 1mm
+    patient_dict_container.set("pixluts", {
+        patient_dict_container.dataset[i].SOPInstanceUID:
+            (np.arange(16.0), np.arange(16.0)) for i in range(4)})
+    square = [2, 2, 4, 10, 2, 4, 10, 10, 4, 2, 10, 4]
+    rtss = create_rtss({"GTV 1": [square], "Empty": []})
+
+    mask_folder_path = str(tmp_path.joinpath("structures"))
+    assert Radiomics.convert_rois_to_nrrd(patient_dict_container, rtss,
+                                          mask_folder_path)
+
+    # ROIs without contours are left out
+    assert os.listdir(mask_folder_path) == ["GTV_1.nrrd"]
+    mask_image = sitk.ReadImage(
+        os.path.join(mask_folder_path, "GTV_1.nrrd"))
+    image = get_sitk_image(patient_dict_container, np.zeros((4, 16, 16)),
+                           ascending=True)
+    assert mask_image.GetOrigin() == pytest.approx(image.GetOrigin())
+    assert mask_image.GetSpacing() == pytest.approx(image.GetSpacing())
+    assert mask_image.GetDirection() == pytest.approx(image.GetDirection())
+
+    # The slices are in ascending order, so z = 4 is the second slice
+    mask = sitk.GetArrayFromImage(mask_image)
+    assert mask[1].sum() > 0
+    assert mask[[0, 2, 3]].sum() == 0
+
+    # The mask was rasterised through the mask cache of the images
+    assert "GTV 1" in get_roi_mask_cache(patient_dict_container).roi_hashes
@@ -0,0 +1,160 @@
+import os
+
+import pytest
+from pydicom import dataset
+
+from src.Model.MovingDictContainer import MovingDictContainer
+from src.Model.PatientDictContainer import PatientDictContainer
+from src.Model.RegistrationCache import RegistrationCache, \
+    get_registration_key
+
+
+def populate_dict_container(dict_container, directory, series_uid):
+    """
+    Populate a dict container with two images of a series, written to
+    files in the directory.
+    """
+    dict_ds = {}
+    filepaths = {}
+    for i in range(2):
+        image_ds = dataset.Dataset()
+        image_ds.SeriesInstanceUID = series_uid
+        dict_ds[i] = image_ds
+        filepaths[i] = os.path.join(directory, series_uid + "." + str(i))
+        with open(filepaths[i], "w") as image_file:
+            image_file.write(series_uid)
+
+    dict_container.clear()
+    dict_container.set_initial_values(str(directory), dict_ds, filepaths)
+    return dict_container
+
+
+def test_registration_key(tmpdir):
+    fixed = populate_dict_container(PatientDictContainer(), tmpdir, "1.2.1")
+    moving = populate_dict_container(MovingDictContainer(), tmpdir, "1.2.2")
+    settings = {"reg_method": "rigid", "shrink_factors": [8]}
+
+    key = get_registration_key(fixed, moving, settings)
+    assert key == get_registration_key(fixed, moving, dict(settings))
+    assert key != get_registration_key(moving, fixed, settings)
+    assert key != get_registration_key(fixed, moving, None)
+    assert key != get_registration_key(
+        fixed, moving, {"reg_method": "affine", "shrink_factors": [8]})
+
+    # Replacing a file of an image set misses the cache
+    modified = os.path.getmtime(moving.filepaths[1]) + 10
+    os.utime(moving.filepaths[1], (modified, modified))
+    assert key != get_registration_key(fixed, moving, settings)
+
+
+def test_cache_stores_transform_and_dcm_flag(tmpdir):
+    registration_cache = RegistrationCache(
+        os.path.join(tmpdir, "RegistrationCache.db"))
+    dcm_path = os.path.join(tmpdir, "transform.dcm")
+    assert registration_cache.get_transform_text("a") is None
+    assert not registration_cache.is_dcm_written("a", dcm_path)
+
+    registration_cache.put_transform_text("a", "transform a")
+    assert registration_cache.get_transform_text("a") == "transform a"
+    assert not registration_cache.is_dcm_written("a", dcm_path)
+    registration_cache.set_dcm_written("a", dcm_path)
+    assert registration_cache.is_dcm_written("a", dcm_path)
+
+    # Writing the file for another registration replaces the first one
+    registration_cache.put_transform_text("b", "transform b")
+    registration_cache.set_dcm_written("b", dcm_path)
+    assert registration_cache.is_dcm_written("b", dcm_path)
+    assert not registration_cache.is_dcm_written("a", dcm_path)
+    registration_cache.set_dcm_written("a", dcm_path)
+
+    # Storing the registration again means its file has to be rewritten
+    registration_cache.put_transform_text("a", "transform c")
+    assert registration_cache.get_transform_text("a") == "transform c"
+    assert not registration_cache.is_dcm_written("a", dcm_path)
+
+    registration_cache.clear()
+    assert registration_cache.get_transform_text("a") is None
+    assert not registration_cache.is_dcm_written("b", dcm_path)
+
+
+def test_transform_dcm_holds_the_last_fused_registration(tmpdir,
+                                                         monkeypatch):
+    sitk = pytest.importorskip("SimpleITK")
+    from src.Model import ImageFusion
+
+    registration_cache = RegistrationCache(
+        os.path.join(tmpdir, "RegistrationCache.db"))
+    monkeypatch.setattr(ImageFusion, "RegistrationCache",
+                        lambda: registration_cache)
+
+    # Register every moving series with its own translation
+    translations = {"1.2.2": (1.0, 0.0, 0.0), "1.2.3": (0.0, 2.0, 0.0)}
+
+    def register_images(image_1, image_2, *args):
+        series_uid = MovingDictContainer().dataset[0].SeriesInstanceUID
+        euler = sitk.Euler3DTransform((0, 0, 0), 0, 0, 0,
+                                      translations[series_uid])
+        transform = sitk.CompositeTransform(
+            [euler, sitk.VersorRigid3DTransform()])
+        return None, transform, []
+
+    # Write the translation of the registration to the transform file
+    written = []
+
+    def write_transform_to_dcm(affine_matrix):
+        written.append(tuple(affine_matrix[:3, 3].tolist()))
+        with open(transform_path, "w") as transform_file:
+            transform_file.write(repr(written[-1]))
+
+    monkeypatch.setattr(ImageFusion, "register_images", register_images)
+    monkeypatch.setattr(ImageFusion, "apply_registration",
+                        lambda *args: None)
+    monkeypatch.setattr(ImageFusion, "write_transform_to_dcm",
+                        write_transform_to_dcm)
+
+    fixed_path = tmpdir.mkdir("fixed")
+    transform_path = os.path.join(fixed_path, "transform.dcm")
+    populate_dict_container(PatientDictContainer(), fixed_path, "1.2.1")
+    moving_image_sets = {}
+    for series_uid in translations:
+        moving = populate_dict_container(
+            MovingDictContainer(), tmpdir.mkdir(series_uid), series_uid)
+        moving_image_sets[series_uid] = (moving.path, moving.dataset,
+                                         moving.filepaths)
+    try:
+        # Fuse the first series again after the second overwrote the file
+        for series_uid in ["1.2.2", "1.2.3", "1.2.2", "1.2.2"]:
+            MovingDictContainer().clear()
+            MovingDictContainer().set_initial_values(
+                *moving_image_sets[series_uid])
+            assert ImageFusion.create_fused_model(None, None)
+            with open(transform_path) as transform_file:
+                assert transform_file.read() \
+                    == repr(translations[series_uid])
+    finally:
+        PatientDictContainer().clear()
+        MovingDictContainer().clear()
+
+    # The file is not rewritten when it already holds the registration
+    assert len(written) == 3
+
+
+def test_transform_round_trip(tmpdir):
+    sitk = pytest.importorskip("SimpleITK")
+    euler = sitk.Euler3DTransform((1, 2, 3), 0.1, 0.2, 0.3, (4, 5, 6))
+    versor = sitk.VersorRigid3DTransform()
+    versor.SetTranslation((-1, 0.5, 2))
+    transform = sitk.CompositeTransform([euler, versor])
+
+    registration_cache = RegistrationCache(
+        os.path.join(tmpdir, "RegistrationCache.db"))
+    registration_cache.put_transform("a", transform)
+    cached = registration_cache.get_transform("a")
+
+    assert cached.GetNumberOfTransforms() == 2
+    for i in range(2):
+        assert cached.GetNthTransform(i).GetParameters() == \
+            transform.GetNthTransform(i).GetParameters()
+    point = (10, -20, 30)
+    assert cached.TransformPoint(point) == \
+        pytest.approx(transform.TransformPoint(point))
@@ -14,7 +14,8 @@ from pydicom.tag import Tag
 from src.Model import ImageLoading
 from src.Model.PatientDictContainer import PatientDictContainer
 from src.Model.ROI import add_to_roi, calculate_matrix, create_roi, roi_to_geometry, \
-    get_roi_contour_pixel, manipulate_rois, geometry_to_roi, create_initial_rtss_from_ct
+    get_roi_contour_pixel, manipulate_rois, geometry_to_roi, create_initial_rtss_from_ct, \
+    delete_roi, rename_roi
 
 
 def find_DICOM_files(file_path):
@@ -184,6 +185,38 @@ def test_create_roi():
     assert (rt_ss.RTROIObservationsSequence[0].RTROIInterpretedType == "ORGAN")
 
 
+def test_modified_rois_are_tracked():
+    rt_ss = dataset.Dataset()
+    rt_ss.StructureSetROISequence = []
+    rt_ss.ROIContourSequence = []
+    rt_ss.RTROIObservationsSequence = []
+
+    image_ds = dataset.Dataset()
+    image_ds.SOPClassUID = "1.2.840.10008.5.1.4.1.1.2"
+    image_ds.SOPInstanceUID = "1.2.3.4.5.6.7.8.9"
+    image_ds.FrameOfReferenceUID = "1.2.3"
+    roi_coordinates = [0, 0, 0, 0, 1, 0, 1, 0, 0, 0, 0, 0]
+
+    patient_dict_container = PatientDictContainer()
+    patient_dict_container.set_initial_values(None, None, None,
+                                              blah="blah", rois={})
+
+    # Nothing is tracked until the DVHs have been calculated
+    create_roi(rt_ss, "ROI1", [{'coords': roi_coordinates, 'ds': image_ds}])
+    assert patient_dict_container.get("dvh_modified_rois") is None
+
+    patient_dict_container.set("dvh_modified_rois", set())
+    create_roi(rt_ss, "ROI2", [{'coords': roi_coordinates, 'ds': image_ds}])
+    assert patient_dict_container.get("dvh_modified_rois") == {2}
+
+    rename_roi(rt_ss, 1, "ROI3")
+    assert patient_dict_container.get("dvh_modified_rois") == {1, 2}
+
+    patient_dict_container.set("dvh_modified_rois", set())
+    delete_roi(rt_ss, "ROI2")
+    assert patient_dict_container.get("dvh_modified_rois") == {2}
+
+
 def test_roi_to_geometry(test_object):
     roi_names = [roi['name']
                  for roi in test_object.
@@ -278,3 +311,51 @@ def test_create_initial_rtss_from_ct(qtbot, test_object, init_config):
     # Checking type 1 sequence tags
     for tag in type_1_sequence_tags:
         assert (tag in rtss) is True
+
+
+def create_outline_shapes(size=120):
+    """
+    :return: Dictionary of boolean masks of a disk, two blobs and an L.
+    """
+    rows, columns = np.mgrid[0:size, 0:size]
+    disk = (columns - 60) ** 2 + (rows - 60) ** 2 < 40 ** 2
+    blobs = ((columns - 30) ** 2 + (rows - 30) ** 2 < 15 ** 2) \
+        | ((columns - 85) ** 2 + (rows - 80) ** 2 < 25 ** 2)
+    l_shape = np.zeros((size, size), dtype=bool)
+    l_shape[10:110, 10:40] = True
+    l_shape[80:110, 10:100] = True
+    return {'disk': disk, 'blobs': blobs, 'L': l_shape}
+
+
+def test_trace_pixel_outlines_matches_alpha_shape():
+    from shapely.geometry import Polygon
+    from src.Model.ROI import calculate_alpha_shape_of_points, \
+        trace_pixel_outlines
+
+    for mask in create_outline_shapes().values():
+        rows, columns = np.nonzero(mask)
+        pixel_coords = list(zip(columns.tolist(), rows.tolist()))
+        outlines = trace_pixel_outlines(pixel_coords)
+        area = sum(Polygon(outline).area for outline in outlines)
+        assert abs(area - mask.sum()) < 0.02 * mask.sum()
+
+        pytest.importorskip("alphashape")
+        alpha_shapes = calculate_alpha_shape_of_points(pixel_coords, 0.2)
+        assert len(outlines) == len(alpha_shapes)
+        # The alpha shape runs through the centres of the edge pixels,
+        # the traced outline around them
+        for outline, shape in zip(
+                sorted(map(Polygon, outlines), key=lambda p: p.area),
+                sorted(map(Polygon, alpha_shapes), key=lambda p: p.area)):
+            assert abs(outline.area - shape.area) < shape.length
+
+
+def test_trace_pixel_outlines_closes_gaps():
+    from src.Model.ROI import trace_pixel_outlines
+
+    # Two squares 3 pixels apart are one outline if the gap is closed
+    pixel_coords = [(x, y) for x in range(10) for y in range(10)] \
+        + [(x, y) for x in range(13, 23) for y in range(10)]
+    assert len(trace_pixel_outlines(pixel_coords, closing_radius=0)) == 2
+    assert len(trace_pixel_outlines(pixel_coords, closing_radius=2)) == 1
+    assert trace_pixel_outlines([]) == []
@@ -0,0 +1,163 @@
+import numpy as np
+import pytest
+from shapely.geometry import Polygon
+
+from src.Model import ROI, ROIMask, ROIMaskCache
+
+
+@pytest.fixture
+def patient_dict_container(axial_patient_dict_container):
+    """
+    :return: PatientDictContainer with a stack of five axial images with
+        a pixel spacing of 1mm and a slice spacing of 2mm.
+    """
+    return axial_patient_dict_container([10, 8, 6, 4, 2],
+                                        pixel_spacing=(1, 1), size=64)
+
+
+def square(x, y, width):
+    """
+    :return: Closed contour of a square in pixel coordinates.
+    """
+    return [[x, y], [x + width, y], [x + width, y + width],
+            [x, y + width], [x, y]]
+
+
+def contour_area(contour_sequence):
+    """
+    :return: Area of a contour sequence, where contours inside other
+        contours are holes.
+    """
+    polygons = [Polygon(contour_data) for contour_data in contour_sequence]
+    area = 0
+    for polygon in polygons:
+        inside = sum(other.contains(polygon) for other in polygons
+                     if other is not polygon)
+        area += -polygon.area if inside % 2 else polygon.area
+    return area
+
+
+def test_roi_to_mask_and_back(patient_dict_container):
+    roi = {"1.2.3.2": [square(10, 20, 30)]}
+
+    grid = ROIMask.create_mask_grid(patient_dict_container, [roi])
+    mask = grid.roi_to_mask(roi)
+
+    assert mask.shape[0] == 3
+    assert abs(mask.sum() - 30 * 30) <= 4 * 30
+    new_roi = grid.mask_to_roi(mask)
+    assert list(new_roi.keys()) == ["1.2.3.2"]
+    assert abs(contour_area(new_roi["1.2.3.2"]) - 30 * 30) < 0.1 * 30 * 30
+
+
+def test_contour_inside_contour_is_hole():
+    grid = ROIMask.MaskGrid((0, 0, 0), (1, 64, 64), (1, 1), 2,
+                            {0: "1.2.3.0"})
+    mask = grid.roi_to_mask({"1.2.3.0": [square(10, 10, 40),
+                                         square(20, 20, 10)]})
+
+    assert not mask[0, 25, 25]
+    assert mask[0, 15, 15]
+
+
+def test_manipulate_masks_agrees_with_geometry(patient_dict_container):
+    roi_1 = {"1.2.3.2": [square(10, 10, 30)]}
+    roi_2 = {"1.2.3.2": [square(25, 25, 30)]}
+    geometry_1 = ROI.roi_to_geometry(roi_1)
+    geometry_2 = ROI.roi_to_geometry(roi_2)
+
+    grid = ROIMask.create_mask_grid(patient_dict_container, [roi_1, roi_2],
+                                    supersampling=2)
+    mask_1 = grid.roi_to_mask(roi_1)
+    mask_2 = grid.roi_to_mask(roi_2)
+
+    for operation in ["UNION", "INTERSECTION", "DIFFERENCE"]:
+        geometry = ROI.manipulate_rois(geometry_1, geometry_2, operation)
+        mask = ROIMask.manipulate_masks(mask_1, mask_2, operation)
+        raster_roi = grid.mask_to_roi(mask)
+
+        expected_area = geometry["1.2.3.2"].area
+        assert abs(contour_area(raster_roi["1.2.3.2"]) - expected_area) \
+            < 0.05 * expected_area
+
+
+def test_scale_mask_expands_across_slices(patient_dict_container):
+    roi = {uid: [square(20, 20, 20)]
+           for uid in ["1.2.3.1", "1.2.3.2", "1.2.3.3"]}
+
+    grid = ROIMask.create_mask_grid(patient_dict_container, [roi], margin=3)
+    mask = grid.roi_to_mask(roi)
+    expanded = ROIMask.scale_mask(mask, 3, grid.spacing)
+    contracted = ROIMask.scale_mask(mask, -3, grid.spacing)
+
+    # The slices are 2mm apart, so a 3mm margin reaches the neighbouring
+    # slices only, and only the middle slice survives the contraction.
+    assert sorted(grid.mask_to_roi(expanded).keys()) == \
+        ["1.2.3.0", "1.2.3.1", "1.2.3.2", "1.2.3.3", "1.2.3.4"]
+    assert list(grid.mask_to_roi(contracted).keys()) == ["1.2.3.2"]
+    assert expanded.sum() > mask.sum() > contracted.sum() > 0
+    assert not np.any(contracted & ~mask)
+
+
+def test_rind_mask():
+    grid = ROIMask.MaskGrid((0, 0, 0), (1, 64, 64), (1, 1), 2,
+                            {0: "1.2.3.0"})
+    mask = grid.roi_to_mask({"1.2.3.0": [square(20, 20, 20)]})
+
+    outer_rind = ROIMask.rind_mask(mask, 3, grid.spacing)
+    inner_rind = ROIMask.rind_mask(mask, -3, grid.spacing)
+
+    assert not np.any(outer_rind & mask)
+    assert not np.any(inner_rind & ~mask)
+    assert outer_rind[0, 30, 18] and not outer_rind[0, 30, 30]
+    assert inner_rind[0, 30, 21] and not inner_rind[0, 30, 30]
+
+
+def test_run_length_mask_decodes_boxes():
+    rng = np.random.default_rng(0)
+    mask = rng.random((3, 20, 30)) > 0.6
+    run_length_mask = ROIMaskCache.RunLengthMask(mask.shape)
+    for slice_index in range(3):
+        run_length_mask.set_slice(slice_index, mask[slice_index])
+
+    assert np.array_equal(run_length_mask.to_mask(), mask)
+    assert np.array_equal(run_length_mask.to_mask((1, 5, 7), (2, 10, 12)),
+                          mask[1:3, 5:15, 7:19])
+
+    # A filled square is a run per row
+    square_mask = np.zeros((20, 30), dtype=bool)
+    square_mask[5:15, 10:20] = True
+    run_length_mask.set_slice(0, square_mask)
+    assert len(run_length_mask.runs[0][0]) == 10
+    assert np.array_equal(run_length_mask.to_mask()[0], square_mask)
+
+
+def test_mask_cache_rasterises_once_per_grid(patient_dict_container):
+    roi = {"1.2.3.1": [square(10, 20, 30)], "1.2.3.2": [square(5, 5, 10)]}
+
+    for supersampling in [1, 2]:
+        grid = ROIMask.create_mask_grid(patient_dict_container, [roi],
+                                        margin=2, supersampling=supersampling)
+        uncached = ROIMask.MaskGrid(
+            grid.origin, [grid.shape[0], grid.shape[1] // supersampling,
+                          grid.shape[2] // supersampling],
+            grid.pixel_spacing, grid.slice_spacing, grid.slice_to_uid,
+            supersampling)
+        assert np.array_equal(grid.roi_to_mask(roi, "ROI"),
+                              uncached.roi_to_mask(roi))
+
+    mask_cache = ROIMaskCache.get_roi_mask_cache(patient_dict_container)
+    assert len(mask_cache.masks) == 2
+    image_grid = ROIMask.create_image_mask_grid(patient_dict_container)
+    run_length_mask = mask_cache.get_run_length_mask(image_grid, roi, "ROI")
+    assert len(mask_cache.masks) == 2
+    assert image_grid.roi_to_mask(roi).sum() == \
+        run_length_mask.to_mask().sum()
+
+    # Editing the ROI drops the masks of its previous contours
+    edited_roi = {"1.2.3.1": [square(10, 20, 20)]}
+    edited_mask = image_grid.roi_to_mask(edited_roi, "ROI")
+    assert len(mask_cache.masks) == 1
+    assert not edited_mask[2].any()
+    mask_cache.invalidate("ROI")
+    assert not mask_cache.masks
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from src.Model import ROITransfer
+from src.Model.SliceGeometry import SliceGeometry
+
+
+@pytest.fixture
+def create_slice_geometry(axial_image_stack):
+    """
+    Factory of the SliceGeometry of axial slices at the z positions,
+    sorted from head to feet as ImageLoading sorts them.
+    """
+    def create(z_positions):
+        return SliceGeometry(
+            axial_image_stack(sorted(z_positions, reverse=True)))
+
+    return create
+
+
+def square(z, size=10):
+    return [0, 0, z, size, 0, z, size, size, z, 0, size, z]
+
+
+def test_transform_contours_fills_target_slices(create_slice_geometry):
+    # Contours every 3mm transferred onto slices every 1mm, moved by 1mm
+    source_geometry = create_slice_geometry([0, 3, 6])
+    target_geometry = create_slice_geometry(np.arange(-3, 12))
+    contours = [square(0), square(3), square(6)]
+    matrix = np.eye(3)
+    offset = np.array([5, -2, 1])
+
+    slice_contours = ROITransfer.transform_contours(
+        contours, matrix, offset, source_geometry, target_geometry)
+
+    z_positions = sorted(target_geometry.z_positions[key]
+                         for key in slice_contours)
+    # Each contour fills its 3mm slab, without slices in two slabs
+    assert z_positions == list(range(-0, 9))
+    for key, points_list in slice_contours.items():
+        assert len(points_list) == 1
+        points = points_list[0]
+        assert np.allclose(points[:, 2], target_geometry.z_positions[key])
+        assert np.allclose(points[:, :2].min(axis=0), [5, -2])
+        assert np.allclose(points[:, :2].max(axis=0), [15, 8])
+
+
+def test_transform_contours_rejects_tilted_slices(create_slice_geometry):
+    geometry = create_slice_geometry([0, 3, 6])
+    angle = np.radians(2 * ROITransfer.MAX_CONTOUR_TILT)
+    rotation = np.array([[1, 0, 0],
+                         [0, np.cos(angle), -np.sin(angle)],
+                         [0, np.sin(angle), np.cos(angle)]])
+    assert ROITransfer.transform_contours(
+        [square(3)], rotation, np.zeros(3), geometry, geometry) is None
+
+    small_rotation = np.array([[1, 0, 0],
+                               [0, np.cos(0.01), -np.sin(0.01)],
+                               [0, np.sin(0.01), np.cos(0.01)]])
+    slice_contours = ROITransfer.transform_contours(
+        [square(3)], small_rotation, np.zeros(3), geometry, geometry)
+    assert list(slice_contours) == [1]
+
+
+def test_invert_affine_transform():
+    matrix = np.array([[2.0, 0, 0], [0, 1, 0.5], [0, 0, 1]])
+    offset = np.array([1.0, 2, 3])
+    inverse, inverse_offset = ROITransfer.invert_affine_transform(matrix,
+                                                                  offset)
+    point = np.array([4.0, -5, 6])
+    assert np.allclose(inverse.dot(matrix.dot(point) + offset)
+                       + inverse_offset, point)
+
+
+def test_extract_roi_polygons_from_label_volume():
+    pytest.importorskip("alphashape")
+    labels = np.zeros((4, 20, 20), dtype=np.uint64)
+    labels[1, 2:8, 2:8] |= np.uint64(1)
+    labels[1:3, 5:15, 5:15] |= np.uint64(1) << np.uint64(1)
+
+    for max_workers in [1, 2]:
+        polygons = ROITransfer.extract_roi_polygons(labels, 2, max_workers)
+        assert len(polygons) == 2
+        assert list(polygons[0]) == [1]
+        assert sorted(polygons[1]) == [1, 2]
+        points = np.array(polygons[1][2][0])
+        assert points.min() >= 5 and points.max() <= 16
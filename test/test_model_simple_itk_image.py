@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from src.constants import CT_RESCALE_INTERCEPT
+from src.Model import SimpleITKImage
+
+
+@pytest.fixture
+def ct_patient_dict_container(axial_patient_dict_container):
+    """
+    Factory populating the PatientDictContainer with a stack of four CT
+    images, sorted from head to feet as ImageLoading sorts them, with a
+    pixel spacing of (0.5, 0.8) mm and a slice spacing of 3mm.
+    """
+    def create(scaled=True):
+        pixel_values = []
+        for i in range(4):
+            hounsfield = np.arange(12, dtype=np.int16).reshape(3, 4) * 10 * i
+            if scaled:
+                pixel_values.append(hounsfield + CT_RESCALE_INTERCEPT)
+            else:
+                pixel_values.append(hounsfield + 1024)
+
+        patient_dict_container = axial_patient_dict_container(
+            [12, 9, 6, 3], pixel_values=pixel_values, origin=(-10, -20),
+            pixel_spacing=(0.5, 0.8), Modality="CT", RescaleSlope="1",
+            RescaleIntercept="-1024")
+        if scaled:
+            patient_dict_container.set("scaled", True)
+        return patient_dict_container
+
+    return create
+
+
+def test_image_volume_is_in_hounsfield_units(ct_patient_dict_container):
+    expected = np.stack([np.arange(12).reshape(3, 4) * 10 * i
+                         for i in range(4)])
+    for scaled in [True, False]:
+        patient_dict_container = ct_patient_dict_container(scaled=scaled)
+        volume = SimpleITKImage.get_image_volume(patient_dict_container)
+        assert volume.dtype == np.float32
+        assert np.array_equal(volume, expected)
+
+
+def test_sitk_image_geometry(ct_patient_dict_container):
+    sitk = pytest.importorskip("SimpleITK")
+    patient_dict_container = ct_patient_dict_container()
+
+    image = SimpleITKImage.get_sitk_image(patient_dict_container)
+    assert SimpleITKImage.get_sitk_image(patient_dict_container) is image
+    assert image.GetOrigin() == (-10, -20, 12)
+    assert image.GetSpacing() == (0.8, 0.5, 3)
+    assert image.GetDirection() == (1, 0, 0, 0, 1, 0, 0, 0, -1)
+
+    # Plastimatch orders the slices from feet to head
+    ascending = SimpleITKImage.get_sitk_image(patient_dict_container,
+                                              ascending=True)
+    assert ascending.GetOrigin() == (-10, -20, 3)
+    assert ascending.GetDirection() == (1, 0, 0, 0, 1, 0, 0, 0, 1)
+    assert np.array_equal(sitk.GetArrayViewFromImage(ascending),
+                          sitk.GetArrayViewFromImage(image)[::-1])
@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+from pydicom import dataset
+
+from src.Model import ImageLoading
+from src.Model.GetPatientInfo import dict_instance_uid
+from src.Model.SliceGeometry import SliceGeometry
+
+
+@pytest.fixture
+def create_image_stack(axial_image_stack):
+    """
+    Factory of dictionaries of axial image datasets with an RTSTRUCT, in
+    the same format as the one produced by ImageLoading.get_datasets(..).
+    """
+    def create(z_positions):
+        dict_ds = axial_image_stack(z_positions)
+        dict_ds['rtss'] = dataset.Dataset()
+        return dict_ds
+
+    return create
+
+
+def create_rtss(contours):
+    """
+    Create an RTSTRUCT dataset where every ROI has a single contour.
+    :param contours: List of (ContourData, SOPInstanceUID) pairs. If the
+        SOPInstanceUID is None, the contour has no ContourImageSequence.
+    :return: RTSTRUCT dataset.
+    """
+    rtss = dataset.Dataset()
+    rtss.ROIContourSequence = []
+    for roi_number, (contour_data, uid) in enumerate(contours, 1):
+        contour = dataset.Dataset()
+        contour.ContourData = contour_data
+        if uid is not None:
+            contour_image = dataset.Dataset()
+            contour_image.ReferencedSOPInstanceUID = uid
+            contour.ContourImageSequence = [contour_image]
+        roi_contour = dataset.Dataset()
+        roi_contour.ReferencedROINumber = roi_number
+        roi_contour.ContourSequence = [contour]
+        rtss.ROIContourSequence.append(roi_contour)
+    return rtss
+
+
+def test_slice_geometry_mappings(create_image_stack):
+    dict_ds = create_image_stack([9, 6, 3, 0])
+    slice_geometry = SliceGeometry(dict_ds)
+
+    assert len(slice_geometry) == 4
+    assert slice_geometry.uid_to_slice["1.2.3.2"] == 2
+    assert slice_geometry.slice_to_uid[1] == "1.2.3.1"
+    assert slice_geometry.uid_list == ["1.2.3.0", "1.2.3.1",
+                                       "1.2.3.2", "1.2.3.3"]
+    assert slice_geometry.z_position(0) == 9
+    assert np.all(slice_geometry.sorted_z == np.array([0, 3, 6, 9]))
+
+    assert dict_instance_uid(dict_ds) == slice_geometry.slice_to_uid
+    assert ImageLoading.get_image_uid_list(dict_ds) == \
+        slice_geometry.uid_list
+
+
+def test_slice_geometry_nearest_slice(create_image_stack):
+    slice_geometry = SliceGeometry(create_image_stack([9, 6, 3, 0]))
+
+    assert slice_geometry.nearest_slice(5.9) == 1
+    assert slice_geometry.nearest_slice(1.4) == 3
+    assert slice_geometry.nearest_slice(-20) == 3
+    assert slice_geometry.nearest_slice(-20, tolerance=1.5) is None
+    assert np.all(slice_geometry.nearest_slices([8.1, 4, 0.2])
+                  == np.array([0, 2, 3]))
+
+
+def test_thickness_dict_contour_without_image_sequence(create_image_stack):
+    dict_ds = create_image_stack([9, 6, 3, 0])
+    rtss = create_rtss([
+        ([0, 0, 6, 1, 0, 6, 1, 1, 6], "1.2.3.1"),
+        ([0, 0, 3, 1, 0, 3, 1, 1, 3], None),
+        ([0, 0, 0, 1, 0, 0, 1, 1, 0], None),
+    ])
+
+    dict_thickness = ImageLoading.get_thickness_dict(rtss, dict_ds)
+
+    assert dict_thickness[1] == 3
+    assert dict_thickness[2] == 3
+    assert dict_thickness[3] == 1.5
+
+
+def test_raw_contour_data_skips_unresolved_contours(create_image_stack):
+    from src.Model import ROI
+
+    dict_ds = create_image_stack([9, 6, 3, 0])
+    slice_geometry = SliceGeometry(dict_ds)
+    # The last contour lies above the stack without referencing a slice
+    rtss = create_rtss([
+        ([0, 0, 6, 1, 0, 6, 1, 1, 6], "1.2.3.1"),
+        ([0, 0, 3, 1, 0, 3, 1, 1, 3], None),
+        ([0, 0, 20, 1, 0, 20, 1, 1, 20], None),
+    ])
+    rtss.StructureSetROISequence = []
+    for roi_contour in rtss.ROIContourSequence:
+        structure_set_roi = dataset.Dataset()
+        structure_set_roi.ROINumber = roi_contour.ReferencedROINumber
+        structure_set_roi.ROIName = "ROI " + str(structure_set_roi.ROINumber)
+        rtss.StructureSetROISequence.append(structure_set_roi)
+        roi_contour.ContourSequence[0].NumberOfContourPoints = 3
+
+    dict_roi, dict_num_points = ROI.get_raw_contour_data(rtss,
+                                                         slice_geometry)
+
+    assert list(dict_roi["ROI 1"]) == ["1.2.3.1"]
+    assert list(dict_roi["ROI 2"]) == ["1.2.3.2"]
+    assert not dict_roi["ROI 3"] and dict_num_points["ROI 3"] == 0
+    assert (dict_roi, dict_num_points) == \
+        ImageLoading.get_raw_contour_data(rtss, slice_geometry)
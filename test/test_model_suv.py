@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+from pydicom import dataset
+
+from src.Model import SUV
+from src.Model.PatientDictContainer import PatientDictContainer
+
+
+def create_pet_dataset(slice_number, weight=70.0):
+    """
+    :return: PET image dataset in Bq/mL, decay corrected to the start of
+        the series, which starts one half life of F-18 after injection.
+    """
+    ds = dataset.Dataset()
+    ds.SOPClassUID = SUV.PET_SOP_CLASS_UID
+    ds.SOPInstanceUID = "1.2.3." + str(slice_number)
+    ds.Units = "BQML"
+    ds.CorrectedImage = ["ATTN", "DECY"]
+    ds.DecayCorrection = "START"
+    ds.SeriesTime = "110909.2"
+    ds.RescaleSlope = "0.5"
+    ds.RescaleIntercept = "0"
+    if weight is not None:
+        ds.PatientWeight = weight
+    info = dataset.Dataset()
+    info.RadionuclideTotalDose = "350000000"
+    info.RadionuclideHalfLife = "6586.2"
+    info.RadiopharmaceuticalStartTime = "091923"
+    ds.RadiopharmaceuticalInformationSequence = [info]
+    return ds
+
+
+def create_pet_images(weight=70.0):
+    pixel_values = [np.arange(16, dtype=np.uint16).reshape(4, 4) * (i + 1)
+                    for i in range(3)]
+    dict_ds = {i: create_pet_dataset(i, weight) for i in range(3)}
+    return dict_ds, pixel_values
+
+
+def test_injected_dose_is_decay_corrected():
+    ds, _ = create_pet_images()
+    assert np.isclose(SUV.get_injected_dose(ds[0]), 175000000)
+
+    ds[0].DecayCorrection = "ADMIN"
+    assert SUV.get_injected_dose(ds[0]) == 350000000
+
+
+def test_suv_volume_of_rescaled_and_stored_values():
+    dict_ds, pixel_values = create_pet_images()
+    datasets = list(dict_ds.values())
+    expected = np.array(pixel_values) * 0.5 * 70000 / 175000000
+
+    suv_volume, suv_factor = SUV.calculate_suv_volume(
+        datasets, pixel_values, False, 70000)
+    assert suv_volume.dtype == np.float32
+    assert np.allclose(suv_volume, expected)
+
+    rescaled = [pixels * 0.5 for pixels in pixel_values]
+    suv_volume, _ = SUV.calculate_suv_volume(
+        datasets, rescaled, True, 70000)
+    assert np.allclose(suv_volume, expected)
+
+
+def test_suv_errors():
+    dict_ds, pixel_values = create_pet_images(weight=None)
+    datasets = list(dict_ds.values())
+
+    with pytest.raises(SUV.SUVError) as error:
+        SUV.calculate_suv_volume(datasets, pixel_values, False, None)
+    assert error.value.reason == "WEIGHT"
+
+    datasets[0].DecayCorrection = "NONE"
+    datasets[0].CorrectedImage = ["ATTN"]
+    with pytest.raises(SUV.SUVError) as error:
+        SUV.calculate_suv_volume(datasets, pixel_values, False, 70000)
+    assert error.value.reason == "DECY"
+
+    datasets[0].Units = "CNTS"
+    with pytest.raises(SUV.SUVError) as error:
+        SUV.calculate_suv_volume(datasets, pixel_values, False, 70000)
+    assert error.value.reason == "UNIT"
+
+
+def test_suv_volume_is_cached_in_patient_context():
+    dict_ds, pixel_values = create_pet_images()
+    patient_dict_container = PatientDictContainer()
+    patient_dict_container.clear()
+    patient_dict_container.set_initial_values("", dict_ds, {},
+                                              pixel_values=pixel_values)
+
+    suv_volume = SUV.get_patient_suv_volume()
+    assert SUV.get_patient_suv_volume() is suv_volume
+    assert patient_dict_container.get("suv_patient_weight") == 70000
+
+    # A different patient weight recalculates the volume
+    heavier = SUV.get_patient_suv_volume(140000)
+    assert np.allclose(heavier, suv_volume * 2)
+    assert SUV.get_patient_suv_volume() is heavier
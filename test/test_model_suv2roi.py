@@ -102,16 +102,13 @@ def test_calculate_suv_values(test_object):
     :param test_object: test_object function, for accessing the shared
                         TestStructureTab object.
     """
-    datasets = []
-
-    # Loop through each dataset in PT CTAC, append them to datasets
-    for ds in test_object.dicom_files["PT CTAC"]:
-        datasets.append(ds)
+    # Calculate SUV values of all PET images
+    suv_volume = test_object.suv2roi.get_suv_volume()
+    suv_factor = test_object.patient_dict_container.get("suv_factor")
 
     # Loop through each dataset, perform tests
-    for ds in datasets:
-        # Calculate SUV values
-        suv_values = test_object.suv2roi.pet2suv(ds)
+    for i, ds in enumerate(test_object.dicom_files["PT CTAC"]):
+        suv_values = suv_volume[i]
         test_object.suv_data.append(suv_values)
 
         # Assert that there are SUV values, and that there are the same
@@ -126,11 +123,11 @@ def test_calculate_suv_values(test_object):
 
         # Convert Bq/ml to SUV
         suv = (pixel_array * rescale_slope + rescale_intercept) \
-            * test_object.suv2roi.weight_over_dose
+            * suv_factor
 
         # Assert that manually-generated SUV values are the same as
         # code-generated SUV values
-        assert numpy.array_equal(suv_values, suv)
+        assert numpy.allclose(suv_values, suv, rtol=1e-5)
 
 
 @pytest.mark.skip()
@@ -0,0 +1,65 @@
+import subprocess
+import sys
+from pathlib import Path
+
+# Modules that are only needed by fusion, 3D, radiomics, anonymisation,
+# DVH calculation and ROI manipulation, and must not be imported when
+# the application starts.
+HEAVY_MODULES = ['radiomics', 'SimpleITK', 'platipy', 'vtk', 'vtkmodules',
+                 'matplotlib', 'pymedphys', 'cv2', 'shapely', 'alphashape',
+                 'skimage']
+
+# Budget for the cumulative import time of the top level controller. It
+# takes about 0.6 s on a warm disk; the budget leaves room for slow CI
+# machines while still catching a heavy module imported at start-up.
+IMPORT_TIME_BUDGET_SECONDS = 3.0
+
+STARTUP_MODULE = 'src.Controller.TopLevelController'
+
+
+def get_import_times(module_name):
+    """
+    Import a module in a fresh interpreter with -X importtime.
+    :param module_name: Name of the module to import.
+    :return: Dictionary of {module name: (self import time, cumulative
+        import time)} in microseconds for every module imported.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module_name],
+        cwd=Path(__file__).parents[1], stderr=subprocess.PIPE,
+        universal_newlines=True, check=True)
+
+    # Lines have the format
+    # "import time: self [us] | cumulative | imported package"
+    import_times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_time, cumulative, name = \
+            line[len('import time:'):].split('|')
+        if cumulative.strip().isnumeric():
+            import_times[name.strip()] = (int(self_time), int(cumulative))
+    return import_times
+
+
+def test_startup_does_not_import_heavy_modules():
+    import_times = get_import_times(STARTUP_MODULE)
+
+    assert STARTUP_MODULE in import_times
+    imported = [name for name in import_times
+                if name.split('.')[0] in HEAVY_MODULES]
+    assert imported == []
+
+
+def test_startup_import_time_budget():
+    import_times = get_import_times(STARTUP_MODULE)
+
+    import_time = import_times[STARTUP_MODULE][1] / 1e6
+    slowest = sorted(import_times, key=lambda name: import_times[name][0],
+                     reverse=True)[:5]
+    assert import_time < IMPORT_TIME_BUDGET_SECONDS, \
+        "Importing %s took %.2f s, over the budget of %.1f s. " \
+        "Slowest modules: %s" % (
+            STARTUP_MODULE, import_time, IMPORT_TIME_BUDGET_SECONDS,
+            ", ".join("%s (%.2f s)" % (name, import_times[name][0] / 1e6)
+                      for name in slowest))
@@ -0,0 +1,25 @@
+import threading
+
+from src.View.ImageLoader import ImageLoader
+
+
+def test_wait_for_calc_dvh_advice(qtbot):
+    image_loader = ImageLoader([], None, None)
+    interrupt_flag = threading.Event()
+
+    # Answer the DVH prompt from another thread, like the GUI thread would
+    timer = threading.Timer(0.05, image_loader.update_calc_dvh, args=(True,))
+    timer.start()
+
+    assert image_loader.wait_for_calc_dvh_advice(interrupt_flag)
+    assert image_loader.calc_dvh
+    timer.join()
+
+
+def test_wait_for_calc_dvh_advice_interrupted(qtbot):
+    image_loader = ImageLoader([], None, None)
+    interrupt_flag = threading.Event()
+    interrupt_flag.set()
+
+    assert not image_loader.wait_for_calc_dvh_advice(interrupt_flag)
+    assert not image_loader.calc_dvh
@@ -0,0 +1,57 @@
+import pytest
+from PySide6.QtWidgets import QMessageBox
+
+from src.Controller.ROIOptionsController import ROITransferOptionUI
+from src.Model.MovingDictContainer import MovingDictContainer
+from src.Model.PatientDictContainer import PatientDictContainer
+
+
+@pytest.fixture
+def transfer_roi_window(qtbot):
+    """
+    :return: ROI Transfer window between two image sets that both have
+        a GTV.
+    """
+    patient_dict_container = PatientDictContainer()
+    patient_dict_container.clear()
+    patient_dict_container.set_initial_values(
+        None, {}, {}, rois={1: {'name': 'GTV'}}, dataset_rtss="fixed rtss")
+    moving_dict_container = MovingDictContainer()
+    moving_dict_container.clear()
+    moving_dict_container.set_initial_values(
+        None, {}, {}, rois={1: {'name': 'GTV'}}, dataset_rtss="moving rtss")
+
+    window = ROITransferOptionUI()
+    qtbot.addWidget(window)
+    yield window
+
+    patient_dict_container.clear()
+    moving_dict_container.clear()
+
+
+def test_transfer_roi_window_starts_transfer(transfer_roi_window,
+                                             monkeypatch):
+    window = transfer_roi_window
+    started = []
+    monkeypatch.setattr(window.progress_window, "start", started.append)
+
+    window.patient_A_initial_roi_double_clicked(
+        window.patient_A_initial_rois_list_widget.item(0))
+    assert window.save_button.isEnabled()
+    window.save_button.click()
+
+    assert started == [window.save_clicked]
+
+
+def test_transfer_roi_finished_emits_modified_rtss(transfer_roi_window,
+                                                   qtbot, monkeypatch):
+    window = transfer_roi_window
+    monkeypatch.setattr(QMessageBox, "about", lambda *args: None)
+    window.patient_A_initial_roi_double_clicked(
+        window.patient_A_initial_rois_list_widget.item(0))
+
+    with qtbot.waitSignal(
+            window.signal_roi_transferred_to_moving_container) as blocker:
+        window.onTransferRoiFinished((True, window.progress_window))
+
+    assert blocker.args == [("moving rtss", {"transfer": None})]